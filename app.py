@@ -4,15 +4,33 @@ from config import Config
 from models import db
 import os
 
-def create_app():
+def create_app(test_config=None):
     """Application factory pattern"""
     app = Flask(__name__)
     app.config.from_object(Config)
+    if test_config:
+        app.config.update(test_config)  # Before the extensions read it (e.g. the database URI)
     
     # Initialize extensions
     db.init_app(app)
     CORS(app)
     
+    # Track writes that invalidate materialized analytics
+    from services.analytics_snapshot_service import AnalyticsSnapshotService
+    AnalyticsSnapshotService.init_app(app)
+    
+    # Keep per-supplier and per-material amount distributions current
+    from services.amount_profiles import AmountProfiles
+    AmountProfiles.register_change_tracking()
+    
+    # Invalidate cached dashboard aggregates on writes
+    from services.dashboard_cache import DashboardCache
+    DashboardCache.register_invalidation()
+    
+    # Deliver queued n8n webhook calls in the background
+    from services.n8n_dispatcher import N8nDispatcher
+    N8nDispatcher.init_app(app)
+    
     # Ensure upload folder exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
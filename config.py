@@ -24,6 +24,24 @@ class Config:
     N8N_BASE_URL = os.getenv('N8N_BASE_URL', 'http://localhost:5678')
     N8N_TO_FLASK_API_KEY = os.getenv('N8N_TO_FLASK_API_KEY')
     
+    # n8n Dispatch Outbox
+    N8N_DISPATCH_WORKER = os.getenv('N8N_DISPATCH_WORKER', 'True') == 'True'  # Background sender thread in this process
+    N8N_DISPATCH_MAX_ATTEMPTS = int(os.getenv('N8N_DISPATCH_MAX_ATTEMPTS', 8))
+    N8N_DISPATCH_TIMEOUT = int(os.getenv('N8N_DISPATCH_TIMEOUT', 10))  # Seconds per webhook call
+    N8N_DISPATCH_BATCH_SIZE = int(os.getenv('N8N_DISPATCH_BATCH_SIZE', 20))
+    N8N_DISPATCH_COALESCE_WINDOW = float(os.getenv('N8N_DISPATCH_COALESCE_WINDOW', 0.5))  # Seconds
+    
+    # PDF Text Extraction
+    PDF_EXTRACTION_WORKERS = int(os.getenv('PDF_EXTRACTION_WORKERS', os.cpu_count() or 1))  # 0 = extract in-process
+    PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 8))
+    PDF_SYNC_MAX_PAGES = int(os.getenv('PDF_SYNC_MAX_PAGES', 20))  # Larger PDFs become background jobs
+    EXTRACTION_PROMPT_VERSION = os.getenv('EXTRACTION_PROMPT_VERSION', '1')  # Bump when the n8n extraction prompt changes
+    
+    # Chunked (resumable) uploads
+    CHUNKED_UPLOAD_MAX_SIZE = int(os.getenv('CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))  # Bytes per file
+    CHUNKED_UPLOAD_CHUNK_SIZE = int(os.getenv('CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # Largest chunk accepted
+    UPLOAD_SESSION_TTL_HOURS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24))  # Unfinished sessions are discarded after
+    
     # Email Configuration
     SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
     SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
@@ -39,6 +57,22 @@ class Config:
     MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 10485760))  # 10MB
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'static/uploads')
     ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'pdf,jpg,jpeg,png,xlsx,xls,doc,docx').split(','))
+    FILE_SERVE_MODE = os.getenv('FILE_SERVE_MODE', 'flask')  # 'x-accel' hands downloads to nginx
+    X_ACCEL_UPLOADS_PREFIX = os.getenv('X_ACCEL_UPLOADS_PREFIX', '/_protected_uploads/')  # nginx internal location
+    THUMBNAIL_MAX_AGE = int(os.getenv('THUMBNAIL_MAX_AGE', 31536000))  # Seconds browsers may cache previews
+    
+    # Analytics Snapshots
+    ANALYTICS_SNAPSHOT_MAX_AGE = int(os.getenv('ANALYTICS_SNAPSHOT_MAX_AGE', 3600))  # Seconds before full rebuild
+    ANALYTICS_REFRESH_WORKER = os.getenv('ANALYTICS_REFRESH_WORKER', 'True') == 'True'  # Background snapshot refresher
+    ANALYTICS_CHANGE_OVERLAP = int(os.getenv('ANALYTICS_CHANGE_OVERLAP', 300))  # Seconds a write may stay uncommitted
+    
+    # Dashboard Cache
+    DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', 30))  # Seconds; 0 disables caching
+    
+    # Amount Anomaly Detection (per-supplier / per-material robust z-scores)
+    AMOUNT_ANOMALY_Z_THRESHOLD = float(os.getenv('AMOUNT_ANOMALY_Z_THRESHOLD', 3.5))
+    AMOUNT_ANOMALY_MIN_SAMPLES = int(os.getenv('AMOUNT_ANOMALY_MIN_SAMPLES', 5))  # History before a group is scored
+    AMOUNT_PROFILE_MAX_AGE = int(os.getenv('AMOUNT_PROFILE_MAX_AGE', 3600))  # Seconds before reloading from the database
     
     # Application Settings
     CURRENCY = os.getenv('CURRENCY', 'AED')
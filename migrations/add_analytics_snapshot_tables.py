@@ -0,0 +1,39 @@
+"""
+Migration: Add AnalyticsSnapshot and AnalyticsChange tables
+Purpose: Materialized analytics dashboard with incremental refresh
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db
+from models.analytics_snapshot import AnalyticsSnapshot, AnalyticsChange
+from app import create_app
+
+def migrate():
+    """Add analytics snapshot tables to database"""
+    app = create_app()
+
+    with app.app_context():
+        print("Creating analytics snapshot tables...")
+
+        # Snapshots are derived data: a table from before the change horizon
+        # columns is dropped and rebuilt on the next dashboard read
+        inspector = db.inspect(db.engine)
+        if inspector.has_table('analytics_snapshots'):
+            columns = {column['name'] for column in inspector.get_columns('analytics_snapshots')}
+            if 'change_horizon' not in columns:
+                AnalyticsSnapshot.__table__.drop(bind=db.engine)
+
+        # Create tables
+        db.create_all()
+        for index in AnalyticsChange.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+        print("✅ Analytics snapshot tables created successfully!")
+        print("   - analytics_snapshots")
+        print("   - analytics_changes")
+
+if __name__ == '__main__':
+    migrate()
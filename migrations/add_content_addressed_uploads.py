@@ -0,0 +1,51 @@
+"""
+Migration: Add files.content_hash and the ExtractionCacheEntry table
+Purpose: Content-addressed upload dedupe and extraction cache keyed by file hash
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import inspect
+from models import db
+from models.file import File
+from models.extraction_cache import ExtractionCacheEntry
+from services.content_store import ContentStore
+from app import create_app
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'uploads')
+
+def migrate():
+    """Add content hash column, backfill it and create the extraction cache table"""
+    app = create_app()
+
+    with app.app_context():
+        print("Creating extraction cache table...")
+        db.create_all()
+
+        columns = [column['name'] for column in inspect(db.engine).get_columns('files')]
+        if 'content_hash' not in columns:
+            print("   Adding files.content_hash column...")
+            with db.engine.begin() as conn:
+                conn.execute(db.text("ALTER TABLE files ADD COLUMN content_hash VARCHAR(64)"))
+        for index in File.__table__.indexes:
+            if index.name == 'ix_files_content_hash':
+                index.create(db.engine, checkfirst=True)
+
+        # Hash files uploaded before the store existed so their extractions can be cached
+        backfilled = 0
+        for file in File.query.filter(File.content_hash.is_(None)).all():
+            full_path = os.path.join(UPLOAD_FOLDER, file.file_path)
+            if os.path.exists(full_path):
+                file.content_hash = ContentStore.hash_file(full_path)
+                backfilled += 1
+        db.session.commit()
+
+        print("✅ Content-addressed uploads ready!")
+        print("   - files.content_hash")
+        print("   - extraction_cache")
+        print(f"   - {backfilled} existing files hashed")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,32 @@
+"""
+Migration: Add N8nDispatch table
+Purpose: Outbox for n8n webhook calls, delivered by the background dispatcher
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db
+from models.n8n_dispatch import N8nDispatch
+from app import create_app
+
+def migrate():
+    """Add n8n dispatch outbox table to database"""
+    app = create_app()
+
+    with app.app_context():
+        print("Creating n8n dispatch table...")
+
+        # Create tables
+        db.create_all()
+
+        # Indexes added since the table was first created
+        for index in sorted(N8nDispatch.__table__.indexes, key=lambda i: i.name):
+            index.create(bind=db.engine, checkfirst=True)
+
+        print("✅ n8n dispatch table created successfully!")
+        print("   - n8n_dispatches")
+
+if __name__ == '__main__':
+    migrate()
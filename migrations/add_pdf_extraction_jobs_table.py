@@ -0,0 +1,28 @@
+"""
+Migration: Add PdfExtractionJob table
+Purpose: Background PDF text extraction jobs
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db
+from models.pdf_extraction_job import PdfExtractionJob
+from app import create_app
+
+def migrate():
+    """Add PDF extraction job table to database"""
+    app = create_app()
+
+    with app.app_context():
+        print("Creating PDF extraction job table...")
+
+        # Create tables
+        db.create_all()
+
+        print("✅ PDF extraction job table created successfully!")
+        print("   - pdf_extraction_jobs")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,44 @@
+"""
+Migration: Add composite indexes for the hot filter columns
+Purpose: Keep dashboard, analytics and n8n queries off full table scans
+
+The indexes are declared in each model's __table_args__ (new databases get
+them from db.create_all()); this script adds any that an existing database
+is missing. Safe to run repeatedly on SQLite and PostgreSQL.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db
+from models.delivery import Delivery
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from models.ai_suggestion import AISuggestion
+from models.file import File
+from app import create_app
+
+INDEXED_MODELS = [Delivery, PurchaseOrder, Payment, AISuggestion, File]
+
+def migrate():
+    """Create missing indexes and refresh planner statistics"""
+    app = create_app()
+
+    with app.app_context():
+        print("Creating query indexes...")
+
+        for model in INDEXED_MODELS:
+            for index in sorted(model.__table__.indexes, key=lambda i: i.name):
+                index.create(bind=db.engine, checkfirst=True)
+                columns = ', '.join(column.name for column in index.columns)
+                print(f"   ✓ {index.name} ({columns})")
+
+        # Let the planner see the new indexes' selectivity
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ANALYZE'))
+
+        print("✅ Query indexes created successfully!")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,28 @@
+"""
+Migration: Add UploadSession table
+Purpose: Resumable chunked uploads
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db
+from models.upload_session import UploadSession
+from app import create_app
+
+def migrate():
+    """Add upload session table to database"""
+    app = create_app()
+
+    with app.app_context():
+        print("Creating upload session table...")
+
+        # Create tables
+        db.create_all()
+
+        print("✅ Upload session table created successfully!")
+        print("   - upload_sessions")
+
+if __name__ == '__main__':
+    migrate()
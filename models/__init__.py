@@ -11,3 +11,8 @@ from .delivery import Delivery
 from .ai_suggestion import AISuggestion
 from .conversation import Conversation, ConversationMessage
 from .file import File
+from .analytics_snapshot import AnalyticsSnapshot, AnalyticsChange
+from .n8n_dispatch import N8nDispatch
+from .pdf_extraction_job import PdfExtractionJob
+from .extraction_cache import ExtractionCacheEntry
+from .upload_session import UploadSession
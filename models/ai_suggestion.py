@@ -5,6 +5,11 @@ import json
 class AISuggestion(db.Model):
     """AI Suggestion model for tracking AI-extracted data waiting for approval"""
     __tablename__ = 'ai_suggestions'
+    __table_args__ = (
+        # Review queue and recent-activity queries (see migrations/add_query_indexes.py)
+        db.Index('ix_ai_suggestions_status_created_at', 'status', 'created_at'),
+        db.Index('ix_ai_suggestions_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
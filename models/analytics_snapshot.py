@@ -0,0 +1,51 @@
+"""
+Analytics Snapshot Models
+Materialized analytics dashboard sections and the change log used to refresh them
+"""
+from datetime import datetime
+from models import db
+
+
+class AnalyticsSnapshot(db.Model):
+    """Precomputed analytics dashboard sections for one date range"""
+    __tablename__ = 'analytics_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    date_range_days = db.Column(db.Integer, unique=True, nullable=False)
+
+    # Computed sections: executive_summary, supplier_performance, delay_predictions,
+    # financial_analytics, delivery_intelligence (full lists, sliced on read)
+    data = db.Column(db.JSON, nullable=False)
+
+    # Date window the sections were computed for
+    cutoff_date = db.Column(db.DateTime, nullable=False)
+
+    # Change log position: every AnalyticsChange created before change_horizon
+    # is folded in, plus the newer ones listed in applied_change_ids (ids are
+    # not commit-ordered, so newer changes are tracked one by one)
+    change_horizon = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    applied_change_ids = db.Column(db.JSON, default=list, nullable=False)
+
+    # Timestamps
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Last full rebuild
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Last incremental refresh
+
+    def __repr__(self):
+        return f'<AnalyticsSnapshot {self.date_range_days}d @ {self.refreshed_at}>'
+
+
+class AnalyticsChange(db.Model):
+    """Scope touched by a PurchaseOrder, Payment or Delivery write"""
+    __tablename__ = 'analytics_changes'
+    __table_args__ = (
+        db.Index('ix_analytics_changes_created_at', 'created_at'),
+        {'sqlite_autoincrement': True}  # Ids must never be reused after pruning
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope_type = db.Column(db.String(20), nullable=False)  # supplier, po, material, month
+    scope_key = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<AnalyticsChange {self.scope_type}={self.scope_key}>'
@@ -1,9 +1,39 @@
 from datetime import datetime
+from sqlalchemy import and_, or_, update
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import joinedload
 from models import db
 
+# Statuses that count as overdue once the expected date has passed
+OPEN_DELIVERY_STATUSES = ['Pending', 'Partial']
+
+
+def calculate_delay_days(expected_date, actual_date, delivery_status, now=None):
+    """Delay in days implied by the dates, or None if the dates show no delay"""
+    if not expected_date:
+        return None
+    if actual_date:
+        # Delivery completed - check if it was late
+        if actual_date > expected_date:
+            return (actual_date - expected_date).days
+        return None
+    # Delivery not completed yet - check if overdue
+    now = now or datetime.utcnow()
+    if now > expected_date and delivery_status in OPEN_DELIVERY_STATUSES:
+        return (now - expected_date).days
+    return None
+
 class Delivery(db.Model):
     """Delivery model for tracking material deliveries"""
     __tablename__ = 'deliveries'
+    __table_args__ = (
+        # Hot filters of the dashboard, analytics and n8n queries (see migrations/add_query_indexes.py)
+        db.Index('ix_deliveries_po_id', 'po_id'),
+        db.Index('ix_deliveries_status_expected', 'delivery_status', 'expected_delivery_date'),
+        db.Index('ix_deliveries_delayed_status', 'is_delayed', 'delivery_status'),
+        db.Index('ix_deliveries_expected_delivery_date', 'expected_delivery_date'),
+        db.Index('ix_deliveries_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -50,25 +80,103 @@ class Delivery(db.Model):
     created_by = db.Column(db.String(100), default='Manual')
     updated_by = db.Column(db.String(100), default='Manual')
     
+    @hybrid_property
+    def is_late(self):
+        """True when the dates show a delay, whether or not is_delayed is stored yet"""
+        return calculate_delay_days(
+            self.expected_delivery_date, self.actual_delivery_date, self.delivery_status
+        ) is not None
+    
+    @is_late.expression
+    def is_late(cls):
+        return and_(
+            cls.expected_delivery_date.isnot(None),
+            or_(
+                and_(
+                    cls.actual_delivery_date.isnot(None),
+                    cls.actual_delivery_date > cls.expected_delivery_date
+                ),
+                and_(
+                    cls.actual_delivery_date.is_(None),
+                    cls.expected_delivery_date < datetime.utcnow(),
+                    cls.delivery_status.in_(OPEN_DELIVERY_STATUSES)
+                )
+            )
+        )
+    
+    def current_delay(self):
+        """Return (is_delayed, delay_days) as of now without modifying the row"""
+        delay_days = calculate_delay_days(
+            self.expected_delivery_date, self.actual_delivery_date, self.delivery_status
+        )
+        if delay_days is None:
+            return self.is_delayed, self.delay_days
+        return True, delay_days
+    
     def check_delay(self):
         """Check if delivery is delayed and calculate delay days"""
-        if self.expected_delivery_date:
-            today = datetime.utcnow()
-            if self.actual_delivery_date:
-                # Delivery completed - check if it was late
-                if self.actual_delivery_date > self.expected_delivery_date:
-                    self.is_delayed = True
-                    self.delay_days = (self.actual_delivery_date - self.expected_delivery_date).days
-                    # Don't change status - keep Delivered/Partial status
-            else:
-                # Delivery not completed yet - check if overdue
-                if today > self.expected_delivery_date and self.delivery_status in ['Pending', 'Partial']:
-                    self.is_delayed = True
-                    self.delay_days = (today - self.expected_delivery_date).days
-                    # Don't change status to 'Delayed' - just mark is_delayed flag
+        # Don't change status to 'Delayed' - just mark is_delayed flag
+        delay_days = calculate_delay_days(
+            self.expected_delivery_date, self.actual_delivery_date, self.delivery_status
+        )
+        if delay_days is not None:
+            self.is_delayed = True
+            self.delay_days = delay_days
+    
+    @staticmethod
+    def refresh_delay_flags():
+        """
+        Persist is_delayed/delay_days for late deliveries in one bulk UPDATE
+        
+        Only rows whose stored values differ from the calculated ones are written.
+        The caller commits.
+        
+        Returns:
+            List of {'id', 'po_id', 'is_delayed', 'delay_days'} for updated rows
+        """
+        now = datetime.utcnow()
+        candidates = db.session.query(
+            Delivery.id,
+            Delivery.po_id,
+            Delivery.expected_delivery_date,
+            Delivery.actual_delivery_date,
+            Delivery.delivery_status,
+            Delivery.is_delayed,
+            Delivery.delay_days
+        ).filter(Delivery.is_late).all()
+        
+        changed = []
+        for row in candidates:
+            delay_days = calculate_delay_days(
+                row.expected_delivery_date, row.actual_delivery_date, row.delivery_status, now
+            )
+            if delay_days is None:
+                continue
+            if not row.is_delayed or row.delay_days != delay_days:
+                changed.append({
+                    'id': row.id,
+                    'po_id': row.po_id,
+                    'is_delayed': True,
+                    'delay_days': delay_days
+                })
+        
+        if changed:
+            db.session.execute(
+                update(Delivery),
+                [{'id': c['id'], 'is_delayed': True, 'delay_days': c['delay_days']} for c in changed]
+            )
+        
+        return changed
+    
+    @staticmethod
+    def serialize_options():
+        """Loader options for the relations to_dict() reads (one query for any number of rows)"""
+        from models.purchase_order import PurchaseOrder
+        return [joinedload(Delivery.purchase_order).joinedload(PurchaseOrder.material)]
     
     def to_dict(self):
         """Convert model to dictionary"""
+        is_delayed, delay_days = self.current_delay()
         result = {
             'id': self.id,
             'po_id': self.po_id,
@@ -80,9 +188,9 @@ class Delivery(db.Model):
             'carrier': self.carrier,
             'delivery_location': self.delivery_location,
             'received_by': self.received_by,
-            'is_delayed': self.is_delayed,
+            'is_delayed': is_delayed,
             'delay_reason': self.delay_reason,
-            'delay_days': self.delay_days,
+            'delay_days': delay_days,
             'notes': self.notes,
             'delivery_note_path': self.delivery_note_path,
             'extracted_data': self.extracted_data,
@@ -0,0 +1,42 @@
+"""
+Extraction Cache Model
+PDF text and n8n extraction results keyed by document content hash, so a
+document uploaded again is not re-extracted
+"""
+from datetime import datetime
+from models import db
+
+
+class ExtractionCacheEntry(db.Model):
+    """One cached extraction of a document's content"""
+    __tablename__ = 'extraction_cache'
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'kind', 'prompt_version', name='uq_extraction_cache_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the file
+    kind = db.Column(db.String(50), nullable=False)  # pdf_text, purchase_order, delivery, invoice
+    prompt_version = db.Column(db.String(50), nullable=False)  # Extraction prompt the result came from
+    result = db.Column(db.JSON, nullable=False)
+
+    # Usage
+    hit_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_hit_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'content_hash': self.content_hash,
+            'kind': self.kind,
+            'prompt_version': self.prompt_version,
+            'result': self.result,
+            'hit_count': self.hit_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_hit_at': self.last_hit_at.isoformat() if self.last_hit_at else None
+        }
+
+    def __repr__(self):
+        return f'<ExtractionCacheEntry {self.kind} {self.content_hash[:12]} v{self.prompt_version}>'
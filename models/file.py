@@ -8,6 +8,13 @@ from models import db
 class File(db.Model):
     """Model for uploaded files (POs, Invoices, Delivery Notes)"""
     __tablename__ = 'files'
+    __table_args__ = (
+        # Processing queue and file list queries (see migrations/add_query_indexes.py)
+        db.Index('ix_files_status_uploaded_at', 'processing_status', 'uploaded_at'),
+        db.Index('ix_files_type_uploaded_at', 'file_type', 'uploaded_at'),
+        db.Index('ix_files_uploaded_at', 'uploaded_at'),
+        db.Index('ix_files_purchase_order_id', 'purchase_order_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
@@ -16,6 +23,7 @@ class File(db.Model):
     file_type = db.Column(db.String(50), nullable=False)  # 'purchase_order', 'invoice', 'delivery_note', 'other'
     file_size = db.Column(db.Integer, nullable=False)  # Size in bytes
     mime_type = db.Column(db.String(100))
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256; files with equal hashes share one blob
     
     # Processing status
     processing_status = db.Column(db.String(50), default='uploaded')  # 'uploaded', 'processing', 'completed', 'failed'
@@ -53,6 +61,8 @@ class File(db.Model):
             'file_type': self.file_type,
             'file_size': self.file_size,
             'mime_type': self.mime_type,
+            'content_hash': self.content_hash,
+            'thumbnail_url': self.thumbnail_url,
             'processing_status': self.processing_status,
             'extracted_data': self.extracted_data,
             'extraction_confidence': self.extraction_confidence,
@@ -76,6 +86,13 @@ class File(db.Model):
         """Get URL to download the file"""
         return f'/uploads/{self.filename}'
     
+    @property
+    def thumbnail_url(self):
+        """Get URL of the first-page thumbnail (PDFs and images only)"""
+        if self.file_path.rsplit('.', 1)[-1].lower() in ('pdf', 'png', 'jpg', 'jpeg'):
+            return f'/api/files/{self.id}/thumbnail'
+        return None
+    
     @staticmethod
     def get_pending_processing():
         """Get all files awaiting AI processing"""
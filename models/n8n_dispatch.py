@@ -0,0 +1,59 @@
+"""
+n8n Dispatch Model
+Outbox of n8n webhook calls, committed with the data that triggers them and
+delivered by the background dispatcher
+"""
+from datetime import datetime
+from models import db
+
+
+class N8nDispatch(db.Model):
+    """One pending or delivered n8n webhook call"""
+    __tablename__ = 'n8n_dispatches'
+    __table_args__ = (
+        db.Index('ix_n8n_dispatches_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_n8n_dispatches_dedupe_key', 'dedupe_key'),
+        # At most one pending row per key, so concurrent enqueues cannot both insert
+        db.Index('uq_n8n_dispatches_pending_dedupe', 'dedupe_key', 'webhook', unique=True,
+                 sqlite_where=db.text("status = 'pending'"), postgresql_where=db.text("status = 'pending'")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Request
+    webhook = db.Column(db.String(100), nullable=False)  # Path under /webhook/, e.g. extract-document
+    payload = db.Column(db.JSON, nullable=False)
+    dedupe_key = db.Column(db.String(200))  # Pending rows with the same key are coalesced
+
+    # Delivery state
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    coalesced_count = db.Column(db.Integer, default=0, nullable=False)  # Later enqueues merged into this row
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(db.DateTime)  # When a dispatcher started sending
+    last_status_code = db.Column(db.Integer)
+    last_error = db.Column(db.Text)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'webhook': self.webhook,
+            'payload': self.payload,
+            'dedupe_key': self.dedupe_key,
+            'status': self.status,
+            'attempts': self.attempts,
+            'coalesced_count': self.coalesced_count,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_status_code': self.last_status_code,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+    def __repr__(self):
+        return f'<N8nDispatch {self.id} {self.webhook} ({self.status})>'
@@ -1,9 +1,20 @@
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from models import db
 
 class Payment(db.Model):
     """Payment model for tracking payments against POs"""
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Hot filters of the dashboard, analytics and n8n queries (see migrations/add_query_indexes.py)
+        db.Index('ix_payments_po_id', 'po_id'),
+        db.Index('ix_payments_status_po_id', 'payment_status', 'po_id'),
+        db.Index('ix_payments_payment_date', 'payment_date'),
+        db.Index('ix_payments_created_at', 'created_at'),
+        # DataProcessingAgent duplicate lookups by reference
+        db.Index('ix_payments_invoice_ref', 'invoice_ref'),
+        db.Index('ix_payments_payment_ref', 'payment_ref'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -52,6 +63,11 @@ class Payment(db.Model):
         else:
             self.payment_percentage = 0
     
+    @staticmethod
+    def serialize_options():
+        """Loader options for the relations to_dict() reads (one query for any number of rows)"""
+        return [joinedload(Payment.purchase_order)]
+    
     def to_dict(self):
         """Convert model to dictionary"""
         return {
@@ -0,0 +1,49 @@
+"""
+PDF Extraction Job Model
+Tracks text extraction of large PDFs that run off the request thread
+"""
+from datetime import datetime
+from models import db
+
+
+class PdfExtractionJob(db.Model):
+    """One background PDF text extraction"""
+    __tablename__ = 'pdf_extraction_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), unique=True, nullable=False, index=True)
+    file_id = db.Column(db.Integer, nullable=True)  # File the PDF came from, when known
+
+    # Progress
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, completed, failed
+    num_pages = db.Column(db.Integer, nullable=False)
+    pages_done = db.Column(db.Integer, default=0, nullable=False)  # Leading pages already extracted, in order
+
+    # Result
+    text = db.Column(db.Text)
+    error = db.Column(db.Text)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+
+    def to_dict(self, include_text=True):
+        """Convert model to dictionary"""
+        data = {
+            'job_id': self.job_id,
+            'file_id': self.file_id,
+            'status': self.status,
+            'num_pages': self.num_pages,
+            'pages_done': self.pages_done,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+        if include_text and self.status == 'completed':
+            data['text'] = self.text
+        return data
+
+    def __repr__(self):
+        return f'<PdfExtractionJob {self.job_id} ({self.status} {self.pages_done}/{self.num_pages})>'
@@ -1,9 +1,19 @@
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from models import db
 
 class PurchaseOrder(db.Model):
     """Purchase Order model for tracking POs"""
     __tablename__ = 'purchase_orders'
+    __table_args__ = (
+        # Hot filters of the dashboard, analytics and n8n queries (see migrations/add_query_indexes.py)
+        db.Index('ix_purchase_orders_supplier_po_date', 'supplier_name', 'po_date'),
+        db.Index('ix_purchase_orders_status_supplier', 'po_status', 'supplier_name'),
+        db.Index('ix_purchase_orders_po_date', 'po_date'),
+        db.Index('ix_purchase_orders_material_id', 'material_id'),
+        # DataProcessingAgent duplicate candidates: same material, date window, amount window
+        db.Index('ix_purchase_orders_material_po_date_amount', 'material_id', 'po_date', 'total_amount'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     
@@ -45,6 +55,11 @@ class PurchaseOrder(db.Model):
     deliveries = db.relationship('Delivery', backref='purchase_order', lazy=True, cascade='all, delete-orphan')
     files = db.relationship('File', backref='po_parent', lazy=True, cascade='all, delete-orphan', foreign_keys='File.purchase_order_id')
     
+    @staticmethod
+    def serialize_options():
+        """Loader options for the relations to_dict() reads (one query for any number of rows)"""
+        return [joinedload(PurchaseOrder.material)]
+    
     def to_dict(self):
         """Convert model to dictionary"""
         return {
@@ -0,0 +1,52 @@
+"""
+Upload Session Model
+Resumable chunked uploads: the file is staged chunk by chunk and becomes a
+File record when the upload is completed
+"""
+from datetime import datetime
+from models import db
+
+
+class UploadSession(db.Model):
+    """One chunked upload in progress"""
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(32), unique=True, nullable=False, index=True)
+
+    # Declared up front and validated at init
+    original_filename = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)  # Total bytes expected
+    mime_type = db.Column(db.String(100))
+    file_type = db.Column(db.String(50), default='other')  # Same values as File.file_type
+    entity_type = db.Column(db.String(50))  # material, purchase_order, payment, delivery
+    entity_id = db.Column(db.Integer)
+    uploaded_by = db.Column(db.String(100))
+
+    # Progress
+    status = db.Column(db.String(20), default='open', nullable=False)  # open, completed, aborted
+    received_bytes = db.Column(db.BigInteger, default=0, nullable=False)  # Chunks are appended in order
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id'))  # Set on completion
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'session_id': self.session_id,
+            'original_filename': self.original_filename,
+            'file_size': self.file_size,
+            'mime_type': self.mime_type,
+            'file_type': self.file_type,
+            'status': self.status,
+            'received_bytes': self.received_bytes,
+            'file_id': self.file_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+    def __repr__(self):
+        return f'<UploadSession {self.session_id} {self.received_bytes}/{self.file_size} ({self.status})>'
@@ -2,14 +2,17 @@
 AGENTS API - Endpoints for AI/Data Processing Agents
 Sprint 1: Data Processing Agent endpoints
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from functools import wraps
 from models import db
 from services.data_processing_agent import DataProcessingAgent
+import json
 import os
 
 agents_bp = Blueprint('agents', __name__)
 
+STREAM_MAX_WAIT = 0.25  # Seconds a streamed chunk waits for more records before its results are written
+
 
 # ============================================================================
 # SECURITY DECORATOR
@@ -229,6 +232,10 @@ def validate_and_check_batch():
     Batch validation for multiple records at once
     Useful for bulk imports or AI-extracted documents
     
+    Referenced POs, payments and duplicate candidates are prefetched for the
+    whole batch, and records are also checked for duplicates of each other
+    (match_type 'Duplicate In Batch' / 'Similar In Batch', with batch_index).
+    
     Request Body:
     {
         "records": [
@@ -284,61 +291,13 @@ def validate_and_check_batch():
                 'message': 'records must be an array'
             }), 400
         
-        # Initialize agent
+        # Validate the whole batch against shared, prefetched lookups
         agent = DataProcessingAgent(db.session)
-        
-        # Process each record
-        results = []
-        summary = {
-            'total': len(records),
-            'valid': 0,
-            'invalid': 0,
-            'duplicates_found': 0
-        }
-        
-        for idx, record in enumerate(records):
-            try:
-                if 'record_type' not in record or 'data' not in record:
-                    results.append({
-                        'index': idx,
-                        'success': False,
-                        'error': 'Missing record_type or data'
-                    })
-                    summary['invalid'] += 1
-                    if stop_on_error:
-                        break
-                    continue
-                
-                result = agent.process_data(
-                    record_type=record['record_type'],
-                    data=record['data'],
-                    check_duplicates=check_duplicates,
-                    match_invoice_to_lpo=record.get('match_invoice_to_lpo', False)
-                )
-                
-                results.append({
-                    'index': idx,
-                    'success': True,
-                    **result
-                })
-                
-                if result['is_valid']:
-                    summary['valid'] += 1
-                else:
-                    summary['invalid'] += 1
-                
-                if result.get('duplicates'):
-                    summary['duplicates_found'] += len(result['duplicates'])
-                
-            except Exception as e:
-                results.append({
-                    'index': idx,
-                    'success': False,
-                    'error': str(e)
-                })
-                summary['invalid'] += 1
-                if stop_on_error:
-                    break
+        results, summary = agent.process_batch(
+            records,
+            check_duplicates=check_duplicates,
+            stop_on_error=stop_on_error
+        )
         
         processing_time_ms = int((time.time() - start_time) * 1000)
         
@@ -357,3 +316,82 @@ def validate_and_check_batch():
             'error': 'Batch processing failed',
             'message': str(e)
         }), 500
+
+
+@agents_bp.route('/validate-and-check/stream', methods=['POST'])
+@require_api_key
+def validate_and_check_stream():
+    """
+    Streaming batch validation for large imports
+    
+    Reads the records as NDJSON (one JSON record per line) while they are
+    uploaded and writes one NDJSON result line per record as soon as it is
+    validated, then a summary line. Records are prefetched and validated in
+    chunks, so memory does not grow with the size of the import; a chunk is
+    cut early when its records trickle in, so results keep flowing while a
+    slow upload is still sending.
+    
+    Query params: check_duplicates (default true), stop_on_error (default false)
+    
+    Request Body (Content-Type: application/x-ndjson):
+    {"record_type": "lpo_release", "data": {...}}
+    {"record_type": "invoice", "data": {...}, "match_invoice_to_lpo": true}
+    
+    Response (application/x-ndjson):
+    {"index": 0, "success": true, "is_valid": true, ...}
+    {"index": 1, "success": false, "error": "Invalid JSON on line 2: ..."}
+    {"success": true, "summary": {"total": 2, "valid": 1, "invalid": 1, "duplicates_found": 0}, "processing_time_ms": 12}
+    
+    Results are the same as /validate-and-check/batch, including in-batch
+    duplicates against every earlier record of the stream.
+    """
+    import time
+    start_time = time.time()
+    
+    check_duplicates = request.args.get('check_duplicates', 'true').lower() == 'true'
+    stop_on_error = request.args.get('stop_on_error', 'false').lower() == 'true'
+    agent = DataProcessingAgent(db.session)
+    
+    def generate():
+        summary = agent.new_summary()
+        try:
+            for result in agent.process_stream(
+                _ndjson_records(request.stream),
+                check_duplicates=check_duplicates,
+                stop_on_error=stop_on_error,
+                max_wait=STREAM_MAX_WAIT
+            ):
+                summary['total'] += 1
+                agent.add_to_summary(summary, result)
+                yield current_app.json.dumps(result) + '\n'
+                
+            yield current_app.json.dumps({
+                'success': True,
+                'summary': summary,
+                'processing_time_ms': int((time.time() - start_time) * 1000)
+            }) + '\n'
+            
+        except Exception as e:
+            # Headers are already sent: report the failure as the last line
+            current_app.logger.error(f"Stream validation error: {str(e)}")
+            yield current_app.json.dumps({
+                'success': False,
+                'error': 'Batch processing failed',
+                'message': str(e),
+                'summary': summary
+            }) + '\n'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'  # Let nginx pass result lines through as they are written
+    return response
+
+
+def _ndjson_records(stream):
+    """Records of an NDJSON body, one line at a time; a line that does not parse becomes a ValueError"""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f'Invalid JSON on line {line_number}: {e}')
@@ -4,6 +4,7 @@ Provides API endpoints for advanced analytics and business intelligence
 """
 from flask import Blueprint, render_template, jsonify, request
 from services.analytics_service import AnalyticsService
+from services.analytics_snapshot_service import AnalyticsSnapshotService
 from datetime import datetime
 
 analytics_bp = Blueprint('analytics', __name__, url_prefix='/analytics')
@@ -160,28 +161,37 @@ def executive_summary():
 def dashboard_data():
     """
     Get all analytics data for dashboard in one call
-    Optimized for dashboard loading
+    Served from the materialized analytics snapshot
+    
+    Query Parameters:
+        date_range_days (optional): Number of days to analyze (default: 180)
+        refresh (optional): 'true' to rebuild the snapshot from scratch
     """
     try:
         date_range_days = int(request.args.get('date_range_days', 180))
+        force_refresh = request.args.get('refresh', 'false').lower() == 'true'
         
-        # Get all analytics in parallel
-        executive = AnalyticsService.get_executive_summary()
-        supplier_perf = AnalyticsService.get_supplier_performance(date_range_days=date_range_days)
-        predictions = AnalyticsService.predict_delivery_delays()
-        financial = AnalyticsService.get_financial_analytics(date_range_days=date_range_days)
-        delivery = AnalyticsService.get_delivery_intelligence(date_range_days=date_range_days)
+        snapshot = AnalyticsSnapshotService.get_dashboard_data(
+            date_range_days=date_range_days,
+            force_refresh=force_refresh
+        )
+        data = snapshot.data
         
         return jsonify({
             'success': True,
             'data': {
-                'executive_summary': executive,
-                'supplier_performance': supplier_perf[:10],  # Top 10 suppliers
-                'delay_predictions': predictions[:10],  # Top 10 risks
-                'financial_analytics': financial,
-                'delivery_intelligence': delivery
+                'executive_summary': data['executive_summary'],
+                'supplier_performance': data['supplier_performance'][:10],  # Top 10 suppliers
+                'delay_predictions': data['delay_predictions'][:10],  # Top 10 risks
+                'financial_analytics': data['financial_analytics'],
+                'delivery_intelligence': data['delivery_intelligence']
             },
-            'generated_at': datetime.utcnow().isoformat()
+            'generated_at': snapshot.refreshed_at.isoformat(),
+            'snapshot': {
+                'generated_at': snapshot.generated_at.isoformat(),
+                'refreshed_at': snapshot.refreshed_at.isoformat(),
+                'age_seconds': round((datetime.utcnow() - snapshot.refreshed_at).total_seconds(), 1)
+            }
         })
     except Exception as e:
         return jsonify({
@@ -6,10 +6,11 @@ from models.file import File
 from models.purchase_order import PurchaseOrder
 from models.delivery import Delivery
 from models.payment import Payment
+from routes.uploads import start_extraction, queue_previews
+from services.content_store import ContentStore
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import os
-import requests
 
 chat_bp = Blueprint('chat', __name__)
 chat_service = ChatService()
@@ -18,15 +19,6 @@ conversational_service = ConversationalChatService()
 # Configuration for file uploads
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads')
 
-def get_upload_path():
-    """Get organized upload path by year/month"""
-    now = datetime.now()
-    year = now.strftime('%Y')
-    month = now.strftime('%m')
-    path = os.path.join(UPLOAD_FOLDER, year, month)
-    os.makedirs(path, exist_ok=True)
-    return path, f"{year}/{month}"
-
 @chat_bp.route('', methods=['POST'])
 def chat():
     """Handle natural language chat queries and conversational data entry"""
@@ -161,20 +153,16 @@ def chat_upload():
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"chat_{doc_type}_{entity_id}_{timestamp}_{filename}"
         
-        # Get organized upload path
-        upload_path, relative_path = get_upload_path()
-        file_path = os.path.join(upload_path, filename)
-        
-        # Save file
-        file.save(file_path)
-        file_size = os.path.getsize(file_path)
+        # Save into the content-addressed store (hashed while streaming; identical files share one blob)
+        stored = ContentStore.save(file.stream, UPLOAD_FOLDER, file_ext)
         
         # Create File record
         file_record = File(
             filename=filename,
             original_filename=file.filename,
-            file_path=os.path.join(relative_path, filename),
-            file_size=file_size,
+            file_path=stored['file_path'],
+            file_size=stored['file_size'],
+            content_hash=stored['content_hash'],
             file_type=file_ext,
             mime_type=file.content_type,
             processing_status='pending',
@@ -190,59 +178,41 @@ def chat_upload():
             file_record.payment_id = entity_id
         
         db.session.add(file_record)
-        db.session.commit()
+        db.session.flush()
         
-        # Trigger n8n workflow for AI extraction
-        n8n_triggered = False
-        try:
-            n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL', 'https://n8n1.trart.uk')
-            n8n_api_key = os.getenv('N8N_API_KEY', '')
-            
-            file_url = f"http://localhost:5001/uploads/{filename}"
-            
-            webhook_payload = {
-                'file_id': file_record.id,
-                'file_url': file_url,
-                'file_path': file_record.file_path,
-                'document_context': doc_type,
-                'user_message': user_message,
-                'source': 'chat_interface'
-            }
-            
-            # Add entity-specific fields
-            if doc_type == 'purchase_order':
-                webhook_payload['po_id'] = entity_id
-                webhook_payload['po_ref'] = entity_record.po_ref
-            elif doc_type == 'delivery_note':
-                webhook_payload['delivery_id'] = entity_id
-            elif doc_type == 'invoice':
-                webhook_payload['payment_id'] = entity_id
-            
-            response = requests.post(
-                f"{n8n_webhook_url}/webhook/extract-document",
-                json=webhook_payload,
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {n8n_api_key}'
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                n8n_triggered = True
-                print(f"✅ n8n document intelligence triggered from chat for {doc_type}")
-            else:
-                print(f"⚠️ n8n workflow trigger failed: {response.status_code}")
-                
-        except Exception as e:
-            print(f"⚠️ Could not trigger n8n workflow: {str(e)}")
+        # Queue the n8n workflow for AI extraction
+        file_url = f"http://localhost:5001/uploads/{filename}"
+        
+        webhook_payload = {
+            'file_id': file_record.id,
+            'file_url': file_url,
+            'file_path': file_record.file_path,
+            'document_context': doc_type,
+            'user_message': user_message,
+            'source': 'chat_interface'
+        }
+        
+        # Add entity-specific fields
+        if doc_type == 'purchase_order':
+            webhook_payload['po_id'] = entity_id
+            webhook_payload['po_ref'] = entity_record.po_ref
+        elif doc_type == 'delivery_note':
+            webhook_payload['delivery_id'] = entity_id
+        elif doc_type == 'invoice':
+            webhook_payload['payment_id'] = entity_id
+        
+        extraction = start_extraction(file_record, webhook_payload)
+        queue_previews(file_record, UPLOAD_FOLDER)
         
         # Format success response
         doc_type_display = doc_type.replace('_', ' ').title()
         message = f"✅ {doc_type_display} uploaded successfully!\n\n"
         message += f"📋 Reference: {entity_record.po_ref if doc_type == 'purchase_order' else entity_record.delivery_order_number if doc_type == 'delivery_note' else entity_record.invoice_ref}\n"
-        message += f"🤖 AI is processing your document...\n"
-        message += f"📊 Data will be extracted automatically"
+        if extraction['cached']:
+            message += f"♻️ This document was processed before - extracted data applied from cache"
+        else:
+            message += f"🤖 AI is processing your document...\n"
+            message += f"📊 Data will be extracted automatically"
         
         return jsonify({
             'success': True,
@@ -252,8 +222,10 @@ def chat_upload():
                 'file_id': file_record.id,
                 'file_name': file.filename,
                 'document_type': doc_type_display,
-                'processing_status': 'pending',
-                'n8n_triggered': n8n_triggered
+                'processing_status': extraction['status'],
+                'extraction_cached': extraction['cached'],
+                'n8n_triggered': extraction['dispatch_id'] is not None,
+                'dispatch_id': extraction['dispatch_id']
             }
         })
     
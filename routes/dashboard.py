@@ -5,7 +5,9 @@ from models.purchase_order import PurchaseOrder
 from models.delivery import Delivery
 from models.ai_suggestion import AISuggestion
 from models.payment import Payment
-from sqlalchemy import func, extract
+from services.dashboard_cache import DashboardCache
+from services.time_buckets import TimeBuckets
+from sqlalchemy import func, case
 from datetime import datetime, timedelta
 import calendar
 import os
@@ -65,121 +67,113 @@ def test_validation_page():
 
 @dashboard_bp.route('/api/dashboard/stats')
 def dashboard_stats():
-    """Get dashboard statistics"""
+    """Get dashboard statistics (cached for DASHBOARD_CACHE_TTL seconds)"""
     try:
-        # Material stats
-        total_materials = Material.query.count()
-        approved_materials = Material.query.filter_by(approval_status='Approved').count()
-        pending_materials = Material.query.filter_by(approval_status='Pending').count()
-        
-        # PO stats
-        total_pos = PurchaseOrder.query.count()
-        released_pos = PurchaseOrder.query.filter_by(po_status='Released').count()
-        
-        # Delivery stats
-        total_deliveries = Delivery.query.count()
-        pending_deliveries = Delivery.query.filter_by(delivery_status='Pending').count()
-        delayed_deliveries = Delivery.query.filter_by(is_delayed=True).count()
-        completed_deliveries = Delivery.query.filter_by(delivery_status='Completed').count()
-        
-        # AI suggestions stats
-        pending_suggestions = AISuggestion.query.filter_by(status='pending').count()
-        high_confidence_suggestions = AISuggestion.query.filter(
-            AISuggestion.status == 'pending',
-            AISuggestion.confidence_score >= 90
-        ).count()
-        
-        # Total PO value
-        total_po_value = db.session.query(func.sum(PurchaseOrder.total_amount)).scalar() or 0
-        
-        # AI Document Intelligence stats
-        total_extractions = Delivery.query.filter(
-            Delivery.extraction_status == 'completed'
-        ).count()
-        
-        # Count successful extractions (confidence >= 80%)
-        successful_extractions = Delivery.query.filter(
-            Delivery.extraction_status == 'completed',
-            Delivery.extraction_confidence >= 80
-        ).count()
-        
-        # Calculate success rate
-        success_rate = round((successful_extractions / total_extractions * 100), 1) if total_extractions > 0 else 0
-        
-        # Average confidence
-        avg_confidence = db.session.query(
-            func.avg(Delivery.extraction_confidence)
-        ).filter(
-            Delivery.extraction_status == 'completed'
-        ).scalar() or 0
-        avg_confidence = round(avg_confidence, 1)
-        
-        # Total items extracted
-        total_items = db.session.query(
-            func.sum(Delivery.extracted_item_count)
-        ).scalar() or 0
-        
-        return jsonify({
-            'materials_count': total_materials,
-            'materials': {
-                'total': total_materials,
-                'approved': approved_materials,
-                'pending': pending_materials
-            },
-            'purchase_orders_count': total_pos,
-            'purchase_orders': {
-                'total': total_pos,
-                'released': released_pos,
-                'total_value': total_po_value
-            },
-            'deliveries_count': total_deliveries,
-            'deliveries': {
-                'total': total_deliveries,
-                'pending': pending_deliveries,
-                'delayed': delayed_deliveries,
-                'completed': completed_deliveries
-            },
-            'payments_count': Payment.query.count(),
-            'ai_suggestions_count': pending_suggestions,
-            'ai_suggestions': {
-                'pending': pending_suggestions,
-                'high_confidence': high_confidence_suggestions
-            },
-            'ai_document_intelligence': {
-                'success_rate': success_rate,
-                'total_extractions': total_extractions,
-                'po_count': 0,  # Will be implemented when PO extraction is added
-                'invoice_count': 0,  # Will be implemented when invoice extraction is added
-                'delivery_count': total_extractions,
-                'avg_confidence': avg_confidence,
-                'total_items': int(total_items)
-            }
-        })
+        return jsonify(DashboardCache.get('stats', compute_dashboard_stats))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def compute_dashboard_stats():
+    """Dashboard statistics: one conditional-aggregate query per table"""
+    materials = get_material_counts()
+    pos = get_po_counts()
+    deliveries = get_delivery_counts()
+    suggestions = get_suggestion_counts()
+    payments_count = db.session.query(func.count(Payment.id)).scalar() or 0
+    
+    # AI Document Intelligence stats
+    total_extractions = deliveries['extracted']
+    success_rate = round((deliveries['extracted_confident'] / total_extractions * 100), 1) if total_extractions > 0 else 0
+    
+    return {
+        'materials_count': materials['total'],
+        'materials': {
+            'total': materials['total'],
+            'approved': materials['approved'],
+            'pending': materials['pending']
+        },
+        'purchase_orders_count': pos['total'],
+        'purchase_orders': {
+            'total': pos['total'],
+            'released': pos['released'],
+            'total_value': pos['total_value']
+        },
+        'deliveries_count': deliveries['total'],
+        'deliveries': {
+            'total': deliveries['total'],
+            'pending': deliveries['pending'],
+            'delayed': deliveries['delayed'],
+            'completed': deliveries['completed']
+        },
+        'payments_count': payments_count,
+        'ai_suggestions_count': suggestions['pending'],
+        'ai_suggestions': {
+            'pending': suggestions['pending'],
+            'high_confidence': suggestions['high_confidence']
+        },
+        'ai_document_intelligence': {
+            'success_rate': success_rate,
+            'total_extractions': total_extractions,
+            'po_count': 0,  # Will be implemented when PO extraction is added
+            'invoice_count': 0,  # Will be implemented when invoice extraction is added
+            'delivery_count': total_extractions,
+            'avg_confidence': round(deliveries['avg_confidence'] or 0, 1),
+            'total_items': int(deliveries['total_items'] or 0)
+        }
+    }
+
+def get_material_counts():
+    """Material totals by approval status in one query"""
+    row = db.session.query(
+        func.count(Material.id).label('total'),
+        func.count(case((Material.approval_status == 'Approved', 1))).label('approved'),
+        func.count(case((Material.approval_status == 'Pending', 1))).label('pending')
+    ).one()
+    return row._asdict()
+
+def get_po_counts():
+    """PO totals by status and total value in one query"""
+    row = db.session.query(
+        func.count(PurchaseOrder.id).label('total'),
+        func.coalesce(func.sum(PurchaseOrder.total_amount), 0).label('total_value'),
+        func.count(case((PurchaseOrder.po_status == 'Draft', 1))).label('draft'),
+        func.count(case((PurchaseOrder.po_status == 'Released', 1))).label('released'),
+        func.count(case((PurchaseOrder.po_status == 'In Progress', 1))).label('in_progress'),
+        func.count(case((PurchaseOrder.po_status == 'Completed', 1))).label('completed'),
+        func.count(case((PurchaseOrder.po_status == 'Cancelled', 1))).label('cancelled')
+    ).one()
+    return row._asdict()
+
+def get_delivery_counts():
+    """Delivery totals by status, delay and extraction results in one query"""
+    extracted = Delivery.extraction_status == 'completed'
+    row = db.session.query(
+        func.count(Delivery.id).label('total'),
+        func.count(case((Delivery.delivery_status == 'Pending', 1))).label('pending'),
+        func.count(case((Delivery.delivery_status == 'In Transit', 1))).label('in_transit'),
+        func.count(case((Delivery.delivery_status == 'Completed', 1))).label('completed'),
+        func.count(case((Delivery.is_delayed == True, 1))).label('delayed'),
+        func.count(case((extracted, 1))).label('extracted'),
+        func.count(case((extracted & (Delivery.extraction_confidence >= 80), 1))).label('extracted_confident'),
+        func.avg(case((extracted, Delivery.extraction_confidence))).label('avg_confidence'),
+        func.sum(Delivery.extracted_item_count).label('total_items')
+    ).one()
+    return row._asdict()
+
+def get_suggestion_counts():
+    """Pending AI suggestion counts in one query"""
+    pending = AISuggestion.status == 'pending'
+    row = db.session.query(
+        func.count(case((pending, 1))).label('pending'),
+        func.count(case((pending & (AISuggestion.confidence_score >= 90), 1))).label('high_confidence')
+    ).one()
+    return row._asdict()
+
 @dashboard_bp.route('/api/dashboard/analytics')
 def dashboard_analytics():
-    """Get analytics data for charts"""
+    """Get analytics data for charts (cached for DASHBOARD_CACHE_TTL seconds)"""
     try:
-        # Payment Trends (Last 6 months)
-        payment_trends = get_payment_trends()
-        
-        # Delivery Status Distribution
-        delivery_status = get_delivery_status_distribution()
-        
-        # Top Materials by Value
-        materials_by_type = get_top_materials()
-        
-        # PO Completion Rate
-        po_completion = get_po_completion_rate()
-        
-        return jsonify({
-            'payment_trends': payment_trends,
-            'delivery_status': delivery_status,
-            'materials_by_type': materials_by_type,
-            'po_completion': po_completion
-        })
+        return jsonify(DashboardCache.get('analytics', compute_dashboard_analytics))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -272,45 +266,52 @@ def n8n_status():
     
     return jsonify(status)
 
-def get_payment_trends():
-    """Get payment trends for the last 6 months"""
-    today = datetime.now()
-    labels = []
-    values = []
-    
-    for i in range(5, -1, -1):
-        # Calculate month
-        month = today.month - i
-        year = today.year
-        
-        if month <= 0:
-            month += 12
-            year -= 1
+def compute_dashboard_analytics():
+    """Chart data for the dashboard"""
+    return {
+        # Payment Trends (Last 6 months)
+        'payment_trends': get_payment_trends(),
         
-        # Get month name
-        month_name = calendar.month_abbr[month]
-        labels.append(month_name)
+        # Delivery Status Distribution
+        'delivery_status': get_delivery_status_distribution(),
         
-        # Sum payments for this month - use paid_amount field
-        total = db.session.query(func.sum(Payment.paid_amount)).filter(
-            extract('month', Payment.payment_date) == month,
-            extract('year', Payment.payment_date) == year
-        ).scalar() or 0
+        # Top Materials by Value
+        'materials_by_type': get_top_materials(),
         
-        values.append(float(total))
+        # PO Completion Rate
+        'po_completion': get_po_completion_rate()
+    }
+
+def get_payment_trends():
+    """Get payment trends for the last 6 months (one grouped query)"""
+    today = datetime.now()
+    
+    # First day of the month five months ago
+    start = TimeBuckets.period_start(today, 'month')
+    for _ in range(5):
+        start = TimeBuckets.period_start(start - timedelta(days=1), 'month')
+    
+    # Sum payments per month - use paid_amount field
+    series = TimeBuckets.series(
+        Payment.payment_date,
+        {'total': func.sum(Payment.paid_amount)},
+        start=start,
+        end=TimeBuckets.next_period_start(today, 'month'),
+        granularity='month'
+    )
+    
+    labels = [calendar.month_abbr[int(row['period'][5:7])] for row in series]
+    values = [float(row['total']) for row in series]
     
     return {'labels': labels, 'values': values}
 
 def get_delivery_status_distribution():
     """Get delivery status distribution"""
-    pending = Delivery.query.filter_by(delivery_status='Pending').count()
-    in_transit = Delivery.query.filter_by(delivery_status='In Transit').count()
-    completed = Delivery.query.filter_by(delivery_status='Completed').count()
-    delayed = Delivery.query.filter_by(is_delayed=True).count()
+    counts = get_delivery_counts()
     
     return {
         'labels': ['Pending', 'In Transit', 'Completed', 'Delayed'],
-        'values': [pending, in_transit, completed, delayed]
+        'values': [counts['pending'], counts['in_transit'], counts['completed'], counts['delayed']]
     }
 
 def get_top_materials():
@@ -337,16 +338,9 @@ def get_top_materials():
 
 def get_po_completion_rate():
     """Get PO completion metrics"""
-    total_pos = PurchaseOrder.query.count()
-    
-    # Count POs by status
-    draft = PurchaseOrder.query.filter_by(po_status='Draft').count()
-    released = PurchaseOrder.query.filter_by(po_status='Released').count()
-    in_progress = PurchaseOrder.query.filter_by(po_status='In Progress').count()
-    completed = PurchaseOrder.query.filter_by(po_status='Completed').count()
-    cancelled = PurchaseOrder.query.filter_by(po_status='Cancelled').count()
+    counts = get_po_counts()
     
     return {
         'labels': ['Draft', 'Released', 'In Progress', 'Completed', 'Cancelled'],
-        'values': [draft, released, in_progress, completed, cancelled]
+        'values': [counts['draft'], counts['released'], counts['in_progress'], counts['completed'], counts['cancelled']]
     }
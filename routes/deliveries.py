@@ -1,22 +1,39 @@
 from flask import Blueprint, request, jsonify
 from models import db
 from models.delivery import Delivery
+from models.purchase_order import PurchaseOrder
+from routes.list_query import ListQuery, ListQueryError, equals, boolean, related, date_from, date_to
 from datetime import datetime
+from sqlalchemy import or_
 
 deliveries_bp = Blueprint('deliveries', __name__)
 
+delivery_list = ListQuery(
+    Delivery,
+    filters={
+        'status': equals(Delivery.delivery_status),
+        'delivery_status': equals(Delivery.delivery_status),
+        'po_id': equals(Delivery.po_id, int),
+        'is_delayed': boolean(Delivery.is_delayed),
+        'supplier': related(Delivery.po_id, PurchaseOrder.id, PurchaseOrder.supplier_name),
+        'date_from': date_from(Delivery.expected_delivery_date),
+        'date_to': date_to(Delivery.expected_delivery_date)
+    },
+    sortable={
+        'expected_delivery_date': Delivery.expected_delivery_date,
+        'actual_delivery_date': Delivery.actual_delivery_date,
+        'created_at': Delivery.created_at
+    }
+)
+
 @deliveries_bp.route('', methods=['GET'])
 def get_deliveries():
-    """Get all deliveries"""
+    """Get deliveries (filterable; paginated when limit or cursor is given)"""
     try:
-        deliveries = Delivery.query.all()
-        
-        # Check for delays
-        for delivery in deliveries:
-            delivery.check_delay()
-        db.session.commit()
-        
-        return jsonify([delivery.to_dict() for delivery in deliveries])
+        # Delay status is calculated in to_dict(); flags are persisted by the scheduled refresh
+        return jsonify(delivery_list.respond(request.args))
+    except ListQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -24,9 +41,7 @@ def get_deliveries():
 def get_delivery(id):
     """Get a specific delivery"""
     try:
-        delivery = Delivery.query.get_or_404(id)
-        delivery.check_delay()
-        db.session.commit()
+        delivery = Delivery.query.options(*Delivery.serialize_options()).get_or_404(id)
         
         return jsonify(delivery.to_dict())
     except Exception as e:
@@ -36,7 +51,7 @@ def get_delivery(id):
 def get_pending_deliveries():
     """Get pending deliveries (for n8n integration)"""
     try:
-        deliveries = Delivery.query.filter(
+        deliveries = Delivery.query.options(*Delivery.serialize_options()).filter(
             Delivery.delivery_status.in_(['Pending', 'In Transit'])
         ).all()
         
@@ -48,7 +63,9 @@ def get_pending_deliveries():
 def get_delayed_deliveries():
     """Get delayed deliveries"""
     try:
-        deliveries = Delivery.query.filter_by(is_delayed=True).all()
+        deliveries = Delivery.query.options(*Delivery.serialize_options()).filter(
+            or_(Delivery.is_delayed == True, Delivery.is_late)
+        ).all()
         return jsonify([delivery.to_dict() for delivery in deliveries])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -163,10 +180,7 @@ def delete_delivery(id):
 def get_deliveries_by_po(po_id):
     """Get all deliveries for a specific PO"""
     try:
-        deliveries = Delivery.query.filter_by(po_id=po_id).all()
-        for delivery in deliveries:
-            delivery.check_delay()
-        db.session.commit()
+        deliveries = Delivery.query.options(*Delivery.serialize_options()).filter_by(po_id=po_id).all()
         
         return jsonify([delivery.to_dict() for delivery in deliveries])
     except Exception as e:
@@ -0,0 +1,291 @@
+"""
+List Query Module
+Shared filtering, sorting, field projection and keyset (cursor) pagination
+for the entity list endpoints
+
+Query parameters understood by every list endpoint:
+    <filter>=value       Filters declared per endpoint, comma-separated values match any
+    sort=field|-field    Sort field (prefix '-' for descending), default per endpoint
+    fields=a,b,c         Only return these keys of each item ('id' is always kept)
+    limit=N              Page size (max 500); turns on pagination
+    cursor=...           Opaque next_cursor from the previous page
+
+Without limit or cursor the endpoints keep returning their original,
+unpaginated payload so existing pages keep working.
+
+Rows are ordered by (sort column, id) and a page continues from the cursor
+with a row-value comparison, so it is an index range scan on the sort
+column. NULLs come last: a nullable sort column is read as the non-NULL rows
+first, then the NULL rows by id.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import select, tuple_, DateTime, Date
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class ListQueryError(ValueError):
+    """Raised for invalid list query parameters (reported as HTTP 400)"""
+
+
+# ==================== FILTER BUILDERS ====================
+
+def equals(column, cast=str):
+    """Filter on column equality; comma-separated values become IN (...)"""
+    def apply(query, value):
+        values = [_cast(cast, v.strip(), column) for v in value.split(',') if v.strip()]
+        if len(values) == 1:
+            return query.filter(column == values[0])
+        return query.filter(column.in_(values))
+    return apply
+
+
+def boolean(column):
+    """Filter on a boolean column ('true'/'false')"""
+    def apply(query, value):
+        return query.filter(column == _parse_bool(value))
+    return apply
+
+
+def date_from(column):
+    """Filter column >= date (ISO format)"""
+    def apply(query, value):
+        return query.filter(column >= _parse_datetime(value))
+    return apply
+
+
+def date_to(column):
+    """Filter column <= date (ISO format, date-only values include the whole day)"""
+    def apply(query, value):
+        parsed = _parse_datetime(value)
+        if len(value) == 10:
+            return query.filter(column < parsed + timedelta(days=1))
+        return query.filter(column <= parsed)
+    return apply
+
+
+def related(column, remote_id, remote_column, cast=str):
+    """Filter on a column of a related table, e.g. payments by PO supplier"""
+    def apply(query, value):
+        values = [_cast(cast, v.strip(), remote_column) for v in value.split(',') if v.strip()]
+        return query.filter(column.in_(select(remote_id).where(remote_column.in_(values))))
+    return apply
+
+
+# ==================== LIST QUERY ====================
+
+class ListQuery:
+    """Declares how one model's list endpoint can be filtered and sorted"""
+
+    def __init__(self, model, filters=None, sortable=None, default_sort='id'):
+        self.model = model
+        self.filters = filters or {}
+        self.sortable = {'id': model.id}
+        self.sortable.update(sortable or {})
+        self.default_sort = default_sort
+
+    @staticmethod
+    def is_paginated(args):
+        """True when the caller asked for a page"""
+        return 'limit' in args or 'cursor' in args
+
+    def respond(self, args, query=None, serialize=None):
+        """
+        Run the list query for a request
+
+        Returns:
+            Page dict when paginated, otherwise the plain list of items
+        """
+        if self.is_paginated(args):
+            return self.page(args, query, serialize)
+        return self.items(args, query, serialize)
+
+    def items(self, args, query=None, serialize=None):
+        """All matching items (filtered, sorted and projected, not paginated)"""
+        query, sort_key, descending = self._build(args, query)
+        return self._serialize(self._fetch(query, sort_key, descending), args, serialize)
+
+    def page(self, args, query=None, serialize=None):
+        """
+        One keyset page of matching items
+
+        Returns:
+            {'items', 'count', 'limit', 'has_more', 'next_cursor'}
+        """
+        limit = self._parse_limit(args.get('limit'))
+        query, sort_key, descending = self._build(args, query)
+
+        cursor = args.get('cursor')
+        position = self._decode_cursor(cursor, sort_key, descending) if cursor else None
+
+        rows = self._fetch(query, sort_key, descending, position, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = self._encode_cursor(sort_key, descending, rows[-1])
+
+        items = self._serialize(rows, args, serialize)
+        return {
+            'items': items,
+            'count': len(items),
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': next_cursor
+        }
+
+    # ==================== BUILDING ====================
+
+    def _build(self, args, query):
+        """Apply filters and check the sort; returns (query, sort_key, descending)"""
+        if query is None:
+            query = self.model.query
+
+        # Eager-load whatever to_dict() reads so serializing is a constant number of queries
+        serialize_options = getattr(self.model, 'serialize_options', None)
+        if serialize_options:
+            query = query.options(*serialize_options())
+
+        for name, apply_filter in self.filters.items():
+            value = args.get(name)
+            if value not in (None, ''):
+                query = apply_filter(query, value)
+
+        sort = args.get('sort') or self.default_sort
+        descending = sort.startswith('-')
+        sort_key = sort.lstrip('-')
+        if sort_key not in self.sortable:
+            raise ListQueryError(
+                f"Cannot sort by '{sort_key}'. Sortable fields: {', '.join(sorted(self.sortable))}"
+            )
+
+        return query, sort_key, descending
+
+    def _fetch(self, query, sort_key, descending, position=None, limit=None):
+        """
+        Rows in (sort column, id) order after position, NULL sort values last
+
+        Args:
+            position: (sort value, id) of the last row already returned, or None
+            limit: Maximum number of rows, or None for all
+        """
+        model_id = self.model.id
+        id_order = model_id.desc() if descending else model_id.asc()
+
+        if sort_key == 'id':
+            if position:
+                query = query.filter(model_id < position[1] if descending else model_id > position[1])
+            return self._limited(query.order_by(id_order), limit)
+
+        column = self.sortable[sort_key]
+        nullable = column.expression.nullable
+        rows = []
+
+        # Non-NULL block: ORDER BY and the row-value bound both match a (column, id) index
+        if not position or position[0] is not None:
+            values = query.filter(column.isnot(None)) if nullable else query
+            if position:
+                key = tuple_(column, model_id)
+                bound = (_cast(None, position[0], column), position[1])
+                values = values.filter(key < bound if descending else key > bound)
+            rows = self._limited(values.order_by(column.desc() if descending else column.asc(), id_order), limit)
+            if limit is not None and len(rows) >= limit:
+                return rows
+
+        # Trailing NULL block, an equality match on the same index
+        if nullable:
+            nulls = query.filter(column.is_(None))
+            if position and position[0] is None:
+                nulls = nulls.filter(model_id < position[1] if descending else model_id > position[1])
+            rows += self._limited(nulls.order_by(id_order), None if limit is None else limit - len(rows))
+
+        return rows
+
+    @staticmethod
+    def _limited(query, limit):
+        return (query if limit is None else query.limit(limit)).all()
+
+    def _decode_cursor(self, cursor, sort_key, descending):
+        """(sort value, id) of the row a cursor points after"""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            cursor_sort, cursor_desc, value, last_id = payload
+        except (ValueError, TypeError):
+            raise ListQueryError('Invalid cursor')
+
+        if cursor_sort != sort_key or cursor_desc != descending:
+            raise ListQueryError('Cursor does not match the requested sort order')
+
+        return value, last_id
+
+    def _encode_cursor(self, sort_key, descending, row):
+        """Opaque cursor for the position just after row"""
+        value = getattr(row, self.sortable[sort_key].key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        payload = json.dumps([sort_key, descending, value, row.id])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    # ==================== SERIALIZING ====================
+
+    @staticmethod
+    def _serialize(rows, args, serialize):
+        """to_dict() each row and apply the fields= projection"""
+        serialize = serialize or (lambda row: row.to_dict())
+        items = [serialize(row) for row in rows]
+
+        fields = args.get('fields')
+        if fields:
+            wanted = {f.strip() for f in fields.split(',') if f.strip()} | {'id'}
+            items = [{k: v for k, v in item.items() if k in wanted} for item in items]
+
+        return items
+
+    @staticmethod
+    def _parse_limit(value):
+        """Page size from the limit parameter"""
+        if value in (None, ''):
+            return DEFAULT_LIMIT
+        try:
+            limit = int(value)
+        except ValueError:
+            raise ListQueryError('limit must be an integer')
+        if limit < 1:
+            raise ListQueryError('limit must be at least 1')
+        return min(limit, MAX_LIMIT)
+
+
+# ==================== PARSING HELPERS ====================
+
+def _parse_bool(value):
+    """Parse 'true'/'false' style flags"""
+    lowered = str(value).lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ListQueryError(f"Invalid boolean value '{value}'")
+
+
+def _parse_datetime(value):
+    """Parse an ISO date or datetime"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ListQueryError(f"Invalid date '{value}', expected ISO format (YYYY-MM-DD)")
+
+
+def _cast(cast, value, column):
+    """Convert a parameter value to the column's Python type"""
+    if cast is None:
+        if isinstance(column.type, (DateTime, Date)):
+            return _parse_datetime(value)
+        return value
+    try:
+        return cast(value)
+    except ValueError:
+        raise ListQueryError(f"Invalid value '{value}' for {column.key}")
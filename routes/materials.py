@@ -2,16 +2,34 @@ from flask import Blueprint, request, jsonify
 from models import db
 from models.material import Material
 from config import Config
+from routes.list_query import ListQuery, ListQueryError, equals, date_from, date_to
 from datetime import datetime
 
 materials_bp = Blueprint('materials', __name__)
 
+material_list = ListQuery(
+    Material,
+    filters={
+        'status': equals(Material.approval_status),
+        'approval_status': equals(Material.approval_status),
+        'material_type': equals(Material.material_type),
+        'date_from': date_from(Material.created_at),
+        'date_to': date_to(Material.created_at)
+    },
+    sortable={
+        'created_at': Material.created_at,
+        'approval_date': Material.approval_date,
+        'material_type': Material.material_type
+    }
+)
+
 @materials_bp.route('', methods=['GET'])
 def get_materials():
-    """Get all materials"""
+    """Get materials (filterable; paginated when limit or cursor is given)"""
     try:
-        materials = Material.query.all()
-        return jsonify([material.to_dict() for material in materials])
+        return jsonify(material_list.respond(request.args))
+    except ListQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
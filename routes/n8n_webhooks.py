@@ -4,7 +4,7 @@ API endpoints for n8n automation workflows
 All endpoints require API key authentication
 """
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, url_for
 from models import db
 from models.ai_suggestion import AISuggestion
 from models.material import Material
@@ -13,11 +13,13 @@ from models.delivery import Delivery
 from models.payment import Payment
 from models.file import File
 from routes.auth import require_api_key
+from services.pdf_extraction import PdfExtractionService, PdfExtractionError
+from services.extraction_cache import ExtractionCache
+from services.content_store import ContentStore
 from datetime import datetime
+import hashlib
 import json
 import os
-import PyPDF2
-import io
 
 n8n_bp = Blueprint('n8n', __name__)
 
@@ -326,6 +328,31 @@ def get_n8n_stats():
         }), 500
 
 
+@n8n_bp.route('/dispatch-metrics', methods=['GET'])
+@require_api_key
+def get_dispatch_metrics():
+    """
+    Get outbox metrics for outgoing n8n webhook calls.
+    
+    Returns:
+        200: Queue depth, oldest pending age and delivery latency
+    """
+    try:
+        from services.n8n_dispatcher import N8nDispatcher
+        
+        return jsonify({
+            'success': True,
+            'metrics': N8nDispatcher.metrics(),
+            'timestamp': datetime.now().isoformat()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'error': 'Failed to fetch dispatch metrics',
+            'message': str(e)
+        }), 500
+
+
 @n8n_bp.route('/health', methods=['GET'])
 def health_check():
     """
@@ -349,9 +376,12 @@ def receive_delivery_extraction():
     Sprint 2: Receive extracted delivery data from n8n + Claude API workflow.
     Enhanced with confidence-based validation - only auto-saves if confidence ≥ 90%
     """
+    return apply_delivery_extraction(request.get_json())
+
+
+def apply_delivery_extraction(data):
+    """Apply an extraction result to its delivery (from n8n or the extraction cache)"""
     try:
-        data = request.get_json()
-        
         # Validate required fields
         required_fields = ['delivery_id', 'extraction_status']
         missing_fields = [field for field in required_fields if field not in data]
@@ -375,6 +405,7 @@ def receive_delivery_extraction():
         if 'extracted_data' in data and data['extracted_data']:
             extracted = data['extracted_data']
             delivery.extracted_data = extracted
+            _record_extraction(data, 'delivery', File.delivery_id == delivery.id)
             
             # Check if confidence is HIGH (≥ 90%) - auto-apply
             if confidence_score >= 90:
@@ -550,13 +581,27 @@ def download_file_for_n8n(file_id):
 @require_api_key
 def extract_pdf_text():
     """
-    Extract text from PDF file sent as base64.
+    Extract text from a PDF file.
     Used by n8n to extract text from PDF documents.
     
-    Request body:
+    The PDF can be sent three ways:
+        - Raw body with Content-Type: application/pdf (file_id and wait as
+          query parameters)
+        - multipart/form-data with the PDF in a "file" part (file_id and
+          wait as form fields)
+        - JSON with the PDF base64 encoded (original format, holds several
+          copies of the document in memory; prefer the two above for large
+          files)
+    
+    PDFs up to PDF_SYNC_MAX_PAGES pages are answered directly; larger ones
+    are extracted in the background and return a job id to poll at
+    /api/n8n/extract-pdf-jobs/<job_id>.
+    
+    JSON request body:
         {
             "file_data": "base64_encoded_pdf_data",
-            "file_id": 1 (optional)
+            "file_id": 1 (optional),
+            "wait": false (optional, extract synchronously whatever the size)
         }
     
     Returns:
@@ -565,9 +610,18 @@ def extract_pdf_text():
             "text": "extracted text",
             "num_pages": 5
         }
+        202: {
+            "success": true,
+            "status": "queued",
+            "job_id": "...",
+            "num_pages": 200
+        }
         400: Invalid request
     """
     try:
+        if request.mimetype in ('application/pdf', 'multipart/form-data'):
+            return _extract_streamed_pdf()
+        
         data = request.get_json()
         
         if not data or 'file_data' not in data:
@@ -580,29 +634,31 @@ def extract_pdf_text():
         import base64
         file_data = data['file_data']
         
-        # Decode base64 to bytes
+        # Decode base64 to bytes and spool to disk for the extraction workers
         pdf_bytes = base64.b64decode(file_data)
+        pdf_path = PdfExtractionService.spool(pdf_bytes)
         
-        # Create file-like object
-        pdf_file = io.BytesIO(pdf_bytes)
-        
-        # Extract text using PyPDF2
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        extracted_text = ""
-        num_pages = len(pdf_reader.pages)
+        result = PdfExtractionService.extract(
+            pdf_path, file_id=data.get('file_id'), owns_file=True, wait=bool(data.get('wait')),
+            content_hash=hashlib.sha256(pdf_bytes).hexdigest()
+        )
         
-        for page_num in range(num_pages):
-            page = pdf_reader.pages[page_num]
-            extracted_text += page.extract_text() + "\n\n"
+        if 'job' in result:
+            return _extraction_job_response(result['job'])
         
         return jsonify({
             'success': True,
-            'text': extracted_text.strip(),
-            'num_pages': num_pages,
-            'file_id': data.get('file_id')
+            'text': result['text'],
+            'num_pages': result['num_pages'],
+            'file_id': data.get('file_id'),
+            'cached': result.get('cached', False)
         }), 200
         
+    except PdfExtractionError as e:
+        return jsonify({
+            'error': 'Failed to extract PDF text',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'error': 'Failed to extract PDF text',
@@ -610,6 +666,39 @@ def extract_pdf_text():
         }), 500
 
 
+def _extract_streamed_pdf():
+    """extract-pdf-text for raw application/pdf and multipart bodies, spooled to disk in chunks"""
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({
+                'error': 'Missing file in multipart body',
+                'message': 'Please send the PDF in a form part named "file"'
+            }), 400
+        stream, params = upload.stream, request.form
+    else:
+        stream, params = request.stream, request.args
+    
+    file_id = params.get('file_id', type=int)
+    pdf_path, content_hash = PdfExtractionService.spool_stream(stream)
+    
+    result = PdfExtractionService.extract(
+        pdf_path, file_id=file_id, owns_file=True,
+        wait=params.get('wait', 'false').lower() == 'true', content_hash=content_hash
+    )
+    
+    if 'job' in result:
+        return _extraction_job_response(result['job'])
+    
+    return jsonify({
+        'success': True,
+        'text': result['text'],
+        'num_pages': result['num_pages'],
+        'file_id': file_id,
+        'cached': result.get('cached', False)
+    }), 200
+
+
 @n8n_bp.route('/extract-pdf-from-file/<int:file_id>', methods=['GET'])
 @require_api_key
 def extract_pdf_from_file_id(file_id):
@@ -626,6 +715,9 @@ def extract_pdf_from_file_id(file_id):
     URL Parameters:
         file_id: The database ID of the file to extract
     
+    Query Parameters:
+        wait: true to extract synchronously whatever the size
+    
     Returns:
         200: {
             "success": true,
@@ -633,6 +725,8 @@ def extract_pdf_from_file_id(file_id):
             "num_pages": 5,
             "file_id": 1
         }
+        202: Large PDF queued, same body as /extract-pdf-text
+        400: Empty or unreadable PDF
         404: File not found
         500: Extraction error
     """
@@ -650,25 +744,33 @@ def extract_pdf_from_file_id(file_id):
                 'file_path': file.file_path
             }), 404
         
-        # Read PDF file
-        with open(full_path, 'rb') as pdf_file:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            extracted_text = ""
-            num_pages = len(pdf_reader.pages)
-            
-            for page_num in range(num_pages):
-                page = pdf_reader.pages[page_num]
-                extracted_text += page.extract_text() + "\n\n"
+        # Files uploaded before content hashing are hashed on first extraction
+        if not file.content_hash:
+            file.content_hash = ContentStore.hash_file(full_path)
+            db.session.commit()
+        
+        result = PdfExtractionService.extract(
+            full_path, file_id=file_id, wait=request.args.get('wait', 'false').lower() == 'true',
+            content_hash=file.content_hash
+        )
+        
+        if 'job' in result:
+            return _extraction_job_response(result['job'])
         
         return jsonify({
             'success': True,
-            'text': extracted_text.strip(),
-            'num_pages': num_pages,
+            'text': result['text'],
+            'num_pages': result['num_pages'],
             'file_id': file_id,
-            'filename': file.original_filename
+            'filename': file.original_filename,
+            'cached': result.get('cached', False)
         }), 200
         
+    except PdfExtractionError as e:
+        return jsonify({
+            'error': 'Failed to extract PDF text',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'error': 'Failed to extract PDF text',
@@ -676,6 +778,38 @@ def extract_pdf_from_file_id(file_id):
         }), 500
 
 
+@n8n_bp.route('/extract-pdf-jobs/<job_id>', methods=['GET'])
+@require_api_key
+def get_extraction_job(job_id):
+    """
+    Get the status of a background PDF extraction.
+    
+    Returns:
+        200: Job status and progress; includes "text" once completed
+        404: Unknown job
+    """
+    job = PdfExtractionService.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Extraction job not found'}), 404
+    
+    return jsonify({
+        'success': True,
+        **job.to_dict()
+    }), 200
+
+
+def _extraction_job_response(job):
+    """202 response pointing at a queued extraction job"""
+    return jsonify({
+        'success': True,
+        'status': job.status,
+        'job_id': job.job_id,
+        'num_pages': job.num_pages,
+        'file_id': job.file_id,
+        'status_url': url_for('n8n.get_extraction_job', job_id=job.job_id)
+    }), 202
+
+
 @n8n_bp.route('/po-extraction', methods=['POST'])
 @require_api_key
 def receive_po_extraction():
@@ -683,9 +817,12 @@ def receive_po_extraction():
     Sprint 2: Receive extracted PO data from n8n + Claude API workflow.
     Enhanced with confidence-based validation - only auto-saves if confidence ≥ 90%
     """
+    return apply_po_extraction(request.get_json())
+
+
+def apply_po_extraction(data):
+    """Apply an extraction result to its purchase order (from n8n or the extraction cache)"""
     try:
-        data = request.get_json()
-        
         # Validate required fields
         required_fields = ['po_id', 'extraction_status']
         missing_fields = [field for field in required_fields if field not in data]
@@ -709,6 +846,7 @@ def receive_po_extraction():
         if 'extracted_data' in data and data['extracted_data']:
             extracted = data['extracted_data']
             po.extracted_data = extracted
+            _record_extraction(data, 'purchase_order', File.purchase_order_id == po.id)
             
             # Check if confidence is HIGH (≥ 90%) - auto-apply
             if confidence_score >= 90:
@@ -904,9 +1042,12 @@ def receive_invoice_extraction():
     Sprint 2: Receive extracted invoice data from n8n + Claude API workflow.
     Enhanced with confidence-based validation - only auto-saves if confidence ≥ 90%
     """
+    return apply_invoice_extraction(request.get_json())
+
+
+def apply_invoice_extraction(data):
+    """Apply an extraction result to its invoice (from n8n or the extraction cache)"""
     try:
-        data = request.get_json()
-        
         # Validate required fields
         required_fields = ['payment_id', 'extraction_status']
         missing_fields = [field for field in required_fields if field not in data]
@@ -930,6 +1071,7 @@ def receive_invoice_extraction():
         if 'extracted_data' in data and data['extracted_data']:
             extracted = data['extracted_data']
             payment.extracted_data = extracted
+            _record_extraction(data, 'invoice', File.payment_id == payment.id)
             
             # Check if confidence is HIGH (≥ 90%) - auto-apply
             if confidence_score >= 90:
@@ -1038,6 +1180,63 @@ def receive_invoice_extraction():
         }), 500
 
 
+def _record_extraction(data, document_context, entity_filter):
+    """
+    Store an extraction result on its source Files and, for results from n8n,
+    in the extraction cache under the files' content hash
+    
+    A merged request (see routes.uploads.merge_extraction_payloads) lists
+    every File it was made for in file_ids; each of them gets the result.
+    """
+    file_ids = data.get('file_ids') or ([data['file_id']] if data.get('file_id') else [])
+    if file_ids:
+        files = File.query.filter(File.id.in_(file_ids)).order_by(File.id).all()
+    else:
+        files = File.query.filter(entity_filter).order_by(File.uploaded_at.desc(), File.id.desc()).limit(1).all()
+    if not files:
+        return
+    
+    now = datetime.utcnow()
+    for file in files:
+        file.extracted_data = data['extracted_data']
+        file.extraction_confidence = data.get('extraction_confidence')
+        file.processing_status = 'completed'
+        file.processed_at = now
+    
+    if not data.get('from_cache'):
+        for content_hash in sorted({file.content_hash for file in files if file.content_hash}):
+            ExtractionCache.store_extraction(content_hash, document_context, data)
+
+
+def apply_cached_extraction(cached_result, webhook_payload):
+    """
+    Apply a cached extraction to a newly uploaded document, as if n8n had
+    just returned it
+    
+    Args:
+        cached_result: ExtractionCacheEntry.result
+        webhook_payload: Payload that would have been sent to n8n
+    
+    Returns:
+        (response, status) from the matching apply_*_extraction
+    """
+    data = dict(cached_result)
+    data.update({
+        'file_id': webhook_payload['file_id'],
+        'document_path': webhook_payload['file_path'],
+        'from_cache': True
+    })
+    
+    kind = ExtractionCache.KINDS.get(webhook_payload.get('document_context'))
+    if kind == 'purchase_order':
+        return apply_po_extraction({**data, 'po_id': webhook_payload['po_id']})
+    if kind == 'delivery':
+        return apply_delivery_extraction({**data, 'delivery_id': webhook_payload['delivery_id']})
+    if kind == 'invoice':
+        return apply_invoice_extraction({**data, 'payment_id': webhook_payload['payment_id']})
+    return jsonify({'error': f"No extraction handler for '{webhook_payload.get('document_context')}'"}), 400
+
+
 @n8n_bp.route('/pending-deliveries', methods=['GET'])
 @require_api_key
 def get_pending_deliveries():
@@ -1119,6 +1318,41 @@ def get_pending_deliveries():
         }), 500
 
 
+@n8n_bp.route('/refresh-delivery-delays', methods=['POST'])
+@require_api_key
+def refresh_delivery_delays():
+    """
+    Persist delay flags for late deliveries.
+    Used by n8n scheduled workflow (Hourly).
+    
+    Delivery reads calculate delay status on the fly; this job writes
+    is_delayed/delay_days back for rows whose stored values are out of date,
+    in a single bulk UPDATE.
+    
+    Returns:
+        200: Number of deliveries updated
+    """
+    try:
+        from services.analytics_snapshot_service import AnalyticsSnapshotService
+        
+        updated = Delivery.refresh_delay_flags()
+        AnalyticsSnapshotService.log_changes(('po', row['po_id']) for row in updated)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'updated_count': len(updated),
+            'updated_ids': [row['id'] for row in updated]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Failed to refresh delivery delays',
+            'message': str(e)
+        }), 500
+
+
 @n8n_bp.route('/weekly-report-data', methods=['GET'])
 @require_api_key
 def get_weekly_report_data():
@@ -1162,7 +1396,7 @@ def get_weekly_report_data():
         
         # Delayed deliveries (expected date passed but not delivered)
         today = datetime.now().date()
-        delayed_deliveries = Delivery.query.filter(
+        delayed_deliveries = Delivery.query.options(*Delivery.serialize_options()).filter(
             Delivery.expected_delivery_date < today,
             Delivery.delivery_status != 'Delivered'
         ).all()
@@ -1170,14 +1404,16 @@ def get_weekly_report_data():
         # Upcoming deliveries (next 7 days)
         from datetime import timedelta
         next_week = today + timedelta(days=7)
-        upcoming_deliveries = Delivery.query.filter(
+        upcoming_deliveries = Delivery.query.options(*Delivery.serialize_options()).filter(
             Delivery.expected_delivery_date >= today,
             Delivery.expected_delivery_date <= next_week,
             Delivery.delivery_status != 'Delivered'
         ).order_by(Delivery.expected_delivery_date.asc()).all()
         
         # Pending POs (Not Released)
-        pending_pos = PurchaseOrder.query.filter_by(po_status='Not Released').all()
+        pending_pos = PurchaseOrder.query.options(*PurchaseOrder.serialize_options()).filter_by(
+            po_status='Not Released'
+        ).all()
         
         # Recent activity (last 7 days)
         last_week = today - timedelta(days=7)
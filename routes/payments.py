@@ -1,16 +1,36 @@
 from flask import Blueprint, request, jsonify
 from models import db
 from models.payment import Payment
+from models.purchase_order import PurchaseOrder
+from routes.list_query import ListQuery, ListQueryError, equals, related, date_from, date_to
 from datetime import datetime
 
 payments_bp = Blueprint('payments', __name__)
 
+payment_list = ListQuery(
+    Payment,
+    filters={
+        'status': equals(Payment.payment_status),
+        'payment_status': equals(Payment.payment_status),
+        'po_id': equals(Payment.po_id, int),
+        'supplier': related(Payment.po_id, PurchaseOrder.id, PurchaseOrder.supplier_name),
+        'date_from': date_from(Payment.payment_date),
+        'date_to': date_to(Payment.payment_date)
+    },
+    sortable={
+        'payment_date': Payment.payment_date,
+        'paid_amount': Payment.paid_amount,
+        'created_at': Payment.created_at
+    }
+)
+
 @payments_bp.route('', methods=['GET'])
 def get_payments():
-    """Get all payments"""
+    """Get payments (filterable; paginated when limit or cursor is given)"""
     try:
-        payments = Payment.query.all()
-        return jsonify([payment.to_dict() for payment in payments])
+        return jsonify(payment_list.respond(request.args))
+    except ListQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -129,7 +149,7 @@ def delete_payment(id):
 def get_payments_by_po(po_id):
     """Get all payments for a specific PO"""
     try:
-        payments = Payment.query.filter_by(po_id=po_id).all()
+        payments = Payment.query.options(*Payment.serialize_options()).filter_by(po_id=po_id).all()
         return jsonify([payment.to_dict() for payment in payments])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
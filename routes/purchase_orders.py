@@ -1,16 +1,38 @@
 from flask import Blueprint, request, jsonify
 from models import db
 from models.purchase_order import PurchaseOrder
+from routes.list_query import ListQuery, ListQueryError, equals, date_from, date_to
 from datetime import datetime
+from sqlalchemy.orm import selectinload
 
 purchase_orders_bp = Blueprint('purchase_orders', __name__)
 
+purchase_order_list = ListQuery(
+    PurchaseOrder,
+    filters={
+        'status': equals(PurchaseOrder.po_status),
+        'po_status': equals(PurchaseOrder.po_status),
+        'supplier': equals(PurchaseOrder.supplier_name),
+        'material_id': equals(PurchaseOrder.material_id, int),
+        'date_from': date_from(PurchaseOrder.po_date),
+        'date_to': date_to(PurchaseOrder.po_date)
+    },
+    sortable={
+        'po_date': PurchaseOrder.po_date,
+        'expected_delivery_date': PurchaseOrder.expected_delivery_date,
+        'supplier_name': PurchaseOrder.supplier_name,
+        'total_amount': PurchaseOrder.total_amount,
+        'created_at': PurchaseOrder.created_at
+    }
+)
+
 @purchase_orders_bp.route('', methods=['GET'])
 def get_purchase_orders():
-    """Get all purchase orders"""
+    """Get purchase orders (filterable; paginated when limit or cursor is given)"""
     try:
-        pos = PurchaseOrder.query.all()
-        return jsonify([po.to_dict() for po in pos])
+        return jsonify(purchase_order_list.respond(request.args))
+    except ListQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -18,7 +40,11 @@ def get_purchase_orders():
 def get_purchase_order(id):
     """Get a specific purchase order"""
     try:
-        po = PurchaseOrder.query.get_or_404(id)
+        po = PurchaseOrder.query.options(
+            *PurchaseOrder.serialize_options(),
+            selectinload(PurchaseOrder.payments),
+            selectinload(PurchaseOrder.deliveries)
+        ).get_or_404(id)
         result = po.to_dict()
         
         # Include related data
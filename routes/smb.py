@@ -3,10 +3,10 @@ SMB File Server Routes
 API endpoints for SMB file operations
 """
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, Response
 from services.smb_service import smb_service
-import os
-import tempfile
+from routes.uploads import content_disposition
+import mimetypes
 from werkzeug.utils import secure_filename
 import logging
 
@@ -32,11 +32,12 @@ def test_connection():
 def list_folders():
     """
     List folders in specified path
-    Query params: path (optional)
+    Query params: path (optional), refresh (optional, bypass the listing cache)
     """
     try:
         path = request.args.get('path', '')
-        folders = smb_service.list_folders(path)
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        folders = smb_service.list_folders(path, refresh)
         
         return jsonify({
             'success': True,
@@ -50,19 +51,18 @@ def list_folders():
             'success': False,
             'error': str(e)
         }), 500
-    finally:
-        smb_service.disconnect()
 
 
 @smb_bp.route('/files', methods=['GET'])
 def list_files():
     """
     List files in specified path
-    Query params: path (optional)
+    Query params: path (optional), refresh (optional, bypass the listing cache)
     """
     try:
         path = request.args.get('path', '')
-        files = smb_service.list_files(path)
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        files = smb_service.list_files(path, refresh)
         
         return jsonify({
             'success': True,
@@ -76,21 +76,21 @@ def list_files():
             'success': False,
             'error': str(e)
         }), 500
-    finally:
-        smb_service.disconnect()
 
 
 @smb_bp.route('/structure', methods=['GET'])
 def get_structure():
     """
     Get hierarchical folder structure
-    Query params: path (optional), max_depth (optional, default 3)
+    Query params: path (optional), max_depth (optional, default 3),
+                  refresh (optional, bypass the listing cache)
     """
     try:
         path = request.args.get('path', '')
         max_depth = int(request.args.get('max_depth', 3))
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
         
-        structure = smb_service.get_folder_structure(path, max_depth)
+        structure = smb_service.get_folder_structure(path, max_depth, refresh=refresh)
         
         return jsonify({
             'success': True,
@@ -103,8 +103,6 @@ def get_structure():
             'success': False,
             'error': str(e)
         }), 500
-    finally:
-        smb_service.disconnect()
 
 
 @smb_bp.route('/upload', methods=['POST'])
@@ -112,8 +110,15 @@ def upload_file():
     """
     Upload file to SMB server
     Form data: file, path (folder path), project_name (optional)
+    
+    Or the raw file as the request body (any non-multipart Content-Type),
+    with path, project_name and filename as query params. The body is piped
+    straight into the SMB write without being buffered on disk.
     """
     try:
+        if request.mimetype != 'multipart/form-data':
+            return upload_raw()
+            
         # Check if file is present
         if 'file' not in request.files:
             return jsonify({
@@ -139,27 +144,14 @@ def upload_file():
         # Secure filename
         filename = secure_filename(file.filename)
         
-        # Save to temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        file.save(temp_file.name)
-        temp_file.close()
+        # Upload to SMB server from the parsed form file
+        result = smb_service.upload_stream(file.stream, path, filename)
         
-        try:
-            # Upload to SMB server
-            result = smb_service.upload_file(temp_file.name, path, filename)
-            
-            return jsonify({
-                'success': True,
-                'message': f'File uploaded successfully to {path}',
-                **result
-            })
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(temp_file.name)
-            except:
-                pass
-            smb_service.disconnect()
+        return jsonify({
+            'success': True,
+            'message': f'File uploaded successfully to {path}',
+            **result
+        })
     
     except Exception as e:
         logger.error(f"Failed to upload file: {str(e)}")
@@ -169,11 +161,37 @@ def upload_file():
         }), 500
 
 
+def upload_raw():
+    """Upload the request body as one file, streamed into the SMB write"""
+    filename = secure_filename(request.args.get('filename', ''))
+    if not filename:
+        return jsonify({
+            'success': False,
+            'error': 'Filename is required'
+        }), 400
+    
+    path = request.args.get('path', '')
+    project_name = request.args.get('project_name', '')
+    if project_name:
+        path = f"{path}/{project_name}" if path else project_name
+    
+    result = smb_service.upload_stream(request.stream, path, filename)
+    
+    return jsonify({
+        'success': True,
+        'message': f'File uploaded successfully to {path}',
+        **result
+    })
+
+
 @smb_bp.route('/download', methods=['GET'])
 def download_file():
     """
     Download file from SMB server
     Query params: path, filename
+    
+    Chunks are sent as they are read from the share, so the first byte goes
+    out without waiting for the whole file.
     """
     try:
         path = request.args.get('path', '')
@@ -185,30 +203,21 @@ def download_file():
                 'error': 'Filename is required'
             }), 400
         
-        # Download file to temp location
-        temp_file_path = smb_service.download_file(path, filename)
+        size, chunks = smb_service.stream_file(path, filename)
         
-        # Send file to client
-        response = send_file(
-            temp_file_path,
-            as_attachment=True,
-            download_name=filename
+        response = Response(
+            chunks,
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            direct_passthrough=True
         )
-        
-        # Clean up temp file after sending
-        @response.call_on_close
-        def cleanup():
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
-            smb_service.disconnect()
+        response.content_length = size
+        response.headers['Content-Disposition'] = content_disposition(filename, 'attachment')
+        response.headers['X-Accel-Buffering'] = 'no'  # Let nginx pass chunks through as they arrive
         
         return response
     
     except Exception as e:
         logger.error(f"Failed to download file: {str(e)}")
-        smb_service.disconnect()
         return jsonify({
             'success': False,
             'error': str(e)
@@ -246,8 +255,6 @@ def delete_file():
             'success': False,
             'error': str(e)
         }), 500
-    finally:
-        smb_service.disconnect()
 
 
 @smb_bp.route('/create-folder', methods=['POST'])
@@ -281,20 +288,20 @@ def create_folder():
             'success': False,
             'error': str(e)
         }), 500
-    finally:
-        smb_service.disconnect()
 
 
 @smb_bp.route('/browse', methods=['GET'])
 def browse():
     """
     Browse both folders and files in one request
-    Query params: path (optional)
+    Query params: path (optional), refresh (optional, bypass the listing cache)
     """
     try:
         path = request.args.get('path', '')
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
         
-        folders = smb_service.list_folders(path)
+        # Both come from one listing of the folder
+        folders = smb_service.list_folders(path, refresh)
         files = smb_service.list_files(path)
         
         return jsonify({
@@ -312,5 +319,3 @@ def browse():
             'success': False,
             'error': str(e)
         }), 500
-    finally:
-        smb_service.disconnect()
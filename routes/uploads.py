@@ -2,9 +2,13 @@
 File Upload Routes
 Handle document upload, download, and management
 """
+import mimetypes
 import os
-from datetime import datetime
-from flask import Blueprint, render_template, request, jsonify, send_file, abort
+from datetime import datetime, timezone
+from urllib.parse import quote
+from flask import Blueprint, render_template, request, jsonify, send_file, abort, current_app, url_for
+from sqlalchemy import func
+from werkzeug.http import parse_content_range_header
 from werkzeug.utils import secure_filename
 from models import db
 from models.file import File
@@ -12,26 +16,121 @@ from models.material import Material
 from models.purchase_order import PurchaseOrder
 from models.payment import Payment
 from models.delivery import Delivery
+from models.upload_session import UploadSession
+from routes.list_query import ListQuery, ListQueryError, equals, date_from, date_to
+from routes.n8n_webhooks import apply_cached_extraction
+from services.n8n_dispatcher import N8nDispatcher
+from services.content_store import ContentStore
+from services.extraction_cache import ExtractionCache
+from services.upload_sessions import UploadSessionService, UploadSessionError
+from services.thumbnails import ThumbnailService
 
 uploads_bp = Blueprint('uploads', __name__)
 
 # Configuration
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads')
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx', 'xls', 'xlsx'}
+FILE_PAGE_SIZE = 50  # Rows per page on the uploads page
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16 MB
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_upload_path():
-    """Get organized upload path by year/month"""
-    now = datetime.now()
-    year = now.strftime('%Y')
-    month = now.strftime('%m')
-    path = os.path.join(UPLOAD_FOLDER, year, month)
-    os.makedirs(path, exist_ok=True)
-    return path, f"{year}/{month}"
+def extraction_dedupe_key(file_record, webhook_payload):
+    """
+    Outbox key of an extraction request: the same document content for the
+    same record and context, so a re-upload while the first request is still
+    pending is merged into it instead of extracted twice (see
+    merge_extraction_payloads for how both files get the result)
+    """
+    target = webhook_payload.get('delivery_id') or webhook_payload.get('payment_id') or webhook_payload.get('po_id')
+    content = file_record.content_hash or f'file-{file_record.id}'
+    return f"extract:{webhook_payload.get('document_context')}:{target}:{content}"
+
+def merge_extraction_payloads(pending_payload, payload):
+    """
+    Payload of a merged extraction request: the latest upload's, with the
+    ids of every File it stands for in file_ids, so the result is recorded
+    on all of them
+    """
+    file_ids = list(pending_payload.get('file_ids') or [pending_payload.get('file_id')])
+    file_ids += [file_id for file_id in payload['file_ids'] if file_id not in file_ids]
+    return {**payload, 'file_ids': file_ids}
+
+def start_extraction(file_record, webhook_payload):
+    """
+    Commit an uploaded document and start its extraction
+    
+    A document whose content was already extracted with the current prompt
+    version gets the cached result applied straight away; anything else is
+    queued for the n8n extract-document workflow, committed in the same
+    transaction as the File so neither exists without the other.
+    
+    Returns:
+        {'status': 'completed' | 'pending', 'cached': bool, 'dispatch_id': int | None}
+    """
+    kind = ExtractionCache.KINDS.get(webhook_payload.get('document_context'))
+    cached = ExtractionCache.lookup(file_record.content_hash, kind)
+    
+    if cached:
+        db.session.commit()  # Applying the result commits (or rolls back) on its own
+        response, status = apply_cached_extraction(cached.result, webhook_payload)
+        if status == 200:
+            return {'status': 'completed', 'cached': True, 'dispatch_id': None}
+        # Fall back to n8n if the cached result could not be applied
+        print(f"⚠️ Cached extraction not applied to file {file_record.id}: {response.get_json()}")
+    
+    dispatch = N8nDispatcher.enqueue('extract-document', {**webhook_payload, 'file_ids': [file_record.id]},
+                                     dedupe_key=extraction_dedupe_key(file_record, webhook_payload),
+                                     merge=merge_extraction_payloads)
+    db.session.commit()
+    return {'status': 'pending', 'cached': False, 'dispatch_id': dispatch.id}
+
+file_list = ListQuery(
+    File,
+    filters={
+        'file_type': equals(File.file_type),
+        'status': equals(File.processing_status),
+        'po_id': equals(File.purchase_order_id, int),
+        'date_from': date_from(File.uploaded_at),
+        'date_to': date_to(File.uploaded_at)
+    },
+    sortable={
+        'uploaded_at': File.uploaded_at,
+        'file_size': File.file_size,
+        'original_filename': File.original_filename
+    },
+    default_sort='-uploaded_at'
+)
+
+def queue_previews(file_record, root=None):
+    """
+    Render the thumbnail and preview of a committed upload in the background
+    
+    Skipped under testing (like the n8n dispatch worker); previews missing
+    for any reason are rendered on first request instead.
+    """
+    if current_app.testing:
+        return None
+    source_path = os.path.join(root or UPLOAD_FOLDER, file_record.file_path)
+    return ThumbnailService.submit(source_path, file_record.content_hash)
+
+def link_to_entity(file_record, entity_type, entity_id):
+    """Attach a file to a material, purchase order, payment or delivery"""
+    if entity_type and entity_id:
+        try:
+            entity_id = int(entity_id)
+            if entity_type == 'material':
+                file_record.material_id = entity_id
+            elif entity_type == 'purchase_order':
+                file_record.purchase_order_id = entity_id
+            elif entity_type == 'payment':
+                file_record.payment_id = entity_id
+            elif entity_type == 'delivery':
+                file_record.delivery_id = entity_id
+        except ValueError:
+            pass  # Invalid entity_id, skip linking
 
 def get_file_type_from_mime(mime_type):
     """Determine file type category from MIME type"""
@@ -47,19 +146,25 @@ def get_file_type_from_mime(mime_type):
 
 @uploads_bp.route('/uploads')
 def uploads_page():
-    """Upload management page"""
-    files = File.query.order_by(File.uploaded_at.desc()).all()
+    """Upload management page (the file list is loaded page by page from /api/files)"""
+    return render_template('uploads.html', stats=upload_stats(), page_size=FILE_PAGE_SIZE)
+
+def upload_stats():
+    """File counts per processing status and total size, in one grouped query"""
+    rows = db.session.query(
+        File.processing_status,
+        func.count(File.id),
+        func.coalesce(func.sum(File.file_size), 0)
+    ).group_by(File.processing_status).all()
     
-    # Get statistics
-    stats = {
-        'total_files': len(files),
-        'pending_processing': len([f for f in files if f.processing_status == 'uploaded']),
-        'completed': len([f for f in files if f.processing_status == 'completed']),
-        'failed': len([f for f in files if f.processing_status == 'failed']),
-        'total_size_mb': sum(f.file_size for f in files) / (1024 * 1024)
+    counts = {status: count for status, count, _ in rows}
+    return {
+        'total_files': sum(counts.values()),
+        'pending_processing': counts.get('uploaded', 0),
+        'completed': counts.get('completed', 0),
+        'failed': counts.get('failed', 0),
+        'total_size_mb': sum(size for _, _, size in rows) / (1024 * 1024)
     }
-    
-    return render_template('uploads.html', files=files, stats=stats)
 
 @uploads_bp.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -90,73 +195,176 @@ def upload_file():
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_{original_filename}"
         
-        # Get organized upload path
-        upload_path, relative_path = get_upload_path()
-        file_path = os.path.join(upload_path, filename)
-        
-        # Save file
-        file.save(file_path)
-        file_size = os.path.getsize(file_path)
+        # Save into the content-addressed store (hashed while streaming; identical files share one blob)
+        stored = ContentStore.save(file.stream, UPLOAD_FOLDER, original_filename.rsplit('.', 1)[1].lower())
         
         # Create database record
         new_file = File(
             filename=filename,
             original_filename=original_filename,
-            file_path=os.path.join(relative_path, filename),
+            file_path=stored['file_path'],
             file_type=file_type,
-            file_size=file_size,
+            file_size=stored['file_size'],
+            content_hash=stored['content_hash'],
             mime_type=file.content_type,
             uploaded_by=uploaded_by,
             processing_status='uploaded'
         )
         
         # Link to entity if provided
-        if entity_type and entity_id:
-            try:
-                entity_id = int(entity_id)
-                if entity_type == 'material':
-                    new_file.material_id = entity_id
-                elif entity_type == 'purchase_order':
-                    new_file.purchase_order_id = entity_id
-                elif entity_type == 'payment':
-                    new_file.payment_id = entity_id
-                elif entity_type == 'delivery':
-                    new_file.delivery_id = entity_id
-            except ValueError:
-                pass  # Invalid entity_id, skip linking
+        link_to_entity(new_file, entity_type, entity_id)
         
         db.session.add(new_file)
         db.session.commit()
+        queue_previews(new_file)
         
         return jsonify({
             'success': True,
             'message': 'File uploaded successfully',
-            'file': new_file.to_dict()
+            'file': new_file.to_dict(),
+            'deduplicated': stored['deduplicated']
         }), 201
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# ==================== CHUNKED UPLOADS ====================
+# Large files are sent as a series of byte ranges against an upload session, so
+# an interrupted upload resumes from the last stored byte instead of restarting
+
+def session_error_response(error):
+    """JSON error for an UploadSessionError"""
+    return jsonify({'error': str(error), **error.details}), error.status_code
+
+def session_response(session):
+    """Session state plus where to send the next chunk"""
+    data = session.to_dict()
+    data['chunk_size'] = current_app.config.get('CHUNKED_UPLOAD_CHUNK_SIZE', UploadSessionService.DEFAULT_CHUNK_SIZE)
+    data['upload_url'] = url_for('uploads.upload_chunk', session_id=session.session_id)
+    return data
+
+@uploads_bp.route('/api/uploads/sessions', methods=['POST'])
+def create_upload_session():
+    """
+    Start a chunked upload
+    
+    JSON body: filename, file_size (required); mime_type, file_type,
+    entity_type, entity_id, uploaded_by (optional)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('filename') or 'file_size' not in data:
+            return jsonify({'error': 'filename and file_size are required'}), 400
+        
+        original_filename = secure_filename(data['filename'])
+        if not allowed_file(original_filename):
+            return jsonify({'error': f'File type not allowed. Allowed: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+        
+        session = UploadSessionService.create(
+            UPLOAD_FOLDER,
+            original_filename,
+            data['file_size'],
+            mime_type=data.get('mime_type'),
+            file_type=data.get('file_type', 'other'),
+            entity_type=data.get('entity_type'),
+            entity_id=data.get('entity_id'),
+            uploaded_by=data.get('uploaded_by', 'Unknown')
+        )
+        return jsonify({'success': True, 'session': session_response(session)}), 201
+        
+    except UploadSessionError as e:
+        return session_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@uploads_bp.route('/api/uploads/sessions/<session_id>')
+def get_upload_session(session_id):
+    """Session state; received_bytes is where a resumed upload continues"""
+    session = UploadSession.query.filter_by(session_id=session_id).first_or_404()
+    return jsonify({'success': True, 'session': session_response(session)})
+
+@uploads_bp.route('/api/uploads/sessions/<session_id>', methods=['PUT'])
+def upload_chunk(session_id):
+    """
+    Store one chunk; the body is the raw bytes and the Content-Range header
+    (bytes start-end/total) says where they go
+    """
+    try:
+        content_range = parse_content_range_header(request.headers.get('Content-Range'))
+        if content_range is None or content_range.units != 'bytes':
+            return jsonify({'error': 'Content-Range header required (bytes start-end/total)'}), 400
+        
+        length = content_range.stop - content_range.start
+        if request.content_length is not None and request.content_length != length:
+            return jsonify({'error': 'Content-Length does not match Content-Range'}), 400
+        
+        session = UploadSessionService.get_open(session_id)
+        session = UploadSessionService.write_chunk(
+            UPLOAD_FOLDER, session, content_range.start, length, content_range.length, request.stream
+        )
+        return jsonify({'success': True, 'session': session_response(session)})
+        
+    except UploadSessionError as e:
+        return session_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@uploads_bp.route('/api/uploads/sessions/<session_id>/complete', methods=['POST'])
+def complete_upload_session(session_id):
+    """
+    Turn a fully received session into a File
+    
+    Optional JSON body: sha256 (hex digest of the whole file, verified before the File is created)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        session = UploadSessionService.get_open(session_id)
+        file_record, stored = UploadSessionService.complete(UPLOAD_FOLDER, session, expected_hash=data.get('sha256'))
+        link_to_entity(file_record, session.entity_type, session.entity_id)
+        db.session.commit()
+        queue_previews(file_record)
+        
+        return jsonify({
+            'success': True,
+            'message': 'File uploaded successfully',
+            'file': file_record.to_dict(),
+            'deduplicated': stored['deduplicated']
+        }), 201
+        
+    except UploadSessionError as e:
+        return session_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@uploads_bp.route('/api/uploads/sessions/<session_id>', methods=['DELETE'])
+def abort_upload_session(session_id):
+    """Cancel an upload and discard its staged bytes"""
+    try:
+        session = UploadSessionService.get_open(session_id)
+        UploadSessionService.abort(UPLOAD_FOLDER, session)
+        return jsonify({'success': True, 'message': 'Upload cancelled'})
+        
+    except UploadSessionError as e:
+        return session_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @uploads_bp.route('/api/files')
 def get_files():
-    """Get all files with optional filtering"""
+    """Get files with optional filtering (paginated when limit or cursor is given)"""
     try:
         # Get query parameters
-        file_type = request.args.get('file_type')
-        status = request.args.get('status')
         entity_type = request.args.get('entity_type')
         entity_id = request.args.get('entity_id')
         
-        # Build query
+        # Build query (file_type, status, dates, sort and fields are handled by file_list)
         query = File.query
         
-        if file_type:
-            query = query.filter_by(file_type=file_type)
-        
-        if status:
-            query = query.filter_by(processing_status=status)
-        
         if entity_type and entity_id:
             try:
                 entity_id = int(entity_id)
@@ -171,13 +379,24 @@ def get_files():
             except ValueError:
                 pass
         
-        files = query.order_by(File.uploaded_at.desc()).all()
+        if ListQuery.is_paginated(request.args):
+            page = file_list.page(request.args, query)
+            return jsonify({
+                'success': True,
+                'files': page['items'],
+                'count': page['count'],
+                'limit': page['limit'],
+                'has_more': page['has_more'],
+                'next_cursor': page['next_cursor']
+            })
         
         return jsonify({
             'success': True,
-            'files': [f.to_dict() for f in files]
+            'files': file_list.items(request.args, query)
         })
         
+    except ListQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -198,16 +417,22 @@ def delete_file(file_id):
     """Delete a file"""
     try:
         file = File.query.get_or_404(file_id)
-        
-        # Delete physical file
         full_path = os.path.join(UPLOAD_FOLDER, file.file_path)
-        if os.path.exists(full_path):
-            os.remove(full_path)
+        content_hash = file.content_hash
+        stored = file.file_path.startswith(ContentStore.BLOB_DIR + os.sep)
         
         # Delete database record
         db.session.delete(file)
         db.session.commit()
         
+        # Blobs may be shared with other records, ContentStore.collect_garbage
+        # removes them once nothing references them. Files saved before the
+        # store existed belong to this record alone
+        if not stored and os.path.exists(full_path):
+            os.remove(full_path)
+            if content_hash:
+                ThumbnailService.remove(full_path, content_hash)
+        
         return jsonify({
             'success': True,
             'message': 'File deleted successfully'
@@ -217,9 +442,97 @@ def delete_file(file_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@uploads_bp.route('/api/files/<int:file_id>/thumbnail')
+def get_file_thumbnail(file_id):
+    """
+    First-page preview of a PDF or image
+    
+    Query: size ('thumb' or 'preview'), format ('webp' or 'png'; defaults to
+    WebP when the browser accepts it). A file's content never changes, so
+    previews are cacheable for THUMBNAIL_MAX_AGE.
+    """
+    size = request.args.get('size', 'thumb')
+    fmt = request.args.get('format') or ('webp' if request.accept_mimetypes['image/webp'] else 'png')
+    if size not in ThumbnailService.SIZES or fmt not in ThumbnailService.FORMATS:
+        return jsonify({'error': f'size must be one of {", ".join(ThumbnailService.SIZES)} '
+                                 f'and format one of {", ".join(ThumbnailService.FORMATS)}'}), 400
+    
+    file = File.query.get_or_404(file_id)
+    full_path = os.path.join(UPLOAD_FOLDER, file.file_path)
+    if not os.path.exists(full_path) or not ThumbnailService.supports(full_path.rsplit('.', 1)[-1].lower()):
+        abort(404)
+    
+    if not file.content_hash:
+        # Stored before content hashing
+        file.content_hash = ContentStore.hash_file(full_path)
+        db.session.commit()
+    
+    try:
+        thumbnail_path = ThumbnailService.get(full_path, file.content_hash, size, fmt)
+    except Exception as e:
+        print(f"❌ Preview rendering failed for file {file_id}: {str(e)}")
+        thumbnail_path = None
+    if not thumbnail_path:
+        abort(404)
+    
+    response = send_file(
+        thumbnail_path,
+        mimetype=ThumbnailService.FORMATS[fmt][1],
+        conditional=True,
+        etag=f'{file.content_hash}.{size}.{fmt}',
+        max_age=current_app.config.get('THUMBNAIL_MAX_AGE', 31536000)
+    )
+    response.cache_control.immutable = True
+    if 'format' not in request.args:
+        response.vary.add('Accept')
+    return response
+
+def accel_redirect_response(file, full_path):
+    """
+    Empty response that hands the transfer to nginx through X-Accel-Redirect
+    
+    Flask answers conditional requests itself (304 without involving nginx);
+    nginx streams the bytes and serves Range requests from its internal
+    location. Returns None for files outside UPLOAD_FOLDER, which nginx
+    cannot reach.
+    """
+    relative_path = os.path.relpath(full_path, UPLOAD_FOLDER)
+    if relative_path.startswith('..'):
+        return None
+    
+    prefix = current_app.config.get('X_ACCEL_UPLOADS_PREFIX', '/_protected_uploads/')
+    response = current_app.response_class(mimetype=file.mime_type or mimetypes.guess_type(full_path)[0])
+    response.automatically_set_content_length = False  # nginx sets it from the file
+    response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative_path.replace(os.sep, '/'))
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = content_disposition(file.original_filename)
+    if file.content_hash:
+        response.set_etag(file.content_hash)
+    response.last_modified = datetime.fromtimestamp(os.path.getmtime(full_path), timezone.utc)
+    response.make_conditional(request)
+    if response.status_code == 304:
+        del response.headers['X-Accel-Redirect']  # nginx would follow it whatever the status
+    return response
+
+def content_disposition(filename, disposition='inline'):
+    """Content-Disposition header, with an RFC 5987 name for non-ASCII filenames"""
+    try:
+        filename.encode('ascii')
+        return f'{disposition}; filename="{filename}"'
+    except UnicodeEncodeError:
+        fallback = filename.encode('ascii', 'ignore').decode() or 'download'
+        return f'{disposition}; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename)}'
+
 @uploads_bp.route('/uploads/<path:filename>')
 def download_file(filename):
-    """Download/serve an uploaded file"""
+    """
+    Download/serve an uploaded file
+    
+    Responses carry a strong ETag (the content hash) and Last-Modified, and
+    honour If-None-Match, If-Modified-Since, Range and If-Range. With
+    FILE_SERVE_MODE = 'x-accel' Flask only looks the file up and nginx sends
+    the bytes.
+    """
     try:
         # Security: prevent directory traversal
         filename = secure_filename(filename)
@@ -233,11 +546,18 @@ def download_file(filename):
         if not os.path.exists(full_path):
             abort(404)
         
+        if current_app.config.get('FILE_SERVE_MODE') == 'x-accel':
+            response = accel_redirect_response(file, full_path)
+            if response is not None:
+                return response
+        
         return send_file(
             full_path,
             mimetype=file.mime_type,
             as_attachment=False,  # Display in browser if possible
-            download_name=file.original_filename
+            download_name=file.original_filename,
+            conditional=True,
+            etag=file.content_hash or True  # Content hash is a strong validator shared by identical files
         )
         
     except Exception as e:
@@ -305,22 +625,16 @@ def upload_delivery_document(delivery_id):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"delivery_{delivery_id}_{timestamp}_{filename}"
         
-        # Get organized upload path
-        upload_path, relative_path = get_upload_path()
-        file_path = os.path.join(upload_path, filename)
-        
-        # Save file
-        file.save(file_path)
-        
-        # Get file size
-        file_size = os.path.getsize(file_path)
+        # Save into the content-addressed store (hashed while streaming; identical files share one blob)
+        stored = ContentStore.save(file.stream, UPLOAD_FOLDER, 'pdf')
         
         # Create File record
         file_record = File(
             filename=filename,
             original_filename=file.filename,
-            file_path=os.path.join(relative_path, filename),
-            file_size=file_size,
+            file_path=stored['file_path'],
+            file_size=stored['file_size'],
+            content_hash=stored['content_hash'],
             file_type='pdf',
             mime_type='application/pdf',
             delivery_id=delivery_id,  # Link directly to delivery
@@ -335,48 +649,25 @@ def upload_delivery_document(delivery_id):
         delivery.extraction_status = 'pending'
         delivery.updated_at = datetime.utcnow()
         
-        db.session.commit()
+        db.session.flush()
         
-        # Trigger n8n workflow for document extraction (works for ALL document types)
-        try:
-            import requests
-            n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL', 'https://n8n1.trart.uk')
-            n8n_api_key = os.getenv('N8N_API_KEY', '')
-            
-            # Build full file URL for n8n to download
-            file_url = f"http://localhost:5001/uploads/{filename}"
-            
-            # Generic webhook payload that works for ALL document types
-            webhook_payload = {
-                'file_id': file_record.id,
-                'file_url': file_url,
-                'file_path': file_record.file_path,
-                # Include all possible ID fields - n8n will use the right one
-                'delivery_id': delivery_id,
-                'po_id': delivery.po_id if delivery.purchase_order else None,
-                'po_ref': delivery.purchase_order.po_ref if delivery.purchase_order else None,
-                'document_context': 'delivery'  # Hint for n8n, but it will auto-detect
-            }
-            
-            # Trigger n8n document intelligence workflow (generic endpoint)
-            response = requests.post(
-                f"{n8n_webhook_url}/webhook/extract-document",  # Generic endpoint for all document types
-                json=webhook_payload,
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {n8n_api_key}'
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                print(f"✅ n8n document intelligence triggered for delivery {delivery_id}")
-            else:
-                print(f"⚠️ n8n workflow trigger failed: {response.status_code}")
-                
-        except Exception as e:
-            print(f"⚠️ Could not trigger n8n workflow: {str(e)}")
-            # Don't fail the upload if n8n is unavailable
+        # Queue the n8n document extraction (works for ALL document types); the
+        # dispatcher sends it after commit and retries while n8n is unavailable
+        file_url = f"http://localhost:5001/uploads/{filename}"
+        
+        # Generic webhook payload that works for ALL document types
+        webhook_payload = {
+            'file_id': file_record.id,
+            'file_url': file_url,
+            'file_path': file_record.file_path,
+            # Include all possible ID fields - n8n will use the right one
+            'delivery_id': delivery_id,
+            'po_id': delivery.po_id if delivery.purchase_order else None,
+            'po_ref': delivery.purchase_order.po_ref if delivery.purchase_order else None,
+            'document_context': 'delivery'  # Hint for n8n, but it will auto-detect
+        }
+        extraction = start_extraction(file_record, webhook_payload)
+        queue_previews(file_record)
         
         return jsonify({
             'success': True,
@@ -384,8 +675,11 @@ def upload_delivery_document(delivery_id):
             'delivery_id': delivery_id,
             'file_id': file_record.id,
             'file_path': file_record.file_path,
-            'extraction_status': 'pending',
-            'n8n_triggered': True
+            'extraction_status': extraction['status'],
+            'extraction_cached': extraction['cached'],
+            'deduplicated': stored['deduplicated'],
+            'n8n_triggered': extraction['dispatch_id'] is not None,
+            'dispatch_id': extraction['dispatch_id']
         }), 201
         
     except Exception as e:
@@ -420,20 +714,16 @@ def upload_po_document(po_id):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"po_{po_id}_{timestamp}_{filename}"
         
-        # Get organized upload path
-        upload_path, relative_path = get_upload_path()
-        file_path = os.path.join(upload_path, filename)
-        
-        # Save file
-        file.save(file_path)
-        file_size = os.path.getsize(file_path)
+        # Save into the content-addressed store (hashed while streaming; identical files share one blob)
+        stored = ContentStore.save(file.stream, UPLOAD_FOLDER, 'pdf')
         
         # Create File record
         file_record = File(
             filename=filename,
             original_filename=file.filename,
-            file_path=os.path.join(relative_path, filename),
-            file_size=file_size,
+            file_path=stored['file_path'],
+            file_size=stored['file_size'],
+            content_hash=stored['content_hash'],
             file_type='pdf',
             mime_type='application/pdf',
             purchase_order_id=po_id,  # Link directly to PO
@@ -442,43 +732,22 @@ def upload_po_document(po_id):
         )
         
         db.session.add(file_record)
-        db.session.commit()
+        db.session.flush()
         
-        # Trigger n8n workflow
-        try:
-            import requests
-            n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL', 'https://n8n1.trart.uk')
-            n8n_api_key = os.getenv('N8N_API_KEY', '')
-            
-            file_url = f"http://localhost:5001/uploads/{filename}"
-            
-            webhook_payload = {
-                'file_id': file_record.id,
-                'file_url': file_url,
-                'file_path': file_record.file_path,
-                'po_id': po_id,
-                'po_ref': po.po_ref,
-                'material_id': po.material_id,
-                'document_context': 'purchase_order'
-            }
-            
-            response = requests.post(
-                f"{n8n_webhook_url}/webhook/extract-document",
-                json=webhook_payload,
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {n8n_api_key}'
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                print(f"✅ n8n document intelligence triggered for PO {po_id}")
-            else:
-                print(f"⚠️ n8n workflow trigger failed: {response.status_code}")
-                
-        except Exception as e:
-            print(f"⚠️ Could not trigger n8n workflow: {str(e)}")
+        # Queue the n8n extraction workflow
+        file_url = f"http://localhost:5001/uploads/{filename}"
+        
+        webhook_payload = {
+            'file_id': file_record.id,
+            'file_url': file_url,
+            'file_path': file_record.file_path,
+            'po_id': po_id,
+            'po_ref': po.po_ref,
+            'material_id': po.material_id,
+            'document_context': 'purchase_order'
+        }
+        extraction = start_extraction(file_record, webhook_payload)
+        queue_previews(file_record)
         
         return jsonify({
             'success': True,
@@ -486,8 +755,11 @@ def upload_po_document(po_id):
             'po_id': po_id,
             'file_id': file_record.id,
             'file_path': file_record.file_path,
-            'extraction_status': 'pending',
-            'n8n_triggered': True
+            'extraction_status': extraction['status'],
+            'extraction_cached': extraction['cached'],
+            'deduplicated': stored['deduplicated'],
+            'n8n_triggered': extraction['dispatch_id'] is not None,
+            'dispatch_id': extraction['dispatch_id']
         }), 201
         
     except Exception as e:
@@ -522,20 +794,16 @@ def upload_payment_document(payment_id):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"invoice_{payment_id}_{timestamp}_{filename}"
         
-        # Get organized upload path
-        upload_path, relative_path = get_upload_path()
-        file_path = os.path.join(upload_path, filename)
-        
-        # Save file
-        file.save(file_path)
-        file_size = os.path.getsize(file_path)
+        # Save into the content-addressed store (hashed while streaming; identical files share one blob)
+        stored = ContentStore.save(file.stream, UPLOAD_FOLDER, 'pdf')
         
         # Create File record
         file_record = File(
             filename=filename,
             original_filename=file.filename,
-            file_path=os.path.join(relative_path, filename),
-            file_size=file_size,
+            file_path=stored['file_path'],
+            file_size=stored['file_size'],
+            content_hash=stored['content_hash'],
             file_type='pdf',
             mime_type='application/pdf',
             payment_id=payment_id,  # Link directly to payment
@@ -544,43 +812,22 @@ def upload_payment_document(payment_id):
         )
         
         db.session.add(file_record)
-        db.session.commit()
+        db.session.flush()
         
-        # Trigger n8n workflow
-        try:
-            import requests
-            n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL', 'https://n8n1.trart.uk')
-            n8n_api_key = os.getenv('N8N_API_KEY', '')
-            
-            file_url = f"http://localhost:5001/uploads/{filename}"
-            
-            webhook_payload = {
-                'file_id': file_record.id,
-                'file_url': file_url,
-                'file_path': file_record.file_path,
-                'payment_id': payment_id,
-                'po_id': payment.po_id,
-                'po_ref': payment.purchase_order.po_ref if payment.purchase_order else None,
-                'document_context': 'invoice'
-            }
-            
-            response = requests.post(
-                f"{n8n_webhook_url}/webhook/extract-document",
-                json=webhook_payload,
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {n8n_api_key}'
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                print(f"✅ n8n document intelligence triggered for payment {payment_id}")
-            else:
-                print(f"⚠️ n8n workflow trigger failed: {response.status_code}")
-                
-        except Exception as e:
-            print(f"⚠️ Could not trigger n8n workflow: {str(e)}")
+        # Queue the n8n extraction workflow
+        file_url = f"http://localhost:5001/uploads/{filename}"
+        
+        webhook_payload = {
+            'file_id': file_record.id,
+            'file_url': file_url,
+            'file_path': file_record.file_path,
+            'payment_id': payment_id,
+            'po_id': payment.po_id,
+            'po_ref': payment.purchase_order.po_ref if payment.purchase_order else None,
+            'document_context': 'invoice'
+        }
+        extraction = start_extraction(file_record, webhook_payload)
+        queue_previews(file_record)
         
         return jsonify({
             'success': True,
@@ -588,8 +835,11 @@ def upload_payment_document(payment_id):
             'payment_id': payment_id,
             'file_id': file_record.id,
             'file_path': file_record.file_path,
-            'extraction_status': 'pending',
-            'n8n_triggered': True
+            'extraction_status': extraction['status'],
+            'extraction_cached': extraction['cached'],
+            'deduplicated': stored['deduplicated'],
+            'n8n_triggered': extraction['dispatch_id'] is not None,
+            'dispatch_id': extraction['dispatch_id']
         }), 201
         
     except Exception as e:
@@ -644,20 +894,16 @@ def upload_new_po():
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"po_{new_po.id}_{timestamp}_{filename}"
         
-        # Get organized upload path
-        upload_path, relative_path = get_upload_path()
-        file_path = os.path.join(upload_path, filename)
-        
-        # Save file
-        file.save(file_path)
-        file_size = os.path.getsize(file_path)
+        # Save into the content-addressed store (hashed while streaming; identical files share one blob)
+        stored = ContentStore.save(file.stream, UPLOAD_FOLDER, 'pdf')
         
         # Create File record linked to new PO
         file_record = File(
             filename=filename,
             original_filename=file.filename,
-            file_path=os.path.join(relative_path, filename),
-            file_size=file_size,
+            file_path=stored['file_path'],
+            file_size=stored['file_size'],
+            content_hash=stored['content_hash'],
             file_type='pdf',
             mime_type='application/pdf',
             purchase_order_id=new_po.id,  # Link to new PO
@@ -666,44 +912,23 @@ def upload_new_po():
         )
         
         db.session.add(file_record)
-        db.session.commit()
+        db.session.flush()
         
-        # Trigger n8n workflow to extract data and populate the PO
-        try:
-            import requests
-            n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL', 'https://n8n1.trart.uk')
-            n8n_api_key = os.getenv('N8N_API_KEY', '')
-            
-            file_url = f"http://localhost:5001/uploads/{filename}"
-            
-            webhook_payload = {
-                'file_id': file_record.id,
-                'file_url': file_url,
-                'file_path': file_record.file_path,
-                'po_id': new_po.id,
-                'po_ref': new_po.po_ref,
-                'material_id': material_id,
-                'document_context': 'purchase_order',
-                'auto_created': True  # Flag to indicate this was auto-created
-            }
-            
-            response = requests.post(
-                f"{n8n_webhook_url}/webhook/extract-document",
-                json=webhook_payload,
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {n8n_api_key}'
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                print(f"✅ n8n document intelligence triggered for new PO {new_po.id}")
-            else:
-                print(f"⚠️ n8n workflow trigger failed: {response.status_code}")
-                
-        except Exception as e:
-            print(f"⚠️ Could not trigger n8n workflow: {str(e)}")
+        # Queue the n8n workflow to extract data and populate the PO
+        file_url = f"http://localhost:5001/uploads/{filename}"
+        
+        webhook_payload = {
+            'file_id': file_record.id,
+            'file_url': file_url,
+            'file_path': file_record.file_path,
+            'po_id': new_po.id,
+            'po_ref': new_po.po_ref,
+            'material_id': material_id,
+            'document_context': 'purchase_order',
+            'auto_created': True  # Flag to indicate this was auto-created
+        }
+        extraction = start_extraction(file_record, webhook_payload)
+        queue_previews(file_record)
         
         return jsonify({
             'success': True,
@@ -712,8 +937,11 @@ def upload_new_po():
             'po_ref': new_po.po_ref,
             'file_id': file_record.id,
             'file_path': file_record.file_path,
-            'extraction_status': 'pending',
-            'n8n_triggered': True
+            'extraction_status': extraction['status'],
+            'extraction_cached': extraction['cached'],
+            'deduplicated': stored['deduplicated'],
+            'n8n_triggered': extraction['dispatch_id'] is not None,
+            'dispatch_id': extraction['dispatch_id']
         }), 201
         
     except Exception as e:
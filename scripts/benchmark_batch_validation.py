@@ -0,0 +1,146 @@
+"""
+Benchmark for DataProcessingAgent batch validation
+Seeds an in-memory database with POs, payments and deliveries, then validates
+batches of mixed LPO releases, invoices and deliveries two ways: one process_data call per record
+(the old /validate-and-check/batch loop) and process_batch with prefetched
+lookups. Reports records per second and SQL statement count for each.
+
+Usage: python scripts/benchmark_batch_validation.py [--skip-per-record]
+"""
+import sys
+import os
+import time
+import random
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import create_app
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from models.delivery import Delivery
+from services.data_processing_agent import DataProcessingAgent
+
+BATCH_SIZES = [100, 1000, 10000]
+TOTAL_POS = 5000
+MATERIALS = 20
+SUPPLIERS = [f'Supplier {s:03d} Trading LLC' for s in range(150)]
+
+
+def seed():
+    """Insert materials, POs spread over a year, one or two payments and one delivery per PO"""
+    db.drop_all()
+    db.create_all()
+    rng = random.Random(42)
+    now = datetime.utcnow()
+
+    db.session.execute(Material.__table__.insert(), [
+        {'material_type': f'Material {m}'} for m in range(MATERIALS)
+    ])
+    material_ids = [row[0] for row in db.session.query(Material.id)]
+
+    db.session.execute(PurchaseOrder.__table__.insert(), [
+        {
+            'material_id': rng.choice(material_ids),
+            'po_ref': f'LPO-2025-{p:05d}',
+            'po_date': now - timedelta(days=rng.randint(0, 365)),
+            'supplier_name': rng.choice(SUPPLIERS),
+            'total_amount': rng.uniform(5000, 400000)
+        }
+        for p in range(TOTAL_POS)
+    ])
+    pos = db.session.query(PurchaseOrder.id, PurchaseOrder.total_amount).all()
+
+    payments = []
+    for po_id, amount in pos:
+        for n in range(rng.randint(1, 2)):
+            payments.append({
+                'po_id': po_id,
+                'total_amount': amount / 2,
+                'paid_amount': amount / 2,
+                'invoice_ref': f'INV-{po_id}-{n}',
+                'payment_ref': f'PAY-{po_id}-{n}'
+            })
+    db.session.execute(Payment.__table__.insert(), payments)
+
+    db.session.execute(Delivery.__table__.insert(), [
+        {
+            'po_id': po_id,
+            'expected_delivery_date': now - timedelta(days=rng.randint(-60, 365)),
+            'delivery_status': 'Pending'
+        }
+        for po_id, _ in pos
+    ])
+    db.session.commit()
+    return material_ids, [po_id for po_id, _ in pos]
+
+
+def records(count, material_ids, po_ids):
+    """Spreadsheet-like mix of LPO releases, invoices and deliveries"""
+    rng = random.Random(count)
+    now = datetime.utcnow()
+    batch = []
+    for i in range(count):
+        if i % 3 == 1:
+            po_id = rng.choice(po_ids)
+            batch.append({'record_type': 'invoice', 'match_invoice_to_lpo': True, 'data': {
+                'po_id': po_id,
+                'payment_date': now.strftime('%Y-%m-%d'),
+                'total_amount': rng.uniform(1000, 50000),
+                'invoice_number': f'INV-{po_id}-{rng.randint(0, 3)}',
+                'payment_ref': f'PAY-NEW-{i}'
+            }})
+        elif i % 3 == 2:
+            batch.append({'record_type': 'delivery', 'data': {
+                'lpo_id': rng.choice(po_ids),
+                'delivery_date': (now - timedelta(days=rng.randint(0, 365))).strftime('%Y-%m-%d'),
+                'status': 'Delivered'
+            }})
+        else:
+            batch.append({'record_type': 'lpo_release', 'data': {
+                'material_id': rng.choice(material_ids),
+                'supplier_name': rng.choice(SUPPLIERS),
+                'lpo_number': f'LPO-2025-{rng.randint(0, TOTAL_POS * 2):05d}',
+                'release_date': (now - timedelta(days=rng.randint(0, 365))).strftime('%Y-%m-%d'),
+                'amount': rng.uniform(5000, 400000)
+            }})
+    return batch
+
+
+def per_record(agent, batch):
+    for record in batch:
+        agent.process_data(record['record_type'], record['data'], check_duplicates=True,
+                           match_invoice_to_lpo=record.get('match_invoice_to_lpo', False))
+
+
+def main():
+    skip_per_record = '--skip-per-record' in sys.argv
+    app = create_app()
+
+    with app.app_context():
+        material_ids, po_ids = seed()
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: statements.append(1))
+
+        print(f"{'records':>8} {'mode':>11} {'seconds':>8} {'records/s':>10} {'queries':>8}")
+        for size in BATCH_SIZES:
+            batch = records(size, material_ids, po_ids)
+            modes = [('batch', lambda: DataProcessingAgent(db.session).process_batch(batch))]
+            if not skip_per_record:
+                modes.insert(0, ('per-record', lambda: per_record(DataProcessingAgent(db.session), batch)))
+
+            for mode, run in modes:
+                db.session.expunge_all()
+                statements.clear()
+                start = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - start
+                print(f"{size:>8} {mode:>11} {elapsed:>8.2f} {size / elapsed:>10.0f} {len(statements):>8}")
+
+
+if __name__ == '__main__':
+    main()
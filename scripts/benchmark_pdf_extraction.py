@@ -0,0 +1,86 @@
+"""
+Benchmark for PdfExtractionService
+Builds a large PDF from the pages of each sample in "sample documents/" and
+times sequential extraction against the process pool at increasing worker
+counts. Speedup should track the worker count up to the number of cores.
+
+Usage: python scripts/benchmark_pdf_extraction.py [pages]
+"""
+import sys
+import os
+import glob
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+import PyPDF2
+from app import create_app
+from services.pdf_extraction import PdfExtractionService
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample documents')
+TARGET_PAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+PAGES_PER_TASK = 8
+RUNS = 3
+
+
+def build_large_pdf(sample_path, target_pages):
+    """Repeat the sample's pages until the document has target_pages pages"""
+    reader = PyPDF2.PdfReader(sample_path)
+    writer = PyPDF2.PdfWriter()
+    while len(writer.pages) < target_pages:
+        for page in reader.pages:
+            if len(writer.pages) == target_pages:
+                break
+            writer.add_page(page)
+
+    fd, path = tempfile.mkstemp(suffix='.pdf', prefix='pdf_bench_')
+    with os.fdopen(fd, 'wb') as f:
+        writer.write(f)
+    return path
+
+
+def time_extraction(path, workers):
+    """Median seconds to extract every page"""
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        pages = list(PdfExtractionService.iter_pages(path, workers=workers, pages_per_task=PAGES_PER_TASK))
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2], pages
+
+
+def main():
+    app = create_app()
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({n for n in (1, 2, 4, 8) if n < cores} | {cores})
+
+    samples = sorted(glob.glob(os.path.join(SAMPLES_DIR, '**', '*.pdf'), recursive=True))
+    if not samples:
+        print(f"No PDFs found in {SAMPLES_DIR}")
+        return
+
+    print(f"{TARGET_PAGES} pages per document, {cores} cores, {PAGES_PER_TASK} pages per task\n")
+    with app.app_context():
+        for sample in samples:
+            path = build_large_pdf(sample, TARGET_PAGES)
+            try:
+                baseline, expected = time_extraction(path, workers=0)
+                print(os.path.basename(sample))
+                print(f"{'workers':>10} {'seconds':>10} {'pages/s':>10} {'speedup':>8}")
+                print(f"{'inline':>10} {baseline:>10.2f} {TARGET_PAGES / baseline:>10.1f} {1.0:>8.2f}")
+
+                for workers in worker_counts:
+                    seconds, pages = time_extraction(path, workers=workers)
+                    assert pages == expected, 'pool output differs from sequential extraction'
+                    print(f"{workers:>10} {seconds:>10.2f} {TARGET_PAGES / seconds:>10.1f} {baseline / seconds:>8.2f}")
+                print()
+            finally:
+                os.remove(path)
+
+    PdfExtractionService.shutdown()
+
+
+if __name__ == '__main__':
+    main()
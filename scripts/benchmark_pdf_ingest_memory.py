@@ -0,0 +1,142 @@
+"""
+Peak memory of /api/n8n/extract-pdf-text per upload format
+Builds single-page PDFs padded to 10, 50 and 100 MB with a large stream,
+then posts each one as base64 JSON, raw application/pdf and multipart in a
+fresh process and reports that process's peak RSS growth. The request body
+is streamed from disk so only the server side of the request is measured.
+
+Usage: python scripts/benchmark_pdf_ingest_memory.py [size_mb ...]
+"""
+import sys
+import os
+import base64
+import json
+import resource
+import shutil
+import subprocess
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'sample documents', 'sample lpo', 'sample single page.pdf')
+DEFAULT_SIZES_MB = [10, 50, 100]
+MODES = ['base64_json', 'raw_pdf', 'multipart']
+API_KEY = 'benchmark-key'
+BOUNDARY = 'pdf-ingest-benchmark'
+
+
+def build_pdf(path, size_mb):
+    """
+    One-page PDF padded to size_mb with an incompressible stream, stored as
+    an indirect object the way large images and attachments usually are
+    """
+    import PyPDF2
+    from PyPDF2.generic import NameObject, StreamObject
+    reader = PyPDF2.PdfReader(SAMPLE_PDF)
+    writer = PyPDF2.PdfWriter()
+    writer.add_page(reader.pages[0])
+    padding = StreamObject()
+    padding._data = os.urandom(size_mb * 1024 * 1024)
+    writer._root_object[NameObject('/Padding')] = writer._add_object(padding)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def build_body(pdf_path, mode, body_path):
+    """Write the request body for mode to body_path and return its content type"""
+    with open(pdf_path, 'rb') as pdf, open(body_path, 'wb') as body:
+        if mode == 'base64_json':
+            body.write(json.dumps({'file_data': base64.b64encode(pdf.read()).decode(), 'wait': True}).encode())
+            return 'application/json'
+        if mode == 'raw_pdf':
+            for chunk in iter(lambda: pdf.read(1024 * 1024), b''):
+                body.write(chunk)
+            return 'application/pdf'
+        body.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="wait"\r\n\r\ntrue\r\n'.encode())
+        body.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="doc.pdf"\r\n'
+                   f'Content-Type: application/pdf\r\n\r\n'.encode())
+        for chunk in iter(lambda: pdf.read(1024 * 1024), b''):
+            body.write(chunk)
+        body.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+        return f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def measure(body_path, content_type):
+    """Run in a fresh process: post the body and print peak RSS growth in MB"""
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    app.config['N8N_API_KEY'] = API_KEY
+    app.config['PDF_EXTRACTION_WORKERS'] = 0
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    query = '?wait=true' if content_type == 'application/pdf' else ''
+    before = reset_peak_rss()
+    with open(body_path, 'rb') as body:
+        response = client.post(f'/api/n8n/extract-pdf-text{query}', input_stream=body,
+                               content_length=os.path.getsize(body_path), content_type=content_type,
+                               headers={'X-API-Key': API_KEY})
+    after = peak_rss()
+    assert response.status_code == 200, response.get_json()
+    print(json.dumps({'peak_mb': after / 1024, 'growth_mb': (after - before) / 1024}))
+
+
+def proc_status_kb(field):
+    """A kB value from /proc/self/status, or None off Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def reset_peak_rss():
+    """Reset the peak RSS counter where the kernel allows it and return current RSS in kB"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+    return proc_status_kb('VmRSS') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss():
+    """Peak RSS in kB since the last reset"""
+    return proc_status_kb('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main(sizes_mb):
+    workdir = tempfile.mkdtemp(prefix='pdf_ingest_')
+    print(f"{'size MB':>8} {'mode':>12} {'peak RSS MB':>12} {'growth MB':>10}")
+    try:
+        for size_mb in sizes_mb:
+            pdf_path = os.path.join(workdir, f'{size_mb}mb.pdf')
+            build_pdf(pdf_path, size_mb)
+            for mode in MODES:
+                body_path = os.path.join(workdir, f'{size_mb}mb.{mode}')
+                content_type = build_body(pdf_path, mode, body_path)
+                run = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--measure', body_path, content_type],
+                    capture_output=True, text=True
+                )
+                if run.returncode != 0:
+                    raise RuntimeError(run.stderr)
+                result = json.loads(run.stdout.strip().splitlines()[-1])
+                print(f"{size_mb:>8} {mode:>12} {result['peak_mb']:>12.1f} {result['growth_mb']:>10.1f}")
+                os.remove(body_path)
+            os.remove(pdf_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES_MB)
@@ -0,0 +1,94 @@
+"""
+Benchmark for AnalyticsService.get_supplier_performance
+Seeds an in-memory database with a fixed number of POs spread across a
+growing number of suppliers and reports latency and SQL statement count,
+which should both stay flat as the supplier count grows.
+
+Usage: python scripts/benchmark_supplier_scorecard.py
+"""
+import sys
+import os
+import time
+import random
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import create_app
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.delivery import Delivery
+from services.analytics_service import AnalyticsService
+
+SUPPLIER_COUNTS = [10, 50, 100, 250, 500]
+TOTAL_POS = 2500
+DELIVERIES_PER_PO = 2
+RUNS = 5
+
+
+def seed(supplier_count):
+    """Reset tables and insert suppliers, POs and deliveries"""
+    db.drop_all()
+    db.create_all()
+    rng = random.Random(42)
+    now = datetime.utcnow()
+
+    material = Material(material_type='Cables & Wires')
+    db.session.add(material)
+    db.session.flush()
+
+    pos = []
+    for p in range(TOTAL_POS):
+        pos.append({
+            'material_id': material.id,
+            'po_ref': f'PO-{p:05d}',
+            'po_date': now - timedelta(days=rng.randint(0, 170)),
+            'supplier_name': f'Supplier {p % supplier_count:04d}',
+            'total_amount': rng.uniform(1000, 200000),
+            'po_status': 'Released'
+        })
+    db.session.execute(PurchaseOrder.__table__.insert(), pos)
+
+    po_ids = [row[0] for row in db.session.query(PurchaseOrder.id)]
+    deliveries = []
+    for po_id in po_ids:
+        for _ in range(DELIVERIES_PER_PO):
+            delayed = rng.random() < 0.3
+            deliveries.append({
+                'po_id': po_id,
+                'delivery_status': rng.choice(['Pending', 'Partial', 'Delivered']),
+                'is_delayed': delayed,
+                'delay_days': rng.randint(1, 10) if delayed else 0
+            })
+    db.session.execute(Delivery.__table__.insert(), deliveries)
+    db.session.commit()
+
+
+def main():
+    app = create_app()
+
+    with app.app_context():
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: statements.append(1))
+
+        print(f"{'suppliers':>10} {'deliveries':>11} {'median ms':>10} {'queries':>8}")
+        for supplier_count in SUPPLIER_COUNTS:
+            seed(supplier_count)
+
+            timings = []
+            for _ in range(RUNS):
+                statements.clear()
+                start = time.perf_counter()
+                AnalyticsService.get_supplier_performance()
+                timings.append((time.perf_counter() - start) * 1000)
+
+            timings.sort()
+            delivery_count = TOTAL_POS * DELIVERIES_PER_PO
+            print(f"{supplier_count:>10} {delivery_count:>11} {timings[len(timings) // 2]:>10.1f} {len(statements):>8}")
+
+
+if __name__ == '__main__':
+    main()
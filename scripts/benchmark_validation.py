@@ -0,0 +1,83 @@
+"""
+Micro-benchmark for DataProcessingAgent validation
+Times DataProcessingAgent._validate per record for each record type on
+spreadsheet-like records (repeated dates, a few bad fields), without a
+database: no PO lookups, and amount anomalies need an application context.
+
+Usage: python scripts/benchmark_validation.py [records per type]
+"""
+import sys
+import os
+import time
+import random
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from services.data_processing_agent import DataProcessingAgent
+
+RECORDS_PER_TYPE = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+ROUNDS = 5
+
+
+def records(record_type, count):
+    """Records of one type; dates come from a few months, as in an import sheet"""
+    rng = random.Random(record_type)
+    today = datetime.now()
+    dates = [(today - timedelta(days=d)).strftime('%Y-%m-%d') for d in range(90)]
+
+    batch = []
+    for i in range(count):
+        if record_type == 'lpo_release':
+            batch.append({
+                'material_id': rng.randint(1, 35),
+                'supplier_name': f'Supplier {rng.randint(1, 150)} LLC',
+                'lpo_number': rng.choice([f'LPO-2025-{i:04d}', f'PO/{i}']),
+                'release_date': rng.choice(dates),
+                'expected_delivery_date': rng.choice(dates),
+                'amount': rng.uniform(-100, 600000),
+                'contact_number': rng.choice(['+971 50 123 4567', '12-34']),
+                'contact_email': rng.choice(['buyer@example.com', 'buyer(at)example.com'])
+            })
+        elif record_type == 'invoice':
+            batch.append({
+                'invoice_number': rng.choice([f'INV-{i}', 'I1']),
+                'payment_date': rng.choice(dates),
+                'invoice_date': rng.choice(dates),
+                'due_date': rng.choice(dates + ['2031-01-01']),
+                'total_amount': rng.uniform(100, 50000)
+            })
+        elif record_type == 'submittal':
+            batch.append({
+                'material_type': 'Cable Tray',
+                'approval_status': rng.choice(['Pending', 'Approved', 'Rejected']),
+                'approval_date': rng.choice(dates),
+                'revision_number': rng.randint(0, 3)
+            })
+        else:
+            batch.append({
+                'lpo_id': rng.randint(1, 500),
+                'delivery_date': rng.choice(dates + ['15/01/2025']),
+                'status': rng.choice(['Delivered', 'Partial', 'Lost']),
+                'delivery_percentage': rng.randint(0, 100)
+            })
+    return batch
+
+
+def main():
+    agent = DataProcessingAgent(None)
+
+    print(f"{'record type':>12} {'records':>8} {'us/record':>10}")
+    for record_type in ['lpo_release', 'invoice', 'submittal', 'delivery']:
+        batch = records(record_type, RECORDS_PER_TYPE)
+        best = None
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            for data in batch:
+                agent._validate(record_type, data)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{record_type:>12} {len(batch):>8} {best / len(batch) * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Remove uploaded blobs that no File row references
+Deleting a file only drops its row; run this periodically (e.g. from cron)
+to reclaim the blob and its previews once no other upload shares them.
+
+Usage: python scripts/collect_blob_garbage.py [grace_seconds]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db
+from models.file import File
+from services.content_store import ContentStore
+from app import create_app
+from routes.uploads import UPLOAD_FOLDER
+
+
+def collect(grace=None):
+    """Remove unreferenced blobs older than the grace period"""
+    app = create_app()
+
+    with app.app_context():
+        referenced = {
+            content_hash for (content_hash,) in
+            db.session.query(File.content_hash).filter(File.content_hash.isnot(None)).distinct()
+        }
+        removed = ContentStore.collect_garbage(UPLOAD_FOLDER, referenced, grace)
+
+    print(f"✅ Removed {removed} unreferenced files from {os.path.join(UPLOAD_FOLDER, ContentStore.BLOB_DIR)}")
+    return removed
+
+
+if __name__ == '__main__':
+    collect(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,330 @@
+"""
+Amount Profiles - Per-supplier and per-material amount distributions
+Holds the amounts of every PO and payment in memory, grouped by supplier and
+material, so the Data Processing Agent can score a new amount against its
+history with a robust z-score (median/MAD of log amounts) without a query
+"""
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+from flask import current_app, has_app_context
+from models import db
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from services.write_tracking import WriteTracker
+
+AmountAnomaly = namedtuple('AmountAnomaly', ['scope', 'z_score', 'median', 'count'])
+
+
+class AmountDistribution:
+    """
+    Log amounts of one group, kept sorted
+
+    The median is read straight off the sorted values. The deviations from it
+    are two sorted runs (values below the median, walked down, and values from
+    it up), so their median (the MAD) is a selection over two sorted
+    sequences in O(log n) rather than a sort of every deviation per change.
+    """
+
+    MAD_SCALE = 1.4826  # MAD -> standard deviation for normal data
+    MEAN_AD_SCALE = 1.2533  # Mean absolute deviation -> standard deviation, when over half the values tie
+
+    def __init__(self):
+        self.values = []
+        self._stats = None
+
+    def add(self, log_amount):
+        insort(self.values, log_amount)
+        self._stats = None
+
+    def remove(self, log_amount):
+        i = bisect_left(self.values, log_amount)
+        if i < len(self.values) and self.values[i] == log_amount:
+            del self.values[i]
+            self._stats = None
+
+    def stats(self):
+        """(median, spread) of the log amounts"""
+        if self._stats is None:
+            values = self.values
+            n = len(values)
+            median = self._median(values)
+            split = bisect_left(values, median)
+            mad = (self._deviation(median, split, (n - 1) // 2) + self._deviation(median, split, n // 2)) / 2
+            spread = mad * self.MAD_SCALE
+            if not spread:
+                # Over half the values tie; rare enough to sum every deviation
+                spread = sum(abs(v - median) for v in values) / n * self.MEAN_AD_SCALE
+            self._stats = (median, spread)
+        return self._stats
+
+    def z_score(self, log_amount):
+        """Robust z-score of a log amount, or None when the group has no spread"""
+        median, spread = self.stats()
+        if not spread:
+            return None
+        return (log_amount - median) / spread
+
+    def _deviation(self, median, split, k):
+        """
+        k-th smallest (0-based) |value - median|
+
+        below[i] = median - values[split - 1 - i] and above[j] = values[split + j] - median
+        are both ascending; find how many of the k + 1 smallest come from below
+        """
+        values = self.values
+        below_count, above_count = split, len(values) - split
+
+        def below(i):
+            return median - values[split - 1 - i] if i < below_count else math.inf
+
+        def above(j):
+            return values[split + j] - median if j < above_count else math.inf
+
+        lo, hi = max(0, k + 1 - above_count), min(k + 1, below_count)
+        while lo < hi:
+            taken = (lo + hi) // 2
+            if below(taken) < above(k - taken):
+                lo = taken + 1
+            else:
+                hi = taken
+        last_below = below(lo - 1) if lo > 0 else -math.inf
+        last_above = above(k - lo) if k - lo >= 0 else -math.inf
+        return max(last_below, last_above)
+
+    @staticmethod
+    def _median(values):
+        n = len(values)
+        return (values[(n - 1) // 2] + values[n // 2]) / 2
+
+
+class AmountProfiles:
+    """Process-local amount distributions, updated as POs and payments are committed"""
+
+    DEFAULT_Z_THRESHOLD = 3.5  # Iglewicz-Hoaglin cut-off for the modified z-score
+    DEFAULT_MIN_SAMPLES = 5  # Amounts a group needs before it is scored
+    DEFAULT_MAX_AGE = 3600  # Seconds before a reload picks up writes from other processes
+
+    # PO amounts form the 'lpo_releases' profiles and payment amounts the
+    # 'invoices' profiles, grouped by the supplier and material of their PO
+    TRACKED_MODELS = (PurchaseOrder, Payment)
+
+    # ==================== LOOKUPS ====================
+
+    @staticmethod
+    def anomalies(kind, amount, supplier_name=None, material_id=None):
+        """
+        Score an amount against the history of its supplier and its material
+
+        Groups with too little history are skipped; when neither can be
+        scored, the amount is scored against every amount of the kind.
+
+        Args:
+            kind: 'lpo_releases' (PO amounts) or 'invoices' (payment amounts)
+            amount: Amount to score
+            supplier_name: Supplier of the record
+            material_id: Material of the record
+
+        Returns:
+            List of AmountAnomaly for the groups where |z| exceeds the threshold
+        """
+        if not has_app_context() or not amount or amount <= 0:
+            return []
+
+        store = AmountProfiles._loaded_store()
+        threshold = current_app.config.get('AMOUNT_ANOMALY_Z_THRESHOLD', AmountProfiles.DEFAULT_Z_THRESHOLD)
+        min_samples = current_app.config.get('AMOUNT_ANOMALY_MIN_SAMPLES', AmountProfiles.DEFAULT_MIN_SAMPLES)
+        log_amount = math.log(amount)
+
+        scopes = []
+        if supplier_name:
+            scopes.append(('supplier', AmountProfiles._supplier_key(supplier_name)))
+        if material_id:
+            try:
+                scopes.append(('material', int(material_id)))
+            except (ValueError, TypeError):
+                pass
+
+        found = []
+        with store['lock']:
+            scored = False
+            for scope, key in scopes + [('all', None)]:
+                if scope == 'all' and scored:
+                    break
+                group = store['groups'].get((kind, scope, key))
+                if group is None or len(group.values) < min_samples:
+                    continue
+                scored = True
+                z_score = group.z_score(log_amount)
+                if z_score is not None and abs(z_score) > threshold:
+                    found.append(AmountAnomaly(scope, z_score, math.exp(group.stats()[0]), len(group.values)))
+        return found
+
+    @staticmethod
+    def load():
+        """(Re)build every distribution from the database"""
+        store = AmountProfiles._store()
+        pos = db.session.query(
+            PurchaseOrder.id, PurchaseOrder.total_amount, PurchaseOrder.supplier_name, PurchaseOrder.material_id
+        ).all()
+        payments = db.session.query(Payment.id, Payment.total_amount, Payment.po_id).all()
+
+        with store['lock']:
+            store.update(rows={}, groups={}, payments_by_po={})
+            for row in pos:
+                AmountProfiles._set_po(store, row[0], row[1:])
+            for row in payments:
+                AmountProfiles._set_payment(store, row[0], row[1:])
+            store['loaded_at'] = time.monotonic()
+
+    @staticmethod
+    def _loaded_store():
+        """Store of the current application, loaded and not older than the max age"""
+        store = AmountProfiles._store()
+        max_age = current_app.config.get('AMOUNT_PROFILE_MAX_AGE', AmountProfiles.DEFAULT_MAX_AGE)
+        if store['loaded_at'] is None or time.monotonic() - store['loaded_at'] > max_age:
+            AmountProfiles.load()
+        return store
+
+    @staticmethod
+    def _store():
+        """Profile state of the current application"""
+        return WriteTracker.store('amount_profiles', lambda: {
+            'lock': threading.RLock(),
+            'loaded_at': None,
+            'rows': {},  # ('po', id) -> (log amount, groups, supplier, material); ('payment', id) -> (log amount, groups, po_id)
+            'groups': {},  # (kind, scope, key) -> AmountDistribution
+            'payments_by_po': {}  # po_id -> {payment_id, ...}
+        })
+
+    # ==================== DISTRIBUTION UPDATES ====================
+
+    @staticmethod
+    def _supplier_key(supplier_name):
+        return ' '.join(str(supplier_name).lower().split()) if supplier_name else None
+
+    @staticmethod
+    def _groups(kind, supplier_key, material_id):
+        """Group keys an amount of this kind, supplier and material belongs to"""
+        groups = [(kind, 'all', None)]
+        if supplier_key:
+            groups.append((kind, 'supplier', supplier_key))
+        if material_id:
+            groups.append((kind, 'material', material_id))
+        return tuple(groups)
+
+    @staticmethod
+    def _payment_groups(store, po_id):
+        """Payments are grouped by the supplier and material of their PO"""
+        po_row = store['rows'].get(('po', po_id))
+        if po_row is None:
+            return AmountProfiles._groups('invoices', None, None)
+        return AmountProfiles._groups('invoices', po_row[2], po_row[3])
+
+    @staticmethod
+    def _regroup(store, row_key, log_amount, groups):
+        """Move a row's amount out of its current groups and into groups"""
+        old = store['rows'].get(row_key)
+        if old and old[0] is not None:
+            for group_key in old[1]:
+                group = store['groups'][group_key]
+                group.remove(old[0])
+                if not group.values:
+                    del store['groups'][group_key]
+
+        if log_amount is not None:
+            for group_key in groups:
+                store['groups'].setdefault(group_key, AmountDistribution()).add(log_amount)
+
+    @staticmethod
+    def _log_amount(amount):
+        return math.log(amount) if amount and amount > 0 else None
+
+    @staticmethod
+    def _set_po(store, po_id, values):
+        """Apply a PO's (total_amount, supplier_name, material_id), or None when deleted"""
+        row_key = ('po', po_id)
+        if values is None:
+            AmountProfiles._regroup(store, row_key, None, ())
+            store['rows'].pop(row_key, None)
+        else:
+            amount, supplier_name, material_id = values
+            supplier_key = AmountProfiles._supplier_key(supplier_name)
+            log_amount = AmountProfiles._log_amount(amount)
+            groups = AmountProfiles._groups('lpo_releases', supplier_key, material_id)
+            AmountProfiles._regroup(store, row_key, log_amount, groups)
+            store['rows'][row_key] = (log_amount, groups, supplier_key, material_id)
+
+        # Payments follow their PO's supplier and material
+        for payment_id in store['payments_by_po'].get(po_id, ()):
+            log_amount, _, payment_po_id = store['rows'][('payment', payment_id)]
+            groups = AmountProfiles._payment_groups(store, po_id)
+            AmountProfiles._regroup(store, ('payment', payment_id), log_amount, groups)
+            store['rows'][('payment', payment_id)] = (log_amount, groups, payment_po_id)
+
+    @staticmethod
+    def _set_payment(store, payment_id, values):
+        """Apply a payment's (total_amount, po_id), or None when deleted"""
+        row_key = ('payment', payment_id)
+        old = store['rows'].get(row_key)
+        if old:
+            store['payments_by_po'].get(old[2], set()).discard(payment_id)
+
+        if values is None:
+            AmountProfiles._regroup(store, row_key, None, ())
+            store['rows'].pop(row_key, None)
+            return
+
+        amount, po_id = values
+        log_amount = AmountProfiles._log_amount(amount)
+        groups = AmountProfiles._payment_groups(store, po_id)
+        AmountProfiles._regroup(store, row_key, log_amount, groups)
+        store['rows'][row_key] = (log_amount, groups, po_id)
+        store['payments_by_po'].setdefault(po_id, set()).add(payment_id)
+
+    # ==================== CHANGE TRACKING ====================
+
+    @staticmethod
+    def register_change_tracking():
+        """Collect PO and payment writes on flush and apply them once committed"""
+        WriteTracker.subscribe(
+            'amount_profiles',
+            AmountProfiles.TRACKED_MODELS,
+            on_flush=AmountProfiles._after_flush,
+            on_commit=AmountProfiles._after_commit
+        )
+
+    @staticmethod
+    def _after_flush(session, objects, deleted):
+        """Flush hook: the current values of written POs and payments"""
+        changes = []
+        for obj in objects:
+            if obj in deleted:
+                changes.append((type(obj), obj.id, None))
+            elif isinstance(obj, PurchaseOrder):
+                changes.append((PurchaseOrder, obj.id, (obj.total_amount, obj.supplier_name, obj.material_id)))
+            else:
+                changes.append((Payment, obj.id, (obj.total_amount, obj.po_id)))
+        return changes
+
+    @staticmethod
+    def _after_commit(session, writes):
+        """Commit hook: apply the transaction's writes to a loaded store"""
+        if not has_app_context():
+            return
+
+        store = AmountProfiles._store()
+        with store['lock']:
+            if writes.bulk:
+                store['loaded_at'] = None  # ORM UPDATE/DELETE statements: reload
+            if store['loaded_at'] is None:
+                return  # The next lookup loads committed rows
+
+            # POs first so payments of a new PO find its supplier and material
+            for model, row_id, values in sorted(writes.changes, key=lambda c: c[0] is Payment):
+                if model is PurchaseOrder:
+                    AmountProfiles._set_po(store, row_id, values)
+                else:
+                    AmountProfiles._set_payment(store, row_id, values)
@@ -4,12 +4,13 @@ Provides supplier performance, predictive analytics, financial insights, and del
 """
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_, or_, case
+from sqlalchemy.orm import joinedload
 from models import db
 from models.purchase_order import PurchaseOrder
 from models.delivery import Delivery
 from models.payment import Payment
 from models.material import Material
-import statistics
+from services.time_buckets import TimeBuckets
 
 
 class AnalyticsService:
@@ -46,11 +47,15 @@ class AnalyticsService:
         
         supplier_data = query.all()
         
+        # Delivery metrics for every supplier in one aggregated pass
+        scorecards = AnalyticsService._calculate_delivery_metrics_by_supplier(
+            cutoff_date, supplier_name=supplier_name
+        )
+        
         results = []
         for supplier in supplier_data:
-            # Get delivery metrics
-            delivery_metrics = AnalyticsService._calculate_delivery_metrics(
-                supplier.supplier_name, cutoff_date
+            delivery_metrics = scorecards.get(
+                supplier.supplier_name, AnalyticsService._empty_delivery_metrics()
             )
             
             # Calculate risk score
@@ -87,55 +92,102 @@ class AnalyticsService:
             })
         
         # Sort by risk score (lowest first = best performers)
-        results.sort(key=lambda x: x['risk_score'])
+        results.sort(key=lambda x: (x['risk_score'], x['supplier_name']))
         
         return results
     
     @staticmethod
     def _calculate_delivery_metrics(supplier_name, cutoff_date):
         """Calculate delivery-specific metrics for a supplier"""
-        # Get all deliveries for this supplier
-        deliveries = db.session.query(Delivery).join(
+        scorecards = AnalyticsService._calculate_delivery_metrics_by_supplier(
+            cutoff_date, supplier_name=supplier_name
+        )
+        return scorecards.get(supplier_name, AnalyticsService._empty_delivery_metrics())
+    
+    @staticmethod
+    def _calculate_delivery_metrics_by_supplier(cutoff_date, supplier_name=None, supplier_names=None):
+        """
+        Calculate delivery metrics for all suppliers in a single grouped query
+        (or only supplier_name / the suppliers in supplier_names)
+        
+        The trend split uses window functions so the "recent" half (first
+        len // 2 deliveries by id, as the per-supplier list was ordered
+        before) is counted in the same pass as the totals.
+        
+        Returns:
+            Dict mapping supplier_name -> delivery metrics dict
+        """
+        completed_statuses = ['Delivered', 'Partial']
+        
+        rows = db.session.query(
+            PurchaseOrder.supplier_name.label('supplier_name'),
+            Delivery.delivery_status.label('delivery_status'),
+            Delivery.is_delayed.label('is_delayed'),
+            Delivery.delay_days.label('delay_days'),
+            func.row_number().over(
+                partition_by=PurchaseOrder.supplier_name,
+                order_by=Delivery.id
+            ).label('position'),
+            func.count(Delivery.id).over(
+                partition_by=PurchaseOrder.supplier_name
+            ).label('supplier_total')
+        ).join(
             PurchaseOrder, Delivery.po_id == PurchaseOrder.id
         ).filter(
-            PurchaseOrder.supplier_name == supplier_name,
             PurchaseOrder.po_date >= cutoff_date
-        ).all()
+        )
         
-        if not deliveries:
-            return {
-                'on_time_rate': 0,
-                'avg_delay': 0,
-                'completed': 0,
-                'pending': 0,
-                'delayed': 0,
-                'quality_score': 0,
-                'trend': 'neutral'
-            }
-        
-        total = len(deliveries)
-        completed = sum(1 for d in deliveries if d.delivery_status in ['Delivered', 'Partial'])
-        pending = sum(1 for d in deliveries if d.delivery_status == 'Pending')
-        delayed = sum(1 for d in deliveries if d.is_delayed)
-        on_time = completed - sum(1 for d in deliveries if d.is_delayed and d.delivery_status in ['Delivered', 'Partial'])
+        if supplier_name:
+            rows = rows.filter(PurchaseOrder.supplier_name == supplier_name)
+        if supplier_names is not None:
+            rows = rows.filter(PurchaseOrder.supplier_name.in_(supplier_names))
+        
+        rows = rows.subquery()
+        
+        is_delayed = rows.c.is_delayed == True
+        is_completed = rows.c.delivery_status.in_(completed_statuses)
+        is_recent = rows.c.position * 2 <= rows.c.supplier_total
+        
+        aggregates = db.session.query(
+            rows.c.supplier_name,
+            func.count().label('total'),
+            func.count(case((is_completed, 1))).label('completed'),
+            func.count(case((rows.c.delivery_status == 'Pending', 1))).label('pending'),
+            func.count(case((is_delayed, 1))).label('delayed'),
+            func.count(case((and_(is_delayed, is_completed), 1))).label('delayed_completed'),
+            func.avg(case((and_(is_delayed, rows.c.delay_days != 0), rows.c.delay_days))).label('avg_delay'),
+            func.count(case((is_recent, 1))).label('recent_total'),
+            func.count(case((and_(is_recent, is_delayed), 1))).label('recent_delayed')
+        ).group_by(rows.c.supplier_name).all()
+        
+        return {
+            row.supplier_name: AnalyticsService._build_delivery_metrics(row)
+            for row in aggregates
+        }
+    
+    @staticmethod
+    def _build_delivery_metrics(row):
+        """Turn one aggregated supplier row into the delivery metrics dict"""
+        total = row.total
+        completed = row.completed
+        on_time = completed - row.delayed_completed
         
         on_time_rate = round((on_time / completed * 100) if completed > 0 else 0, 1)
         
-        # Calculate average delay (only for delayed deliveries)
-        delay_days = [d.delay_days for d in deliveries if d.is_delayed and d.delay_days]
-        avg_delay = round(statistics.mean(delay_days), 1) if delay_days else 0
+        # Average delay (only for delayed deliveries)
+        avg_delay = round(float(row.avg_delay), 1) if row.avg_delay is not None else 0
         
         # Quality score (inverse of delay rate + completion rate)
         quality_score = round((on_time_rate * 0.7) + ((completed / total * 100) * 0.3), 1)
         
         # Trend analysis (compare recent vs older deliveries)
-        mid_point = len(deliveries) // 2
-        if mid_point > 0:
-            recent_deliveries = deliveries[:mid_point]
-            older_deliveries = deliveries[mid_point:]
+        recent_total = row.recent_total
+        if recent_total > 0:
+            older_total = total - recent_total
+            older_delayed = row.delayed - row.recent_delayed
             
-            recent_delay_rate = sum(1 for d in recent_deliveries if d.is_delayed) / len(recent_deliveries)
-            older_delay_rate = sum(1 for d in older_deliveries if d.is_delayed) / len(older_deliveries)
+            recent_delay_rate = row.recent_delayed / recent_total
+            older_delay_rate = older_delayed / older_total
             
             if recent_delay_rate < older_delay_rate - 0.1:
                 trend = 'improving'
@@ -150,12 +202,25 @@ class AnalyticsService:
             'on_time_rate': on_time_rate,
             'avg_delay': avg_delay,
             'completed': completed,
-            'pending': pending,
-            'delayed': delayed,
+            'pending': row.pending,
+            'delayed': row.delayed,
             'quality_score': quality_score,
             'trend': trend
         }
     
+    @staticmethod
+    def _empty_delivery_metrics():
+        """Delivery metrics for a supplier with no deliveries in range"""
+        return {
+            'on_time_rate': 0,
+            'avg_delay': 0,
+            'completed': 0,
+            'pending': 0,
+            'delayed': 0,
+            'quality_score': 0,
+            'trend': 'neutral'
+        }
+    
     @staticmethod
     def _calculate_risk_score(supplier_name, delivery_metrics):
         """
@@ -197,12 +262,13 @@ class AnalyticsService:
     # ==================== PREDICTIVE ANALYTICS ====================
     
     @staticmethod
-    def predict_delivery_delays(po_id=None):
+    def predict_delivery_delays(po_id=None, supplier_name=None):
         """
         Predict potential delivery delays based on historical patterns
         
         Args:
             po_id: Optional specific PO to analyze, if None analyzes all pending
+            supplier_name: Optional supplier to restrict predictions to
             
         Returns:
             List of predictions with risk scores and recommendations
@@ -217,14 +283,27 @@ class AnalyticsService:
         
         if po_id:
             query = query.filter(PurchaseOrder.id == po_id)
+        if supplier_name:
+            query = query.filter(PurchaseOrder.supplier_name == supplier_name)
         
-        pending_deliveries = query.all()
+        pending_deliveries = query.options(joinedload(PurchaseOrder.material)).all()
+        
+        if not pending_deliveries:
+            return []
+        
+        # Supplier history table for the pending suppliers, built once and
+        # shared by every prediction
+        supplier_names = sorted({po.supplier_name for _, po in pending_deliveries})
+        history_cutoff = datetime.utcnow() - timedelta(days=365)
+        supplier_histories = AnalyticsService._calculate_delivery_metrics_by_supplier(
+            history_cutoff, supplier_names=supplier_names
+        )
         
         predictions = []
         for delivery, po in pending_deliveries:
             # Get supplier historical performance
-            supplier_history = AnalyticsService._calculate_delivery_metrics(
-                po.supplier_name, datetime.utcnow() - timedelta(days=365)
+            supplier_history = supplier_histories.get(
+                po.supplier_name, AnalyticsService._empty_delivery_metrics()
             )
             
             # Calculate prediction
@@ -232,7 +311,7 @@ class AnalyticsService:
             predictions.append(prediction)
         
         # Sort by risk score (highest first)
-        predictions.sort(key=lambda x: x['risk_score'], reverse=True)
+        predictions.sort(key=lambda x: (-x['risk_score'], x['po_id']))
         
         return predictions
     
@@ -323,6 +402,15 @@ class AnalyticsService:
         # Payment trends by month
         payment_trends = AnalyticsService._get_payment_trends(cutoff_date)
         
+        # Return structure that matches frontend expectations
+        return {
+            'payment_trends': payment_trends,
+            **AnalyticsService._get_financial_totals(cutoff_date)
+        }
+    
+    @staticmethod
+    def _get_financial_totals(cutoff_date):
+        """Budget, cash flow and supplier payment sections of the financial analytics"""
         # Budget vs Actual
         budget_tracking = AnalyticsService._get_budget_tracking(cutoff_date)
         
@@ -332,9 +420,7 @@ class AnalyticsService:
         # Supplier payment analysis
         supplier_payments = AnalyticsService._get_supplier_payment_analysis(cutoff_date)
         
-        # Return structure that matches frontend expectations
         return {
-            'payment_trends': payment_trends,
             'budget': {
                 'total': budget_tracking['total_planned'],
                 'spent': budget_tracking['total_paid'],
@@ -352,22 +438,24 @@ class AnalyticsService:
         }
     
     @staticmethod
-    def _get_payment_trends(cutoff_date):
-        """Get monthly payment trends"""
-        payments = db.session.query(
-            func.strftime('%Y-%m', Payment.payment_date).label('month'),
-            func.sum(Payment.paid_amount).label('total_paid'),
-            func.count(Payment.id).label('payment_count')
-        ).filter(
-            Payment.payment_date >= cutoff_date,
-            Payment.payment_date.isnot(None)
-        ).group_by('month').order_by('month').all()
+    def _get_payment_trends(cutoff_date, end_date=None):
+        """Get monthly payment trends (every month in the range, empty ones included)"""
+        series = TimeBuckets.series(
+            Payment.payment_date,
+            {
+                'total_paid': func.sum(Payment.paid_amount),
+                'payment_count': func.count(Payment.id)
+            },
+            start=cutoff_date,
+            end=end_date,
+            granularity='month'
+        )
         
         return [{
-            'month': p.month,
-            'total_paid': round(p.total_paid or 0, 2),
-            'payment_count': p.payment_count
-        } for p in payments]
+            'month': p['period'],
+            'total_paid': round(p['total_paid'], 2),
+            'payment_count': p['payment_count']
+        } for p in series]
     
     @staticmethod
     def _get_budget_tracking(cutoff_date):
@@ -500,9 +588,9 @@ class AnalyticsService:
         }
     
     @staticmethod
-    def _get_material_lead_times(cutoff_date):
+    def _get_material_lead_times(cutoff_date, material_types=None):
         """Calculate average lead time by material type"""
-        lead_times = db.session.query(
+        query = db.session.query(
             Material.material_type,
             func.avg(
                 func.julianday(Delivery.actual_delivery_date) - 
@@ -516,9 +604,12 @@ class AnalyticsService:
         ).filter(
             Delivery.actual_delivery_date.isnot(None),
             PurchaseOrder.po_date >= cutoff_date
-        ).group_by(
-            Material.material_type
-        ).all()
+        )
+        
+        if material_types is not None:
+            query = query.filter(Material.material_type.in_(material_types))
+        
+        lead_times = query.group_by(Material.material_type).all()
         
         return [{
             'material_type': lt.material_type,
@@ -527,24 +618,27 @@ class AnalyticsService:
         } for lt in lead_times]
     
     @staticmethod
-    def _get_delivery_trends(cutoff_date):
-        """Get monthly delivery volume trends"""
-        trends = db.session.query(
-            func.strftime('%Y-%m', Delivery.created_at).label('month'),
-            func.count(Delivery.id).label('total_deliveries'),
-            func.count(case((Delivery.delivery_status == 'Delivered', 1))).label('completed'),
-            func.count(case((Delivery.is_delayed == True, 1))).label('delayed')
-        ).filter(
-            Delivery.created_at >= cutoff_date
-        ).group_by('month').order_by('month').all()
+    def _get_delivery_trends(cutoff_date, end_date=None):
+        """Get monthly delivery volume trends (every month in the range, empty ones included)"""
+        series = TimeBuckets.series(
+            Delivery.created_at,
+            {
+                'total_deliveries': func.count(Delivery.id),
+                'completed': func.count(case((Delivery.delivery_status == 'Delivered', 1))),
+                'delayed': func.count(case((Delivery.is_delayed == True, 1)))
+            },
+            start=cutoff_date,
+            end=end_date,
+            granularity='month'
+        )
         
         return [{
-            'month': t.month,
-            'total_deliveries': t.total_deliveries,
-            'completed': t.completed,
-            'delayed': t.delayed,
-            'on_time_rate': round(((t.completed - t.delayed) / t.completed * 100) if t.completed > 0 else 0, 1)
-        } for t in trends]
+            'month': t['period'],
+            'total_deliveries': t['total_deliveries'],
+            'completed': t['completed'],
+            'delayed': t['delayed'],
+            'on_time_rate': round(((t['completed'] - t['delayed']) / t['completed'] * 100) if t['completed'] > 0 else 0, 1)
+        } for t in series]
     
     @staticmethod
     def _get_on_time_metrics(cutoff_date):
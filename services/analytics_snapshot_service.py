@@ -0,0 +1,396 @@
+"""
+Analytics Snapshot Service - Materialized analytics dashboard
+Keeps the computed dashboard sections in the analytics_snapshots table and
+refreshes only the suppliers, month buckets and materials that changed; a
+background worker folds changes in after the commits that log them, so
+dashboard reads never recompute
+"""
+import copy
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+from models import db
+from models.analytics_snapshot import AnalyticsSnapshot, AnalyticsChange
+from models.purchase_order import PurchaseOrder
+from models.delivery import Delivery
+from models.payment import Payment
+from models.material import Material
+from services.analytics_service import AnalyticsService
+from services.time_buckets import TimeBuckets
+from services.write_tracking import WriteTracker
+
+
+class AnalyticsSnapshotService:
+    """Service for reading and incrementally refreshing analytics snapshots"""
+
+    DEFAULT_MAX_AGE = 3600  # Seconds before a snapshot is fully rebuilt
+    DEFAULT_CHANGE_OVERLAP = 300  # Seconds a writing transaction may stay open before it commits
+    POLL_INTERVAL = 60  # Seconds between checks for expired snapshots
+    DEBOUNCE = 1  # Seconds the worker waits after a wake-up so a burst of commits is refreshed once
+
+    _worker = None
+    _wake_event = threading.Event()
+    _lock = threading.Lock()
+
+    # Attributes whose old and new values decide which scopes a write touches
+    TRACKED_ATTRIBUTES = {
+        PurchaseOrder: {'supplier': ['supplier_name'], 'material': ['material_id'], 'po': ['id']},
+        Payment: {'po': ['po_id'], 'month': ['payment_date']},
+        Delivery: {'po': ['po_id'], 'month': ['created_at']}
+    }
+
+    # ==================== SETUP ====================
+
+    @staticmethod
+    def init_app(app):
+        """Track writes and refresh snapshots in the background"""
+        AnalyticsSnapshotService.register_change_tracking()
+
+        @app.before_request
+        def start_analytics_refresher():
+            if AnalyticsSnapshotService._worker is None:
+                AnalyticsSnapshotService.start_worker()
+
+    @staticmethod
+    def start_worker():
+        """Start the background refresh thread for the current app, if enabled"""
+        app = current_app._get_current_object()
+        if app.testing or not app.config.get('ANALYTICS_REFRESH_WORKER', True):
+            return False
+
+        with AnalyticsSnapshotService._lock:
+            if AnalyticsSnapshotService._worker is None or not AnalyticsSnapshotService._worker.is_alive():
+                AnalyticsSnapshotService._worker = threading.Thread(
+                    target=AnalyticsSnapshotService._run, args=(app,), name='analytics-refresher', daemon=True
+                )
+                AnalyticsSnapshotService._worker.start()
+        return True
+
+    @staticmethod
+    def _run(app):
+        """Worker loop: sleep until woken or the poll interval passes, then refresh"""
+        while True:
+            woken = AnalyticsSnapshotService._wake_event.wait(timeout=AnalyticsSnapshotService.POLL_INTERVAL)
+            AnalyticsSnapshotService._wake_event.clear()
+            if woken:
+                time.sleep(AnalyticsSnapshotService.DEBOUNCE)
+
+            with app.app_context():
+                try:
+                    AnalyticsSnapshotService.refresh()
+                except Exception as e:
+                    print(f"⚠️ Analytics snapshot refresh error: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    # ==================== CHANGE TRACKING ====================
+
+    @staticmethod
+    def register_change_tracking():
+        """Record PurchaseOrder, Payment and Delivery writes on every flush"""
+        if event.contains(PurchaseOrder.supplier_name, 'set', AnalyticsSnapshotService._load_previous_value):
+            return
+
+        WriteTracker.subscribe(
+            'analytics_snapshot',
+            tuple(AnalyticsSnapshotService.TRACKED_ATTRIBUTES),
+            on_flush=AnalyticsSnapshotService._record_changes,
+            on_commit=AnalyticsSnapshotService._after_commit
+        )
+
+        # Load the previous value on assignment so a moved row invalidates its old scope too
+        for model, tracked in AnalyticsSnapshotService.TRACKED_ATTRIBUTES.items():
+            for attributes in tracked.values():
+                for attribute in attributes:
+                    if attribute != 'id':
+                        event.listen(getattr(model, attribute), 'set',
+                                     AnalyticsSnapshotService._load_previous_value, active_history=True)
+
+    @staticmethod
+    def _load_previous_value(target, value, oldvalue, initiator):
+        """No-op 'set' listener registered with active_history=True"""
+        return value
+
+    @staticmethod
+    def _record_changes(session, objects, deleted):
+        """Flush hook: log the scopes touched in this flush"""
+        scopes = set()
+
+        for obj in objects:
+            tracked = AnalyticsSnapshotService.TRACKED_ATTRIBUTES[type(obj)]
+            state = sa_inspect(obj)
+            for scope_type, attributes in tracked.items():
+                for attribute in attributes:
+                    history = state.attrs[attribute].history
+                    for value in history.sum():
+                        if value is None:
+                            continue
+                        if scope_type == 'month':
+                            value = value.strftime('%Y-%m')
+                        scopes.add((scope_type, str(value)))
+
+        AnalyticsSnapshotService._insert_changes(session, scopes)
+
+    @staticmethod
+    def log_changes(scopes):
+        """
+        Log scopes changed by bulk statements that bypass the session flush
+
+        Args:
+            scopes: Iterable of (scope_type, scope_key) tuples, e.g. ('po', 12)
+        """
+        scopes = {(scope_type, str(scope_key)) for scope_type, scope_key in scopes}
+        AnalyticsSnapshotService._insert_changes(db.session, scopes)
+
+    @staticmethod
+    def _insert_changes(session, scopes):
+        """Insert one analytics_changes row per scope; the commit wakes the refresher"""
+        if not scopes:
+            return
+        WriteTracker.writes(session, 'analytics_snapshot')
+        now = datetime.utcnow()
+        session.connection().execute(
+            AnalyticsChange.__table__.insert(),
+            [{'scope_type': scope_type, 'scope_key': scope_key, 'created_at': now}
+             for scope_type, scope_key in sorted(scopes)]
+        )
+
+    @staticmethod
+    def _after_commit(session, writes):
+        """Commit hook: refresh snapshots once the logged changes are visible"""
+        if AnalyticsSnapshotService._worker is None or not AnalyticsSnapshotService._worker.is_alive():
+            AnalyticsSnapshotService.start_worker()
+        AnalyticsSnapshotService._wake_event.set()
+
+    # ==================== SNAPSHOT READS ====================
+
+    @staticmethod
+    def get_dashboard_data(date_range_days=180, force_refresh=False):
+        """
+        Get the dashboard snapshot as last refreshed
+
+        Writes are folded in by refresh() in the background, so a read is a
+        single row lookup; only a missing snapshot, or force_refresh, is
+        built inline
+
+        Args:
+            date_range_days: Number of days the sections cover
+            force_refresh: Rebuild every section from scratch
+
+        Returns:
+            AnalyticsSnapshot
+        """
+        snapshot = AnalyticsSnapshot.query.filter_by(date_range_days=date_range_days).first()
+
+        if force_refresh or snapshot is None:
+            return AnalyticsSnapshotService.rebuild(date_range_days, snapshot)
+        return snapshot
+
+    @staticmethod
+    def refresh():
+        """
+        Fold logged changes into every snapshot and rebuild expired ones
+
+        Returns:
+            Number of snapshots refreshed or rebuilt
+        """
+        max_age = current_app.config.get('ANALYTICS_SNAPSHOT_MAX_AGE', AnalyticsSnapshotService.DEFAULT_MAX_AGE)
+        expiry = datetime.utcnow() - timedelta(seconds=max_age)
+
+        refreshed = 0
+        for snapshot in AnalyticsSnapshot.query.order_by(AnalyticsSnapshot.id).all():
+            if snapshot.generated_at < expiry:
+                AnalyticsSnapshotService.rebuild(snapshot.date_range_days, snapshot)
+                refreshed += 1
+                continue
+
+            seen = AnalyticsSnapshotService._changes_since(snapshot.change_horizon)
+            applied = set(snapshot.applied_change_ids or [])
+            changes = [change for change in seen if change.id not in applied]
+            if changes:
+                AnalyticsSnapshotService._apply_changes(snapshot, changes, seen)
+                refreshed += 1
+        return refreshed
+
+    @staticmethod
+    def rebuild(date_range_days=180, snapshot=None):
+        """Recompute every section and store it as the snapshot"""
+        # Read the change log first: changes visible now are reflected in the
+        # sections below, later commits are folded in by the next refresh
+        now = datetime.utcnow()
+        horizon = AnalyticsSnapshotService._horizon(now)
+        seen = AnalyticsSnapshotService._changes_since(horizon)
+
+        data = {
+            'executive_summary': AnalyticsService.get_executive_summary(),
+            'supplier_performance': AnalyticsService.get_supplier_performance(date_range_days=date_range_days),
+            'delay_predictions': AnalyticsService.predict_delivery_delays(),
+            'financial_analytics': AnalyticsService.get_financial_analytics(date_range_days=date_range_days),
+            'delivery_intelligence': AnalyticsService.get_delivery_intelligence(date_range_days=date_range_days)
+        }
+
+        if snapshot is None:
+            snapshot = AnalyticsSnapshot(date_range_days=date_range_days)
+            db.session.add(snapshot)
+
+        snapshot.data = data
+        snapshot.cutoff_date = now - timedelta(days=date_range_days)
+        snapshot.change_horizon = horizon
+        snapshot.applied_change_ids = [change.id for change in seen]
+        snapshot.generated_at = now
+        snapshot.refreshed_at = now
+
+        AnalyticsSnapshotService._save(snapshot)
+        return snapshot
+
+    # ==================== INCREMENTAL REFRESH ====================
+
+    @staticmethod
+    def _apply_changes(snapshot, changes, seen):
+        """
+        Recompute only the suppliers, months and materials touched by changes
+
+        Args:
+            changes: Changes not folded in yet
+            seen: Every change since the snapshot's horizon, changes included
+        """
+        suppliers, material_types, months = AnalyticsSnapshotService._resolve_scopes(changes)
+        data = copy.deepcopy(snapshot.data)
+        cutoff_date = snapshot.cutoff_date
+
+        # Whole-table KPIs are a handful of aggregates, recompute them outright
+        data['executive_summary'] = AnalyticsService.get_executive_summary()
+
+        # Supplier-keyed sections
+        for supplier_name in suppliers:
+            data['supplier_performance'] = [
+                s for s in data['supplier_performance'] if s['supplier_name'] != supplier_name
+            ] + AnalyticsService.get_supplier_performance(
+                supplier_name=supplier_name, date_range_days=snapshot.date_range_days
+            )
+            data['delay_predictions'] = [
+                p for p in data['delay_predictions'] if p['supplier_name'] != supplier_name
+            ] + AnalyticsService.predict_delivery_delays(supplier_name=supplier_name)
+
+        # Same ordering as AnalyticsService, ties included, so merged lists match a recompute
+        data['supplier_performance'].sort(key=lambda x: (x['risk_score'], x['supplier_name']))
+        data['delay_predictions'].sort(key=lambda x: (-x['risk_score'], x['po_id']))
+
+        # Financial analytics: month buckets for trends, totals recomputed
+        financial = data['financial_analytics']
+        financial['payment_trends'] = AnalyticsSnapshotService._merge_months(
+            financial['payment_trends'], months, cutoff_date, AnalyticsService._get_payment_trends
+        )
+        financial.update(AnalyticsService._get_financial_totals(cutoff_date))
+
+        # Delivery intelligence: material and month buckets, totals recomputed
+        delivery = data['delivery_intelligence']
+        if material_types:
+            delivery['material_lead_times'] = sorted(
+                [m for m in delivery['material_lead_times'] if m['material_type'] not in material_types] +
+                AnalyticsService._get_material_lead_times(cutoff_date, material_types=material_types),
+                key=lambda x: x['material_type']
+            )
+        delivery['delivery_trends'] = AnalyticsSnapshotService._merge_months(
+            delivery['delivery_trends'], months, cutoff_date, AnalyticsService._get_delivery_trends
+        )
+        delivery['on_time_metrics'] = AnalyticsService._get_on_time_metrics(cutoff_date)
+        delivery['delay_analysis'] = AnalyticsService._get_delay_analysis(cutoff_date)
+
+        # Recomputing a scope is idempotent, so a change that commits late
+        # (after a higher id was applied) is simply folded in when it appears
+        now = datetime.utcnow()
+        horizon = max(snapshot.change_horizon, AnalyticsSnapshotService._horizon(now))
+        snapshot.data = data
+        snapshot.change_horizon = horizon
+        snapshot.applied_change_ids = sorted(change.id for change in seen if change.created_at >= horizon)
+        snapshot.refreshed_at = now
+
+        AnalyticsSnapshotService._save(snapshot)
+
+    @staticmethod
+    def _horizon(now):
+        """
+        Oldest change time that may still be uncommitted: a change is logged at
+        flush and becomes visible at commit, up to the overlap window later
+        """
+        overlap = current_app.config.get('ANALYTICS_CHANGE_OVERLAP', AnalyticsSnapshotService.DEFAULT_CHANGE_OVERLAP)
+        return now - timedelta(seconds=overlap)
+
+    @staticmethod
+    def _changes_since(horizon):
+        """Logged changes created at or after horizon, in id order"""
+        return AnalyticsChange.query.filter(
+            AnalyticsChange.created_at >= horizon
+        ).order_by(AnalyticsChange.id).all()
+
+    @staticmethod
+    def _resolve_scopes(changes):
+        """Turn logged changes into supplier names, material types and months"""
+        suppliers = set()
+        po_ids = set()
+        material_ids = set()
+        months = set()
+
+        for change in changes:
+            if change.scope_type == 'supplier':
+                suppliers.add(change.scope_key)
+            elif change.scope_type == 'po':
+                po_ids.add(int(change.scope_key))
+            elif change.scope_type == 'material':
+                material_ids.add(int(change.scope_key))
+            elif change.scope_type == 'month':
+                months.add(change.scope_key)
+
+        if po_ids:
+            for supplier_name, material_id in db.session.query(
+                PurchaseOrder.supplier_name, PurchaseOrder.material_id
+            ).filter(PurchaseOrder.id.in_(po_ids)):
+                suppliers.add(supplier_name)
+                material_ids.add(material_id)
+
+        material_types = set()
+        if material_ids:
+            material_types = {
+                row[0] for row in db.session.query(Material.material_type).filter(Material.id.in_(material_ids))
+            }
+
+        return sorted(suppliers), material_types, sorted(months)
+
+    @staticmethod
+    def _merge_months(trends, months, cutoff_date, trend_query):
+        """Replace the given 'YYYY-MM' buckets in a monthly trend list"""
+        # The current month is always refreshed so a new, still empty month gets its bucket
+        months = set(months) | {TimeBuckets.period_key(datetime.utcnow(), 'month')}
+
+        by_month = {t['month']: t for t in trends}
+        for month in months:
+            month_start = TimeBuckets.parse_period_key(month, 'month')
+            month_end = TimeBuckets.next_period_start(month_start, 'month')
+            if month_end <= cutoff_date:
+                continue
+
+            by_month.pop(month, None)
+            for row in trend_query(max(cutoff_date, month_start), end_date=month_end):
+                by_month[row['month']] = row
+
+        return [by_month[m] for m in sorted(by_month)]
+
+    @staticmethod
+    def _save(snapshot):
+        """Commit the snapshot and prune change rows older than every snapshot's horizon"""
+        try:
+            db.session.flush()
+            oldest_horizon = db.session.query(func.min(AnalyticsSnapshot.change_horizon)).scalar()
+            if oldest_horizon:
+                AnalyticsChange.query.filter(
+                    AnalyticsChange.created_at < oldest_horizon
+                ).delete(synchronize_session=False)
+            db.session.commit()
+        except IntegrityError:
+            # Another worker built the same snapshot concurrently; its copy wins
+            db.session.rollback()
@@ -0,0 +1,165 @@
+"""
+Content Store - Content-addressed storage for uploaded files
+Uploads are hashed (SHA-256) while they stream to disk and stored once per
+distinct content under blobs/<first two hex digits>/<hash>.<ext>
+
+Blobs are never removed inline: deleting a File row only drops the reference,
+and collect_garbage() later removes blobs no row references once they are
+older than a grace period, so an upload that is about to commit a reference
+to a blob never loses it
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+
+class ContentStore:
+    """Service for storing uploads by content hash"""
+
+    CHUNK_SIZE = 64 * 1024
+    BLOB_DIR = 'blobs'
+    TEMP_PREFIX = '.upload_'
+    GC_GRACE = 3600  # Seconds a blob is kept after its last write or reuse
+
+    @staticmethod
+    def save(stream, root, extension):
+        """
+        Stream an upload into the store
+
+        If the caller's transaction never commits a row for the blob, the
+        blob is left for collect_garbage()
+
+        Args:
+            stream: Readable binary stream (e.g. FileStorage.stream)
+            root: Upload folder the blob path is relative to
+            extension: File extension without the dot
+
+        Returns:
+            {'content_hash', 'file_path' (relative to root), 'file_size', 'deduplicated'}
+        """
+        blob_root = os.path.join(root, ContentStore.BLOB_DIR)
+        os.makedirs(blob_root, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=blob_root, prefix=ContentStore.TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(ContentStore.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return ContentStore.adopt(temp_path, root, extension, digest.hexdigest())
+
+    @staticmethod
+    def adopt(path, root, extension, content_hash=None):
+        """
+        Move a file already written under root into the store
+
+        Args:
+            path: File to move (removed if its content is already stored)
+            root: Upload folder the blob path is relative to
+            extension: File extension without the dot
+            content_hash: SHA-256 if already known, computed otherwise
+
+        Returns:
+            {'content_hash', 'file_path' (relative to root), 'file_size', 'deduplicated'}
+        """
+        content_hash = content_hash or ContentStore.hash_file(path)
+        file_size = os.path.getsize(path)
+        relative_path = ContentStore.blob_path(content_hash, extension)
+        full_path = os.path.join(root, relative_path)
+
+        deduplicated = os.path.exists(full_path)
+        if deduplicated:
+            os.remove(path)
+            # Restart the grace period so a collection running before the
+            # caller commits its reference keeps the blob
+            os.utime(full_path)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(path, full_path)
+
+        return {
+            'content_hash': content_hash,
+            'file_path': relative_path,
+            'file_size': file_size,
+            'deduplicated': deduplicated
+        }
+
+    @staticmethod
+    def blob_path(content_hash, extension):
+        """Relative path of the blob for a hash"""
+        name = f"{content_hash}.{extension.lower()}" if extension else content_hash
+        return os.path.join(ContentStore.BLOB_DIR, content_hash[:2], name)
+
+    @staticmethod
+    def hash_file(path):
+        """SHA-256 of a file already on disk"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(ContentStore.CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def collect_garbage(root, referenced_hashes, grace=None):
+        """
+        Remove blobs no row references, with the previews stored beside them
+
+        Args:
+            root: Upload folder the store lives in
+            referenced_hashes: Content hashes still referenced by File rows
+            grace: Seconds since the last write or reuse before a blob may go
+                (ContentStore.GC_GRACE by default)
+
+        Returns:
+            Number of files removed (blobs, previews and abandoned temp files)
+        """
+        grace = ContentStore.GC_GRACE if grace is None else grace
+        cutoff = time.time() - grace
+        blob_root = os.path.join(root, ContentStore.BLOB_DIR)
+        removed = 0
+
+        for directory, _, names in os.walk(blob_root):
+            # Blob and previews share the <hash> prefix, so collect them together
+            by_hash = {}
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.startswith(ContentStore.TEMP_PREFIX):
+                    # Left behind by a save that crashed mid-stream
+                    if ContentStore._older_than(path, cutoff):
+                        removed += ContentStore._remove(path)
+                    continue
+                by_hash.setdefault(name.split('.', 1)[0], []).append(path)
+
+            for content_hash, paths in by_hash.items():
+                if content_hash in referenced_hashes:
+                    continue
+                if all(ContentStore._older_than(path, cutoff) for path in paths):
+                    for path in paths:
+                        removed += ContentStore._remove(path)
+
+        return removed
+
+    @staticmethod
+    def _older_than(path, cutoff):
+        try:
+            return os.path.getmtime(path) < cutoff
+        except OSError:
+            return False
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
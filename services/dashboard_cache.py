@@ -0,0 +1,105 @@
+"""
+Dashboard Cache - Short-TTL, process-local cache for dashboard aggregates
+Polling clients share one computed result per key until it expires or a
+write to one of the aggregated tables invalidates it
+"""
+import threading
+import time
+from flask import current_app
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.delivery import Delivery
+from models.ai_suggestion import AISuggestion
+from models.payment import Payment
+from services.write_tracking import WriteTracker
+
+
+class DashboardCache:
+    """Per-application TTL cache invalidated by session writes"""
+
+    DEFAULT_TTL = 30  # Seconds
+
+    # Writes to these models invalidate every cached entry
+    CACHED_MODELS = (Material, PurchaseOrder, Delivery, AISuggestion, Payment)
+
+    # ==================== READS ====================
+
+    @staticmethod
+    def get(key, compute):
+        """
+        Get a cached value, computing it when missing or expired
+
+        Concurrent misses for the same key compute once; the other callers
+        wait for and reuse that result.
+
+        Args:
+            key: Cache key
+            compute: Zero-argument function producing the value
+
+        Returns:
+            Cached or freshly computed value
+        """
+        store = DashboardCache._store()
+        ttl = current_app.config.get('DASHBOARD_CACHE_TTL', DashboardCache.DEFAULT_TTL)
+
+        entry = store['entries'].get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        with store['locks'].setdefault(key, threading.Lock()):
+            entry = store['entries'].get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+
+            generation = store['generation']
+            value = compute()
+
+            # Skip storing if a write invalidated the cache while computing
+            if ttl > 0 and generation == store['generation']:
+                store['entries'][key] = (time.monotonic() + ttl, value)
+            return value
+
+    @staticmethod
+    def invalidate():
+        """Drop every cached entry"""
+        store = DashboardCache._store()
+        store['generation'] += 1
+        store['entries'].clear()
+
+    @staticmethod
+    def _store():
+        """Cache state of the current application"""
+        return WriteTracker.store('dashboard_cache', lambda: {
+            'entries': {},
+            'locks': {},
+            'generation': 0
+        })
+
+    # ==================== INVALIDATION ====================
+
+    @staticmethod
+    def register_invalidation():
+        """Invalidate on flushes, bulk statements and commits touching cached models"""
+        WriteTracker.subscribe(
+            'dashboard_cache',
+            DashboardCache.CACHED_MODELS,
+            on_flush=DashboardCache._after_write,
+            on_bulk=DashboardCache._after_write,
+            on_commit=DashboardCache._after_transaction,
+            on_rollback=DashboardCache._after_transaction
+        )
+
+    @staticmethod
+    def _after_write(session, *written):
+        """Flush or bulk statement hook: invalidate now"""
+        DashboardCache.invalidate()
+
+    @staticmethod
+    def _after_transaction(session, writes):
+        """
+        Commit/rollback hook
+
+        Another request may have cached committed-but-old values between the
+        flush and the commit, so invalidate once more when the write lands.
+        """
+        DashboardCache.invalidate()
@@ -5,10 +5,89 @@ Combines: Validation + Duplicate Detection + Invoice-LPO Matching
 🎯 ZERO TOKEN USAGE - Pure Python logic, no LLM calls!
 Saves ~800 tokens per operation compared to using AI for validation.
 """
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 from difflib import SequenceMatcher
+from functools import lru_cache
+from itertools import islice
 import re
-from typing import Dict, List, Tuple, Any, Optional
+import threading
+import time
+from typing import Dict, List, Tuple, Any, Optional, Iterable, Iterator
+from sqlalchemy import or_, func
+from services.validation_rules import VALIDATORS, ValidationResult, parse_date
+
+
+@lru_cache(maxsize=4096)
+def _bounded_similarity(str1: str, str2: str, threshold: float) -> float:
+    """
+    SequenceMatcher ratio of two strings, or an upper bound of it that is
+    already <= threshold (bulk imports compare the same names over and over)
+    """
+    matcher = SequenceMatcher(None, str1, str2)
+    # Length-only bound, then character-count bound, before the full match
+    for bound in (matcher.real_quick_ratio, matcher.quick_ratio):
+        value = bound()
+        if value <= threshold:
+            return value
+    return matcher.ratio()
+
+
+def _as_key(value: Any) -> Any:
+    """Integer ids arrive as ints or numeric strings; key lookup tables by int"""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return value
+
+
+def _is_scalar(value: Any) -> bool:
+    """Prefetch keys are only built from plain values (a list or dict is left to the record's own checks)"""
+    return isinstance(value, (str, int, float))
+
+
+class BatchLookups:
+    """
+    Shared lookup tables for one batch: every PO, payment total, payment
+    reference, similar-PO candidate and nearby delivery the batch refers to,
+    loaded up front, plus the batch's own records seen so far (for in-batch
+    duplicates).
+    A stream loads new tables per chunk and carries the seen records over
+    from the previous chunk's lookups.
+    """
+    
+    def __init__(self, previous: Optional['BatchLookups'] = None):
+        self.pos_by_id = {}
+        self.pos_by_ref = {}
+        self.paid_by_po = {}
+        self.payments_by_invoice_ref = {}
+        self.payments_by_payment_ref = {}
+        self.candidates = {}  # material_id -> ([po_date, ...], [PO, ...]) sorted by po_date
+        self.deliveries_by_po = {}  # po_id -> [Delivery, ...] in id order
+        
+        self.seen_lpo_numbers = previous.seen_lpo_numbers if previous else {}
+        self.seen_invoice_refs = previous.seen_invoice_refs if previous else {}
+        self.seen_payment_refs = previous.seen_payment_refs if previous else {}
+        # (material_id, day ordinal) -> [(index, release_date, amount, supplier)]
+        self.seen_releases = previous.seen_releases if previous else {}
+    
+    def similar_po_candidates(self, material_id: Any, date_start: datetime, date_end: datetime,
+                              amount_window: Tuple[float, float]) -> List[Any]:
+        """Prefetched POs inside the date and amount windows, in id order"""
+        dates, pos = self.candidates.get(_as_key(material_id), ([], []))
+        low, high = amount_window
+        return sorted(
+            (po for po in pos[bisect_left(dates, date_start):bisect_right(dates, date_end)]
+             if low <= po.total_amount <= high),
+            key=lambda po: po.id
+        )
+    
+    def similar_deliveries(self, po_id: Any, date_start: datetime, date_end: datetime) -> List[Any]:
+        """Prefetched deliveries of a PO dated inside the window, in id order"""
+        return [
+            delivery for delivery in self.deliveries_by_po.get(_as_key(po_id), [])
+            if date_start <= DataProcessingAgent._delivery_date(delivery) <= date_end
+        ]
 
 
 class DataProcessingAgent:
@@ -23,9 +102,17 @@ class DataProcessingAgent:
     
     def __init__(self, db_session):
         self.db = db_session
-        self.validation_errors = []
-        self.validation_warnings = []
         self.similarity_threshold = 0.85  # 85% = potential duplicate
+        self._local = threading.local()  # Per-thread run state: one agent can serve concurrent requests
+    
+    @property
+    def _lookups(self) -> Optional[BatchLookups]:
+        """BatchLookups while process_batch/process_stream runs in this thread"""
+        return getattr(self._local, 'lookups', None)
+    
+    @_lookups.setter
+    def _lookups(self, lookups: Optional[BatchLookups]):
+        self._local.lookups = lookups
     
     # ============================================================================
     # MAIN ENTRY POINT - Unified Processing
@@ -83,359 +170,321 @@ class DataProcessingAgent:
             'ready_to_save': ready_to_save
         }
     
-    # ============================================================================
-    # PART 1: DATA VALIDATION
-    # ============================================================================
-    
-    def _validate(self, record_type: str, data: Dict[str, Any]) -> Tuple[bool, List[str], List[str]]:
-        """Route to appropriate validation method"""
-        self.validation_errors = []
-        self.validation_warnings = []
+    def process_batch(
+        self,
+        records: List[Dict[str, Any]],
+        check_duplicates: bool = True,
+        stop_on_error: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Process many records with shared lookups.
         
-        if record_type == 'lpo_release':
-            return self._validate_lpo_release(data)
-        elif record_type == 'invoice':
-            return self._validate_invoice(data)
-        elif record_type == 'submittal':
-            return self._validate_submittal(data)
-        elif record_type == 'delivery':
-            return self._validate_delivery(data)
-        else:
-            self.validation_errors.append(f"❌ Unknown record type: {record_type}")
-            return False, self.validation_errors, []
-    
-    def _validate_lpo_release(self, data: Dict[str, Any]) -> Tuple[bool, List[str], List[str]]:
-        """Validate LPO Release data"""
-        # Mandatory fields
-        self._check_mandatory_fields(data, [
-            'material_id', 'supplier_name', 'lpo_number', 
-            'release_date', 'amount'
-        ])
-        
-        # Format validation
-        self._validate_lpo_number(data.get('lpo_number'))
-        self._validate_date(data.get('release_date'), 'Release Date')
-        self._validate_amount(data.get('amount'), 'Amount')
-        self._validate_phone_number(data.get('contact_number'))
-        self._validate_email(data.get('contact_email'))
-        
-        # Cross-reference validation
-        if data.get('expected_delivery_date') and data.get('release_date'):
-            self._validate_delivery_after_release(
-                data['release_date'], 
-                data['expected_delivery_date']
-            )
+        Every PO, payment, similar-PO candidate and nearby delivery the batch
+        refers to is loaded first with a few IN (...) queries; each record then runs
+        through process_data reading those tables instead of the database.
+        Records are also checked against earlier records of the same batch.
         
-        # Anomaly detection
-        self._detect_amount_anomaly(data.get('amount'), 'lpo_releases')
+        Args:
+            records: [{'record_type': ..., 'data': {...}, 'match_invoice_to_lpo': bool}, ...]
+            check_duplicates: Whether to check for duplicates
+            stop_on_error: Stop at the first malformed or failing record
         
-        is_valid = len(self.validation_errors) == 0
-        return is_valid, self.validation_errors, self.validation_warnings
-    
-    def _validate_invoice(self, data: Dict[str, Any]) -> Tuple[bool, List[str], List[str]]:
-        """Validate Invoice/Payment data"""
-        # Mandatory fields (matching Payment model)
-        self._check_mandatory_fields(data, [
-            'payment_date', 'total_amount'
-        ])
+        Returns:
+            (results, summary) - one result per record processed, with its
+            index, and counts of valid, invalid and duplicate findings
+        """
+        results = []
+        summary = self.new_summary(len(records))
         
-        # Format validation
-        if data.get('invoice_number'):
-            self._validate_invoice_number(data.get('invoice_number'))
-        self._validate_date(data.get('payment_date') or data.get('invoice_date'), 'Payment Date')
-        self._validate_amount(data.get('total_amount') or data.get('amount'), 'Amount')
+        # One chunk: the whole batch shares a single set of lookups
+        for result in self.process_stream(records, check_duplicates, stop_on_error, chunk_size=None):
+            results.append(result)
+            self.add_to_summary(summary, result)
         
-        # Optional due date validation
-        if data.get('due_date'):
-            self._validate_date(data.get('due_date'), 'Due Date')
-            
-        # Cross-reference validation
-        if data.get('invoice_date') and data.get('due_date'):
-            self._validate_due_after_invoice(
-                data['invoice_date'], 
-                data['due_date']
-            )
+        return results, summary
+    
+    def process_stream(
+        self,
+        records: Iterable[Any],
+        check_duplicates: bool = True,
+        stop_on_error: bool = False,
+        chunk_size: Optional[int] = 500,
+        max_wait: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Process records as they arrive, yielding one result per record.
         
-        # CRITICAL: Check if payment exceeds PO amount
-        if data.get('po_id') and data.get('total_amount'):
-            self._validate_payment_against_po(data['po_id'], data['total_amount'])
-        
-        is_valid = len(self.validation_errors) == 0
-        return is_valid, self.validation_errors, self.validation_warnings
-    
-    def _validate_submittal(self, data: Dict[str, Any]) -> Tuple[bool, List[str], List[str]]:
-        """Validate Material Submittal data"""
-        # Mandatory fields - material_type is required for new materials
-        required_fields = ['material_type', 'approval_status']
-        self._check_mandatory_fields(data, required_fields)
-        
-        # Format validation
-        self._validate_status(data.get('approval_status'), [
-            'Pending', 'Under Review', 'Approved', 'Approved as Noted', 'Revise & Resubmit'
-        ])
-        
-        # Validate approval_date if provided
-        if data.get('approval_date'):
-            self._validate_date(data.get('approval_date'), 'Approval Date')
-        
-        # Validate revision_number if provided
-        if 'revision_number' in data:
-            try:
-                rev_num = int(data['revision_number'])
-                if rev_num < 0:
-                    self.validation_errors.append(
-                        "❌ Revision number cannot be negative"
-                    )
-            except (ValueError, TypeError):
-                self.validation_errors.append(
-                    "❌ Revision number must be a valid number"
-                )
+        Records are read chunk_size at a time (None reads them all) and each
+        chunk gets its own prefetched lookups, so the records, results and
+        database rows held at once depend on the chunk size, not on the
+        length of the stream. In-batch duplicates are still checked against
+        every earlier record of the stream.
         
-        # Check if previous_submittal_id exists when revision > 0
-        try:
-            rev_num = int(data.get('revision_number', 0))
-            if rev_num > 0 and not data.get('previous_submittal_id'):
-                self.validation_warnings.append(
-                    "⚠️ Consider linking to previous submittal for revisions"
-                )
-        except (ValueError, TypeError):
-            pass  # Already handled above
-        
-        is_valid = len(self.validation_errors) == 0
-        return is_valid, self.validation_errors, self.validation_warnings
-    
-    def _validate_delivery(self, data: Dict[str, Any]) -> Tuple[bool, List[str], List[str]]:
-        """Validate Delivery Order data"""
-        # Mandatory fields
-        self._check_mandatory_fields(data, [
-            'lpo_id', 'delivery_date', 'status'
-        ])
-        
-        # Format validation
-        self._validate_date(data.get('delivery_date'), 'Delivery Date')
-        self._validate_status(data.get('status'), [
-            'Pending', 'Partial', 'Delivered', 'Rejected'
-        ])
-        
-        # Delivery percentage validation for partial deliveries
-        if data.get('status') == 'Partial':
-            delivery_percentage = data.get('delivery_percentage', 0)
-            if delivery_percentage <= 0 or delivery_percentage >= 100:
-                self.validation_warnings.append(
-                    f"⚠️ Partial delivery should have percentage between 1-99% (currently: {delivery_percentage}%)"
-                )
+        With max_wait, a chunk is also cut once that many seconds have passed
+        since its first record arrived, so a slow upload gets results while
+        it is still sending instead of after chunk_size records.
         
-        is_valid = len(self.validation_errors) == 0
-        return is_valid, self.validation_errors, self.validation_warnings
-    
-    # Validation helper methods
-    def _check_mandatory_fields(self, data: Dict[str, Any], required_fields: List[str]):
-        """Check if all mandatory fields are present and not empty"""
-        for field in required_fields:
-            if field not in data or data[field] is None or str(data[field]).strip() == '':
-                self.validation_errors.append(
-                    f"❌ {field.replace('_', ' ').title()} is required"
-                )
-    
-    def _validate_lpo_number(self, lpo_number: Optional[str]):
-        """Validate LPO number format"""
-        if not lpo_number:
-            return
-        pattern = r'^LPO-\d{4}-\d{3,}$'
-        if not re.match(pattern, lpo_number, re.IGNORECASE):
-            self.validation_warnings.append(
-                f"⚠️ LPO number '{lpo_number}' doesn't follow standard format (LPO-YYYY-NNN)"
-            )
-    
-    def _validate_invoice_number(self, invoice_number: Optional[str]):
-        """Validate invoice number format"""
-        if not invoice_number:
-            return
-        if len(invoice_number) < 3:
-            self.validation_errors.append(
-                f"❌ Invoice number '{invoice_number}' is too short"
-            )
-    
-    def _validate_date(self, date_value: Any, field_name: str):
-        """Validate date format and reasonableness"""
-        if not date_value:
-            return
+        Args:
+            records: Iterable of records as for process_batch; an Exception
+                     in place of a record (e.g. a line that failed to parse)
+                     is reported as that record's error
+            check_duplicates: Whether to check for duplicates
+            stop_on_error: Stop at the first malformed or failing record
+            chunk_size: Records prefetched together
+            max_wait: Seconds a chunk may wait for more records (None waits
+                      for chunk_size)
         
-        try:
-            if isinstance(date_value, str):
-                date_obj = datetime.strptime(date_value, '%Y-%m-%d')
-            elif isinstance(date_value, datetime):
-                date_obj = date_value
-            else:
-                self.validation_errors.append(
-                    f"❌ {field_name} has invalid format"
-                )
+        Yields:
+            The same result dicts as process_batch, in input order
+        """
+        records = iter(records)
+        lookups = None
+        index = 0
+        
+        while True:
+            chunk = self._read_chunk(records, chunk_size, max_wait)
+            if not chunk:
                 return
             
-            # Check if date not too old (> 5 years)
-            five_years_ago = datetime.now() - timedelta(days=365*5)
-            if date_obj < five_years_ago:
-                self.validation_warnings.append(
-                    f"⚠️ {field_name} is more than 5 years in the past"
-                )
-            
-            # Check if date not too far future (> 2 years)
-            two_years_future = datetime.now() + timedelta(days=365*2)
-            if date_obj > two_years_future:
-                self.validation_warnings.append(
-                    f"⚠️ {field_name} is more than 2 years in the future"
-                )
-        
-        except (ValueError, TypeError):
-            self.validation_errors.append(
-                f"❌ {field_name} has invalid date format (use YYYY-MM-DD)"
+            lookups = self._load_batch_lookups(
+                [r for r in chunk if self._is_well_formed(r)], check_duplicates, previous=lookups
             )
+            
+            for record in chunk:
+                self._lookups = lookups
+                try:
+                    result = self._process_batch_record(index, record, check_duplicates)
+                finally:
+                    self._lookups = None
+                index += 1
+                
+                yield result
+                
+                if stop_on_error and not result['success']:
+                    return
+    
+    @staticmethod
+    def _read_chunk(records: Iterator[Any], chunk_size: Optional[int], max_wait: Optional[float]) -> List[Any]:
+        """Up to chunk_size records, fewer if max_wait runs out first"""
+        if max_wait is None:
+            return list(islice(records, chunk_size))
+        
+        chunk = []
+        deadline = None
+        for record in records:
+            chunk.append(record)
+            if deadline is None:
+                deadline = time.monotonic() + max_wait
+            if len(chunk) == chunk_size or time.monotonic() >= deadline:
+                break
+        return chunk
+    
+    @staticmethod
+    def new_summary(total: int = 0) -> Dict[str, int]:
+        """Empty batch summary"""
+        return {
+            'total': total,
+            'valid': 0,
+            'invalid': 0,
+            'duplicates_found': 0
+        }
     
-    def _validate_amount(self, amount: Any, field_name: str):
-        """Validate amount is positive number"""
-        if amount is None:
-            return
+    @staticmethod
+    def add_to_summary(summary: Dict[str, int], result: Dict[str, Any]):
+        """Count one process_stream result into a batch summary"""
+        if result['success'] and result['is_valid']:
+            summary['valid'] += 1
+        else:
+            summary['invalid'] += 1
+        
+        if result.get('duplicates'):
+            summary['duplicates_found'] += len(result['duplicates'])
+    
+    @staticmethod
+    def _is_well_formed(record: Any) -> bool:
+        return isinstance(record, dict) and 'record_type' in record and 'data' in record
+    
+    def _process_batch_record(self, index: int, record: Any, check_duplicates: bool) -> Dict[str, Any]:
+        """process_data for one batch record, plus in-batch duplicates"""
+        if isinstance(record, Exception):
+            return {
+                'index': index,
+                'success': False,
+                'error': str(record)
+            }
         
-        try:
-            amount_float = float(amount)
-            if amount_float <= 0:
-                self.validation_errors.append(
-                    f"❌ {field_name} must be a positive number"
-                )
-            elif amount_float > 10000000:  # 10 million
-                self.validation_warnings.append(
-                    f"⚠️ {field_name} is unusually high (AED {amount_float:,.2f})"
-                )
-        except (ValueError, TypeError):
-            self.validation_errors.append(
-                f"❌ {field_name} must be a valid number"
-            )
-    
-    def _validate_phone_number(self, phone: Optional[str]):
-        """Validate phone number format"""
-        if not phone:
-            return
+        if not self._is_well_formed(record):
+            return {
+                'index': index,
+                'success': False,
+                'error': 'Missing record_type or data'
+            }
         
-        cleaned = re.sub(r'[\s\-\(\)]', '', phone)
-        if not cleaned.isdigit() or len(cleaned) < 7 or len(cleaned) > 15:
-            self.validation_warnings.append(
-                f"⚠️ Phone number '{phone}' may not be valid"
+        try:
+            result = self.process_data(
+                record_type=record['record_type'],
+                data=record['data'],
+                check_duplicates=check_duplicates,
+                match_invoice_to_lpo=record.get('match_invoice_to_lpo', False)
             )
-    
-    def _validate_email(self, email: Optional[str]):
-        """Validate email format"""
-        if not email:
-            return
+            
+            if check_duplicates:
+                batch_duplicates = self._check_batch_duplicates(index, record['record_type'], record['data'])
+                if batch_duplicates:
+                    result['duplicates'] = result['duplicates'] + batch_duplicates
+                    result['ready_to_save'] = False
+            
+            return {
+                'index': index,
+                'success': True,
+                **result
+            }
         
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_pattern, email):
-            self.validation_errors.append(
-                f"❌ Email '{email}' is not valid"
-            )
+        except Exception as e:
+            return {
+                'index': index,
+                'success': False,
+                'error': str(e)
+            }
     
-    def _validate_status(self, status: Optional[str], allowed_values: List[str]):
-        """Validate status is one of allowed values"""
-        if not status:
-            return
+    def _load_batch_lookups(self, records: List[Dict[str, Any]], check_duplicates: bool,
+                            previous: Optional[BatchLookups] = None) -> BatchLookups:
+        """Prefetch everything the batch's validators and duplicate checks look up"""
+        from models.purchase_order import PurchaseOrder
+        from models.payment import Payment
+        from models.delivery import Delivery
         
-        if status not in allowed_values:
-            self.validation_errors.append(
-                f"❌ Status '{status}' is invalid. Must be one of: {', '.join(allowed_values)}"
-            )
-    
-    def _validate_delivery_after_release(self, release_date: Any, delivery_date: Any):
-        """Ensure delivery date is after release date"""
-        try:
-            release = self._parse_date(release_date)
-            delivery = self._parse_date(delivery_date)
+        lookups = BatchLookups(previous)
+        po_ids, po_refs, invoice_refs, payment_refs = set(), set(), set(), set()
+        windows = {}  # material_id -> [date_start, date_end, amount_low, amount_high]
+        delivery_windows = {}  # po_id -> [date_start, date_end]
+        
+        for record in records:
+            data = record['data'] if isinstance(record['data'], dict) else {}
+            if record['record_type'] == 'invoice':
+                if data.get('po_id') and _is_scalar(data['po_id']):
+                    po_ids.add(_as_key(data['po_id']))
+                if data.get('po_reference') and _is_scalar(data['po_reference']):
+                    po_refs.add(data['po_reference'])
+                if check_duplicates:
+                    invoice_num = data.get('invoice_number') or data.get('invoice_ref')
+                    if invoice_num and _is_scalar(invoice_num):
+                        invoice_refs.add(invoice_num)
+                    if data.get('payment_ref') and _is_scalar(data['payment_ref']):
+                        payment_refs.add(data['payment_ref'])
             
-            if delivery < release:
-                self.validation_errors.append(
-                    "❌ Expected delivery date cannot be before LPO release date"
-                )
-            elif delivery == release:
-                self.validation_warnings.append(
-                    "⚠️ Expected delivery is same day as LPO release"
-                )
-        except:
-            pass
-    
-    def _validate_due_after_invoice(self, invoice_date: Any, due_date: Any):
-        """Ensure payment due date is after invoice date"""
-        try:
-            invoice = self._parse_date(invoice_date)
-            due = self._parse_date(due_date)
+            elif record['record_type'] == 'lpo_release' and check_duplicates:
+                if data.get('lpo_number') and _is_scalar(data['lpo_number']):
+                    po_refs.add(data['lpo_number'])
+                amount_window = self._amount_window(data.get('amount'))
+                if (data.get('supplier_name') and data.get('material_id') and _is_scalar(data['material_id'])
+                        and data.get('release_date') and amount_window):
+                    try:
+                        release_date = self._parse_date(data['release_date'])
+                    except ValueError:
+                        continue  # process_data reports it
+                    window = windows.setdefault(_as_key(data['material_id']), [release_date, release_date, *amount_window])
+                    window[0] = min(window[0], release_date)
+                    window[1] = max(window[1], release_date)
+                    window[2] = min(window[2], amount_window[0])
+                    window[3] = max(window[3], amount_window[1])
             
-            if due < invoice:
-                self.validation_errors.append(
-                    "❌ Payment due date cannot be before invoice date"
-                )
+            elif record['record_type'] == 'delivery' and check_duplicates:
+                po_id = self._delivery_po_id(data)
+                if po_id and _is_scalar(po_id) and data.get('delivery_date'):
+                    try:
+                        delivery_date = self._parse_date(data['delivery_date'])
+                    except ValueError:
+                        continue  # process_data reports it
+                    window = delivery_windows.setdefault(_as_key(po_id), [delivery_date, delivery_date])
+                    window[0] = min(window[0], delivery_date)
+                    window[1] = max(window[1], delivery_date)
+        
+        for chunk in self._chunks(po_ids):
+            for po in self.db.query(PurchaseOrder).filter(PurchaseOrder.id.in_(chunk)):
+                lookups.pos_by_id[po.id] = po
             
-            days_diff = (due - invoice).days
-            if days_diff > 90:
-                self.validation_warnings.append(
-                    f"⚠️ Payment terms are {days_diff} days (longer than typical)"
-                )
-        except:
-            pass
+            paid = self.db.query(Payment.po_id, func.sum(self._paid_amount_expression())).filter(
+                Payment.po_id.in_(chunk)
+            ).group_by(Payment.po_id)
+            lookups.paid_by_po.update(paid)
+        
+        for chunk in self._chunks(po_refs):
+            for po in self.db.query(PurchaseOrder).filter(PurchaseOrder.po_ref.in_(chunk)):
+                lookups.pos_by_ref[po.po_ref] = po
+        
+        # First payment (lowest id) per reference, as the per-record query returns
+        for chunk in self._chunks(invoice_refs):
+            for payment in self.db.query(Payment).filter(Payment.invoice_ref.in_(chunk)).order_by(Payment.id):
+                lookups.payments_by_invoice_ref.setdefault(payment.invoice_ref, payment)
+        for chunk in self._chunks(payment_refs):
+            for payment in self.db.query(Payment).filter(Payment.payment_ref.in_(chunk)).order_by(Payment.id):
+                lookups.payments_by_payment_ref.setdefault(payment.payment_ref, payment)
+        
+        # Similar-PO candidates: one query per chunk of materials, spanning the
+        # widest date and amount windows of that chunk
+        for chunk in self._chunks(windows):
+            date_start = min(windows[m][0] for m in chunk) - timedelta(days=7)
+            date_end = max(windows[m][1] for m in chunk) + timedelta(days=7)
+            pos = self.db.query(PurchaseOrder).filter(
+                PurchaseOrder.material_id.in_(chunk),
+                PurchaseOrder.po_date.between(date_start, date_end),
+                PurchaseOrder.total_amount.between(min(windows[m][2] for m in chunk), max(windows[m][3] for m in chunk))
+            ).order_by(PurchaseOrder.po_date, PurchaseOrder.id)
+            for po in pos:
+                dates, material_pos = lookups.candidates.setdefault(po.material_id, ([], []))
+                dates.append(po.po_date)
+                material_pos.append(po)
+        
+        # Nearby deliveries: one query per chunk of POs, spanning that chunk's widest date window
+        for chunk in self._chunks(delivery_windows):
+            date_start = min(delivery_windows[p][0] for p in chunk) - timedelta(days=7)
+            date_end = max(delivery_windows[p][1] for p in chunk) + timedelta(days=7)
+            deliveries = self.db.query(Delivery).filter(
+                Delivery.po_id.in_(chunk),
+                self._delivery_date_expression().between(date_start, date_end)
+            ).order_by(Delivery.id)
+            for delivery in deliveries:
+                lookups.deliveries_by_po.setdefault(delivery.po_id, []).append(delivery)
+        
+        return lookups
+    
+    @staticmethod
+    def _chunks(values, size=500):
+        """Split values into lists small enough for one IN (...) clause"""
+        values = sorted(values, key=str)
+        for start in range(0, len(values), size):
+            yield values[start:start + size]
     
-    def _validate_response_after_submission(self, submitted_date: Any, response_date: Any):
-        """Ensure response date is after submission date"""
-        try:
-            submitted = self._parse_date(submitted_date)
-            response = self._parse_date(response_date)
-            
-            if response < submitted:
-                self.validation_errors.append(
-                    "❌ Response date cannot be before submission date"
-                )
-        except:
-            pass
+    # ============================================================================
+    # PART 1: DATA VALIDATION
+    # ============================================================================
     
-    def _validate_quantity_match(self, ordered: Any, delivered: Any):
-        """Check if delivered quantity matches ordered"""
-        try:
-            ordered_qty = float(ordered)
-            delivered_qty = float(delivered)
-            
-            if delivered_qty > ordered_qty:
-                self.validation_warnings.append(
-                    f"⚠️ Delivered quantity ({delivered_qty}) exceeds ordered ({ordered_qty})"
-                )
-            elif delivered_qty < ordered_qty * 0.9:
-                self.validation_warnings.append(
-                    f"⚠️ Delivered quantity ({delivered_qty}) is less than ordered ({ordered_qty})"
-                )
-        except (ValueError, TypeError):
-            pass
+    def _validate(self, record_type: str, data: Dict[str, Any]) -> Tuple[bool, List[str], List[str]]:
+        """Run the record type's compiled rules (see services/validation_rules.py)"""
+        validator = VALIDATORS.get(record_type)
+        if validator is None:
+            return False, [f"❌ Unknown record type: {record_type}"], []
+        
+        result = validator(data, self)
+        return result.is_valid, result.errors, result.warnings
     
-    def _validate_payment_against_po(self, po_id: int, new_payment_amount: float):
+    def _validate_payment_against_po(self, po_id: int, new_payment_amount: float, result: ValidationResult):
         """
         CRITICAL: Validate that total payments don't exceed PO amount.
         This prevents over-payment and financial errors.
         """
-        from models.purchase_order import PurchaseOrder
-        from models.payment import Payment
-        
         try:
             # Get the PO
-            po = self.db.query(PurchaseOrder).filter(PurchaseOrder.id == po_id).first()
+            po = self._get_po(po_id)
             if not po:
-                self.validation_errors.append(
+                result.errors.append(
                     f"❌ Purchase Order with ID {po_id} not found"
                 )
                 return
             
-            # Get all existing payments for this PO
-            existing_payments = self.db.query(Payment).filter(
-                Payment.po_id == po_id
-            ).all()
-            
             # Calculate total existing payments
-            total_existing = sum(
-                payment.paid_amount or payment.total_amount or 0 
-                for payment in existing_payments
-            )
+            total_existing = self._paid_total(po.id)
             
             # Calculate total with new payment
             total_with_new = total_existing + new_payment_amount
@@ -443,7 +492,7 @@ class DataProcessingAgent:
             # Check if exceeds PO amount
             if total_with_new > po.total_amount:
                 excess = total_with_new - po.total_amount
-                self.validation_errors.append(
+                result.errors.append(
                     f"❌ PAYMENT EXCEEDS PO AMOUNT!\n"
                     f"   PO {po.po_ref}: AED {po.total_amount:,.2f}\n"
                     f"   Already paid: AED {total_existing:,.2f}\n"
@@ -454,7 +503,7 @@ class DataProcessingAgent:
             # Warn if payment exceeds remaining balance
             elif total_with_new > po.total_amount * 0.95:  # Within 5% of limit
                 remaining = po.total_amount - total_existing
-                self.validation_warnings.append(
+                result.warnings.append(
                     f"⚠️ Payment is close to PO limit\n"
                     f"   PO {po.po_ref}: AED {po.total_amount:,.2f}\n"
                     f"   Already paid: AED {total_existing:,.2f}\n"
@@ -465,7 +514,7 @@ class DataProcessingAgent:
             else:
                 remaining = po.total_amount - total_existing - new_payment_amount
                 percentage = (total_with_new / po.total_amount) * 100
-                self.validation_warnings.append(
+                result.warnings.append(
                     f"ℹ️ Payment Progress for PO {po.po_ref}:\n"
                     f"   PO Amount: AED {po.total_amount:,.2f}\n"
                     f"   Paid: AED {total_existing:,.2f}\n"
@@ -475,49 +524,36 @@ class DataProcessingAgent:
                 )
                 
         except Exception as e:
-            self.validation_warnings.append(
+            result.warnings.append(
                 f"⚠️ Could not validate payment against PO: {str(e)}"
             )
     
-    def _detect_amount_anomaly(self, amount: Any, table_name: str):
-        """Detect if amount is significantly outside normal range"""
+    def _detect_amount_anomaly(self, amount: Any, table_name: str, result: ValidationResult,
+                               supplier_name: Optional[str] = None, material_id: Any = None):
+        """
+        Detect if amount is far from what this supplier and this material
+        usually cost: robust z-score against the amounts already recorded
+        (see AmountProfiles)
+        """
+        from services.amount_profiles import AmountProfiles
+        
         if not amount:
             return
         
         try:
             amount_float = float(amount)
-            
-            typical_ranges = {
-                'lpo_releases': (1000, 500000),
-                'invoices': (1000, 500000),
-            }
-            
-            if table_name in typical_ranges:
-                min_typical, max_typical = typical_ranges[table_name]
-                
-                if amount_float < min_typical:
-                    self.validation_warnings.append(
-                        f"⚠️ Amount (AED {amount_float:,.2f}) is lower than typical range"
-                    )
-                elif amount_float > max_typical:
-                    self.validation_warnings.append(
-                        f"⚠️ Amount (AED {amount_float:,.2f}) is higher than typical range"
-                    )
         except (ValueError, TypeError):
-            pass
-    
-    def _check_submittal_response_overdue(self, submitted_date: Any):
-        """Check if submittal response is overdue (> 7 days)"""
-        try:
-            submitted = self._parse_date(submitted_date)
-            days_pending = (datetime.now() - submitted).days
-            
-            if days_pending > 7:
-                self.validation_warnings.append(
-                    f"⚠️ Submittal response pending for {days_pending} days (>7 days threshold)"
-                )
-        except:
-            pass
+            return
+        
+        scope_names = {'supplier': 'this supplier', 'material': 'this material', 'all': 'all records'}
+        for anomaly in AmountProfiles.anomalies(table_name, amount_float, supplier_name, material_id):
+            direction = 'higher' if anomaly.z_score > 0 else 'lower'
+            difference = abs(amount_float / anomaly.median - 1) * 100
+            result.warnings.append(
+                f"⚠️ Amount (AED {amount_float:,.2f}) is {difference:.0f}% {direction} than the median "
+                f"for {scope_names[anomaly.scope]} (AED {anomaly.median:,.2f}, z-score {anomaly.z_score:+.1f} "
+                f"over {anomaly.count} records)"
+            )
     
     # ============================================================================
     # PART 2: DUPLICATE DETECTION
@@ -537,16 +573,20 @@ class DataProcessingAgent:
             return False, []
     
     def _check_lpo_duplicate(self, data: Dict[str, Any]) -> Tuple[bool, List[Dict[str, Any]]]:
-        """Check for duplicate PO/LPO releases"""
+        """
+        Check for duplicate PO/LPO releases
+        
+        Similar POs are read through the (material_id, po_date, total_amount)
+        index, so only rows already inside the date and amount windows are
+        loaded; supplier names are compared for those alone.
+        """
         from models.purchase_order import PurchaseOrder
         
         potential_duplicates = []
         
         # Strategy 1: Exact PO number match
         if data.get('lpo_number'):
-            exact_match = self.db.query(PurchaseOrder).filter(
-                PurchaseOrder.po_ref == data['lpo_number']
-            ).first()
+            exact_match = self._get_po_by_ref(data['lpo_number'])
             
             if exact_match:
                 potential_duplicates.append({
@@ -561,20 +601,27 @@ class DataProcessingAgent:
                 })
         
         # Strategy 2: Similar supplier + material + date proximity + similar amount
-        if data.get('supplier_name') and data.get('material_id') and data.get('release_date'):
+        amount_window = self._amount_window(data.get('amount'))
+        if data.get('supplier_name') and data.get('material_id') and data.get('release_date') and amount_window:
             release_date = self._parse_date(data['release_date'])
             date_start = release_date - timedelta(days=7)
             date_end = release_date + timedelta(days=7)
             
-            similar_pos = self.db.query(PurchaseOrder).filter(
-                PurchaseOrder.material_id == data['material_id'],
-                PurchaseOrder.po_date.between(date_start, date_end)
-            ).all()
+            if self._lookups is not None:
+                similar_pos = self._lookups.similar_po_candidates(data['material_id'], date_start, date_end, amount_window)
+            else:
+                similar_pos = self.db.query(PurchaseOrder).filter(
+                    PurchaseOrder.material_id == data['material_id'],
+                    PurchaseOrder.po_date.between(date_start, date_end),
+                    PurchaseOrder.total_amount.between(*amount_window)
+                ).order_by(PurchaseOrder.id).all()
             
+            supplier_name = data['supplier_name'].lower()
             for po in similar_pos:
-                supplier_similarity = self._calculate_similarity(
-                    data['supplier_name'].lower(),
-                    po.supplier_name.lower()
+                supplier_similarity = _bounded_similarity(
+                    supplier_name,
+                    po.supplier_name.lower(),
+                    self.similarity_threshold
                 )
                 
                 amount_similar = False
@@ -603,12 +650,26 @@ class DataProcessingAgent:
         
         potential_duplicates = []
         
-        # Strategy 1: Exact invoice reference match
+        # Both reference lookups in one indexed query
         invoice_num = data.get('invoice_number') or data.get('invoice_ref')
+        payment_ref = data.get('payment_ref')
+        conditions = []
+        if invoice_num:
+            conditions.append(Payment.invoice_ref == invoice_num)
+        if payment_ref:
+            conditions.append(Payment.payment_ref == payment_ref)
+        if self._lookups is not None:
+            matches = [self._lookups.payments_by_invoice_ref.get(invoice_num),
+                       self._lookups.payments_by_payment_ref.get(payment_ref)]
+            matches = [payment for payment in matches if payment is not None]
+        elif conditions:
+            matches = self.db.query(Payment).filter(or_(*conditions)).order_by(Payment.id).all()
+        else:
+            matches = []
+        
+        # Strategy 1: Exact invoice reference match
         if invoice_num:
-            exact_match = self.db.query(Payment).filter(
-                Payment.invoice_ref == invoice_num
-            ).first()
+            exact_match = next((p for p in matches if p.invoice_ref == invoice_num), None)
             
             if exact_match:
                 potential_duplicates.append({
@@ -623,11 +684,8 @@ class DataProcessingAgent:
                 })
         
         # Strategy 2: Exact payment reference match
-        payment_ref = data.get('payment_ref')
         if payment_ref:
-            exact_match = self.db.query(Payment).filter(
-                Payment.payment_ref == payment_ref
-            ).first()
+            exact_match = next((p for p in matches if p.payment_ref == payment_ref), None)
             
             if exact_match and exact_match.id not in [d['id'] for d in potential_duplicates]:
                 potential_duplicates.append({
@@ -658,30 +716,40 @@ class DataProcessingAgent:
         return has_duplicates, potential_duplicates
     
     def _check_delivery_duplicate(self, data: Dict[str, Any]) -> Tuple[bool, List[Dict[str, Any]]]:
-        """Check for duplicate delivery orders"""
+        """
+        Check for duplicate delivery orders
+        
+        A delivery is dated by its actual delivery date, or its expected one
+        while it has not arrived; deliveries of the same PO within a week match.
+        """
         from models.delivery import Delivery
         
         potential_duplicates = []
         
-        if data.get('po_id') and data.get('delivery_date'):
+        po_id = self._delivery_po_id(data)
+        if po_id and data.get('delivery_date'):
             delivery_date = self._parse_date(data['delivery_date'])
             date_start = delivery_date - timedelta(days=7)
             date_end = delivery_date + timedelta(days=7)
             
-            similar_deliveries = self.db.query(Delivery).filter(
-                Delivery.po_id == data['po_id'],
-                Delivery.delivery_date.between(date_start, date_end)
-            ).all()
+            if self._lookups is not None:
+                similar_deliveries = self._lookups.similar_deliveries(po_id, date_start, date_end)
+            else:
+                similar_deliveries = self.db.query(Delivery).filter(
+                    Delivery.po_id == po_id,
+                    self._delivery_date_expression().between(date_start, date_end)
+                ).order_by(Delivery.id).all()
             
             for delivery in similar_deliveries:
+                date = self._delivery_date(delivery).strftime('%Y-%m-%d')
                 potential_duplicates.append({
                     'id': delivery.id,
                     'match_type': 'Similar Delivery',
                     'confidence': 0.85,
                     'po_id': delivery.po_id,
-                    'delivery_date': delivery.delivery_date.strftime('%Y-%m-%d') if delivery.delivery_date else None,
+                    'delivery_date': date,
                     'status': delivery.delivery_status,
-                    'reason': f"Similar delivery for same PO on {delivery.delivery_date.strftime('%Y-%m-%d')}"
+                    'reason': f"Similar delivery for same PO on {date}"
                 })
         
         has_duplicates = len(potential_duplicates) > 0
@@ -696,22 +764,16 @@ class DataProcessingAgent:
         Match invoice to corresponding LPO/PO using multiple strategies.
         Returns PO ID if high-confidence match found, None otherwise.
         """
-        from models.purchase_order import PurchaseOrder
-        
         # Strategy 1: Exact PO ID provided
         if invoice_data.get('po_id'):
-            po = self.db.query(PurchaseOrder).filter(
-                PurchaseOrder.id == invoice_data['po_id']
-            ).first()
+            po = self._get_po(invoice_data['po_id'])
             if po:
                 return po.id
         
         # Strategy 2: Match by PO number extracted from invoice
         # (Assumes invoice_data might have 'po_reference' field)
         if invoice_data.get('po_reference'):
-            po = self.db.query(PurchaseOrder).filter(
-                PurchaseOrder.po_ref == invoice_data['po_reference']
-            ).first()
+            po = self._get_po_by_ref(invoice_data['po_reference'])
             if po:
                 return po.id
         
@@ -721,23 +783,172 @@ class DataProcessingAgent:
         return None
     
     # ============================================================================
-    # HELPER METHODS
+    # PART 4: IN-BATCH DUPLICATES
     # ============================================================================
     
+    def _check_batch_duplicates(self, index: int, record_type: str, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Compare a record with the earlier records of the batch, then remember it.
+        Same rules as the database checks: PO number, invoice and payment
+        references, and similar supplier + material + date + amount.
+        """
+        lookups = self._lookups
+        duplicates = []
+        if not isinstance(data, dict):
+            return duplicates
+        
+        if record_type == 'lpo_release':
+            lpo_number = data.get('lpo_number')
+            if lpo_number:
+                earlier = lookups.seen_lpo_numbers.setdefault(lpo_number, index)
+                if earlier != index:
+                    duplicates.append({
+                        'id': None,
+                        'batch_index': earlier,
+                        'match_type': 'Duplicate In Batch',
+                        'confidence': 1.0,
+                        'lpo_number': lpo_number,
+                        'reason': f"PO number '{lpo_number}' also appears in record {earlier} of this batch"
+                    })
+            
+            duplicates.extend(self._similar_in_batch(index, data))
+        
+        elif record_type == 'invoice':
+            for field, ref, seen in (
+                ('invoice_ref', data.get('invoice_number') or data.get('invoice_ref'), lookups.seen_invoice_refs),
+                ('payment_ref', data.get('payment_ref'), lookups.seen_payment_refs)
+            ):
+                if not ref:
+                    continue
+                earlier = seen.setdefault(ref, index)
+                # An earlier record matching on both references is reported once, as for the database check
+                if earlier != index and earlier not in [d['batch_index'] for d in duplicates]:
+                    duplicates.append({
+                        'id': None,
+                        'batch_index': earlier,
+                        'match_type': 'Duplicate In Batch',
+                        'confidence': 1.0,
+                        field: ref,
+                        'reason': f"{field.replace('_', ' ').title()} '{ref}' also appears in record {earlier} of this batch"
+                    })
+        
+        return duplicates
+    
+    def _similar_in_batch(self, index: int, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Earlier releases of the batch that _check_lpo_duplicate would call similar"""
+        amount_window = self._amount_window(data.get('amount'))
+        if not (data.get('supplier_name') and data.get('material_id') and data.get('release_date') and amount_window):
+            return []
+        try:
+            release_date = self._parse_date(data['release_date'])
+        except ValueError:
+            return []
+        
+        material_id = _as_key(data['material_id'])
+        amount = float(data['amount'])
+        supplier_name = data['supplier_name'].lower()
+        day = release_date.toordinal()
+        
+        similar = []
+        for bucket in range(day - 8, day + 9):
+            for earlier, earlier_date, earlier_amount, earlier_supplier in self._lookups.seen_releases.get((material_id, bucket), []):
+                if abs(release_date - earlier_date) > timedelta(days=7):
+                    continue
+                if abs(amount - earlier_amount) / earlier_amount >= 0.1:
+                    continue
+                similarity = _bounded_similarity(supplier_name, earlier_supplier.lower(), self.similarity_threshold)
+                if similarity > self.similarity_threshold:
+                    similar.append({
+                        'id': None,
+                        'batch_index': earlier,
+                        'match_type': 'Similar In Batch',
+                        'confidence': similarity,
+                        'supplier': earlier_supplier,
+                        'amount': earlier_amount,
+                        'release_date': earlier_date.strftime('%Y-%m-%d'),
+                        'reason': f"Similar PO in record {earlier} of this batch"
+                    })
+        
+        self._lookups.seen_releases.setdefault((material_id, day), []).append(
+            (index, release_date, amount, data['supplier_name'])
+        )
+        return sorted(similar, key=lambda d: d['batch_index'])
+    
+    # ============================================================================
+    # LOOKUPS - the batch's shared tables, or one query per record
+    # ============================================================================
+    
+    def _get_po(self, po_id: Any):
+        """PurchaseOrder by id, or None"""
+        from models.purchase_order import PurchaseOrder
+        if self._lookups is not None:
+            return self._lookups.pos_by_id.get(_as_key(po_id))
+        return self.db.query(PurchaseOrder).filter(PurchaseOrder.id == po_id).first()
+    
+    def _get_po_by_ref(self, po_ref: str):
+        """PurchaseOrder by PO number, or None"""
+        from models.purchase_order import PurchaseOrder
+        if self._lookups is not None:
+            return self._lookups.pos_by_ref.get(po_ref)
+        return self.db.query(PurchaseOrder).filter(PurchaseOrder.po_ref == po_ref).first()
+    
+    def _paid_total(self, po_id: int) -> float:
+        """Sum of existing payments against a PO"""
+        from models.payment import Payment
+        if self._lookups is not None:
+            return self._lookups.paid_by_po.get(po_id) or 0
+        total = self.db.query(func.sum(self._paid_amount_expression())).filter(Payment.po_id == po_id).scalar()
+        return total or 0
+    
+    @staticmethod
+    def _paid_amount_expression():
+        """SQL for what a payment counts towards its PO: paid amount, else total amount"""
+        from models.payment import Payment
+        return func.coalesce(func.nullif(Payment.paid_amount, 0), Payment.total_amount, 0)
+    
+    @staticmethod
+    def _delivery_po_id(data: Dict[str, Any]) -> Any:
+        """PO of a delivery record: po_id, or lpo_id as the delivery rules name it"""
+        return data.get('po_id') or data.get('lpo_id')
+    
+    @staticmethod
+    def _delivery_date(delivery) -> Optional[datetime]:
+        """When a delivery arrived, or is expected while it has not"""
+        return delivery.actual_delivery_date or delivery.expected_delivery_date
+    
+    @staticmethod
+    def _delivery_date_expression():
+        """SQL for _delivery_date"""
+        from models.delivery import Delivery
+        return func.coalesce(Delivery.actual_delivery_date, Delivery.expected_delivery_date)
+    
+    # ============================================================================
+    # HELPER METHODS
+    # ============================================================================
+
     def _calculate_similarity(self, str1: str, str2: str) -> float:
         """Calculate similarity ratio between two strings (0.0 to 1.0)"""
         if not str1 or not str2:
             return 0.0
         return SequenceMatcher(None, str1, str2).ratio()
     
+    def _amount_window(self, amount: Any) -> Optional[Tuple[float, float]]:
+        """
+        Range of PO amounts that can pass the 10% similarity check
+        (|amount - po| / po < 0.1), slightly widened for float rounding;
+        None when no PO can match
+        """
+        try:
+            amount = float(amount) if amount else 0.0
+        except (ValueError, TypeError):
+            return None
+        if amount <= 0:
+            return None
+        return amount / 1.1 * (1 - 1e-9), amount / 0.9 * (1 + 1e-9)
+    
     def _parse_date(self, date_value: Any) -> datetime:
         """Convert various date formats to datetime object"""
-        if isinstance(date_value, datetime):
-            return date_value
-        elif isinstance(date_value, str):
-            return datetime.strptime(date_value, '%Y-%m-%d')
-        else:
-            raise ValueError("Invalid date format")
+        return parse_date(date_value)
     
     def get_duplicate_summary(self, duplicates: List[Dict[str, Any]]) -> str:
         """Generate human-readable summary of duplicates found"""
@@ -0,0 +1,100 @@
+"""
+Extraction Cache - Reuse PDF text and n8n extraction results across uploads
+Results are keyed by content hash, kind and prompt version; bumping
+EXTRACTION_PROMPT_VERSION makes every document extract afresh
+"""
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from models import db
+from models.extraction_cache import ExtractionCacheEntry
+
+
+class ExtractionCache:
+    """Service for reading and writing cached extraction results"""
+
+    TEXT_KIND = 'pdf_text'
+    TEXT_VERSION = 'pypdf2'  # PDF text does not depend on the prompt
+
+    # Upload document_context -> cached kind
+    KINDS = {
+        'purchase_order': 'purchase_order',
+        'delivery': 'delivery',
+        'delivery_note': 'delivery',
+        'invoice': 'invoice'
+    }
+
+    # Fields of an n8n extraction callback that are replayed from the cache
+    RESULT_FIELDS = ('extraction_status', 'extracted_data', 'extraction_confidence')
+
+    @staticmethod
+    def prompt_version():
+        """Current extraction prompt version"""
+        return str(current_app.config.get('EXTRACTION_PROMPT_VERSION', '1'))
+
+    @staticmethod
+    def lookup(content_hash, kind, version=None):
+        """
+        Cached entry for a document, counting the hit
+
+        Returns:
+            ExtractionCacheEntry or None
+        """
+        if not content_hash or not kind:
+            return None
+        entry = ExtractionCacheEntry.query.filter_by(
+            content_hash=content_hash, kind=kind, prompt_version=str(version or ExtractionCache.prompt_version())
+        ).first()
+        if entry:
+            entry.hit_count += 1
+            entry.last_hit_at = datetime.utcnow()
+        return entry
+
+    @staticmethod
+    def store(content_hash, kind, result, version=None):
+        """Insert or replace the cached result (committed with the caller's transaction)"""
+        if not content_hash or not kind:
+            return None
+        key = {
+            'content_hash': content_hash,
+            'kind': kind,
+            'prompt_version': str(version or ExtractionCache.prompt_version())
+        }
+
+        entry = ExtractionCacheEntry.query.filter_by(**key).first()
+        if entry is None:
+            try:
+                # Savepoint: a concurrent writer may have inserted the same key
+                with db.session.begin_nested():
+                    entry = ExtractionCacheEntry(result=result, **key)
+                    db.session.add(entry)
+                return entry
+            except IntegrityError:
+                entry = ExtractionCacheEntry.query.filter_by(**key).first()
+
+        entry.result = result
+        return entry
+
+    @staticmethod
+    def store_extraction(content_hash, document_context, data):
+        """Cache the result fields of an n8n extraction callback"""
+        result = {field: data[field] for field in ExtractionCache.RESULT_FIELDS if field in data}
+        return ExtractionCache.store(
+            content_hash, ExtractionCache.KINDS.get(document_context), result, version=data.get('prompt_version')
+        )
+
+    # ==================== PDF TEXT ====================
+
+    @staticmethod
+    def get_text(content_hash):
+        """Cached {'text', 'num_pages'} for a PDF, or None"""
+        entry = ExtractionCache.lookup(content_hash, ExtractionCache.TEXT_KIND, ExtractionCache.TEXT_VERSION)
+        return entry.result if entry else None
+
+    @staticmethod
+    def put_text(content_hash, text, num_pages):
+        """Cache the text of a PDF"""
+        return ExtractionCache.store(
+            content_hash, ExtractionCache.TEXT_KIND, {'text': text, 'num_pages': num_pages},
+            ExtractionCache.TEXT_VERSION
+        )
@@ -0,0 +1,315 @@
+"""
+n8n Dispatcher - Outbox delivery of n8n webhook calls
+Requests enqueue a dispatch row in the same transaction as the data it refers
+to; a background worker sends it over a pooled HTTP session, retrying with
+exponential backoff until n8n accepts it
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from sqlalchemy import event, func, update, and_, or_
+from sqlalchemy.exc import IntegrityError
+from models import db
+from models.n8n_dispatch import N8nDispatch
+
+
+class N8nDispatcher:
+    """Service for queueing and delivering n8n webhook calls"""
+
+    DEFAULT_MAX_ATTEMPTS = 8
+    DEFAULT_TIMEOUT = 10  # Seconds per HTTP call
+    DEFAULT_BATCH_SIZE = 20
+    DEFAULT_COALESCE_WINDOW = 0.5  # Seconds the worker waits after a wake-up so bursts coalesce
+    POLL_INTERVAL = 5  # Seconds between checks for due retries
+    BACKOFF_BASE = 5  # Seconds before the first retry, doubled per attempt
+    BACKOFF_MAX = 900
+    CLAIM_TIMEOUT = 300  # Seconds before a row stuck in 'sending' (crashed worker) is retried
+
+    _http = None
+    _worker = None
+    _wake_event = threading.Event()
+    _lock = threading.Lock()
+    _stats = {'sent': 0, 'failed': 0, 'retried': 0, 'coalesced': 0, 'last_error': None}
+    _latencies = deque(maxlen=200)  # Seconds from enqueue to delivery of recent sends
+
+    # ==================== SETUP ====================
+
+    @staticmethod
+    def init_app(app):
+        """Wake the worker after commits that enqueued dispatches"""
+        if not event.contains(db.session, 'after_commit', N8nDispatcher._after_commit):
+            event.listen(db.session, 'after_commit', N8nDispatcher._after_commit)
+            event.listen(db.session, 'after_rollback', N8nDispatcher._after_rollback)
+
+        # Pick up rows left pending by a previous process on the first request
+        @app.before_request
+        def start_n8n_dispatcher():
+            if N8nDispatcher._worker is None:
+                N8nDispatcher.start_worker()
+
+    @staticmethod
+    def start_worker():
+        """Start the background worker thread for the current app, if enabled"""
+        app = current_app._get_current_object()
+        if app.testing or not app.config.get('N8N_DISPATCH_WORKER', True):
+            return False
+
+        with N8nDispatcher._lock:
+            if N8nDispatcher._worker is None or not N8nDispatcher._worker.is_alive():
+                N8nDispatcher._worker = threading.Thread(
+                    target=N8nDispatcher._run, args=(app,), name='n8n-dispatcher', daemon=True
+                )
+                N8nDispatcher._worker.start()
+        return True
+
+    # ==================== ENQUEUE ====================
+
+    @staticmethod
+    def enqueue(webhook, payload, dedupe_key=None, merge=None):
+        """
+        Add a webhook call to the outbox (committed with the caller's transaction)
+
+        Args:
+            webhook: Path under the n8n /webhook/ prefix, e.g. 'extract-document'
+            payload: JSON body
+            dedupe_key: Calls with the same key that are still pending are
+                merged into one
+            merge: merge(pending_payload, payload) -> payload sent for the
+                merged call; by default the latest payload replaces the pending one
+
+        Returns:
+            N8nDispatch row
+        """
+        db.session.info['n8n_dispatch_enqueued'] = True
+
+        if not dedupe_key:
+            dispatch = N8nDispatch(webhook=webhook, payload=payload, next_attempt_at=datetime.utcnow())
+            db.session.add(dispatch)
+            return dispatch
+
+        pending = N8nDispatcher._merge_pending(webhook, payload, dedupe_key, merge)
+        if pending:
+            return pending
+
+        dispatch = N8nDispatch(webhook=webhook, payload=payload, dedupe_key=dedupe_key,
+                               next_attempt_at=datetime.utcnow())
+        try:
+            # Savepoint: a concurrent request may have inserted the pending row
+            # for this key first (the unique partial index allows only one)
+            with db.session.begin_nested():
+                db.session.add(dispatch)
+            return dispatch
+        except IntegrityError:
+            pending = N8nDispatcher._merge_pending(webhook, payload, dedupe_key, merge)
+            if pending is None:
+                raise
+            return pending
+
+    @staticmethod
+    def _merge_pending(webhook, payload, dedupe_key, merge):
+        """Merge payload into the pending row for the key; None if there is none"""
+        pending = N8nDispatch.query.filter_by(
+            dedupe_key=dedupe_key, webhook=webhook, status='pending'
+        ).first()
+        if pending is None:
+            return None
+
+        # Conditional update: a worker may claim the row in the meantime, and
+        # a payload written after that would never be sent
+        result = db.session.execute(
+            update(N8nDispatch).where(
+                N8nDispatch.id == pending.id,
+                N8nDispatch.status == 'pending'
+            ).values(
+                payload=merge(pending.payload, payload) if merge else payload,
+                coalesced_count=N8nDispatch.coalesced_count + 1
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            return None
+        db.session.refresh(pending)
+        N8nDispatcher._stats['coalesced'] += 1
+        return pending
+
+    @staticmethod
+    def _after_commit(session):
+        """after_commit hook: wake the worker once the outbox rows are visible"""
+        if session.info.pop('n8n_dispatch_enqueued', False):
+            if N8nDispatcher._worker is None or not N8nDispatcher._worker.is_alive():
+                N8nDispatcher.start_worker()
+            N8nDispatcher._wake_event.set()
+
+    @staticmethod
+    def _after_rollback(session):
+        """after_rollback hook: the enqueued rows were discarded"""
+        session.info.pop('n8n_dispatch_enqueued', None)
+
+    # ==================== DELIVERY ====================
+
+    @staticmethod
+    def _run(app):
+        """Worker loop: sleep until woken or a retry is due, then drain the outbox"""
+        while True:
+            woken = N8nDispatcher._wake_event.wait(timeout=N8nDispatcher.POLL_INTERVAL)
+            N8nDispatcher._wake_event.clear()
+            if woken:
+                time.sleep(app.config.get('N8N_DISPATCH_COALESCE_WINDOW', N8nDispatcher.DEFAULT_COALESCE_WINDOW))
+
+            with app.app_context():
+                try:
+                    while N8nDispatcher.process_due():
+                        pass
+                except Exception as e:
+                    print(f"⚠️ n8n dispatcher error: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    @staticmethod
+    def process_due():
+        """
+        Claim and send one batch of due dispatches
+
+        Returns:
+            Number of dispatches attempted (0 when nothing is due)
+        """
+        batch = N8nDispatcher._claim_batch()
+        for dispatch in batch:
+            N8nDispatcher._send(dispatch)
+        if batch:
+            db.session.commit()
+        return len(batch)
+
+    @staticmethod
+    def _claim_batch():
+        """Mark up to one batch of due rows as 'sending' for this worker"""
+        now = datetime.utcnow()
+        batch_size = current_app.config.get('N8N_DISPATCH_BATCH_SIZE', N8nDispatcher.DEFAULT_BATCH_SIZE)
+        stale = now - timedelta(seconds=N8nDispatcher.CLAIM_TIMEOUT)
+
+        candidates = N8nDispatch.query.filter(
+            or_(
+                and_(N8nDispatch.status == 'pending', N8nDispatch.next_attempt_at <= now),
+                and_(N8nDispatch.status == 'sending', N8nDispatch.claimed_at < stale)
+            )
+        ).order_by(N8nDispatch.next_attempt_at, N8nDispatch.id).limit(batch_size).all()
+
+        claimed = []
+        for dispatch in candidates:
+            # Conditional update so concurrent workers never send the same row
+            result = db.session.execute(
+                update(N8nDispatch).where(
+                    N8nDispatch.id == dispatch.id,
+                    N8nDispatch.status == dispatch.status,
+                    N8nDispatch.attempts == dispatch.attempts
+                ).values(status='sending', claimed_at=now).execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(dispatch.id)
+        db.session.commit()
+
+        if not claimed:
+            return []
+        return N8nDispatch.query.filter(N8nDispatch.id.in_(claimed)).order_by(N8nDispatch.id).all()
+
+    @staticmethod
+    def _send(dispatch):
+        """POST one dispatch and record the outcome on the row"""
+        n8n_webhook_url = os.getenv('N8N_WEBHOOK_URL', 'https://n8n1.trart.uk')
+        n8n_api_key = os.getenv('N8N_API_KEY', '')
+        timeout = current_app.config.get('N8N_DISPATCH_TIMEOUT', N8nDispatcher.DEFAULT_TIMEOUT)
+
+        dispatch.attempts += 1
+        try:
+            response = N8nDispatcher._session().post(
+                f"{n8n_webhook_url}/webhook/{dispatch.webhook}",
+                json=dispatch.payload,
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f'Bearer {n8n_api_key}'
+                },
+                timeout=timeout
+            )
+            dispatch.last_status_code = response.status_code
+            error = None if 200 <= response.status_code < 300 else f'HTTP {response.status_code}'
+        except requests.RequestException as e:
+            dispatch.last_status_code = None
+            error = str(e)[:500]
+
+        now = datetime.utcnow()
+        if error is None:
+            dispatch.status = 'sent'
+            dispatch.sent_at = now
+            dispatch.last_error = None
+            N8nDispatcher._stats['sent'] += 1
+            N8nDispatcher._latencies.append((now - dispatch.created_at).total_seconds())
+            return
+
+        dispatch.last_error = error
+        N8nDispatcher._stats['last_error'] = error
+        max_attempts = current_app.config.get('N8N_DISPATCH_MAX_ATTEMPTS', N8nDispatcher.DEFAULT_MAX_ATTEMPTS)
+        if dispatch.attempts >= max_attempts:
+            dispatch.status = 'failed'
+            N8nDispatcher._stats['failed'] += 1
+            print(f"❌ n8n dispatch {dispatch.id} ({dispatch.webhook}) failed after {dispatch.attempts} attempts: {error}")
+        else:
+            dispatch.status = 'pending'
+            dispatch.next_attempt_at = now + timedelta(seconds=N8nDispatcher.backoff(dispatch.attempts))
+            N8nDispatcher._stats['retried'] += 1
+
+    @staticmethod
+    def backoff(attempts):
+        """Seconds before the next attempt: exponential with +/-20% jitter"""
+        delay = min(N8nDispatcher.BACKOFF_BASE * 2 ** (attempts - 1), N8nDispatcher.BACKOFF_MAX)
+        return delay * random.uniform(0.8, 1.2)
+
+    @staticmethod
+    def _session():
+        """Shared keep-alive HTTP session"""
+        if N8nDispatcher._http is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            N8nDispatcher._http = session
+        return N8nDispatcher._http
+
+    # ==================== METRICS ====================
+
+    @staticmethod
+    def metrics():
+        """Queue depth, age and delivery latency"""
+        now = datetime.utcnow()
+        by_status = dict(
+            db.session.query(N8nDispatch.status, func.count(N8nDispatch.id)).group_by(N8nDispatch.status).all()
+        )
+        oldest_pending = db.session.query(func.min(N8nDispatch.created_at)).filter(
+            N8nDispatch.status.in_(['pending', 'sending'])
+        ).scalar()
+
+        latencies = sorted(N8nDispatcher._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3)
+
+        return {
+            'queue_depth': by_status.get('pending', 0) + by_status.get('sending', 0),
+            'by_status': by_status,
+            'oldest_pending_age_seconds': round((now - oldest_pending).total_seconds(), 1) if oldest_pending else None,
+            'latency_seconds': {
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': round(latencies[-1], 3) if latencies else None,
+                'samples': len(latencies)
+            },
+            'totals': dict(N8nDispatcher._stats),
+            'worker_running': N8nDispatcher._worker is not None and N8nDispatcher._worker.is_alive()
+        }
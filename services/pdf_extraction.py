@@ -0,0 +1,295 @@
+"""
+PDF Extraction - Page-parallel PDF text extraction
+Pages are split into contiguous ranges extracted in a process pool and read
+back in page order; small PDFs are answered in the request, large ones run as
+background jobs tracked in pdf_extraction_jobs
+"""
+import hashlib
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+import PyPDF2
+from flask import current_app
+from models import db
+from models.pdf_extraction_job import PdfExtractionJob
+from services.extraction_cache import ExtractionCache
+
+
+class PdfExtractionError(ValueError):
+    """PDF that cannot be read (answered with 400 instead of 500)"""
+
+
+@contextmanager
+def open_pdf(path):
+    """
+    PdfReader over a read-only memory map of the file
+
+    PyPDF2 copies the whole file into a BytesIO when given a path; a memory
+    map lets it read only the objects it needs, from pages shared with any
+    other process reading the same file.
+
+    Raises:
+        PdfExtractionError: Empty file (it cannot be memory-mapped)
+    """
+    if os.path.getsize(path) == 0:
+        raise PdfExtractionError('PDF file is empty')
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield PyPDF2.PdfReader(view)
+
+
+def _extract_page_range(path, start, stop):
+    """Pool task: text of pages [start, stop) of the PDF at path"""
+    with open_pdf(path) as reader:
+        return [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+
+class PdfExtractionService:
+    """Service for extracting text from PDFs across CPU cores"""
+
+    DEFAULT_PAGES_PER_TASK = 8
+    DEFAULT_SYNC_MAX_PAGES = 20
+    MAX_CONCURRENT_JOBS = 2
+    SPOOL_CHUNK_SIZE = 1024 * 1024
+    # Workers are never forked: a fork copies the app's threads' locks
+    # (SQLAlchemy pool, dispatcher, job runner) in whatever state they are in
+    START_METHODS = ('forkserver', 'spawn')
+
+    _pool = None
+    _pool_workers = None
+    _jobs = None
+    _lock = threading.Lock()
+
+    # ==================== EXTRACTION ====================
+
+    @staticmethod
+    def extract(path, file_id=None, owns_file=False, wait=False, content_hash=None):
+        """
+        Extract text now for small PDFs, or start a background job for large ones
+
+        Args:
+            path: PDF on disk
+            file_id: File the PDF came from (recorded on the job)
+            owns_file: Delete path once extraction is finished
+            wait: Extract synchronously whatever the page count
+            content_hash: SHA-256 of the PDF; text already extracted for the
+                same content is returned from the extraction cache
+
+        Returns:
+            {'num_pages', 'text'} when answered synchronously or from the cache,
+            {'num_pages', 'job'} when queued as a PdfExtractionJob
+        """
+        try:
+            cached = ExtractionCache.get_text(content_hash)
+            if cached:
+                db.session.commit()  # Record the hit
+                return {'num_pages': cached['num_pages'], 'text': cached['text'], 'cached': True}
+
+            num_pages = PdfExtractionService.count_pages(path)
+            sync_max = current_app.config.get('PDF_SYNC_MAX_PAGES', PdfExtractionService.DEFAULT_SYNC_MAX_PAGES)
+
+            if wait or num_pages <= sync_max:
+                text = PdfExtractionService.extract_text(path, num_pages)
+                if content_hash:
+                    ExtractionCache.put_text(content_hash, text, num_pages)
+                    db.session.commit()
+                return {'num_pages': num_pages, 'text': text}
+
+            job = PdfExtractionService.submit(path, num_pages, file_id=file_id, owns_file=owns_file,
+                                              content_hash=content_hash)
+            owns_file = False  # The job removes it
+            return {'num_pages': num_pages, 'job': job}
+        finally:
+            if owns_file:
+                PdfExtractionService._remove(path)
+
+    @staticmethod
+    def extract_text(path, num_pages=None):
+        """Full text of the PDF, pages separated by blank lines"""
+        return '\n\n'.join(PdfExtractionService.iter_pages(path, num_pages)).strip()
+
+    @staticmethod
+    def iter_pages(path, num_pages=None, workers=None, pages_per_task=None):
+        """
+        Yield the text of each page in page order
+
+        Page ranges are extracted in parallel; each page is yielded as soon
+        as its range and every range before it have finished.
+        """
+        config = current_app.config
+        workers = config.get('PDF_EXTRACTION_WORKERS', os.cpu_count() or 1) if workers is None else workers
+        pages_per_task = pages_per_task or config.get('PDF_PAGES_PER_TASK', PdfExtractionService.DEFAULT_PAGES_PER_TASK)
+        if num_pages is None:
+            num_pages = PdfExtractionService.count_pages(path)
+
+        # One range or no pool: the pool round trip would only add latency
+        if workers <= 0 or num_pages <= pages_per_task:
+            yield from _extract_page_range(path, 0, num_pages)
+            return
+
+        pool = PdfExtractionService._get_pool(workers)
+        futures = [
+            pool.submit(_extract_page_range, path, start, min(start + pages_per_task, num_pages))
+            for start in range(0, num_pages, pages_per_task)
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        except BrokenProcessPool:
+            PdfExtractionService.shutdown()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def count_pages(path):
+        """Number of pages in the PDF at path"""
+        with open_pdf(path) as reader:
+            return len(reader.pages)
+
+    @staticmethod
+    def spool(pdf_bytes):
+        """Write PDF bytes to a temporary file the pool workers can open"""
+        fd, path = tempfile.mkstemp(suffix='.pdf', prefix='pdf_extract_')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_bytes)
+        return path
+
+    @staticmethod
+    def spool_stream(stream):
+        """
+        Copy a binary stream to a temporary file in fixed-size chunks,
+        hashing it on the way, so the document is never held in memory whole
+
+        Returns:
+            (path, content_hash)
+        """
+        digest = hashlib.sha256()
+        fd, path = tempfile.mkstemp(suffix='.pdf', prefix='pdf_extract_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(PdfExtractionService.SPOOL_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+        except Exception:
+            PdfExtractionService._remove(path)
+            raise
+        return path, digest.hexdigest()
+
+    # ==================== JOBS ====================
+
+    @staticmethod
+    def submit(path, num_pages, file_id=None, owns_file=False, content_hash=None):
+        """Queue a background extraction and return its PdfExtractionJob"""
+        job = PdfExtractionJob(job_id=uuid.uuid4().hex, file_id=file_id, num_pages=num_pages)
+        db.session.add(job)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        PdfExtractionService._get_job_runner().submit(
+            PdfExtractionService._run_job, app, job.job_id, path, owns_file, content_hash
+        )
+        return job
+
+    @staticmethod
+    def get_job(job_id):
+        """PdfExtractionJob by its public id, or None"""
+        return PdfExtractionJob.query.filter_by(job_id=job_id).first()
+
+    @staticmethod
+    def _run_job(app, job_id, path, owns_file, content_hash=None):
+        """Job runner thread: extract in page order, recording progress per range"""
+        with app.app_context():
+            job = PdfExtractionService.get_job(job_id)
+            try:
+                job.status = 'running'
+                job.started_at = datetime.utcnow()
+                db.session.commit()
+
+                progress_every = app.config.get('PDF_PAGES_PER_TASK', PdfExtractionService.DEFAULT_PAGES_PER_TASK)
+                pages = []
+                for text in PdfExtractionService.iter_pages(path, job.num_pages):
+                    pages.append(text)
+                    if len(pages) % progress_every == 0:
+                        job.pages_done = len(pages)
+                        db.session.commit()
+
+                job.text = '\n\n'.join(pages).strip()
+                job.pages_done = len(pages)
+                job.status = 'completed'
+                if content_hash:
+                    ExtractionCache.put_text(content_hash, job.text, job.num_pages)
+            except Exception as e:
+                db.session.rollback()
+                job = PdfExtractionService.get_job(job_id)
+                job.status = 'failed'
+                job.error = str(e)[:1000]
+                print(f"❌ PDF extraction job {job_id} failed: {str(e)}")
+            finally:
+                job.completed_at = datetime.utcnow()
+                db.session.commit()
+                db.session.remove()
+                if owns_file:
+                    PdfExtractionService._remove(path)
+
+    # ==================== POOLS ====================
+
+    @staticmethod
+    def _get_pool(workers):
+        """Shared process pool, rebuilt if the worker count changes"""
+        with PdfExtractionService._lock:
+            if PdfExtractionService._pool is None or PdfExtractionService._pool_workers != workers:
+                if PdfExtractionService._pool is not None:
+                    PdfExtractionService._pool.shutdown(wait=False, cancel_futures=True)
+                PdfExtractionService._pool = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=PdfExtractionService._mp_context()
+                )
+                PdfExtractionService._pool_workers = workers
+            return PdfExtractionService._pool
+
+    @staticmethod
+    def _mp_context():
+        """First available start method of START_METHODS"""
+        available = multiprocessing.get_all_start_methods()
+        method = next(m for m in PdfExtractionService.START_METHODS if m in available)
+        context = multiprocessing.get_context(method)
+        if method == 'forkserver':
+            # The (single-threaded) server imports this module once; workers
+            # forked from it start without importing the app again
+            context.set_forkserver_preload([__name__])
+        return context
+
+    @staticmethod
+    def _get_job_runner():
+        """Threads that drive background jobs (the pages themselves run in the process pool)"""
+        with PdfExtractionService._lock:
+            if PdfExtractionService._jobs is None:
+                PdfExtractionService._jobs = ThreadPoolExecutor(
+                    max_workers=PdfExtractionService.MAX_CONCURRENT_JOBS, thread_name_prefix='pdf-extraction'
+                )
+            return PdfExtractionService._jobs
+
+    @staticmethod
+    def shutdown():
+        """Stop the process pool (it is recreated on next use)"""
+        with PdfExtractionService._lock:
+            if PdfExtractionService._pool is not None:
+                PdfExtractionService._pool.shutdown(wait=False, cancel_futures=True)
+            PdfExtractionService._pool = None
+            PdfExtractionService._pool_workers = None
+
+    @staticmethod
+    def _remove(path):
+        """Delete a spooled PDF, ignoring one that is already gone"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -3,8 +3,13 @@ SMB File Server Service
 Handles connections and operations with office SMB/CIFS file server
 """
 
+import io
 import os
-import tempfile
+import socket
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from pathlib import Path
 import logging
@@ -12,13 +17,185 @@ import logging
 try:
     from smb.SMBConnection import SMBConnection
     from smb.smb_structs import OperationFailure
+    from smb.base import NotConnectedError, NotReadyError, SMBTimeout
     SMB_AVAILABLE = True
+    # Errors that mean the connection itself is unusable (as opposed to an
+    # OperationFailure such as a missing file, which leaves it healthy)
+    CONNECTION_ERRORS = (NotConnectedError, NotReadyError, SMBTimeout, ConnectionError, socket.error)
 except ImportError:
     SMB_AVAILABLE = False
+    CONNECTION_ERRORS = (ConnectionError, socket.error)
     print("⚠️  pysmb not installed. Install with: pip install pysmb")
 
 logger = logging.getLogger(__name__)
 
+# Directory entry as kept in the listing cache (same attribute names as pysmb's SharedFile)
+SMBEntry = namedtuple('SMBEntry', 'filename isDirectory file_size last_write_time')
+
+
+class SMBConnectionPool:
+    """
+    Thread-safe pool of authenticated SMB connections
+    
+    Connections are opened on demand up to max_size and handed to one thread
+    at a time. Idle connections are closed after idle_timeout seconds; one
+    idle for longer than health_check_interval is pinged (SMB ECHO) before
+    reuse and replaced if it does not answer.
+    """
+    
+    def __init__(self, factory, max_size=4, idle_timeout=300, health_check_interval=30, acquire_timeout=30):
+        """
+        Args:
+            factory: Callable returning a new connected SMBConnection
+            max_size: Most connections open at once
+            idle_timeout: Seconds an unused connection is kept
+            health_check_interval: Seconds of idleness after which a
+                connection is pinged before being handed out
+            acquire_timeout: Seconds to wait for a free connection
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        
+        self._idle = []  # [(conn, idle_since)], most recently used last
+        self._open = 0
+        self._cond = threading.Condition()
+        self.stats = {'created': 0, 'reused': 0, 'discarded': 0, 'failed_health_checks': 0}
+    
+    def acquire(self):
+        """
+        Take a connection out of the pool (give it back with release or discard)
+        
+        Raises:
+            Exception: No connection freed up within acquire_timeout, or the
+                server could not be reached
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                self._close_expired()
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception(f"No SMB connection available after {self.acquire_timeout}s "
+                                    f"({self.max_size} in use)")
+                self._cond.wait(remaining)
+                
+        # Network round trips happen outside the lock
+        if conn is not None:
+            if time.monotonic() - idle_since < self.health_check_interval or self._is_alive(conn):
+                self._count('reused')
+                return conn
+            self._count('failed_health_checks')
+            self._close(conn)
+            
+        try:
+            conn = self.factory()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        self._count('created')
+        return conn
+    
+    def release(self, conn):
+        """Return a healthy connection for reuse"""
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def discard(self, conn):
+        """Close a broken connection and free its slot"""
+        self._close(conn)
+        with self._cond:
+            self._open -= 1
+            self.stats['discarded'] += 1
+            self._cond.notify()
+    
+    def run(self, operation, retries=1):
+        """
+        Call operation(conn) on a pooled connection
+        
+        A connection-level failure discards the connection and retries on a
+        fresh one (up to retries times); any other error is raised with the
+        connection returned to the pool. Use retries=0 for operations that
+        cannot be repeated, such as consuming a request stream.
+        """
+        for attempt in range(retries + 1):
+            conn = self.acquire()
+            try:
+                result = operation(conn)
+            except CONNECTION_ERRORS as e:
+                self.discard(conn)
+                if attempt == retries:
+                    raise
+                logger.warning(f"SMB connection lost ({e}); reconnecting")
+            except Exception:
+                self.release(conn)
+                raise
+            else:
+                self.release(conn)
+                return result
+    
+    def close_all(self):
+        """Close every idle connection"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+    
+    def status(self):
+        """Pool size and counters"""
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                **self.stats
+            }
+    
+    def _close_expired(self):
+        """Close connections idle longer than idle_timeout (caller holds the lock)"""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = [conn for conn, idle_since in self._idle if idle_since < cutoff]
+        if expired:
+            self._idle = [(conn, idle_since) for conn, idle_since in self._idle if idle_since >= cutoff]
+            self._open -= len(expired)
+            for conn in expired:
+                self._close(conn)
+    
+    def _count(self, name):
+        with self._cond:
+            self.stats[name] += 1
+    
+    @staticmethod
+    def _is_alive(conn):
+        """SMB ECHO round trip"""
+        try:
+            conn.echo(b'ping', timeout=5)
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
 
 class SMBService:
     """Service for managing SMB file server operations"""
@@ -36,17 +213,36 @@ class SMBService:
         # Base path for PKP projects on SMB server
         self.base_path = os.getenv('SMB_BASE_PATH', 'PKP_Projects')
         
-        self.conn = None
-        self.is_connected = False
+        # Connections are shared across requests and threads, so the NTLMv2
+        # handshake is paid once per connection rather than once per request
+        self.pool = SMBConnectionPool(
+            self.connect,
+            max_size=int(os.getenv('SMB_POOL_SIZE', 4)),
+            idle_timeout=int(os.getenv('SMB_POOL_IDLE_TIMEOUT', 300)),
+            health_check_interval=int(os.getenv('SMB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+            acquire_timeout=int(os.getenv('SMB_POOL_ACQUIRE_TIMEOUT', 30))
+        )
+        
+        # Directory listings, keyed by share path. Fresh for listing_ttl
+        # seconds; after that a folder whose last_write_time has not changed
+        # is reused (one attribute lookup instead of a listing) until
+        # listing_max_age, when it is listed again regardless
+        self.listing_ttl = int(os.getenv('SMB_LISTING_CACHE_TTL', 60))
+        self.listing_max_age = int(os.getenv('SMB_LISTING_CACHE_MAX_AGE', 600))
+        self.crawl_workers = int(os.getenv('SMB_CRAWL_WORKERS', self.pool.max_size))
+        self.stream_chunk_size = int(os.getenv('SMB_STREAM_CHUNK_SIZE', 1024 * 1024))
+        self._listings = {}
+        self._listings_lock = threading.Lock()
+        self.cache_stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'invalidated': 0}
     
     def connect(self):
-        """Establish connection to SMB server"""
+        """Open a new authenticated connection to the SMB server"""
         if not SMB_AVAILABLE:
             raise Exception("pysmb library not installed. Run: pip install pysmb")
-        
+            
         try:
             # Create SMB connection
-            self.conn = SMBConnection(
+            conn = SMBConnection(
                 username=self.username,
                 password=self.password,
                 my_name=self.client_name,
@@ -57,48 +253,110 @@ class SMBService:
             )
             
             # Connect to server (port 445 for direct TCP)
-            self.is_connected = self.conn.connect(self.server_ip, 445)
-            
-            if not self.is_connected:
+            if not conn.connect(self.server_ip, 445):
                 raise Exception("Failed to connect to SMB server")
-            
+                
             logger.info(f"✅ Connected to SMB server: {self.server_name} ({self.server_ip})")
-            return True
+            return conn
             
         except Exception as e:
             logger.error(f"❌ SMB connection failed: {str(e)}")
-            self.is_connected = False
             raise Exception(f"SMB connection failed: {str(e)}")
     
     def disconnect(self):
-        """Close SMB connection"""
-        if self.conn and self.is_connected:
-            self.conn.close()
-            self.is_connected = False
-            logger.info("Disconnected from SMB server")
+        """Close idle pooled connections"""
+        self.pool.close_all()
+        logger.info("Disconnected from SMB server")
     
-    def list_folders(self, path=''):
+    def _full_path(self, path='', name=None):
+        """Share path of a folder (or of a file in it) under base_path"""
+        full_path = f"{self.base_path}/{path}" if path else self.base_path
+        return f"{full_path}/{name}" if name else full_path
+    
+    # ==================== LISTING CACHE ====================
+    
+    def _listing(self, path='', refresh=False):
+        """
+        Entries of a folder (without . and ..), from the cache when possible
+        
+        Args:
+            path: Relative path from base_path
+            refresh: Skip the cache and list the folder again
+            
+        Returns:
+            List of SMBEntry
+        """
+        full_path = self._full_path(path)
+        now = time.monotonic()
+        with self._listings_lock:
+            cached = self._listings.get(full_path)
+            
+        if cached and not refresh:
+            age = now - cached['fetched_at']
+            if age < self.listing_ttl:
+                self._count_cache('hits')
+                return cached['entries']
+            if age < self.listing_max_age and cached['last_write_time'] is not None:
+                # Adding, removing or renaming an entry updates the folder's last_write_time
+                attributes = self.pool.run(lambda conn: conn.getAttributes(self.share_name, full_path))
+                if attributes.last_write_time == cached['last_write_time']:
+                    self._store_listing(full_path, cached['entries'], cached['last_write_time'], now)
+                    self._count_cache('revalidated')
+                    return cached['entries']
+                    
+        file_list = self.pool.run(lambda conn: conn.listPath(self.share_name, full_path))
+        folder_write_time = next((f.last_write_time for f in file_list if f.filename == '.'), None)
+        entries = [
+            SMBEntry(f.filename, f.isDirectory, f.file_size, f.last_write_time)
+            for f in file_list if f.filename not in ['.', '..']
+        ]
+        self._store_listing(full_path, entries, folder_write_time, now)
+        self._count_cache('misses')
+        return entries
+    
+    def _store_listing(self, full_path, entries, last_write_time, fetched_at):
+        with self._listings_lock:
+            self._listings[full_path] = {
+                'entries': entries,
+                'last_write_time': last_write_time,
+                'fetched_at': fetched_at
+            }
+    
+    def _count_cache(self, name):
+        with self._listings_lock:
+            self.cache_stats[name] += 1
+    
+    def invalidate(self, path=''):
+        """Drop the cached listing of a folder after changing its contents"""
+        with self._listings_lock:
+            if self._listings.pop(self._full_path(path), None) is not None:
+                self.cache_stats['invalidated'] += 1
+    
+    def clear_cache(self):
+        """Drop every cached listing"""
+        with self._listings_lock:
+            self._listings.clear()
+    
+    # ==================== OPERATIONS ====================
+    
+    def list_folders(self, path='', refresh=False):
         """
         List folders in the specified path
         
         Args:
             path: Relative path from base_path (e.g., 'Villa_Projects/Villa_123')
-        
+            refresh: Bypass the listing cache
+            
         Returns:
             List of folder names
         """
-        if not self.is_connected:
-            self.connect()
-        
         try:
-            full_path = f"{self.base_path}/{path}" if path else self.base_path
-            
             # List directory contents
-            file_list = self.conn.listPath(self.share_name, full_path)
+            file_list = self._listing(path, refresh)
             
             # Filter only directories (exclude . and ..)
             folders = [
-                f.filename for f in file_list 
+                f.filename for f in file_list
                 if f.isDirectory and f.filename not in ['.', '..']
             ]
             
@@ -108,24 +366,20 @@ class SMBService:
             logger.error(f"Failed to list folders: {str(e)}")
             raise Exception(f"Failed to list folders: {str(e)}")
     
-    def list_files(self, path=''):
+    def list_files(self, path='', refresh=False):
         """
         List files in the specified path with metadata
         
         Args:
             path: Relative path from base_path
-        
+            refresh: Bypass the listing cache
+            
         Returns:
             List of dicts with file information
         """
-        if not self.is_connected:
-            self.connect()
-        
         try:
-            full_path = f"{self.base_path}/{path}" if path else self.base_path
-            
             # List directory contents
-            file_list = self.conn.listPath(self.share_name, full_path)
+            file_list = self._listing(path, refresh)
             
             # Filter only files and get metadata
             files = []
@@ -140,7 +394,7 @@ class SMBService:
                         'extension': Path(f.filename).suffix.lower(),
                         'path': f"{path}/{f.filename}" if path else f.filename
                     })
-            
+                    
             return sorted(files, key=lambda x: x['modified'], reverse=True)
             
         except Exception as e:
@@ -155,24 +409,41 @@ class SMBService:
             local_file_path: Path to local file
             remote_path: Remote folder path (relative to base_path)
             filename: Name to save file as
+            
+        Returns:
+            Dict with upload status
+        """
+        with open(local_file_path, 'rb') as local_file:
+            return self.upload_stream(local_file, remote_path, filename)
+    
+    def upload_stream(self, stream, remote_path, filename):
+        """
+        Upload from a file-like object straight into storeFile
+        
+        A seekable source is rewound and retried after a dropped connection;
+        a request body cannot be replayed, so it gets a single attempt.
         
+        Args:
+            stream: Readable file-like object (e.g. request.stream)
+            remote_path: Remote folder path (relative to base_path)
+            filename: Name to save file as
+            
         Returns:
             Dict with upload status
         """
-        if not self.is_connected:
-            self.connect()
+        full_path = self._full_path(remote_path, filename)
+        seekable = hasattr(stream, 'seekable') and stream.seekable()
+        start = stream.tell() if seekable else 0
         
-        try:
-            full_path = f"{self.base_path}/{remote_path}/{filename}" if remote_path else f"{self.base_path}/{filename}"
+        def store(conn):
+            if seekable:
+                stream.seek(start)
+            return conn.storeFile(self.share_name, full_path, stream)
             
-            # Read local file
-            with open(local_file_path, 'rb') as local_file:
-                # Upload to SMB server
-                bytes_uploaded = self.conn.storeFile(
-                    self.share_name,
-                    full_path,
-                    local_file
-                )
+        try:
+            # Upload to SMB server
+            bytes_uploaded = self.pool.run(store, retries=1 if seekable else 0)
+            self.invalidate(remote_path)
             
             logger.info(f"✅ Uploaded {bytes_uploaded} bytes to {full_path}")
             
@@ -188,41 +459,55 @@ class SMBService:
             logger.error(f"Failed to upload file: {str(e)}")
             raise Exception(f"Failed to upload file: {str(e)}")
     
-    def download_file(self, remote_path, filename):
+    def stream_file(self, remote_path, filename, chunk_size=None):
         """
-        Download file from SMB server
+        Stream file from SMB server
+        
+        The size is looked up first, so a missing file fails before anything
+        is sent. The content is then read chunk by chunk with
+        retrieveFileFromOffset: the pooled connection is only held while a
+        chunk is read, and a dropped connection resumes at the current offset.
         
         Args:
             remote_path: Remote folder path (relative to base_path)
             filename: Name of file to download
-        
+            chunk_size: Bytes per read (default SMB_STREAM_CHUNK_SIZE)
+            
         Returns:
-            Path to temporary downloaded file
+            Tuple of (size in bytes, iterator of byte chunks)
         """
-        if not self.is_connected:
-            self.connect()
+        full_path = self._full_path(remote_path, filename)
+        chunk_size = chunk_size or self.stream_chunk_size
         
         try:
-            full_path = f"{self.base_path}/{remote_path}/{filename}" if remote_path else f"{self.base_path}/{filename}"
-            
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix)
-            
-            # Download from SMB server
-            with open(temp_file.name, 'wb') as local_file:
-                self.conn.retrieveFile(
-                    self.share_name,
-                    full_path,
-                    local_file
-                )
-            
-            logger.info(f"✅ Downloaded {filename} to {temp_file.name}")
-            
-            return temp_file.name
-            
+            attributes = self.pool.run(lambda conn: conn.getAttributes(self.share_name, full_path))
+            if attributes.isDirectory:
+                raise Exception(f"{filename} is a folder")
         except Exception as e:
             logger.error(f"Failed to download file: {str(e)}")
             raise Exception(f"Failed to download file: {str(e)}")
+            
+        size = attributes.file_size
+        
+        def read_chunk(offset):
+            def retrieve(conn):
+                # Fresh buffer on every attempt so a retry does not append
+                buffer = io.BytesIO()
+                conn.retrieveFileFromOffset(self.share_name, full_path, buffer, offset, min(chunk_size, size - offset))
+                return buffer.getvalue()
+            return self.pool.run(retrieve)
+            
+        def chunks():
+            offset = 0
+            while offset < size:
+                data = read_chunk(offset)
+                if not data:
+                    break  # Truncated on the server since the size lookup
+                offset += len(data)
+                yield data
+            logger.info(f"✅ Streamed {offset} bytes of {full_path}")
+            
+        return size, chunks()
     
     def delete_file(self, remote_path, filename):
         """
@@ -231,18 +516,16 @@ class SMBService:
         Args:
             remote_path: Remote folder path (relative to base_path)
             filename: Name of file to delete
-        
+            
         Returns:
             Dict with deletion status
         """
-        if not self.is_connected:
-            self.connect()
-        
         try:
-            full_path = f"{self.base_path}/{remote_path}/{filename}" if remote_path else f"{self.base_path}/{filename}"
+            full_path = self._full_path(remote_path, filename)
             
             # Delete file
-            self.conn.deleteFiles(self.share_name, full_path)
+            self.pool.run(lambda conn: conn.deleteFiles(self.share_name, full_path))
+            self.invalidate(remote_path)
             
             logger.info(f"✅ Deleted {full_path}")
             
@@ -263,18 +546,16 @@ class SMBService:
         Args:
             path: Parent folder path (relative to base_path)
             folder_name: Name of new folder
-        
+            
         Returns:
             Dict with creation status
         """
-        if not self.is_connected:
-            self.connect()
-        
         try:
-            full_path = f"{self.base_path}/{path}/{folder_name}" if path else f"{self.base_path}/{folder_name}"
+            full_path = self._full_path(path, folder_name)
             
             # Create directory
-            self.conn.createDirectory(self.share_name, full_path)
+            self.pool.run(lambda conn: conn.createDirectory(self.share_name, full_path))
+            self.invalidate(path)
             
             logger.info(f"✅ Created folder {full_path}")
             
@@ -288,40 +569,49 @@ class SMBService:
             logger.error(f"Failed to create folder: {str(e)}")
             raise Exception(f"Failed to create folder: {str(e)}")
     
-    def get_folder_structure(self, path='', max_depth=3, current_depth=0):
+    def get_folder_structure(self, path='', max_depth=3, current_depth=0, refresh=False):
         """
         Get hierarchical folder structure
         
+        Folders are listed concurrently over the connection pool, at most
+        crawl_workers at a time; each subfolder is queued as soon as its
+        parent has been listed. Fresh listings come from the listing cache.
+        
         Args:
             path: Starting path
             max_depth: Maximum depth to traverse
-            current_depth: Current recursion depth
-        
+            current_depth: Depth of path
+            refresh: Bypass the listing cache
+            
         Returns:
             Nested dict representing folder structure
         """
-        if not self.is_connected:
-            self.connect()
-        
         if current_depth >= max_depth:
             return {}
-        
-        try:
-            folders = self.list_folders(path)
-            structure = {}
-            
-            for folder in folders:
-                folder_path = f"{path}/{folder}" if path else folder
-                structure[folder] = {
-                    'path': folder_path,
-                    'subfolders': self.get_folder_structure(folder_path, max_depth, current_depth + 1)
-                }
-            
-            return structure
             
-        except Exception as e:
-            logger.error(f"Failed to get folder structure: {str(e)}")
-            return {}
+        structure = {}
+        with ThreadPoolExecutor(max_workers=max(self.crawl_workers, 1), thread_name_prefix='smb-crawl') as executor:
+            pending = {executor.submit(self.list_folders, path, refresh): (path, structure, current_depth)}
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    folder_path, node, depth = pending.pop(future)
+                    try:
+                        folders = future.result()
+                    except Exception as e:
+                        # An unreadable folder is left empty, the rest of the tree is kept
+                        logger.error(f"Failed to get folder structure: {str(e)}")
+                        continue
+                        
+                    for folder in folders:
+                        child_path = f"{folder_path}/{folder}" if folder_path else folder
+                        node[folder] = {'path': child_path, 'subfolders': {}}
+                        if depth + 1 < max_depth:
+                            child = executor.submit(self.list_folders, child_path, refresh)
+                            pending[child] = (child_path, node[folder]['subfolders'], depth + 1)
+                            
+        return structure
     
     @staticmethod
     def _format_size(bytes):
@@ -335,10 +625,8 @@ class SMBService:
     def test_connection(self):
         """Test SMB connection and return server info"""
         try:
-            self.connect()
-            
             # Try to list shares
-            shares = self.conn.listShares()
+            shares = self.pool.run(lambda conn: conn.listShares())
             share_names = [s.name for s in shares if not s.name.endswith('$')]
             
             # Try to access configured share
@@ -351,6 +639,8 @@ class SMBService:
                 'base_path': self.base_path,
                 'available_shares': share_names,
                 'folders_count': len(folders),
+                'pool': self.pool.status(),
+                'listing_cache': {'folders': len(self._listings), **self.cache_stats},
                 'message': 'SMB connection successful'
             }
             
@@ -360,8 +650,6 @@ class SMBService:
                 'error': str(e),
                 'message': 'SMB connection failed'
             }
-        finally:
-            self.disconnect()
 
 
 # Global instance
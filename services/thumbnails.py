@@ -0,0 +1,177 @@
+"""
+Thumbnails - First-page previews of uploaded documents
+PDFs and images get a small thumbnail and a larger preview rendered in the
+background after upload, stored next to their blob as
+<hash>.<size>.<format> so identical uploads share them
+"""
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pdfplumber
+from PIL import Image, ImageOps
+
+
+class ThumbnailService:
+    """Service for rendering and locating document previews"""
+
+    # Longest edge in pixels
+    SIZES = {
+        'thumb': 200,
+        'preview': 1024
+    }
+
+    # format -> (PIL format, mimetype, save options)
+    FORMATS = {
+        'webp': ('WEBP', 'image/webp', {'quality': 80}),
+        'png': ('PNG', 'image/png', {'optimize': True})
+    }
+
+    IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    PDF_EXTENSIONS = {'pdf'}
+
+    _runner = None
+    _pending = set()
+    _lock = threading.Lock()
+    _render_lock = threading.Lock()  # pdfium is not thread-safe
+
+    # ==================== LOOKUP ====================
+
+    @staticmethod
+    def supports(extension):
+        """Whether previews can be rendered for this file extension"""
+        return extension in ThumbnailService.PDF_EXTENSIONS | ThumbnailService.IMAGE_EXTENSIONS
+
+    @staticmethod
+    def path_for(source_path, content_hash, size, fmt):
+        """Where the preview of a blob is cached"""
+        return os.path.join(os.path.dirname(source_path), f'{content_hash}.{size}.{fmt}')
+
+    @staticmethod
+    def get(source_path, content_hash, size, fmt):
+        """
+        Path of a preview, rendering it first if it is not cached yet
+
+        Returns:
+            Path, or None when the source cannot be previewed
+        """
+        path = ThumbnailService.path_for(source_path, content_hash, size, fmt)
+        if not os.path.exists(path):
+            ThumbnailService.generate(source_path, content_hash)
+        return path if os.path.exists(path) else None
+
+    # ==================== RENDERING ====================
+
+    @staticmethod
+    def generate(source_path, content_hash):
+        """
+        Render every size and format missing for a blob
+
+        Returns:
+            Number of files written
+        """
+        missing = [
+            (size, fmt) for size in ThumbnailService.SIZES for fmt in ThumbnailService.FORMATS
+            if not os.path.exists(ThumbnailService.path_for(source_path, content_hash, size, fmt))
+        ]
+        if not missing:
+            return 0
+
+        largest = max(ThumbnailService.SIZES[size] for size, _ in missing)
+        image = ThumbnailService.render_first_page(source_path, largest)
+        if image is None:
+            return 0
+
+        for size, fmt in missing:
+            scaled = image.copy()
+            scaled.thumbnail((ThumbnailService.SIZES[size],) * 2, Image.LANCZOS)
+            ThumbnailService._write(scaled, ThumbnailService.path_for(source_path, content_hash, size, fmt), fmt)
+        return len(missing)
+
+    @staticmethod
+    def render_first_page(source_path, box):
+        """
+        First page (or the image itself) as an RGB image no larger than box
+
+        Returns:
+            PIL Image, or None for unsupported types
+        """
+        extension = source_path.rsplit('.', 1)[-1].lower()
+
+        if extension in ThumbnailService.PDF_EXTENSIONS:
+            with ThumbnailService._render_lock, pdfplumber.open(source_path) as pdf:
+                if not pdf.pages:
+                    return None
+                page = pdf.pages[0]
+                # Page size is in points (1/72 inch); pick the DPI that fits box
+                resolution = 72 * box / max(page.width, page.height)
+                image = page.to_image(resolution=resolution).original.convert('RGB')
+            image.thumbnail((box, box), Image.LANCZOS)
+            return image
+
+        if extension in ThumbnailService.IMAGE_EXTENSIONS:
+            with Image.open(source_path) as image:
+                image.draft('RGB', (box, box))  # JPEG decodes at reduced scale
+                image = ImageOps.exif_transpose(image).convert('RGB')
+            image.thumbnail((box, box), Image.LANCZOS)
+            return image
+
+        return None
+
+    @staticmethod
+    def _write(image, path, fmt):
+        """Save atomically so readers never see a partial file"""
+        pil_format, _, options = ThumbnailService.FORMATS[fmt]
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.thumb_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, pil_format, **options)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def remove(source_path, content_hash):
+        """Delete every cached preview of a blob"""
+        for size in ThumbnailService.SIZES:
+            for fmt in ThumbnailService.FORMATS:
+                try:
+                    os.remove(ThumbnailService.path_for(source_path, content_hash, size, fmt))
+                except OSError:
+                    pass
+
+    # ==================== BACKGROUND ====================
+
+    @staticmethod
+    def submit(source_path, content_hash):
+        """
+        Render previews in the background
+
+        Returns:
+            Future, or None when the type is unsupported or a render for the
+            same blob is already queued
+        """
+        extension = source_path.rsplit('.', 1)[-1].lower()
+        if not content_hash or not ThumbnailService.supports(extension):
+            return None
+
+        with ThumbnailService._lock:
+            if content_hash in ThumbnailService._pending:
+                return None
+            ThumbnailService._pending.add(content_hash)
+            if ThumbnailService._runner is None:
+                ThumbnailService._runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+            return ThumbnailService._runner.submit(ThumbnailService._run, source_path, content_hash)
+
+    @staticmethod
+    def _run(source_path, content_hash):
+        """Runner thread: render, logging rather than raising"""
+        try:
+            return ThumbnailService.generate(source_path, content_hash)
+        except Exception as e:
+            print(f"❌ Preview rendering failed for {content_hash[:12]}: {str(e)}")
+            return 0
+        finally:
+            with ThumbnailService._lock:
+                ThumbnailService._pending.discard(content_hash)
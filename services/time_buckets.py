@@ -0,0 +1,157 @@
+"""
+Time Buckets - Shared day/week/month/quarter series for trend charts
+Builds one GROUP BY query per series on SQLite or PostgreSQL and fills the
+periods that have no rows
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func, cast, Integer
+from models import db
+
+
+class TimeBuckets:
+    """Period keys and grouped time series"""
+
+    # Period key formats: day 2025-03-14, week 2025-03-10 (Monday), month 2025-03, quarter 2025-Q1
+    GRANULARITIES = ('day', 'week', 'month', 'quarter')
+
+    # ==================== SERIES ====================
+
+    @staticmethod
+    def series(date_column, aggregates, start, end=None, granularity='month', filters=None, joins=None):
+        """
+        Aggregate rows into consecutive periods with one grouped query
+
+        Args:
+            date_column: Column the rows are bucketed by
+            aggregates: Dict of output name -> aggregate expression, e.g. {'total': func.sum(Payment.paid_amount)}
+            start: First datetime included (its whole period is reported)
+            end: Datetime excluded (default: no upper bound; periods run to now or the latest row)
+            granularity: day, week, month or quarter
+            filters: Extra filter clauses
+            joins: Extra join arguments, e.g. [(PurchaseOrder, Payment.po_id == PurchaseOrder.id)]
+
+        Returns:
+            List of {'period': key, <aggregate names>...} for every period from
+            start to end, oldest first; empty periods have 0 for every aggregate
+        """
+        period = TimeBuckets.period_expression(date_column, granularity).label('period')
+
+        query = db.session.query(period, *[expr.label(name) for name, expr in aggregates.items()])
+        for join in joins or []:
+            query = query.join(*join)
+        query = query.filter(date_column.isnot(None), date_column >= start)
+        if end:
+            query = query.filter(date_column < end)
+        for clause in filters or []:
+            query = query.filter(clause)
+
+        rows = {row.period: row._asdict() for row in query.group_by(period).all()}
+
+        if end is None:
+            end = datetime.utcnow()
+            if rows:
+                latest = TimeBuckets.parse_period_key(max(rows), granularity)
+                end = max(end, TimeBuckets.next_period_start(latest, granularity))
+
+        series = []
+        for key in TimeBuckets.periods(start, end, granularity):
+            row = rows.get(key)
+            series.append({'period': key, **{
+                name: (row[name] if row and row[name] is not None else 0) for name in aggregates
+            }})
+        return series
+
+    # ==================== PERIOD KEYS ====================
+
+    @staticmethod
+    def period_expression(date_column, granularity, dialect_name=None):
+        """SQL expression giving the period key of date_column"""
+        TimeBuckets._check_granularity(granularity)
+        dialect_name = dialect_name or db.session.get_bind().dialect.name
+
+        if dialect_name == 'sqlite':
+            if granularity == 'day':
+                return func.strftime('%Y-%m-%d', date_column)
+            if granularity == 'week':
+                # Next Sunday (or same day), back six days: the Monday starting the week
+                return func.date(date_column, 'weekday 0', '-6 days')
+            if granularity == 'month':
+                return func.strftime('%Y-%m', date_column)
+            quarter = (cast(func.strftime('%m', date_column), Integer) + 2) // 3
+            return func.printf('%s-Q%d', func.strftime('%Y', date_column), quarter)
+
+        if dialect_name == 'postgresql':
+            if granularity == 'day':
+                return func.to_char(date_column, 'YYYY-MM-DD')
+            if granularity == 'week':
+                return func.to_char(func.date_trunc('week', date_column), 'YYYY-MM-DD')
+            if granularity == 'month':
+                return func.to_char(date_column, 'YYYY-MM')
+            return func.to_char(date_column, 'YYYY-"Q"Q')
+
+        raise ValueError(f"Time buckets are not supported on '{dialect_name}'")
+
+    @staticmethod
+    def period_key(value, granularity):
+        """Period key of a datetime (Python equivalent of period_expression)"""
+        TimeBuckets._check_granularity(granularity)
+        start = TimeBuckets.period_start(value, granularity)
+        if granularity == 'month':
+            return start.strftime('%Y-%m')
+        if granularity == 'quarter':
+            return f'{start.year}-Q{(start.month - 1) // 3 + 1}'
+        return start.strftime('%Y-%m-%d')
+
+    @staticmethod
+    def parse_period_key(key, granularity):
+        """Start datetime of the period a key names"""
+        TimeBuckets._check_granularity(granularity)
+        if granularity == 'month':
+            return datetime.strptime(key, '%Y-%m')
+        if granularity == 'quarter':
+            year, quarter = key.split('-Q')
+            return datetime(int(year), (int(quarter) - 1) * 3 + 1, 1)
+        return datetime.strptime(key, '%Y-%m-%d')
+
+    @staticmethod
+    def period_start(value, granularity):
+        """Midnight at the start of the period containing value"""
+        day = datetime(value.year, value.month, value.day)
+        if granularity == 'day':
+            return day
+        if granularity == 'week':
+            return day - timedelta(days=day.weekday())
+        if granularity == 'month':
+            return day.replace(day=1)
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+
+    @staticmethod
+    def next_period_start(value, granularity):
+        """Start of the period after the one containing value"""
+        start = TimeBuckets.period_start(value, granularity)
+        if granularity == 'day':
+            return start + timedelta(days=1)
+        if granularity == 'week':
+            return start + timedelta(days=7)
+        months = 1 if granularity == 'month' else 3
+        month_index = start.year * 12 + start.month - 1 + months
+        return start.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+    @staticmethod
+    def periods(start, end, granularity):
+        """Keys of every period overlapping [start, end), oldest first"""
+        TimeBuckets._check_granularity(granularity)
+        keys = []
+        current = TimeBuckets.period_start(start, granularity)
+        while current < end:
+            keys.append(TimeBuckets.period_key(current, granularity))
+            current = TimeBuckets.next_period_start(current, granularity)
+        return keys
+
+    @staticmethod
+    def _check_granularity(granularity):
+        """Reject unknown granularities"""
+        if granularity not in TimeBuckets.GRANULARITIES:
+            raise ValueError(
+                f"Unknown granularity '{granularity}'. Use one of: {', '.join(TimeBuckets.GRANULARITIES)}"
+            )
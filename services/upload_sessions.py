@@ -0,0 +1,382 @@
+"""
+Upload Sessions - Resumable chunked uploads
+A client opens a session with the file's name and size, PUTs byte ranges in
+order and completes the session; each chunk is a short request written
+straight to a staging file, so a dropped connection only loses the chunk in
+flight and the upload resumes from received_bytes
+"""
+import hashlib
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update
+from models import db
+from models.file import File
+from models.upload_session import UploadSession
+from services.content_store import ContentStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: staging writes are serialised within one process only
+    fcntl = None
+
+
+class UploadSessionError(ValueError):
+    """Invalid upload session request, with the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400, **details):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class UploadSessionService:
+    """Service for staging and completing chunked uploads"""
+
+    STAGING_DIR = '.sessions'
+    COPY_SIZE = 64 * 1024
+    DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024
+    DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+    DEFAULT_TTL_HOURS = 24
+
+    # Leading bytes each allowed extension must start with
+    SIGNATURES = {
+        'pdf': (b'%PDF',),
+        'png': (b'\x89PNG',),
+        'jpg': (b'\xff\xd8\xff',),
+        'jpeg': (b'\xff\xd8\xff',),
+        'doc': (b'\xd0\xcf\x11\xe0',),
+        'xls': (b'\xd0\xcf\x11\xe0',),
+        'docx': (b'PK\x03\x04',),
+        'xlsx': (b'PK\x03\x04',)
+    }
+
+    # Running SHA-256 per session, so the file is hashed as chunks arrive.
+    # Process-local: a chunk handled by another worker drops it and the
+    # staged file is hashed on completion instead.
+    _hashers = {}
+    _lock = threading.Lock()
+    _write_lock = threading.Lock()  # Stands in for the staging file lock without fcntl
+
+    # ==================== SESSIONS ====================
+
+    @staticmethod
+    def create(root, original_filename, file_size, mime_type=None, file_type='other',
+               entity_type=None, entity_id=None, uploaded_by=None):
+        """
+        Validate an upload before any bytes are sent and open its session
+
+        Raises:
+            UploadSessionError: Disallowed type or size
+        """
+        extension = UploadSessionService.extension(original_filename)
+        if extension not in UploadSessionService.SIGNATURES:
+            raise UploadSessionError(
+                f"File type not allowed. Allowed: {', '.join(UploadSessionService.SIGNATURES)}", 415
+            )
+
+        max_size = current_app.config.get('CHUNKED_UPLOAD_MAX_SIZE', UploadSessionService.DEFAULT_MAX_SIZE)
+        if not isinstance(file_size, int) or file_size <= 0:
+            raise UploadSessionError('file_size must be a positive number of bytes')
+        if file_size > max_size:
+            raise UploadSessionError(f'File is larger than the {max_size} byte limit', 413, max_size=max_size)
+
+        UploadSessionService.purge_expired(root)
+
+        ttl = current_app.config.get('UPLOAD_SESSION_TTL_HOURS', UploadSessionService.DEFAULT_TTL_HOURS)
+        session = UploadSession(
+            session_id=uuid.uuid4().hex,
+            original_filename=original_filename,
+            file_size=file_size,
+            mime_type=mime_type,
+            file_type=file_type or 'other',
+            entity_type=entity_type,
+            entity_id=entity_id,
+            uploaded_by=uploaded_by,
+            expires_at=datetime.utcnow() + timedelta(hours=ttl)
+        )
+
+        os.makedirs(os.path.join(root, UploadSessionService.STAGING_DIR), exist_ok=True)
+        open(UploadSessionService.part_path(root, session.session_id), 'wb').close()
+
+        db.session.add(session)
+        db.session.commit()
+        with UploadSessionService._lock:
+            UploadSessionService._hashers[session.session_id] = (0, hashlib.sha256())
+        return session
+
+    @staticmethod
+    def get_open(session_id):
+        """
+        Session that can still receive chunks
+
+        Raises:
+            UploadSessionError: Unknown (404), finished or expired (410)
+        """
+        session = UploadSession.query.filter_by(session_id=session_id).first()
+        if not session:
+            raise UploadSessionError('Upload session not found', 404)
+        if session.status != 'open':
+            raise UploadSessionError(f'Upload session is {session.status}', 410, status=session.status)
+        if session.expires_at < datetime.utcnow():
+            raise UploadSessionError('Upload session has expired', 410, status='expired')
+        return session
+
+    # ==================== CHUNKS ====================
+
+    @staticmethod
+    def write_chunk(root, session, start, length, total, stream):
+        """
+        Write bytes [start, start + length) of the file from stream
+
+        Chunks must arrive in order: start has to equal received_bytes, so a
+        client that lost track after a disconnect asks for the session and
+        resumes from there. Writers hold the staging file's lock from that
+        check until received_bytes is committed, so a retried chunk cannot
+        overwrite bytes a later chunk has already written.
+
+        Raises:
+            UploadSessionError: Out-of-order (409), oversized (413),
+                wrong content (415) or truncated (400) chunk
+        """
+        chunk_limit = current_app.config.get('CHUNKED_UPLOAD_CHUNK_SIZE', UploadSessionService.DEFAULT_CHUNK_SIZE)
+        if total is not None and total != session.file_size:
+            raise UploadSessionError('Content-Range total does not match the declared file_size')
+        if start != session.received_bytes:
+            raise UploadSessionError('Chunk does not start at the resume offset', 409,
+                                     received_bytes=session.received_bytes)
+        if length > chunk_limit:
+            raise UploadSessionError(f'Chunks are limited to {chunk_limit} bytes', 413, chunk_size=chunk_limit)
+        if start + length > session.file_size:
+            raise UploadSessionError('Chunk runs past the declared file_size')
+
+        with UploadSessionService._staging_file(root, session.session_id) as part:
+            # Another request may have written this offset while we waited for the lock
+            db.session.refresh(session)
+            if session.status != 'open':
+                raise UploadSessionError(f'Upload session is {session.status}', 410, status=session.status)
+            if start != session.received_bytes:
+                raise UploadSessionError('Chunk does not start at the resume offset', 409,
+                                         received_bytes=session.received_bytes)
+            return UploadSessionService._write_locked(part, session, start, length, stream)
+
+    @staticmethod
+    def _write_locked(part, session, start, length, stream):
+        """write_chunk's copy, signature check and offset update, under the staging file lock"""
+        with UploadSessionService._lock:
+            offset, hasher = UploadSessionService._hashers.get(session.session_id, (None, None))
+        hasher = hasher.copy() if offset == start else None
+
+        written = 0
+        part.seek(start)
+        part.truncate()  # Drop whatever an interrupted attempt at this chunk left behind
+        while written < length:
+            piece = stream.read(min(UploadSessionService.COPY_SIZE, length - written))
+            if not piece:
+                break
+            part.write(piece)
+            if hasher:
+                hasher.update(piece)
+            written += len(piece)
+
+        # Checked once, by the chunk that completes the leading bytes
+        # (however the client split them across chunks and reads)
+        needed = UploadSessionService._signature_length(session)
+        end = start + written
+        if written == length and start < needed and (end >= needed or end == session.file_size):
+            part.seek(0)
+            UploadSessionService._check_signature(session, part.read(needed))
+
+        if written != length:
+            raise UploadSessionError('Chunk body ended early; resend it', 400,
+                                     received_bytes=session.received_bytes)
+        part.flush()  # On disk before received_bytes says so
+
+        # Conditional so two requests racing for the same offset cannot both advance it
+        result = db.session.execute(
+            update(UploadSession).where(
+                UploadSession.id == session.id,
+                UploadSession.received_bytes == start
+            ).values(received_bytes=start + length, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            db.session.refresh(session)
+            raise UploadSessionError('Chunk does not start at the resume offset', 409,
+                                     received_bytes=session.received_bytes)
+
+        with UploadSessionService._lock:
+            if hasher:
+                UploadSessionService._hashers[session.session_id] = (start + length, hasher)
+            else:
+                UploadSessionService._hashers.pop(session.session_id, None)
+
+        db.session.refresh(session)
+        return session
+
+    @staticmethod
+    @contextmanager
+    def _staging_file(root, session_id):
+        """Staging file opened for update, locked against other threads and worker processes"""
+        with open(UploadSessionService.part_path(root, session_id), 'r+b') as part:
+            if fcntl is None:
+                with UploadSessionService._write_lock:
+                    yield part
+                return
+            fcntl.flock(part.fileno(), fcntl.LOCK_EX)  # Released when the file is closed
+            yield part
+
+    @staticmethod
+    def _signature_length(session):
+        """Leading bytes needed to check the declared file type"""
+        extension = UploadSessionService.extension(session.original_filename)
+        return max(len(signature) for signature in UploadSessionService.SIGNATURES[extension])
+
+    @staticmethod
+    def _check_signature(session, first_bytes):
+        """The file must start like the declared file type"""
+        extension = UploadSessionService.extension(session.original_filename)
+        if not first_bytes.startswith(UploadSessionService.SIGNATURES[extension]):
+            raise UploadSessionError(f'File content is not a valid .{extension} file', 415)
+
+    # ==================== COMPLETION ====================
+
+    @staticmethod
+    def complete(root, session, expected_hash=None):
+        """
+        Move the staged file into the content store and create its File record
+        (committed by the caller)
+
+        Args:
+            expected_hash: SHA-256 the client computed, checked when given
+
+        Returns:
+            (File, stored) where stored is the ContentStore result
+
+        Raises:
+            UploadSessionError: Bytes still missing, from the session or the
+                staging file, or the session was completed or aborted by a
+                concurrent request (409); content not matching expected_hash (422)
+        """
+        if session.received_bytes != session.file_size:
+            raise UploadSessionError('Upload is incomplete', 409, received_bytes=session.received_bytes)
+
+        # No chunk can be written once received_bytes reaches file_size, so the
+        # staging file is final here; it must hold every byte the session counted
+        part_path = UploadSessionService.part_path(root, session.session_id)
+        staged_size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if staged_size != session.file_size:
+            UploadSessionService._rewind(session, min(staged_size, session.file_size))
+            raise UploadSessionError('Staged file is incomplete; resume from received_bytes', 409,
+                                     received_bytes=session.received_bytes)
+
+        with UploadSessionService._lock:
+            offset, hasher = UploadSessionService._hashers.get(session.session_id, (None, None))
+        # The running hash covers the bytes this process received; without it
+        # (another worker took a chunk, or a restart) the staged file is hashed
+        content_hash = hasher.hexdigest() if offset == session.file_size else ContentStore.hash_file(part_path)
+        if expected_hash and expected_hash.lower() != content_hash:
+            raise UploadSessionError('File content does not match the expected SHA-256', 422,
+                                     sha256=content_hash)
+
+        # Conditional so only one of two racing requests adopts the staged file;
+        # the claim commits (or rolls back) with the caller's transaction
+        result = db.session.execute(
+            update(UploadSession).where(
+                UploadSession.id == session.id,
+                UploadSession.status == 'open',
+                UploadSession.received_bytes == session.file_size
+            ).values(status='completed', updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            db.session.refresh(session)
+            raise UploadSessionError(f'Upload session is {session.status}', 409,
+                                     status=session.status, received_bytes=session.received_bytes)
+
+        with UploadSessionService._lock:
+            UploadSessionService._hashers.pop(session.session_id, None)
+
+        extension = UploadSessionService.extension(session.original_filename)
+        stored = ContentStore.adopt(part_path, root, extension, content_hash)
+
+        file_record = File(
+            filename=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{session.session_id[:8]}_{session.original_filename}",
+            original_filename=session.original_filename,
+            file_path=stored['file_path'],
+            file_size=stored['file_size'],
+            content_hash=stored['content_hash'],
+            file_type=session.file_type,
+            mime_type=session.mime_type,
+            uploaded_by=session.uploaded_by,
+            processing_status='uploaded'
+        )
+        db.session.add(file_record)
+        db.session.flush()
+
+        session.status = 'completed'  # Already claimed above; keeps the loaded object in step
+        session.file_id = file_record.id
+        return file_record, stored
+
+    @staticmethod
+    def _rewind(session, received_bytes):
+        """Move the resume offset back to the bytes actually staged"""
+        db.session.execute(
+            update(UploadSession).where(
+                UploadSession.id == session.id,
+                UploadSession.status == 'open'
+            ).values(received_bytes=received_bytes, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        db.session.refresh(session)
+        with UploadSessionService._lock:
+            UploadSessionService._hashers.pop(session.session_id, None)
+
+    @staticmethod
+    def abort(root, session):
+        """Discard a session and its staged bytes"""
+        session.status = 'aborted'
+        UploadSessionService._discard(root, session.session_id)
+        db.session.commit()
+
+    @staticmethod
+    def purge_expired(root):
+        """Abort open sessions past their expiry"""
+        expired = UploadSession.query.filter(
+            UploadSession.status == 'open',
+            UploadSession.expires_at < datetime.utcnow()
+        ).all()
+        for session in expired:
+            session.status = 'aborted'
+            UploadSessionService._discard(root, session.session_id)
+        if expired:
+            db.session.commit()
+        return len(expired)
+
+    # ==================== HELPERS ====================
+
+    @staticmethod
+    def part_path(root, session_id):
+        """Staging file of a session"""
+        return os.path.join(root, UploadSessionService.STAGING_DIR, f'{session_id}.part')
+
+    @staticmethod
+    def extension(filename):
+        """Lower-case extension without the dot ('' if none)"""
+        return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+    @staticmethod
+    def _discard(root, session_id):
+        """Remove staged bytes and the running hash"""
+        with UploadSessionService._lock:
+            UploadSessionService._hashers.pop(session_id, None)
+        try:
+            os.remove(UploadSessionService.part_path(root, session_id))
+        except OSError:
+            pass
@@ -0,0 +1,344 @@
+"""
+Validation Rules - Declarative field rules for the Data Processing Agent
+Each record type is a list of rules (plain data); compile_validator turns a
+list into one callable with its fields, messages and patterns bound up front.
+Every run writes to its own ValidationResult, so validators are reentrant.
+"""
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+
+class ValidationResult:
+    """Errors and warnings of one validation run"""
+
+    __slots__ = ('errors', 'warnings')
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_string(value: str) -> datetime:
+    # Imports repeat the same handful of dates; strptime only sees each once
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def parse_date(date_value: Any) -> datetime:
+    """datetime from a datetime or 'YYYY-MM-DD' string; ValueError otherwise"""
+    if isinstance(date_value, datetime):
+        return date_value
+    elif isinstance(date_value, str):
+        return _parse_date_string(date_value)
+    else:
+        raise ValueError("Invalid date format")
+
+
+# ============================================================================
+# RULES PER RECORD TYPE
+# ============================================================================
+#
+# 'field' is a field name or a tuple of alternatives (the first one set wins,
+# as in data.get('a') or data.get('b')). Checks run in order.
+
+VALIDATION_RULES = {
+    'lpo_release': [
+        {'check': 'required', 'fields': ['material_id', 'supplier_name', 'lpo_number', 'release_date', 'amount']},
+        {'check': 'pattern', 'field': 'lpo_number', 'pattern': r'^LPO-\d{4}-\d{3,}$', 'flags': re.IGNORECASE,
+         'warning': "⚠️ LPO number '{value}' doesn't follow standard format (LPO-YYYY-NNN)"},
+        {'check': 'date', 'field': 'release_date', 'label': 'Release Date'},
+        {'check': 'amount', 'field': 'amount', 'label': 'Amount'},
+        {'check': 'phone', 'field': 'contact_number'},
+        {'check': 'email', 'field': 'contact_email'},
+        {'check': 'date_order', 'start': 'release_date', 'end': 'expected_delivery_date',
+         'before_error': "❌ Expected delivery date cannot be before LPO release date",
+         'same_day_warning': "⚠️ Expected delivery is same day as LPO release"},
+        {'check': 'amount_anomaly', 'field': 'amount', 'table': 'lpo_releases'},
+    ],
+    'invoice': [
+        {'check': 'required', 'fields': ['payment_date', 'total_amount']},
+        {'check': 'min_length', 'field': 'invoice_number', 'length': 3,
+         'error': "❌ Invoice number '{value}' is too short"},
+        {'check': 'date', 'field': ('payment_date', 'invoice_date'), 'label': 'Payment Date'},
+        {'check': 'amount', 'field': ('total_amount', 'amount'), 'label': 'Amount'},
+        {'check': 'date', 'field': 'due_date', 'label': 'Due Date'},
+        {'check': 'date_order', 'start': 'invoice_date', 'end': 'due_date',
+         'before_error': "❌ Payment due date cannot be before invoice date",
+         'max_days': 90, 'max_days_warning': "⚠️ Payment terms are {days} days (longer than typical)"},
+        {'check': 'payment_against_po', 'po_field': 'po_id', 'field': 'total_amount'},
+        {'check': 'amount_anomaly', 'field': ('total_amount', 'amount'), 'table': 'invoices', 'po_field': 'po_id'},
+    ],
+    'submittal': [
+        {'check': 'required', 'fields': ['material_type', 'approval_status']},
+        {'check': 'one_of', 'field': 'approval_status',
+         'values': ['Pending', 'Under Review', 'Approved', 'Approved as Noted', 'Revise & Resubmit']},
+        {'check': 'date', 'field': 'approval_date', 'label': 'Approval Date'},
+        {'check': 'revision', 'field': 'revision_number', 'link_field': 'previous_submittal_id'},
+    ],
+    'delivery': [
+        {'check': 'required', 'fields': ['lpo_id', 'delivery_date', 'status']},
+        {'check': 'date', 'field': 'delivery_date', 'label': 'Delivery Date'},
+        {'check': 'one_of', 'field': 'status', 'values': ['Pending', 'Partial', 'Delivered', 'Rejected']},
+        {'check': 'partial_percentage', 'field': 'delivery_percentage', 'status_field': 'status'},
+    ],
+}
+
+
+# ============================================================================
+# CHECKS - each factory returns check(data, result, agent)
+# ============================================================================
+
+def _getter(field) -> Callable[[Dict[str, Any]], Any]:
+    """Value of a field, or of the first set field of a tuple of alternatives"""
+    if isinstance(field, str):
+        return lambda data: data.get(field)
+
+    first, *rest = field
+
+    def get(data):
+        value = data.get(first)
+        for name in rest:
+            value = value or data.get(name)
+        return value
+    return get
+
+
+def _required(fields: List[str]):
+    messages = [(field, f"❌ {field.replace('_', ' ').title()} is required") for field in fields]
+
+    def check(data, result, agent):
+        for field, message in messages:
+            if field not in data or data[field] is None or str(data[field]).strip() == '':
+                result.errors.append(message)
+    return check
+
+
+def _pattern(field: str, pattern: str, warning: str, flags: int = 0):
+    get, regex = _getter(field), re.compile(pattern, flags)
+
+    def check(data, result, agent):
+        value = get(data)
+        if value and not regex.match(value):
+            result.warnings.append(warning.format(value=value))
+    return check
+
+
+def _min_length(field: str, length: int, error: str):
+    get = _getter(field)
+
+    def check(data, result, agent):
+        value = get(data)
+        if value and len(value) < length:
+            result.errors.append(error.format(value=value))
+    return check
+
+
+def _date(field, label: str):
+    get = _getter(field)
+    invalid_type = f"❌ {label} has invalid format"
+    invalid_date = f"❌ {label} has invalid date format (use YYYY-MM-DD)"
+    too_old = f"⚠️ {label} is more than 5 years in the past"
+    too_far = f"⚠️ {label} is more than 2 years in the future"
+
+    def check(data, result, agent):
+        value = get(data)
+        if not value:
+            return
+        if not isinstance(value, (str, datetime)):
+            result.errors.append(invalid_type)
+            return
+        try:
+            date_obj = parse_date(value)
+            now = datetime.now()
+            if date_obj < now - timedelta(days=365 * 5):
+                result.warnings.append(too_old)
+            if date_obj > now + timedelta(days=365 * 2):
+                result.warnings.append(too_far)
+        except (ValueError, TypeError):
+            result.errors.append(invalid_date)
+    return check
+
+
+def _amount(field, label: str):
+    get = _getter(field)
+    not_positive = f"❌ {label} must be a positive number"
+    not_number = f"❌ {label} must be a valid number"
+
+    def check(data, result, agent):
+        value = get(data)
+        if value is None:
+            return
+        try:
+            amount = float(value)
+        except (ValueError, TypeError):
+            result.errors.append(not_number)
+            return
+        if amount <= 0:
+            result.errors.append(not_positive)
+        elif amount > 10000000:  # 10 million
+            result.warnings.append(f"⚠️ {label} is unusually high (AED {amount:,.2f})")
+    return check
+
+
+def _phone(field: str):
+    get, separators = _getter(field), re.compile(r'[\s\-\(\)]')
+
+    def check(data, result, agent):
+        phone = get(data)
+        if not phone:
+            return
+        cleaned = separators.sub('', phone)
+        if not cleaned.isdigit() or len(cleaned) < 7 or len(cleaned) > 15:
+            result.warnings.append(f"⚠️ Phone number '{phone}' may not be valid")
+    return check
+
+
+def _email(field: str):
+    get, regex = _getter(field), re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+    def check(data, result, agent):
+        email = get(data)
+        if email and not regex.match(email):
+            result.errors.append(f"❌ Email '{email}' is not valid")
+    return check
+
+
+def _one_of(field: str, values: List[str]):
+    get, allowed = _getter(field), tuple(values)
+    suffix = f". Must be one of: {', '.join(values)}"
+
+    def check(data, result, agent):
+        status = get(data)
+        if status and status not in allowed:
+            result.errors.append(f"❌ Status '{status}' is invalid{suffix}")
+    return check
+
+
+def _date_order(start: str, end: str, before_error: str, same_day_warning: Optional[str] = None,
+                max_days: Optional[int] = None, max_days_warning: Optional[str] = None):
+    """Cross-field check: end date not before start date (unparseable dates are left to the date checks)"""
+    get_start, get_end = _getter(start), _getter(end)
+
+    def check(data, result, agent):
+        start_value, end_value = get_start(data), get_end(data)
+        if not (start_value and end_value):
+            return
+        try:
+            start_date, end_date = parse_date(start_value), parse_date(end_value)
+
+            if end_date < start_date:
+                result.errors.append(before_error)
+            elif end_date == start_date and same_day_warning:
+                result.warnings.append(same_day_warning)
+
+            if max_days is not None and (end_date - start_date).days > max_days:
+                result.warnings.append(max_days_warning.format(days=(end_date - start_date).days))
+        except Exception:
+            pass
+    return check
+
+
+def _revision(field: str, link_field: str):
+    def check(data, result, agent):
+        if field in data:
+            try:
+                if int(data[field]) < 0:
+                    result.errors.append("❌ Revision number cannot be negative")
+            except (ValueError, TypeError):
+                result.errors.append("❌ Revision number must be a valid number")
+
+        try:
+            if int(data.get(field, 0)) > 0 and not data.get(link_field):
+                result.warnings.append("⚠️ Consider linking to previous submittal for revisions")
+        except (ValueError, TypeError):
+            pass  # Already reported above
+    return check
+
+
+def _partial_percentage(field: str, status_field: str):
+    def check(data, result, agent):
+        if data.get(status_field) != 'Partial':
+            return
+        percentage = data.get(field, 0)
+        if percentage <= 0 or percentage >= 100:
+            result.warnings.append(
+                f"⚠️ Partial delivery should have percentage between 1-99% (currently: {percentage}%)"
+            )
+    return check
+
+
+def _payment_against_po(po_field: str, field: str):
+    """Database check, run by the agent: payments so far plus this one must fit the PO"""
+    def check(data, result, agent):
+        po_id, amount = data.get(po_field), data.get(field)
+        if po_id and amount:
+            agent._validate_payment_against_po(po_id, amount, result)
+    return check
+
+
+def _amount_anomaly(field, table: str, po_field: Optional[str] = None):
+    """Amount against its supplier's and material's history (the PO's, when po_field is set)"""
+    get = _getter(field)
+
+    def check(data, result, agent):
+        supplier_name, material_id = data.get('supplier_name'), None
+        if po_field:
+            po = agent._get_po(data[po_field]) if data.get(po_field) else None
+            if po:
+                supplier_name, material_id = po.supplier_name, po.material_id
+        else:
+            material_id = data.get('material_id')
+        agent._detect_amount_anomaly(get(data), table, result,
+                                     supplier_name=supplier_name, material_id=material_id)
+    return check
+
+
+CHECKS = {
+    'required': _required,
+    'pattern': _pattern,
+    'min_length': _min_length,
+    'date': _date,
+    'amount': _amount,
+    'phone': _phone,
+    'email': _email,
+    'one_of': _one_of,
+    'date_order': _date_order,
+    'revision': _revision,
+    'partial_percentage': _partial_percentage,
+    'payment_against_po': _payment_against_po,
+    'amount_anomaly': _amount_anomaly,
+}
+
+
+# ============================================================================
+# COMPILATION
+# ============================================================================
+
+def compile_validator(rules: List[Dict[str, Any]]) -> Callable[[Dict[str, Any], Any], ValidationResult]:
+    """
+    Bind a record type's rules into one validator
+
+    Returns:
+        validate(data, agent) -> new ValidationResult
+    """
+    checks = tuple(
+        CHECKS[rule['check']](**{key: value for key, value in rule.items() if key != 'check'})
+        for rule in rules
+    )
+
+    def validate(data, agent):
+        result = ValidationResult()
+        for check in checks:
+            check(data, result, agent)
+        return result
+    return validate
+
+
+# Compiled once, when the agent module is imported
+VALIDATORS = {record_type: compile_validator(rules) for record_type, rules in VALIDATION_RULES.items()}
@@ -0,0 +1,124 @@
+"""
+Write Tracking - One set of session listeners for everything that reacts to writes
+Caches and materialized views subscribe with the models they depend on; a
+single after_flush, do_orm_execute, after_commit and after_rollback listener
+collects the writes of each transaction and hands every subscriber only the
+ones it asked for
+"""
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import event
+from models import db
+
+Subscription = namedtuple('Subscription', ['models', 'on_flush', 'on_bulk', 'on_commit', 'on_rollback'])
+
+
+class TrackedWrites:
+    """What one subscriber has seen written in the current transaction"""
+
+    def __init__(self):
+        self.changes = []  # Whatever the subscriber's on_flush returned
+        self.bulk = set()  # Models hit by ORM UPDATE/DELETE statements
+
+
+class WriteTracker:
+    """Shared session listeners dispatching writes to subscribers"""
+
+    _subscriptions = {}
+
+    @staticmethod
+    def subscribe(name, models, on_flush=None, on_bulk=None, on_commit=None, on_rollback=None):
+        """
+        Be told about writes to models
+
+        Args:
+            name: Subscriber name, subscribing again replaces the callbacks
+            models: Tuple of model classes the subscriber depends on
+            on_flush: f(session, objects, deleted) for the flushed objects of
+                those models; an iterable it returns is added to the
+                transaction's TrackedWrites.changes
+            on_bulk: f(session, model) for an ORM UPDATE/DELETE of a model
+            on_commit: f(session, writes) once a transaction with writes commits
+            on_rollback: f(session, writes) when it rolls back instead
+        """
+        WriteTracker._register()
+        WriteTracker._subscriptions[name] = Subscription(models, on_flush, on_bulk, on_commit, on_rollback)
+
+    @staticmethod
+    def writes(session, name):
+        """TrackedWrites of a subscriber in the session's transaction, marking it as written"""
+        return session.info.setdefault('tracked_writes', {}).setdefault(name, TrackedWrites())
+
+    @staticmethod
+    def store(name, factory):
+        """Process-local state a subscriber keeps for the current application"""
+        store = current_app.extensions.get(name)
+        if store is None:
+            store = current_app.extensions.setdefault(name, factory())
+        return store
+
+    @staticmethod
+    def _register():
+        if event.contains(db.session, 'after_flush', WriteTracker._after_flush):
+            return
+
+        event.listen(db.session, 'after_flush', WriteTracker._after_flush)
+        event.listen(db.session, 'do_orm_execute', WriteTracker._after_bulk_statement)
+        event.listen(db.session, 'after_commit', WriteTracker._after_commit)
+        event.listen(db.session, 'after_rollback', WriteTracker._after_rollback)
+
+    # ==================== SESSION EVENTS ====================
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        """after_flush hook: hand each subscriber the flushed objects of its models"""
+        deleted = set(session.deleted)
+        dirty = [obj for obj in session.dirty if session.is_modified(obj)]
+        written = list(session.new) + dirty + list(deleted)
+        if not written:
+            return
+
+        for name, subscription in list(WriteTracker._subscriptions.items()):
+            objects = [obj for obj in written if isinstance(obj, subscription.models)]
+            if not objects:
+                continue
+            writes = WriteTracker.writes(session, name)
+            if subscription.on_flush:
+                writes.changes.extend(subscription.on_flush(session, objects, deleted) or ())
+
+    @staticmethod
+    def _after_bulk_statement(orm_execute_state):
+        """do_orm_execute hook: ORM UPDATE/DELETE statements bypass the flush"""
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is None:
+            return
+
+        session = orm_execute_state.session
+        for name, subscription in list(WriteTracker._subscriptions.items()):
+            if issubclass(mapper.class_, subscription.models):
+                WriteTracker.writes(session, name).bulk.add(mapper.class_)
+                if subscription.on_bulk:
+                    subscription.on_bulk(session, mapper.class_)
+
+    @staticmethod
+    def _after_commit(session):
+        """after_commit hook: the transaction's writes are visible"""
+        WriteTracker._dispatch(session, 'on_commit')
+
+    @staticmethod
+    def _after_rollback(session):
+        """after_rollback hook: the transaction's writes were discarded"""
+        WriteTracker._dispatch(session, 'on_rollback')
+
+    @staticmethod
+    def _dispatch(session, callback):
+        tracked = session.info.pop('tracked_writes', None)
+        if not tracked:
+            return
+        for name, writes in tracked.items():
+            subscription = WriteTracker._subscriptions.get(name)
+            handler = subscription and getattr(subscription, callback)
+            if handler:
+                handler(session, writes)
@@ -540,14 +540,14 @@ async function uploadFiles() {
     let uploaded = 0;
     
     for (const file of selectedFiles) {
-        const formData = new FormData();
-        formData.append('file', file);
-        formData.append('path', currentPath);
+        // Raw body rather than multipart so the server can pipe it straight to the share
+        const url = `/api/smb/upload?path=${encodeURIComponent(currentPath)}&filename=${encodeURIComponent(file.name)}`;
         
         try {
-            const response = await fetch('/api/smb/upload', {
+            const response = await fetch(url, {
                 method: 'POST',
-                body: formData
+                headers: {'Content-Type': 'application/octet-stream'},
+                body: file
             });
             
             const data = await response.json();
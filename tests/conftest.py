@@ -0,0 +1,18 @@
+"""
+Shared pytest fixtures
+"""
+import pytest
+from app import create_app
+from models import db
+
+
+@pytest.fixture
+def app():
+    """Create application for testing, on an in-memory database"""
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
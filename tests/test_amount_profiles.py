@@ -0,0 +1,227 @@
+"""
+Tests for AmountProfiles - per-supplier and per-material amount distributions
+Committed PO and payment writes update the in-memory groups without a reload,
+and the Data Processing Agent warns with robust z-scores from them
+"""
+import math
+import random
+import statistics
+import pytest
+from datetime import datetime
+from sqlalchemy import event
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from services.amount_profiles import AmountProfiles, AmountDistribution
+from services.data_processing_agent import DataProcessingAgent
+from services.validation_rules import ValidationResult
+
+
+@pytest.fixture
+def materials(app):
+    materials = [Material(material_type='Cables'), Material(material_type='Conduits')]
+    db.session.add_all(materials)
+    db.session.commit()
+    return [m.id for m in materials]
+
+
+def add_po(material_id, supplier_name, amount, ref):
+    po = PurchaseOrder(material_id=material_id, supplier_name=supplier_name, total_amount=amount,
+                       po_ref=ref, po_date=datetime(2025, 3, 1))
+    db.session.add(po)
+    return po
+
+
+def snapshot():
+    """Group contents of the current store"""
+    return {key: list(group.values) for key, group in AmountProfiles._store()['groups'].items()}
+
+
+def count_selects(function):
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    try:
+        result = function()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_execute)
+    return result, len(statements)
+
+
+class TestDistribution:
+    """Median and MAD of log amounts"""
+
+    def test_matches_statistics_module(self):
+        rng = random.Random(2)
+        amounts = [rng.lognormvariate(10, 0.5) for _ in range(101)]
+        distribution = AmountDistribution()
+        for amount in amounts:
+            distribution.add(math.log(amount))
+        distribution.remove(math.log(amounts[0]))
+
+        logs = [math.log(a) for a in amounts[1:]]
+        median = statistics.median(logs)
+        mad = statistics.median(abs(v - median) for v in logs)
+
+        assert distribution.stats() == pytest.approx((median, mad * 1.4826))
+
+    def test_mad_after_each_change(self):
+        """The selected MAD matches sorting every deviation, for odd, even and tied groups"""
+        rng = random.Random(7)
+        distribution = AmountDistribution()
+        logs = []
+        for _ in range(300):
+            if logs and rng.random() < 0.3:
+                value = logs.pop(rng.randrange(len(logs)))
+                distribution.remove(value)
+            else:
+                value = float(rng.randint(0, 6)) if rng.random() < 0.4 else rng.uniform(0, 6)
+                logs.append(value)
+                distribution.add(value)
+            if not logs:
+                continue
+
+            median = statistics.median(logs)
+            mad = statistics.median(abs(v - median) for v in logs)
+            if mad:
+                assert distribution.stats() == pytest.approx((median, mad * 1.4826))
+
+    def test_tied_values_fall_back_to_mean_deviation(self):
+        distribution = AmountDistribution()
+        for amount in [1000] * 6 + [1100, 1200]:
+            distribution.add(math.log(amount))
+
+        assert distribution.stats()[1] > 0
+        assert distribution.z_score(math.log(1000)) == 0
+
+
+class TestAnomalyWarnings:
+    """_detect_amount_anomaly against supplier and material history"""
+
+    def test_supplier_outlier_carries_z_score(self, materials):
+        for i, amount in enumerate([9000, 10000, 10500, 11000, 9500, 10200]):
+            add_po(materials[0], 'Gulf Cables LLC', amount, f'LPO-{i}')
+        db.session.commit()
+
+        agent = DataProcessingAgent(db.session)
+        _, _, warnings = agent._validate('lpo_release', {
+            'material_id': materials[1], 'supplier_name': 'gulf  cables llc', 'lpo_number': 'LPO-2025-001',
+            'release_date': '2025-03-05', 'amount': 60000
+        })
+
+        assert len(warnings) == 1
+        assert 'higher than the median for this supplier' in warnings[0]
+        assert 'AED 10,099.50' in warnings[0] and 'over 6 records' in warnings[0]
+        assert 'z-score +' in warnings[0]
+
+    def test_typical_amount_does_not_warn(self, materials):
+        for i, amount in enumerate([9000, 10000, 10500, 11000, 9500]):
+            add_po(materials[0], 'Gulf Cables LLC', amount, f'LPO-{i}')
+        db.session.commit()
+
+        result = ValidationResult()
+        DataProcessingAgent(db.session)._detect_amount_anomaly(12000, 'lpo_releases', result,
+                                                               supplier_name='Gulf Cables LLC', material_id=materials[0])
+
+        assert result.warnings == []
+
+    def test_thin_history_falls_back_to_all_records(self, materials):
+        for i, amount in enumerate([9000, 10000, 10500, 11000, 9500]):
+            add_po(materials[0], f'Supplier {i}', amount, f'LPO-{i}')
+        db.session.commit()
+
+        result = ValidationResult()
+        DataProcessingAgent(db.session)._detect_amount_anomaly(600, 'lpo_releases', result,
+                                                               supplier_name='Supplier 0', material_id=materials[1])
+
+        assert len(result.warnings) == 1
+        assert 'lower than the median for all records' in result.warnings[0]
+
+    def test_no_history_does_not_warn(self, materials):
+        """No fixed range: a small first order is not an anomaly"""
+        result = ValidationResult()
+        DataProcessingAgent(db.session)._detect_amount_anomaly(600, 'lpo_releases', result,
+                                                               supplier_name='Gulf Cables LLC', material_id=materials[0])
+
+        assert result.warnings == []
+
+    def test_invoice_scored_against_po_supplier(self, materials):
+        po = add_po(materials[0], 'Gulf Cables LLC', 100000, 'LPO-1')
+        db.session.flush()
+        db.session.add_all(Payment(po_id=po.id, total_amount=amount) for amount in [5000, 5200, 4800, 5100, 4900])
+        db.session.commit()
+
+        agent = DataProcessingAgent(db.session)
+        _, _, warnings = agent._validate('invoice', {'po_id': po.id, 'payment_date': '2025-03-05', 'total_amount': 400})
+
+        anomalies = [w for w in warnings if 'than the median' in w]
+        assert len(anomalies) == 2
+        assert 'lower than the median for this supplier' in anomalies[0]
+        assert 'lower than the median for this material' in anomalies[1]
+
+
+class TestIncrementalUpdates:
+    """Committed writes reach the loaded profiles without a reload"""
+
+    def test_commit_updates_without_queries(self, materials):
+        AmountProfiles.load()
+        add_po(materials[0], 'Gulf Cables LLC', 10000, 'LPO-1')
+        db.session.commit()
+
+        _, queries = count_selects(lambda: AmountProfiles.anomalies('lpo_releases', 10000, 'Gulf Cables LLC'))
+
+        assert queries == 0
+        assert snapshot()[('lpo_releases', 'supplier', 'gulf cables llc')] == [math.log(10000)]
+
+    def test_random_writes_match_a_fresh_load(self, materials):
+        rng = random.Random(8)
+        suppliers = ['Gulf Cables LLC', 'Emirates Conduits', 'ABC Trading']
+        AmountProfiles.load()
+
+        for step in range(40):
+            pos = PurchaseOrder.query.all()
+            action = rng.random()
+            if action < 0.4 or not pos:
+                add_po(rng.choice(materials), rng.choice(suppliers), rng.uniform(1000, 50000), f'LPO-{step}')
+            elif action < 0.6:
+                po = rng.choice(pos)
+                po.supplier_name = rng.choice(suppliers)
+                po.total_amount = rng.uniform(1000, 50000)
+            elif action < 0.85:
+                db.session.add(Payment(po_id=rng.choice(pos).id, total_amount=rng.uniform(100, 5000)))
+            else:
+                db.session.delete(rng.choice(pos))
+            db.session.commit()
+
+        incremental = snapshot()
+        AmountProfiles.load()
+
+        assert incremental.keys() == snapshot().keys()
+        for key, values in snapshot().items():
+            assert incremental[key] == pytest.approx(values)
+
+    def test_rollback_is_ignored(self, materials):
+        AmountProfiles.load()
+        add_po(materials[0], 'Gulf Cables LLC', 10000, 'LPO-1')
+        db.session.flush()
+        db.session.rollback()
+
+        assert snapshot() == {}
+
+    def test_bulk_update_forces_reload(self, materials):
+        add_po(materials[0], 'Gulf Cables LLC', 10000, 'LPO-1')
+        db.session.commit()
+        AmountProfiles.load()
+
+        PurchaseOrder.query.update({'total_amount': 20000})
+        db.session.commit()
+
+        _, queries = count_selects(lambda: AmountProfiles.anomalies('lpo_releases', 10000, 'Gulf Cables LLC'))
+
+        assert queries == 2
+        assert snapshot()[('lpo_releases', 'all', None)] == [math.log(20000)]
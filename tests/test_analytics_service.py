@@ -0,0 +1,208 @@
+"""
+Tests for AnalyticsService
+Verifies the aggregated supplier scorecards match the per-row calculation
+"""
+import random
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.delivery import Delivery
+from services.analytics_service import AnalyticsService
+
+
+def seed_deliveries(supplier_count=6, pos_per_supplier=4, seed=7, ref_prefix='PO'):
+    """Create POs and deliveries with a mix of statuses and delays"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    material = Material(material_type='Cables & Wires', description='Test cables')
+    db.session.add(material)
+    db.session.flush()
+
+    for s in range(supplier_count):
+        for p in range(pos_per_supplier):
+            po = PurchaseOrder(
+                material_id=material.id,
+                po_ref=f'{ref_prefix}-{s}-{p}',
+                po_date=now - timedelta(days=rng.randint(0, 300)),
+                supplier_name=f'Supplier {s}',
+                total_amount=rng.uniform(1000, 200000),
+                po_status=rng.choice(['Released', 'Not Released'])
+            )
+            db.session.add(po)
+            db.session.flush()
+
+            for _ in range(rng.randint(0, 4)):
+                delayed = rng.random() < 0.4
+                db.session.add(Delivery(
+                    po_id=po.id,
+                    delivery_status=rng.choice(['Pending', 'Partial', 'Delivered']),
+                    is_delayed=delayed,
+                    delay_days=rng.randint(0, 12) if delayed else 0
+                ))
+
+    db.session.commit()
+
+
+def count_queries(func, *args, **kwargs):
+    """Run func and return (result, number of SQL statements executed)"""
+    statements = []
+
+    def before_execute(*_):
+        statements.append(1)
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_execute)
+    return result, len(statements)
+
+
+def reference_delivery_metrics(supplier_name, cutoff_date):
+    """Original per-supplier calculation, kept here as the oracle"""
+    deliveries = db.session.query(Delivery).join(
+        PurchaseOrder, Delivery.po_id == PurchaseOrder.id
+    ).filter(
+        PurchaseOrder.supplier_name == supplier_name,
+        PurchaseOrder.po_date >= cutoff_date
+    ).order_by(Delivery.id).all()
+
+    if not deliveries:
+        return AnalyticsService._empty_delivery_metrics()
+
+    total = len(deliveries)
+    completed = sum(1 for d in deliveries if d.delivery_status in ['Delivered', 'Partial'])
+    pending = sum(1 for d in deliveries if d.delivery_status == 'Pending')
+    delayed = sum(1 for d in deliveries if d.is_delayed)
+    on_time = completed - sum(1 for d in deliveries if d.is_delayed and d.delivery_status in ['Delivered', 'Partial'])
+    on_time_rate = round((on_time / completed * 100) if completed > 0 else 0, 1)
+
+    delay_days = [d.delay_days for d in deliveries if d.is_delayed and d.delay_days]
+    avg_delay = round(sum(delay_days) / len(delay_days), 1) if delay_days else 0
+    quality_score = round((on_time_rate * 0.7) + ((completed / total * 100) * 0.3), 1)
+
+    mid_point = len(deliveries) // 2
+    if mid_point > 0:
+        recent = deliveries[:mid_point]
+        older = deliveries[mid_point:]
+        recent_rate = sum(1 for d in recent if d.is_delayed) / len(recent)
+        older_rate = sum(1 for d in older if d.is_delayed) / len(older)
+        if recent_rate < older_rate - 0.1:
+            trend = 'improving'
+        elif recent_rate > older_rate + 0.1:
+            trend = 'declining'
+        else:
+            trend = 'stable'
+    else:
+        trend = 'neutral'
+
+    return {
+        'on_time_rate': on_time_rate,
+        'avg_delay': avg_delay,
+        'completed': completed,
+        'pending': pending,
+        'delayed': delayed,
+        'quality_score': quality_score,
+        'trend': trend
+    }
+
+
+class TestSupplierScorecards:
+    """Aggregated supplier scorecards"""
+
+    def test_scorecards_match_per_row_calculation(self, app):
+        """Every supplier's metrics match the original Python computation"""
+        with app.app_context():
+            seed_deliveries()
+            cutoff = datetime.utcnow() - timedelta(days=180)
+
+            scorecards = AnalyticsService._calculate_delivery_metrics_by_supplier(cutoff)
+
+            suppliers = [row[0] for row in db.session.query(PurchaseOrder.supplier_name).distinct()]
+            for supplier in suppliers:
+                expected = reference_delivery_metrics(supplier, cutoff)
+                actual = scorecards.get(supplier, AnalyticsService._empty_delivery_metrics())
+                assert actual == expected, supplier
+
+    def test_supplier_performance_shape(self, app):
+        """Route payload keeps the same keys"""
+        with app.app_context():
+            seed_deliveries(supplier_count=3)
+
+            results = AnalyticsService.get_supplier_performance()
+
+            assert results
+            assert set(results[0].keys()) == {
+                'supplier_name', 'total_orders', 'released_orders', 'total_value',
+                'on_time_delivery_rate', 'average_delay_days', 'completed_deliveries',
+                'pending_deliveries', 'delayed_deliveries', 'quality_score',
+                'risk_score', 'risk_level', 'risk_color', 'performance_trend'
+            }
+
+    def test_single_supplier_filter(self, app):
+        """Filtering by supplier returns only that supplier's metrics"""
+        with app.app_context():
+            seed_deliveries(supplier_count=3)
+            cutoff = datetime.utcnow() - timedelta(days=365)
+
+            metrics = AnalyticsService._calculate_delivery_metrics('Supplier 1', cutoff)
+
+            assert metrics == reference_delivery_metrics('Supplier 1', cutoff)
+
+
+class TestDelayPredictions:
+    """Delay predictions reuse one supplier history table"""
+
+    def test_query_count_independent_of_pending_deliveries(self, app):
+        """Doubling the pending deliveries does not add queries"""
+        with app.app_context():
+            seed_deliveries(supplier_count=3, pos_per_supplier=2)
+            _, small_count = count_queries(AnalyticsService.predict_delivery_delays)
+
+            seed_deliveries(supplier_count=6, pos_per_supplier=6, seed=11, ref_prefix='PO-B')
+            predictions, large_count = count_queries(AnalyticsService.predict_delivery_delays)
+
+            assert predictions
+            assert large_count == small_count
+
+    def test_predictions_use_supplier_history(self, app):
+        """Each prediction is computed from its supplier's 365-day metrics"""
+        with app.app_context():
+            seed_deliveries(supplier_count=4)
+            cutoff = datetime.utcnow() - timedelta(days=365)
+
+            predictions = AnalyticsService.predict_delivery_delays()
+
+            for prediction in predictions:
+                po = PurchaseOrder.query.get(prediction['po_id'])
+                delivery = Delivery.query.filter_by(po_id=po.id).first()
+                history = reference_delivery_metrics(po.supplier_name, cutoff)
+                expected = AnalyticsService._predict_delay(delivery, po, history)
+                assert prediction['risk_score'] == expected['risk_score']
+                assert prediction['risk_factors'] == expected['risk_factors']
+
+    def test_history_limited_to_pending_suppliers(self, app, monkeypatch):
+        """Suppliers without pending deliveries are not aggregated"""
+        with app.app_context():
+            seed_deliveries(supplier_count=4)
+            Delivery.query.filter(
+                Delivery.po_id.in_(db.session.query(PurchaseOrder.id).filter(PurchaseOrder.supplier_name != 'Supplier 2'))
+            ).update({'delivery_status': 'Delivered'}, synchronize_session=False)
+            db.session.commit()
+
+            calculate = AnalyticsService._calculate_delivery_metrics_by_supplier
+            histories = []
+
+            def recording(*args, **kwargs):
+                histories.append(calculate(*args, **kwargs))
+                return histories[-1]
+            monkeypatch.setattr(AnalyticsService, '_calculate_delivery_metrics_by_supplier', recording)
+
+            predictions = AnalyticsService.predict_delivery_delays()
+
+            assert predictions
+            assert [set(history) for history in histories] == [{'Supplier 2'}]
@@ -0,0 +1,227 @@
+"""
+Tests for the materialized analytics snapshot
+Verifies change tracking and that incremental refreshes match a full recompute
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from models.delivery import Delivery
+from models.analytics_snapshot import AnalyticsSnapshot, AnalyticsChange
+from services.analytics_service import AnalyticsService
+from services.analytics_snapshot_service import AnalyticsSnapshotService
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+def create_po(po_ref, supplier_name, material_type='Cables & Wires', days_ago=10, amount=50000):
+    """Create a material and a released PO"""
+    material = Material(material_type=material_type)
+    db.session.add(material)
+    db.session.flush()
+
+    po = PurchaseOrder(
+        material_id=material.id,
+        po_ref=po_ref,
+        po_date=datetime.utcnow() - timedelta(days=days_ago),
+        expected_delivery_date=datetime.utcnow() + timedelta(days=20),
+        supplier_name=supplier_name,
+        total_amount=amount,
+        po_status='Released'
+    )
+    db.session.add(po)
+    db.session.commit()
+    return po
+
+
+def seed():
+    """Two suppliers with deliveries and payments"""
+    for i, supplier in enumerate(['Alpha Trading', 'Beta Supplies']):
+        po = create_po(f'PO-{i}', supplier, material_type=f'Material {i}')
+        db.session.add(Delivery(po_id=po.id, delivery_status='Pending'))
+        db.session.add(Delivery(
+            po_id=po.id,
+            delivery_status='Delivered',
+            actual_delivery_date=datetime.utcnow() - timedelta(days=1),
+            is_delayed=i == 1,
+            delay_days=3 if i == 1 else 0
+        ))
+        db.session.add(Payment(
+            po_id=po.id,
+            total_amount=po.total_amount,
+            paid_amount=po.total_amount / 2,
+            payment_date=datetime.utcnow() - timedelta(days=5),
+            payment_status='Partial'
+        ))
+    db.session.commit()
+
+
+def full_recompute(date_range_days=180):
+    """Dashboard sections computed directly from the service"""
+    return {
+        'executive_summary': AnalyticsService.get_executive_summary(),
+        'supplier_performance': AnalyticsService.get_supplier_performance(date_range_days=date_range_days),
+        'delay_predictions': AnalyticsService.predict_delivery_delays(),
+        'financial_analytics': AnalyticsService.get_financial_analytics(date_range_days=date_range_days),
+        'delivery_intelligence': AnalyticsService.get_delivery_intelligence(date_range_days=date_range_days)
+    }
+
+
+class TestChangeTracking:
+    """Session events log the scopes touched by writes"""
+
+    def test_writes_record_scopes(self, app):
+        """Creating a PO, delivery and payment logs supplier, po and month scopes"""
+        with app.app_context():
+            po = create_po('PO-T1', 'Gamma LLC')
+            db.session.add(Delivery(po_id=po.id))
+            db.session.add(Payment(po_id=po.id, total_amount=10, payment_date=datetime(2025, 3, 4)))
+            db.session.commit()
+
+            scopes = {(c.scope_type, c.scope_key) for c in AnalyticsChange.query.all()}
+
+            assert ('supplier', 'Gamma LLC') in scopes
+            assert ('po', str(po.id)) in scopes
+            assert ('month', '2025-03') in scopes
+
+    def test_supplier_rename_records_old_and_new(self, app):
+        """Both the old and new supplier are marked as changed"""
+        with app.app_context():
+            po = create_po('PO-T2', 'Old Name')
+            AnalyticsChange.query.delete()
+            db.session.commit()
+
+            po.supplier_name = 'New Name'
+            db.session.commit()
+
+            suppliers = {c.scope_key for c in AnalyticsChange.query.filter_by(scope_type='supplier')}
+            assert suppliers == {'Old Name', 'New Name'}
+
+
+class TestDashboardSnapshot:
+    """Dashboard reads come from the snapshot"""
+
+    def test_snapshot_reused_between_reads(self, client, app):
+        """A second read without writes does not rebuild"""
+        with app.app_context():
+            seed()
+
+        first = client.get('/analytics/api/dashboard-data').get_json()
+        second = client.get('/analytics/api/dashboard-data').get_json()
+
+        assert first['success'] and second['success']
+        assert first['snapshot']['generated_at'] == second['snapshot']['generated_at']
+        assert first['data'] == second['data']
+
+    def test_incremental_refresh_matches_full_recompute(self, app):
+        """Folding in changes gives the same sections as recomputing everything"""
+        with app.app_context():
+            seed()
+            snapshot = AnalyticsSnapshotService.get_dashboard_data()
+            generated_at = snapshot.generated_at
+
+            # New supplier, extra delivery and payment for an existing one
+            po = create_po('PO-NEW', 'Delta Contracting', material_type='Material 9')
+            db.session.add(Delivery(po_id=po.id, delivery_status='Pending'))
+            beta = PurchaseOrder.query.filter_by(supplier_name='Beta Supplies').first()
+            db.session.add(Delivery(po_id=beta.id, delivery_status='Delivered', is_delayed=True, delay_days=8))
+            db.session.add(Payment(po_id=beta.id, total_amount=100, paid_amount=100,
+                                   payment_date=datetime.utcnow(), payment_status='Completed'))
+            db.session.commit()
+
+            assert AnalyticsSnapshotService.refresh() == 1
+            snapshot = AnalyticsSnapshotService.get_dashboard_data()
+
+            assert snapshot.generated_at == generated_at
+            assert snapshot.refreshed_at > generated_at
+            assert snapshot.data == full_recompute()
+
+    def test_read_after_write_does_not_recompute(self, app):
+        """Reads return the stored snapshot; refreshing is left to the worker"""
+        with app.app_context():
+            seed()
+            AnalyticsSnapshotService.get_dashboard_data()
+            create_po('PO-READ', 'Zeta Trading')
+            db.session.expire_all()
+
+            statements = []
+
+            def count(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                snapshot = AnalyticsSnapshotService.get_dashboard_data()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+            assert len(statements) == 1
+            assert 'Zeta Trading' not in {s['supplier_name'] for s in snapshot.data['supplier_performance']}
+
+    def test_late_commit_is_not_skipped(self, app):
+        """A change committed after a higher id was applied is still folded in"""
+        with app.app_context():
+            seed()
+            AnalyticsSnapshotService.get_dashboard_data()
+            alpha = PurchaseOrder.query.filter_by(supplier_name='Alpha Trading').first()
+
+            # Transaction A logs its change first but has not committed yet
+            started = datetime.utcnow()
+            late = AnalyticsChange(scope_type='po', scope_key=str(alpha.id), created_at=started)
+            db.session.add(late)
+            db.session.flush()
+            late_id = late.id
+            db.session.delete(late)
+            db.session.commit()
+
+            # Transaction B logs a higher id, commits and is refreshed
+            create_po('PO-B', 'Delta Contracting', material_type='Material 9')
+            AnalyticsSnapshotService.refresh()
+
+            # Transaction A commits
+            db.session.execute(Delivery.__table__.insert().values(
+                po_id=alpha.id,
+                delivery_status='Delivered',
+                actual_delivery_date=datetime.utcnow(),
+                is_delayed=True,
+                delay_days=12
+            ))
+            db.session.execute(AnalyticsChange.__table__.insert().values(
+                id=late_id, scope_type='po', scope_key=str(alpha.id), created_at=started
+            ))
+            db.session.commit()
+
+            assert AnalyticsSnapshotService.refresh() == 1
+            assert AnalyticsSnapshotService.get_dashboard_data().data == full_recompute()
+            assert AnalyticsSnapshotService.refresh() == 0
+
+    def test_force_refresh_rebuilds(self, client, app):
+        """refresh=true rebuilds the snapshot"""
+        with app.app_context():
+            seed()
+
+        first = client.get('/analytics/api/dashboard-data').get_json()
+        forced = client.get('/analytics/api/dashboard-data?refresh=true').get_json()
+
+        assert forced['snapshot']['generated_at'] > first['snapshot']['generated_at']
+
+    def test_change_log_pruned(self, app):
+        """Changes older than every snapshot's horizon are deleted"""
+        app.config['ANALYTICS_CHANGE_OVERLAP'] = 0
+        with app.app_context():
+            seed()
+            AnalyticsSnapshotService.get_dashboard_data()
+            create_po('PO-PRUNE', 'Epsilon FZE')
+
+            AnalyticsSnapshotService.refresh()
+            AnalyticsSnapshotService.refresh()
+
+            assert AnalyticsChange.query.count() == 0
+            assert AnalyticsSnapshot.query.count() == 1
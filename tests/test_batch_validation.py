@@ -0,0 +1,357 @@
+"""
+Tests for batch validation (DataProcessingAgent.process_batch and process_stream)
+A batch prefetches its lookups in a few queries, gives every record the same
+result process_data would, and flags duplicates between its own records
+"""
+import json
+import random
+import time
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from models.delivery import Delivery
+from services.amount_profiles import AmountProfiles
+from services.data_processing_agent import DataProcessingAgent
+import routes.agents
+
+API_KEY = 'batch-test-key'
+
+SUPPLIERS = ['Al Futtaim Steel LLC', 'Al Futaim Steel L.L.C', 'Gulf Cement Co', 'Gulf Cement Company', 'ABC Trading']
+
+TODAY = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def app(app, monkeypatch):
+    """Test application with this module's settings"""
+    monkeypatch.setenv('N8N_TO_FLASK_API_KEY', API_KEY)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+@pytest.fixture
+def agent(app):
+    return DataProcessingAgent(db.session)
+
+
+def seed(rng, po_count=120):
+    """Two materials, POs around today, a few payments and up to one delivery per PO"""
+    materials = [Material(material_type='Steel'), Material(material_type='Cement')]
+    db.session.add_all(materials)
+    db.session.flush()
+
+    pos = [
+        PurchaseOrder(material_id=rng.choice(materials).id, po_ref=f'LPO-2025-{i:03d}',
+                      supplier_name=rng.choice(SUPPLIERS), total_amount=rng.choice([10000, 20000, 50000]),
+                      po_date=TODAY - timedelta(days=rng.randint(0, 30)))
+        for i in range(po_count)
+    ]
+    db.session.add_all(pos)
+    db.session.flush()
+
+    for po in pos:
+        for p in range(rng.randint(0, 2)):
+            db.session.add(Payment(po_id=po.id, total_amount=po.total_amount / 2,
+                                   paid_amount=rng.choice([0, po.total_amount / 4]),
+                                   invoice_ref=f'INV-{po.id}-{p}', payment_ref=f'PAY-{po.id}-{p}'))
+        if rng.random() < 0.5:
+            expected = TODAY + timedelta(days=rng.randint(-20, 20))
+            db.session.add(Delivery(po_id=po.id, expected_delivery_date=expected,
+                                    actual_delivery_date=rng.choice([None, expected + timedelta(days=3)])))
+    db.session.commit()
+    return [m.id for m in materials], [po.id for po in pos]
+
+
+def random_records(rng, material_ids, po_ids, count):
+    records = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            records.append({'record_type': 'lpo_release', 'data': {
+                'material_id': rng.choice(material_ids),
+                'supplier_name': rng.choice(SUPPLIERS),
+                'lpo_number': f'LPO-2025-{rng.randint(0, 200):03d}',
+                'release_date': (TODAY - timedelta(days=rng.randint(0, 30))).strftime('%Y-%m-%d'),
+                'amount': rng.choice([9500, 10000, 20500, 51000])
+            }})
+        elif kind < 0.8:
+            po_id = rng.choice(po_ids)
+            records.append({'record_type': 'invoice', 'match_invoice_to_lpo': True, 'data': {
+                'po_id': rng.choice([po_id, str(po_id), 99999]),
+                'payment_date': TODAY.strftime('%Y-%m-%d'),
+                'total_amount': rng.choice([1000, 8000, 30000]),
+                'invoice_number': f'INV-{po_id}-{rng.randint(0, 3)}',
+                'payment_ref': f'PAY-{rng.choice(po_ids)}-0'
+            }})
+        else:
+            po_id = rng.choice(po_ids)
+            records.append({'record_type': 'delivery', 'data': {
+                rng.choice(['po_id', 'lpo_id']): rng.choice([po_id, str(po_id), 99999]),
+                'delivery_date': (TODAY + timedelta(days=rng.randint(-30, 30))).strftime('%Y-%m-%d'),
+                'status': 'Delivered'
+            }})
+    return records
+
+
+def count_selects(function):
+    """Result of function() and the number of SELECTs it issued"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    try:
+        result = function()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_execute)
+    return result, len(statements)
+
+
+def without_batch_duplicates(result):
+    duplicates = [d for d in result['duplicates'] if not d['match_type'].endswith('In Batch')]
+    return {**result, 'duplicates': duplicates, 'ready_to_save': result['is_valid'] and not duplicates}
+
+
+class TestSharedLookups:
+    """Same answers as one process_data call per record, from a few queries"""
+
+    def test_matches_per_record_processing(self, agent):
+        rng = random.Random(3)
+        material_ids, po_ids = seed(rng)
+        records = random_records(rng, material_ids, po_ids, 300)
+
+        expected = []
+        for record in records:
+            result = agent.process_data(record['record_type'], record['data'], check_duplicates=True,
+                                        match_invoice_to_lpo=record.get('match_invoice_to_lpo', False))
+            expected.append({'index': len(expected), 'success': True, **result})
+
+        results, summary = agent.process_batch(records)
+
+        assert [without_batch_duplicates(r) for r in results] == expected
+        assert summary['total'] == 300
+        assert summary['valid'] + summary['invalid'] == 300
+
+    def test_query_count_does_not_grow_with_batch(self, agent):
+        rng = random.Random(5)
+        material_ids, po_ids = seed(rng)
+        AmountProfiles.load()  # Loaded once per process, not per batch
+
+        (small, _), small_queries = count_selects(
+            lambda: agent.process_batch(random_records(rng, material_ids, po_ids, 20)))
+        (large, _), large_queries = count_selects(
+            lambda: agent.process_batch(random_records(rng, material_ids, po_ids, 400)))
+
+        assert len(large) == 400
+        assert large_queries == small_queries
+        assert large_queries <= 7
+
+    def test_malformed_record_and_stop_on_error(self, agent):
+        records = [{'record_type': 'invoice'}, {'record_type': 'submittal', 'data': {}}]
+
+        results, summary = agent.process_batch(records)
+        assert [r['success'] for r in results] == [False, True]
+        assert summary['invalid'] == 2
+
+        results, _ = agent.process_batch(records, stop_on_error=True)
+        assert len(results) == 1
+
+    def test_malformed_field_values(self, agent):
+        """Lists and dicts in key fields fail their own record, not the batch"""
+        material_ids, po_ids = seed(random.Random(5), po_count=5)
+        release = {'material_id': material_ids[0], 'supplier_name': 'ABC Trading', 'lpo_number': 'LPO-2030-001',
+                   'release_date': TODAY.strftime('%Y-%m-%d'), 'amount': 10000}
+        invoice = {'po_id': po_ids[0], 'invoice_number': 'INV-2030-1', 'payment_date': TODAY.strftime('%Y-%m-%d'),
+                   'total_amount': 100}
+        records = [
+            {'record_type': 'invoice', 'data': {**invoice, 'po_id': [po_ids[0]]}},
+            {'record_type': 'invoice', 'data': {**invoice, 'invoice_number': ['INV-1'], 'payment_ref': {'ref': 1}}},
+            {'record_type': 'lpo_release', 'data': {**release, 'material_id': [1], 'lpo_number': {'n': 1}}},
+            {'record_type': 'invoice', 'data': invoice},
+            {'record_type': 'lpo_release', 'data': release},
+        ]
+
+        results, summary = agent.process_batch(records)
+        streamed = list(agent.process_stream(records, chunk_size=2))
+
+        assert [r['success'] for r in results] == [False, False, False, True, True]
+        assert summary['valid'] == 2
+        assert [r['success'] for r in streamed] == [False, False, False, True, True]
+        assert results[3]['duplicates'] == agent.process_data('invoice', invoice)['duplicates']
+
+
+class TestInBatchDuplicates:
+    """Records repeated inside one import"""
+
+    def test_repeated_po_number(self, agent):
+        material_ids, _ = seed(random.Random(1), po_count=0)
+        release = {'material_id': material_ids[0], 'supplier_name': 'ABC Trading', 'lpo_number': 'LPO-2030-001',
+                   'release_date': TODAY.strftime('%Y-%m-%d'), 'amount': 10000}
+        other = {**release, 'supplier_name': 'XYZ Building Materials', 'lpo_number': 'LPO-2030-002'}
+
+        results, summary = agent.process_batch([
+            {'record_type': 'lpo_release', 'data': release},
+            {'record_type': 'lpo_release', 'data': other},
+            {'record_type': 'lpo_release', 'data': release}
+        ])
+
+        assert results[0]['duplicates'] == [] and results[1]['duplicates'] == []
+        assert [(d['match_type'], d['batch_index']) for d in results[2]['duplicates']] == [
+            ('Duplicate In Batch', 0), ('Similar In Batch', 0)
+        ]
+        assert results[2]['ready_to_save'] is False
+        assert summary['duplicates_found'] == 2
+
+    def test_similar_release_within_window(self, agent):
+        material_ids, _ = seed(random.Random(1), po_count=0)
+        base = {'material_id': material_ids[0], 'supplier_name': 'Gulf Cement Co', 'amount': 20000}
+
+        results, _ = agent.process_batch([
+            {'record_type': 'lpo_release', 'data': {**base, 'release_date': TODAY.strftime('%Y-%m-%d')}},
+            {'record_type': 'lpo_release', 'data': {**base, 'supplier_name': 'Gulf Cement Co.', 'amount': 21000,
+                                                    'release_date': (TODAY + timedelta(days=6)).strftime('%Y-%m-%d')}},
+            {'record_type': 'lpo_release', 'data': {**base, 'release_date': (TODAY + timedelta(days=20)).strftime('%Y-%m-%d')}},
+            {'record_type': 'lpo_release', 'data': {**base, 'material_id': material_ids[1],
+                                                    'release_date': TODAY.strftime('%Y-%m-%d')}}
+        ])
+
+        assert [d['batch_index'] for d in results[1]['duplicates']] == [0]
+        assert results[1]['duplicates'][0]['confidence'] > 0.85
+        assert results[2]['duplicates'] == []
+        assert results[3]['duplicates'] == []
+
+    def test_repeated_invoice_reported_once(self, agent):
+        invoice = {'payment_date': TODAY.strftime('%Y-%m-%d'), 'total_amount': 500,
+                   'invoice_number': 'INV-NEW-1', 'payment_ref': 'PAY-NEW-1'}
+
+        results, _ = agent.process_batch([
+            {'record_type': 'invoice', 'data': invoice},
+            {'record_type': 'invoice', 'data': invoice}
+        ])
+
+        assert [(d['match_type'], d['batch_index']) for d in results[1]['duplicates']] == [('Duplicate In Batch', 0)]
+
+    def test_endpoint(self, client):
+        invoice = {'payment_date': TODAY.strftime('%Y-%m-%d'), 'total_amount': 500, 'invoice_number': 'INV-NEW-1'}
+
+        response = client.post('/api/agents/validate-and-check/batch', headers={'X-API-Key': API_KEY}, json={
+            'records': [{'record_type': 'invoice', 'data': invoice}, {'record_type': 'invoice', 'data': invoice}]
+        })
+
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['summary'] == {'total': 2, 'valid': 2, 'invalid': 0, 'duplicates_found': 1}
+        assert body['results'][1]['duplicates'][0]['batch_index'] == 0
+
+
+class TestStreaming:
+    """process_stream and the NDJSON endpoint"""
+
+    def test_matches_batch_across_chunks(self, agent):
+        rng = random.Random(9)
+        material_ids, po_ids = seed(rng)
+        records = random_records(rng, material_ids, po_ids, 200)
+        records[150] = dict(records[3])  # In-batch duplicate of a record from an earlier chunk
+
+        expected, _ = agent.process_batch(records)
+        streamed = list(agent.process_stream(iter(records), chunk_size=7))
+
+        assert streamed == expected
+        assert any(d.get('batch_index') == 3 for d in streamed[150]['duplicates'])
+
+    def test_reads_one_chunk_ahead(self, agent):
+        rng = random.Random(4)
+        material_ids, po_ids = seed(rng)
+        pulled = []
+
+        def source():
+            for record in random_records(rng, material_ids, po_ids, 100):
+                pulled.append(record)
+                yield record
+
+        stream = agent.process_stream(source(), chunk_size=10)
+        first = next(stream)
+
+        assert first['index'] == 0
+        assert len(pulled) == 10
+        assert len(list(stream)) == 99
+
+    def test_slow_source_flushes_before_chunk_fills(self, agent):
+        rng = random.Random(4)
+        material_ids, po_ids = seed(rng)
+        pulled = []
+
+        def source():
+            for record in random_records(rng, material_ids, po_ids, 5):
+                pulled.append(record)
+                yield record
+                time.sleep(0.05)
+
+        stream = agent.process_stream(source(), chunk_size=10, max_wait=0.01)
+        first = next(stream)
+
+        assert first['index'] == 0
+        assert len(pulled) == 2
+        assert len(list(stream)) == 4
+
+    def test_endpoint_writes_first_result_before_chunk_fills(self, client, monkeypatch):
+        invoice = {'payment_date': TODAY.strftime('%Y-%m-%d'), 'total_amount': 500, 'invoice_number': 'INV-NEW-1'}
+        read = []
+
+        def trickle(stream):
+            for record in ndjson_records(stream):
+                read.append(record)
+                yield record
+                time.sleep(0.05)
+
+        ndjson_records = routes.agents._ndjson_records
+        monkeypatch.setattr('routes.agents._ndjson_records', trickle)
+        monkeypatch.setattr('routes.agents.STREAM_MAX_WAIT', 0.01)
+        body = ''.join(json.dumps({'record_type': 'invoice', 'data': {**invoice, 'invoice_number': f'INV-{i}'}}) + '\n'
+                       for i in range(20))
+
+        response = client.post('/api/agents/validate-and-check/stream', data=body, buffered=False,
+                               headers={'X-API-Key': API_KEY, 'Content-Type': 'application/x-ndjson'})
+        lines = iter(response.response)
+        first = json.loads(next(lines))
+
+        assert first['index'] == 0
+        assert len(read) < 20
+        assert len([line for line in lines if line.strip()]) == 20
+        response.close()
+
+    def test_endpoint(self, client):
+        invoice = {'payment_date': TODAY.strftime('%Y-%m-%d'), 'total_amount': 500, 'invoice_number': 'INV-NEW-1'}
+        body = '\n'.join([
+            json.dumps({'record_type': 'invoice', 'data': invoice}),
+            '',
+            '{"record_type": "invoice", "data": ',
+            json.dumps({'record_type': 'invoice', 'data': invoice})
+        ]) + '\n'
+
+        response = client.post('/api/agents/validate-and-check/stream', data=body,
+                               headers={'X-API-Key': API_KEY, 'Content-Type': 'application/x-ndjson'})
+
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [line.get('index') for line in lines] == [0, 1, 2, None]
+        assert lines[1]['success'] is False and 'line 3' in lines[1]['error']
+        assert lines[2]['duplicates'][0]['batch_index'] == 0
+        assert lines[3]['summary'] == {'total': 3, 'valid': 2, 'invalid': 1, 'duplicates_found': 1}
+
+    def test_endpoint_requires_api_key(self, client):
+        response = client.post('/api/agents/validate-and-check/stream', data='{}\n')
+
+        assert response.status_code == 401
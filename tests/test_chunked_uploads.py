@@ -0,0 +1,261 @@
+"""
+Tests for resumable chunked uploads
+Chunks are written in order against an upload session; a broken upload
+resumes from received_bytes and the finished file lands in the content store
+"""
+import hashlib
+import io
+import os
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+from models import db
+from models.file import File
+from models.upload_session import UploadSession
+from services.upload_sessions import UploadSessionService, UploadSessionError
+
+CHUNK = 4096
+
+
+@pytest.fixture
+def app(app, monkeypatch, tmp_path):
+    """Test application with this module's settings"""
+    app.config['CHUNKED_UPLOAD_CHUNK_SIZE'] = CHUNK
+    app.config['CHUNKED_UPLOAD_MAX_SIZE'] = 1024 * 1024
+    monkeypatch.setattr('routes.uploads.UPLOAD_FOLDER', str(tmp_path))
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+def pdf_content(size=CHUNK * 2 + 100):
+    """Bytes with a PDF header"""
+    return b'%PDF-1.4\n' + os.urandom(size - 9)
+
+
+def open_session(client, content, filename='drawing.pdf', **extra):
+    response = client.post('/api/uploads/sessions', json={
+        'filename': filename, 'file_size': len(content), 'mime_type': 'application/pdf', **extra
+    })
+    assert response.status_code == 201
+    return response.get_json()['session']
+
+
+def put_chunk(client, session, content, start, stop=None):
+    stop = min(start + CHUNK, len(content)) if stop is None else stop
+    return client.put(session['upload_url'], data=content[start:stop], headers={
+        'Content-Range': f'bytes {start}-{stop - 1}/{len(content)}'
+    })
+
+
+def upload_all(client, session, content, start=0):
+    for offset in range(start, len(content), CHUNK):
+        assert put_chunk(client, session, content, offset).status_code == 200
+    return client.post(f"/api/uploads/sessions/{session['session_id']}/complete")
+
+
+class TestSessionStart:
+    """Type and size are checked before any bytes are sent"""
+
+    def test_disallowed_type(self, client):
+        response = client.post('/api/uploads/sessions', json={'filename': 'run.exe', 'file_size': 10})
+        assert response.status_code == 400
+
+    def test_too_large(self, client):
+        response = client.post('/api/uploads/sessions', json={'filename': 'big.pdf', 'file_size': 2 * 1024 * 1024})
+        assert response.status_code == 413
+        assert response.get_json()['max_size'] == 1024 * 1024
+
+    def test_session_fields(self, client):
+        session = open_session(client, pdf_content())
+        assert session['received_bytes'] == 0
+        assert session['chunk_size'] == CHUNK
+        assert session['status'] == 'open'
+
+
+class TestChunks:
+    """Ordered chunks, resume and completion"""
+
+    def test_upload_in_chunks(self, client, app, tmp_path):
+        """The stored file is byte-identical and hashed"""
+        content = pdf_content()
+        session = open_session(client, content, entity_type='material', entity_id=3)
+
+        response = upload_all(client, session, content)
+
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['deduplicated'] is False
+        file = db.session.get(File, data['file']['id'])
+        assert file.content_hash == hashlib.sha256(content).hexdigest()
+        assert file.file_size == len(content)
+        assert file.material_id == 3
+        with open(tmp_path / file.file_path, 'rb') as f:
+            assert f.read() == content
+        assert not os.listdir(tmp_path / UploadSessionService.STAGING_DIR)
+
+    def test_out_of_order_chunk(self, client):
+        """A chunk past the resume point is refused with the offset to resume from"""
+        content = pdf_content()
+        session = open_session(client, content)
+        put_chunk(client, session, content, 0)
+
+        response = put_chunk(client, session, content, CHUNK * 2)
+
+        assert response.status_code == 409
+        assert response.get_json()['received_bytes'] == CHUNK
+
+    def test_resume_after_disconnect(self, client, app):
+        """A truncated chunk is not counted; the client resumes from received_bytes"""
+        content = pdf_content()
+        session = open_session(client, content)
+        put_chunk(client, session, content, 0)
+
+        # Connection drops half way through the second chunk
+        short = client.put(session['upload_url'], input_stream=io.BytesIO(content[CHUNK:CHUNK + 100]),
+                           headers={'Content-Range': f'bytes {CHUNK}-{CHUNK * 2 - 1}/{len(content)}'})
+        assert short.status_code == 400
+
+        resume_from = client.get(f"/api/uploads/sessions/{session['session_id']}").get_json()['session']
+        assert resume_from['received_bytes'] == CHUNK
+
+        # Running hash was dropped for the broken chunk; completion hashes the staged file
+        response = upload_all(client, session, content, start=resume_from['received_bytes'])
+        assert response.status_code == 201
+        assert response.get_json()['file']['content_hash'] == hashlib.sha256(content).hexdigest()
+
+    def test_incomplete_upload_cannot_complete(self, client):
+        content = pdf_content()
+        session = open_session(client, content)
+        put_chunk(client, session, content, 0)
+
+        response = client.post(f"/api/uploads/sessions/{session['session_id']}/complete")
+
+        assert response.status_code == 409
+        assert response.get_json()['received_bytes'] == CHUNK
+
+    def test_identical_upload_is_deduplicated(self, client):
+        content = pdf_content()
+        first = upload_all(client, open_session(client, content), content).get_json()
+        second = upload_all(client, open_session(client, content), content).get_json()
+
+        assert second['deduplicated'] is True
+        assert second['file']['file_path'] == first['file']['file_path']
+
+    def test_wrong_magic_bytes(self, client):
+        """Content is checked against the extension on the first chunk"""
+        content = b'MZ' + os.urandom(500)
+        session = open_session(client, content)
+
+        response = put_chunk(client, session, content, 0)
+
+        assert response.status_code == 415
+        assert db.session.query(UploadSession).one().received_bytes == 0
+
+    @pytest.mark.parametrize('header, status_code', [(b'%PDF', 200), (b'%PXX', 415)])
+    def test_magic_bytes_split_across_chunks(self, client, header, status_code):
+        """A first chunk shorter than the signature does not skip the check"""
+        content = header + os.urandom(500)
+        session = open_session(client, content)
+
+        assert put_chunk(client, session, content, 0, 2).status_code == 200
+        response = put_chunk(client, session, content, 2)
+
+        assert response.status_code == status_code
+        if status_code == 415:
+            assert response.get_json()['error'] == 'File content is not a valid .pdf file'
+            assert db.session.query(UploadSession).one().received_bytes == 2
+
+    def test_concurrent_completion_has_one_winner(self, client, app, tmp_path):
+        """The loser of a race to complete gets 409 and creates no File"""
+        content = pdf_content()
+        session = open_session(client, content)
+        for offset in range(0, len(content), CHUNK):
+            put_chunk(client, session, content, offset)
+
+        loser = UploadSessionService.get_open(session['session_id'])
+        # The winner completes between the loser's get_open and complete
+        db.session.execute(
+            update(UploadSession).where(UploadSession.id == loser.id).values(status='completed')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        with pytest.raises(UploadSessionError) as error:
+            UploadSessionService.complete(str(tmp_path), loser)
+
+        assert error.value.status_code == 409
+        assert error.value.details['status'] == 'completed'
+        assert File.query.count() == 0
+
+
+    def test_stale_retry_does_not_overwrite_later_chunks(self, client, app, tmp_path):
+        """A retried first chunk that lost the race is refused without touching the staged bytes"""
+        content = pdf_content()
+        session = open_session(client, content)
+        put_chunk(client, session, content, 0)
+        put_chunk(client, session, content, CHUNK)
+
+        # The retry loaded the session before either chunk was counted
+        retry = UploadSessionService.get_open(session['session_id'])
+        set_committed_value(retry, 'received_bytes', 0)
+
+        with pytest.raises(UploadSessionError) as error:
+            UploadSessionService.write_chunk(str(tmp_path), retry, 0, CHUNK, len(content),
+                                             io.BytesIO(content[:CHUNK]))
+
+        assert error.value.status_code == 409
+        assert error.value.details['received_bytes'] == CHUNK * 2
+        with open(UploadSessionService.part_path(str(tmp_path), session['session_id']), 'rb') as f:
+            assert f.read() == content[:CHUNK * 2]
+
+    def test_short_staging_file_cannot_complete(self, client, tmp_path):
+        """Completion checks the bytes on disk and rewinds the session to them"""
+        content = pdf_content()
+        session = open_session(client, content)
+        for offset in range(0, len(content), CHUNK):
+            put_chunk(client, session, content, offset)
+        with open(UploadSessionService.part_path(str(tmp_path), session['session_id']), 'r+b') as f:
+            f.truncate(CHUNK + 10)
+
+        response = client.post(f"/api/uploads/sessions/{session['session_id']}/complete")
+
+        assert response.status_code == 409
+        assert response.get_json()['received_bytes'] == CHUNK + 10
+        assert File.query.count() == 0
+
+        put_chunk(client, session, content, CHUNK + 10, CHUNK * 2)
+        response = upload_all(client, session, content, start=CHUNK * 2)
+        assert response.status_code == 201
+        assert response.get_json()['file']['content_hash'] == hashlib.sha256(content).hexdigest()
+
+    def test_expected_hash(self, client):
+        """A client-supplied SHA-256 must match the staged file"""
+        content = pdf_content()
+        session = open_session(client, content)
+        for offset in range(0, len(content), CHUNK):
+            put_chunk(client, session, content, offset)
+        complete_url = f"/api/uploads/sessions/{session['session_id']}/complete"
+
+        response = client.post(complete_url, json={'sha256': hashlib.sha256(b'other').hexdigest()})
+        assert response.status_code == 422
+        assert File.query.count() == 0
+
+        response = client.post(complete_url, json={'sha256': hashlib.sha256(content).hexdigest()})
+        assert response.status_code == 201
+
+
+class TestAbort:
+    def test_abort_discards_staged_bytes(self, client, tmp_path):
+        content = pdf_content()
+        session = open_session(client, content)
+        put_chunk(client, session, content, 0)
+
+        assert client.delete(f"/api/uploads/sessions/{session['session_id']}").status_code == 200
+
+        assert not os.listdir(tmp_path / UploadSessionService.STAGING_DIR)
+        assert put_chunk(client, session, content, CHUNK).status_code == 410
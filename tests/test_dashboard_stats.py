@@ -0,0 +1,169 @@
+"""
+Tests for the dashboard statistics endpoints
+Aggregates come from one query per table and are served from a TTL cache
+that writes invalidate
+"""
+import pytest
+from sqlalchemy import event, update
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from models.delivery import Delivery
+from models.ai_suggestion import AISuggestion
+
+
+@pytest.fixture
+def app(app):
+    """Test application with this module's settings"""
+    app.config['DASHBOARD_CACHE_TTL'] = 60
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+@pytest.fixture
+def seeded(app):
+    """A spread of statuses across every aggregated table"""
+    with app.app_context():
+        for i, status in enumerate(['Approved', 'Approved', 'Pending', 'Rejected']):
+            db.session.add(Material(material_type=f'Material {i}', description=f'Description {i}',
+                                     approval_status=status))
+        db.session.flush()
+
+        po_statuses = ['Draft', 'Released', 'Released', 'In Progress', 'Completed', 'Cancelled']
+        for i, status in enumerate(po_statuses):
+            po = PurchaseOrder(material_id=1, po_ref=f'PO-STAT-{i}', supplier_name='Alpha',
+                               total_amount=1000 * (i + 1), po_status=status)
+            db.session.add(po)
+            db.session.flush()
+            db.session.add(Payment(po_id=po.id, total_amount=100, paid_amount=50))
+
+        delivery_rows = [
+            ('Pending', True, 'completed', 95, 4),
+            ('Pending', False, 'completed', 70, 2),
+            ('In Transit', False, 'pending', None, None),
+            ('Completed', True, 'completed', 85, 6),
+            ('Completed', False, None, None, 1)
+        ]
+        for status, delayed, extraction, confidence, items in delivery_rows:
+            db.session.add(Delivery(po_id=1, delivery_status=status, is_delayed=delayed,
+                                    extraction_status=extraction, extraction_confidence=confidence,
+                                    extracted_item_count=items))
+
+        for status, confidence in [('pending', 95), ('pending', 60), ('approved', 99)]:
+            db.session.add(AISuggestion(target_table='deliveries', action_type='create',
+                                        confidence_score=confidence, suggested_data='{}', status=status))
+        db.session.commit()
+
+
+def count_queries(client, url):
+    """Response JSON and the number of SELECTs the request issued"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    try:
+        data = client.get(url).get_json()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_execute)
+    return data, len(statements)
+
+
+class TestDashboardAggregates:
+    """Same numbers as the per-status counts, far fewer queries"""
+
+    def test_stats_values(self, client, app, seeded):
+        """Every figure matches the seeded rows"""
+        data = client.get('/api/dashboard/stats').get_json()
+
+        assert data['materials'] == {'total': 4, 'approved': 2, 'pending': 1}
+        assert data['purchase_orders'] == {'total': 6, 'released': 2, 'total_value': 21000}
+        assert data['deliveries'] == {'total': 5, 'pending': 2, 'delayed': 2, 'completed': 2}
+        assert data['payments_count'] == 6
+        assert data['ai_suggestions'] == {'pending': 2, 'high_confidence': 1}
+
+        intelligence = data['ai_document_intelligence']
+        assert intelligence['total_extractions'] == 3
+        assert intelligence['success_rate'] == 66.7
+        assert intelligence['avg_confidence'] == 83.3
+        assert intelligence['total_items'] == 13
+
+    def test_stats_query_count(self, client, app, seeded):
+        """One aggregate query per table"""
+        with app.app_context():
+            _, queries = count_queries(client, '/api/dashboard/stats')
+        assert queries <= 5
+
+    def test_analytics_distributions(self, client, app, seeded):
+        """Status distributions come from the aggregate queries"""
+        with app.app_context():
+            data, queries = count_queries(client, '/api/dashboard/analytics')
+
+        assert data['delivery_status']['values'] == [2, 1, 2, 2]
+        assert data['po_completion']['values'] == [1, 2, 1, 1, 1]
+        assert queries <= 4  # payment trend + top materials + 2 aggregates
+
+
+class TestDashboardCache:
+    """Polling reuses the cached result until a write or the TTL invalidates it"""
+
+    def test_repeated_reads_hit_cache(self, client, app, seeded):
+        """A second poll issues no queries"""
+        with app.app_context():
+            first, _ = count_queries(client, '/api/dashboard/stats')
+            second, queries = count_queries(client, '/api/dashboard/stats')
+
+        assert queries == 0
+        assert first == second
+
+    def test_write_invalidates(self, client, app, seeded):
+        """Committing a new row is visible on the next poll"""
+        client.get('/api/dashboard/stats')
+
+        with app.app_context():
+            db.session.add(Material(material_type='New Material', approval_status='Pending'))
+            db.session.commit()
+
+        data = client.get('/api/dashboard/stats').get_json()
+        assert data['materials'] == {'total': 5, 'approved': 2, 'pending': 2}
+
+    def test_bulk_update_invalidates(self, client, app, seeded):
+        """ORM UPDATE statements that bypass the flush also invalidate"""
+        client.get('/api/dashboard/stats')
+
+        with app.app_context():
+            db.session.execute(update(Delivery).values(is_delayed=False))
+            db.session.commit()
+
+        data = client.get('/api/dashboard/stats').get_json()
+        assert data['deliveries']['delayed'] == 0
+
+    def test_unrelated_write_keeps_cache(self, client, app, seeded):
+        """Writes to other tables leave the cache alone"""
+        from models.conversation import Conversation
+
+        with app.app_context():
+            client.get('/api/dashboard/stats')
+            db.session.add(Conversation(conversation_id='conv-1'))
+            db.session.commit()
+            _, queries = count_queries(client, '/api/dashboard/stats')
+
+        assert queries == 0
+
+    def test_zero_ttl_disables_cache(self, client, app, seeded):
+        """DASHBOARD_CACHE_TTL=0 recomputes on every request"""
+        app.config['DASHBOARD_CACHE_TTL'] = 0
+
+        with app.app_context():
+            client.get('/api/dashboard/stats')
+            _, queries = count_queries(client, '/api/dashboard/stats')
+
+        assert queries > 0
@@ -36,6 +36,9 @@ class MockQuery:
     def filter(self, *args):
         return self
     
+    def order_by(self, *args):
+        return self
+    
     def first(self):
         return None
     
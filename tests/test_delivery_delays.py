@@ -0,0 +1,137 @@
+"""
+Tests for delivery delay calculation
+GET endpoints must not write; the scheduled refresh persists changed flags in bulk
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.delivery import Delivery
+
+API_KEY = 'test-api-key'
+
+
+@pytest.fixture
+def app(app):
+    """Test application with this module's settings"""
+    app.config['N8N_API_KEY'] = API_KEY
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+@pytest.fixture
+def deliveries(app):
+    """One overdue, one late-delivered, one on-time and one future delivery"""
+    with app.app_context():
+        material = Material(material_type='Isolator')
+        db.session.add(material)
+        db.session.flush()
+        po = PurchaseOrder(material_id=material.id, po_ref='PO-DELAY-1',
+                           supplier_name='ABC Trading LLC', total_amount=1000)
+        db.session.add(po)
+        db.session.flush()
+
+        now = datetime.utcnow()
+        rows = {
+            'overdue': Delivery(po_id=po.id, delivery_status='Pending',
+                                expected_delivery_date=now - timedelta(days=5)),
+            'late': Delivery(po_id=po.id, delivery_status='Delivered',
+                             expected_delivery_date=now - timedelta(days=10),
+                             actual_delivery_date=now - timedelta(days=7)),
+            'on_time': Delivery(po_id=po.id, delivery_status='Delivered',
+                                expected_delivery_date=now - timedelta(days=10),
+                                actual_delivery_date=now - timedelta(days=12)),
+            'future': Delivery(po_id=po.id, delivery_status='Pending',
+                               expected_delivery_date=now + timedelta(days=10))
+        }
+        db.session.add_all(rows.values())
+        db.session.commit()
+        return {name: delivery.id for name, delivery in rows.items()}
+
+
+def capture_writes(engine):
+    """Collect INSERT/UPDATE/DELETE statements executed on engine"""
+    writes = []
+
+    def before_execute(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
+            writes.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    return writes, lambda: event.remove(engine, 'before_cursor_execute', before_execute)
+
+
+class TestDelayOnRead:
+    """GET endpoints compute delay without writing"""
+
+    def test_get_endpoints_do_not_write(self, client, app, deliveries):
+        """List, detail and by-PO reads issue no writes"""
+        with app.app_context():
+            writes, stop = capture_writes(db.engine)
+            try:
+                listing = client.get('/api/deliveries').get_json()
+                detail = client.get(f"/api/deliveries/{deliveries['overdue']}").get_json()
+                by_po = client.get(f"/api/deliveries/po/{detail['po_id']}").get_json()
+            finally:
+                stop()
+
+        assert writes == []
+        assert len(listing) == 4 and len(by_po) == 4
+        assert detail['is_delayed'] is True
+        assert detail['delay_days'] == 5
+
+    def test_response_reports_calculated_delay(self, client, deliveries):
+        """Late rows are reported delayed even before flags are persisted"""
+        listing = {d['id']: d for d in client.get('/api/deliveries').get_json()}
+
+        assert listing[deliveries['late']]['is_delayed'] is True
+        assert listing[deliveries['late']]['delay_days'] == 3
+        assert listing[deliveries['on_time']]['is_delayed'] is False
+        assert listing[deliveries['future']]['is_delayed'] is False
+
+    def test_is_late_expression_matches_python(self, app, deliveries):
+        """The hybrid SQL expression selects the same rows as the Python side"""
+        with app.app_context():
+            sql_ids = {d.id for d in Delivery.query.filter(Delivery.is_late)}
+            python_ids = {d.id for d in Delivery.query.all() if d.is_late}
+
+            assert sql_ids == python_ids == {deliveries['overdue'], deliveries['late']}
+
+
+class TestDelayRefreshJob:
+    """Scheduled refresh persists flags in one bulk UPDATE"""
+
+    def test_refresh_updates_only_changed_rows(self, client, app, deliveries):
+        """First run writes two rows in one statement, second run writes nothing"""
+        headers = {'X-API-Key': API_KEY}
+
+        with app.app_context():
+            writes, stop = capture_writes(db.engine)
+            try:
+                first = client.post('/api/n8n/refresh-delivery-delays', headers=headers).get_json()
+            finally:
+                stop()
+
+            delivery_updates = [w for w in writes if w.lstrip().upper().startswith('UPDATE DELIVERIES')]
+            assert len(delivery_updates) == 1
+            assert first['updated_count'] == 2
+            assert set(first['updated_ids']) == {deliveries['overdue'], deliveries['late']}
+
+            second = client.post('/api/n8n/refresh-delivery-delays', headers=headers).get_json()
+            assert second['updated_count'] == 0
+
+            overdue = db.session.get(Delivery, deliveries['overdue'])
+            assert overdue.is_delayed is True
+            assert overdue.delay_days == 5
+
+    def test_refresh_requires_api_key(self, client, deliveries):
+        """Endpoint is protected like the other n8n routes"""
+        response = client.post('/api/n8n/refresh-delivery-delays')
+        assert response.status_code == 401
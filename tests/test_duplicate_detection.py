@@ -0,0 +1,179 @@
+"""
+Tests for DataProcessingAgent duplicate detection
+Similar-PO candidates come from the (material, date, amount) index and the
+result must match the original scan-and-compare logic exactly
+"""
+import random
+import pytest
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from sqlalchemy import event
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from services.data_processing_agent import DataProcessingAgent, _bounded_similarity
+
+SUPPLIERS = ['Al Futtaim Steel LLC', 'Al Futaim Steel L.L.C', 'Gulf Cement Co', 'Gulf Cement Company',
+             'Emirates Glass', 'Emirates Glass LLC', 'ABC Trading', 'XYZ Building Materials']
+
+START = datetime(2025, 3, 1)
+
+
+@pytest.fixture
+def agent(app):
+    return DataProcessingAgent(db.session)
+
+
+def seed_pos(count=400, materials=3, rng=None):
+    rng = rng or random.Random(7)
+    material_ids = []
+    for m in range(materials):
+        material = Material(material_type=f'Material {m}')
+        db.session.add(material)
+        db.session.flush()
+        material_ids.append(material.id)
+
+    db.session.add_all(
+        PurchaseOrder(material_id=rng.choice(material_ids), po_ref=f'LPO-2025-{i:04d}',
+                      supplier_name=rng.choice(SUPPLIERS), total_amount=rng.choice([9000, 10000, 10500, 12000, 50000]),
+                      po_date=START + timedelta(days=rng.randint(0, 60)))
+        for i in range(count)
+    )
+    db.session.commit()
+    return material_ids
+
+
+def scan_duplicates(data):
+    """Similar POs as the agent found them before the index: every PO of the material in the date window"""
+    release_date = datetime.strptime(data['release_date'], '%Y-%m-%d')
+    found = []
+    for po in PurchaseOrder.query.filter(
+        PurchaseOrder.material_id == data['material_id'],
+        PurchaseOrder.po_date.between(release_date - timedelta(days=7), release_date + timedelta(days=7))
+    ).order_by(PurchaseOrder.id):
+        similarity = SequenceMatcher(None, data['supplier_name'].lower(), po.supplier_name.lower()).ratio()
+        amount_diff = abs(float(data['amount']) - po.total_amount) / po.total_amount
+        if similarity > 0.85 and amount_diff < 0.1:
+            found.append((po.id, similarity))
+    return found
+
+
+def count_selects(function):
+    """Result of function() and the SELECTs it issued"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    try:
+        result = function()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_execute)
+    return result, statements
+
+
+class TestSimilarPOs:
+    """Strategy 2: supplier + material + date + amount"""
+
+    def test_matches_full_scan(self, agent):
+        rng = random.Random(11)
+        material_ids = seed_pos(rng=rng)
+
+        for _ in range(150):
+            data = {
+                'material_id': rng.choice(material_ids),
+                'supplier_name': rng.choice(SUPPLIERS),
+                'release_date': (START + timedelta(days=rng.randint(-5, 65))).strftime('%Y-%m-%d'),
+                'amount': rng.choice([9500, 10000, 11000, 48000, 70000])
+            }
+            _, duplicates = agent._check_lpo_duplicate(data)
+
+            assert [(d['id'], d['confidence']) for d in duplicates] == scan_duplicates(data)
+
+    def test_reads_only_the_amount_window(self, agent):
+        material_id = seed_pos(count=0, materials=1)[0]
+        db.session.add_all(
+            PurchaseOrder(material_id=material_id, po_ref=f'LPO-2025-{i:04d}', supplier_name='Gulf Cement Co',
+                          total_amount=1000 + i * 1000, po_date=START)
+            for i in range(50)
+        )
+        db.session.commit()
+
+        _, duplicates = agent._check_lpo_duplicate({
+            'material_id': material_id, 'supplier_name': 'Gulf Cement Co.',
+            'release_date': START.strftime('%Y-%m-%d'), 'amount': 20000
+        })
+
+        assert [d['amount'] for d in duplicates] == [19000, 20000, 21000, 22000]
+        assert all(d['match_type'] == 'Similar PO' for d in duplicates)
+
+    def test_exact_po_number_is_reported_first(self, agent):
+        material_id = seed_pos(count=0, materials=1)[0]
+        db.session.add(PurchaseOrder(material_id=material_id, po_ref='LPO-2025-0001', supplier_name='ABC Trading',
+                                     total_amount=10000, po_date=START))
+        db.session.commit()
+
+        has_duplicates, duplicates = agent._check_lpo_duplicate({
+            'lpo_number': 'LPO-2025-0001', 'material_id': material_id, 'supplier_name': 'ABC Trading',
+            'release_date': START.strftime('%Y-%m-%d'), 'amount': 10000
+        })
+
+        assert has_duplicates
+        assert [d['match_type'] for d in duplicates] == ['Exact PO Number', 'Similar PO']
+
+    def test_no_amount_skips_the_lookup(self, agent):
+        material_id = seed_pos(count=0, materials=1)[0]
+
+        (_, duplicates), statements = count_selects(lambda: agent._check_lpo_duplicate({
+            'material_id': material_id, 'supplier_name': 'ABC Trading', 'release_date': '2025-03-01'
+        }))
+
+        assert duplicates == []
+        assert statements == []
+
+    def test_bounded_similarity_never_hides_a_match(self, agent):
+        """The cheap bounds only cut off pairs that could not pass the threshold"""
+        for name in SUPPLIERS:
+            for other in SUPPLIERS:
+                exact = SequenceMatcher(None, name.lower(), other.lower()).ratio()
+                bounded = _bounded_similarity(name.lower(), other.lower(), agent.similarity_threshold)
+                if exact > agent.similarity_threshold:
+                    assert bounded == exact
+                else:
+                    assert bounded <= agent.similarity_threshold
+
+
+class TestInvoiceDuplicates:
+    """Invoice and payment references"""
+
+    def test_both_references_in_one_query(self, agent):
+        seed_pos(count=2, materials=1)
+        po_id = PurchaseOrder.query.first().id
+        db.session.add_all([
+            Payment(po_id=po_id, total_amount=100, invoice_ref='INV-001', payment_ref='PAY-9'),
+            Payment(po_id=po_id, total_amount=100, invoice_ref='INV-002', payment_ref='PAY-1')
+        ])
+        db.session.commit()
+
+        (has_duplicates, duplicates), statements = count_selects(
+            lambda: agent._check_invoice_duplicate({'invoice_number': 'INV-001', 'payment_ref': 'PAY-1'})
+        )
+
+        assert has_duplicates
+        assert [(d['match_type'], d['id']) for d in duplicates] == [
+            ('Exact Invoice Reference', 1), ('Exact Payment Reference', 2)
+        ]
+        assert len(statements) == 1
+
+    def test_same_payment_reported_once(self, agent):
+        seed_pos(count=1, materials=1)
+        db.session.add(Payment(po_id=PurchaseOrder.query.first().id, total_amount=100,
+                               invoice_ref='INV-001', payment_ref='PAY-1'))
+        db.session.commit()
+
+        _, duplicates = agent._check_invoice_duplicate({'invoice_ref': 'INV-001', 'payment_ref': 'PAY-1'})
+
+        assert [d['match_type'] for d in duplicates] == ['Exact Invoice Reference']
@@ -0,0 +1,223 @@
+"""
+Tests for content-addressed uploads and the extraction cache
+Identical documents share one blob, and a document extracted once is not
+sent to n8n again for the same prompt version
+"""
+import base64
+import hashlib
+import io
+import os
+import pytest
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.delivery import Delivery
+from models.file import File
+from models.n8n_dispatch import N8nDispatch
+from models.extraction_cache import ExtractionCacheEntry
+from services.content_store import ContentStore
+
+API_KEY = 'test-cache-key'
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                          'sample documents', 'sample lpo', 'sample single page.pdf')
+
+
+@pytest.fixture
+def app(app, monkeypatch, tmp_path):
+    """Test application with this module's settings"""
+    app.config['N8N_API_KEY'] = API_KEY
+    app.config['EXTRACTION_PROMPT_VERSION'] = '3'
+    monkeypatch.setattr('routes.uploads.UPLOAD_FOLDER', str(tmp_path))
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+@pytest.fixture
+def deliveries(app):
+    """Two deliveries to attach the same document to"""
+    material = Material(material_type='Cables & Wires', description='Power cables')
+    db.session.add(material)
+    db.session.flush()
+    po = PurchaseOrder(material_id=material.id, po_ref='PO-CACHE', supplier_name='Alpha', total_amount=1000)
+    db.session.add(po)
+    db.session.flush()
+    first, second = Delivery(po_id=po.id), Delivery(po_id=po.id)
+    db.session.add_all([first, second])
+    db.session.commit()
+    return first.id, second.id
+
+
+def pdf_bytes():
+    with open(SAMPLE_PDF, 'rb') as f:
+        return f.read()
+
+
+def upload(client, delivery_id, content=None):
+    """Upload a delivery note and return the response JSON"""
+    response = client.post(
+        f'/api/deliveries/{delivery_id}/upload-document',
+        data={'file': (io.BytesIO(content or pdf_bytes()), 'note.pdf')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def referenced_hashes():
+    """Content hashes still referenced by File rows"""
+    return {content_hash for (content_hash,) in db.session.query(File.content_hash).distinct()}
+
+
+def n8n_result(client, delivery_id, file_id, confidence=95):
+    """Post an extraction result as the n8n workflow would"""
+    return client.post('/api/n8n/delivery-extraction', headers={'X-API-Key': API_KEY}, json={
+        'delivery_id': delivery_id,
+        'file_id': file_id,
+        'extraction_status': 'completed',
+        'extraction_confidence': confidence,
+        'extracted_data': {'dn_number': 'DN-100', 'items': [{'description': 'Cable', 'quantity': 4}]}
+    })
+
+
+class TestContentStore:
+    """Uploads are hashed while streaming and stored once per content"""
+
+    def test_hash_and_size(self, tmp_path):
+        """Hash matches hashlib over the whole file"""
+        content = os.urandom(ContentStore.CHUNK_SIZE * 3 + 17)
+
+        stored = ContentStore.save(io.BytesIO(content), str(tmp_path), 'pdf')
+
+        assert stored['content_hash'] == hashlib.sha256(content).hexdigest()
+        assert stored['file_size'] == len(content)
+        assert stored['file_path'].endswith(f"{stored['content_hash']}.pdf")
+        assert stored['deduplicated'] is False
+        with open(tmp_path / stored['file_path'], 'rb') as f:
+            assert f.read() == content
+
+    def test_identical_uploads_share_blob(self, client, app, deliveries, tmp_path):
+        """The second copy is not written again"""
+        first = upload(client, deliveries[0])
+        second = upload(client, deliveries[1])
+
+        assert first['deduplicated'] is False
+        assert second['deduplicated'] is True
+        assert first['file_path'] == second['file_path']
+        blobs = [name for _, _, names in os.walk(tmp_path / 'blobs') for name in names]
+        assert len(blobs) == 1
+
+    def test_delete_keeps_shared_blob(self, client, app, deliveries, tmp_path):
+        """A blob is collected once the last file that uses it is deleted"""
+        first = upload(client, deliveries[0])
+        second = upload(client, deliveries[1])
+        blob = tmp_path / first['file_path']
+
+        client.delete(f"/api/files/{first['file_id']}")
+        assert ContentStore.collect_garbage(str(tmp_path), referenced_hashes(), grace=0) == 0
+        assert blob.exists()
+
+        client.delete(f"/api/files/{second['file_id']}")
+        assert blob.exists()
+        assert ContentStore.collect_garbage(str(tmp_path), referenced_hashes(), grace=0) == 1
+        assert not blob.exists()
+
+    def test_failed_commit_blob_is_collected(self, tmp_path):
+        """A blob saved for a row that never committed is removed after the grace period"""
+        stored = ContentStore.save(io.BytesIO(b'orphan'), str(tmp_path), 'pdf')
+        blob = tmp_path / stored['file_path']
+
+        assert ContentStore.collect_garbage(str(tmp_path), set()) == 0
+        assert blob.exists()
+
+        old = blob.stat().st_mtime - ContentStore.GC_GRACE - 1
+        os.utime(blob, (old, old))
+        assert ContentStore.collect_garbage(str(tmp_path), set()) == 1
+        assert not blob.exists()
+
+    def test_reuse_restarts_grace_period(self, tmp_path):
+        """Uploading an unreferenced blob again protects it until the new row commits"""
+        stored = ContentStore.save(io.BytesIO(b'shared'), str(tmp_path), 'pdf')
+        blob = tmp_path / stored['file_path']
+        old = blob.stat().st_mtime - ContentStore.GC_GRACE - 1
+        os.utime(blob, (old, old))
+
+        assert ContentStore.save(io.BytesIO(b'shared'), str(tmp_path), 'pdf')['deduplicated'] is True
+        assert ContentStore.collect_garbage(str(tmp_path), set()) == 0
+        assert blob.exists()
+
+
+class TestExtractionCache:
+    """Repeated documents skip n8n"""
+
+    def test_n8n_result_is_cached(self, client, app, deliveries):
+        """The callback fills the File and caches by content hash"""
+        uploaded = upload(client, deliveries[0])
+        assert uploaded['extraction_cached'] is False
+        assert uploaded['n8n_triggered'] is True
+
+        assert n8n_result(client, deliveries[0], uploaded['file_id']).status_code == 200
+
+        file = db.session.get(File, uploaded['file_id'])
+        assert file.processing_status == 'completed'
+        assert file.extracted_data['dn_number'] == 'DN-100'
+        entry = ExtractionCacheEntry.query.one()
+        assert entry.content_hash == hashlib.sha256(pdf_bytes()).hexdigest()
+        assert (entry.kind, entry.prompt_version) == ('delivery', '3')
+
+    def test_repeat_upload_uses_cache(self, client, app, deliveries):
+        """Same content: the cached result is applied and nothing is queued"""
+        first = upload(client, deliveries[0])
+        n8n_result(client, deliveries[0], first['file_id'])
+
+        second = upload(client, deliveries[1])
+
+        assert second['extraction_cached'] is True
+        assert second['extraction_status'] == 'completed'
+        assert second['n8n_triggered'] is False
+        assert N8nDispatch.query.count() == 1
+
+        delivery = db.session.get(Delivery, deliveries[1])
+        assert delivery.extracted_data['dn_number'] == 'DN-100'
+        assert delivery.extraction_confidence == 95
+        assert delivery.updated_by == 'AI (Auto)'
+        assert db.session.get(File, second['file_id']).processing_status == 'completed'
+        assert ExtractionCacheEntry.query.one().hit_count == 1
+
+    def test_prompt_version_change_misses(self, client, app, deliveries):
+        """A new prompt version extracts again"""
+        first = upload(client, deliveries[0])
+        n8n_result(client, deliveries[0], first['file_id'])
+        app.config['EXTRACTION_PROMPT_VERSION'] = '4'
+
+        second = upload(client, deliveries[1])
+
+        assert second['extraction_cached'] is False
+        assert N8nDispatch.query.count() == 2
+
+    def test_different_content_misses(self, client, app, deliveries):
+        """Only byte-identical documents hit"""
+        first = upload(client, deliveries[0])
+        n8n_result(client, deliveries[0], first['file_id'])
+
+        second = upload(client, deliveries[1], content=pdf_bytes() + b'\n% revised')
+
+        assert second['extraction_cached'] is False
+        assert second['deduplicated'] is False
+
+    def test_pdf_text_is_cached(self, client, app):
+        """extract-pdf-text answers a repeated PDF from the cache"""
+        body = {'file_data': base64.b64encode(pdf_bytes()).decode()}
+        headers = {'X-API-Key': API_KEY}
+
+        first = client.post('/api/n8n/extract-pdf-text', json=body, headers=headers).get_json()
+        second = client.post('/api/n8n/extract-pdf-text', json=body, headers=headers).get_json()
+
+        assert first['cached'] is False
+        assert second['cached'] is True
+        assert second['text'] == first['text']
+        assert second['num_pages'] == first['num_pages']
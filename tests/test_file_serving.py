@@ -0,0 +1,93 @@
+"""
+Tests for serving uploaded files
+Downloads carry the content hash as a strong ETag and support conditional
+and range requests, either from Flask or handed to nginx via X-Accel-Redirect
+"""
+import hashlib
+import io
+import os
+import pytest
+
+CONTENT = b'%PDF-1.4\n' + os.urandom(5000)
+ETAG = f'"{hashlib.sha256(CONTENT).hexdigest()}"'
+
+
+@pytest.fixture
+def app(app, monkeypatch, tmp_path):
+    """Test application with this module's settings"""
+    monkeypatch.setattr('routes.uploads.UPLOAD_FOLDER', str(tmp_path))
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+@pytest.fixture
+def uploaded(client):
+    """An uploaded PDF's File record as JSON"""
+    response = client.post('/api/upload', data={'file': (io.BytesIO(CONTENT), 'drawing.pdf')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 201
+    return response.get_json()['file']
+
+
+class TestFlaskServing:
+    """Default mode: Flask streams the file"""
+
+    def test_validators(self, client, uploaded):
+        response = client.get(f"/uploads/{uploaded['filename']}")
+
+        assert response.status_code == 200
+        assert response.data == CONTENT
+        assert response.headers['ETag'] == ETAG
+        assert response.headers['Last-Modified']
+
+    def test_if_none_match(self, client, uploaded):
+        response = client.get(f"/uploads/{uploaded['filename']}", headers={'If-None-Match': ETAG})
+        assert response.status_code == 304
+        assert response.data == b''
+
+    def test_range(self, client, uploaded):
+        response = client.get(f"/uploads/{uploaded['filename']}", headers={'Range': 'bytes=100-199'})
+
+        assert response.status_code == 206
+        assert response.data == CONTENT[100:200]
+        assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+
+    def test_stale_if_range_sends_whole_file(self, client, uploaded):
+        response = client.get(f"/uploads/{uploaded['filename']}",
+                              headers={'Range': 'bytes=100-199', 'If-Range': '"old"'})
+        assert response.status_code == 200
+        assert response.data == CONTENT
+
+
+class TestAccelRedirect:
+    """x-accel mode: Flask answers with headers only"""
+
+    @pytest.fixture(autouse=True)
+    def accel(self, app):
+        app.config['FILE_SERVE_MODE'] = 'x-accel'
+
+    def test_hands_off_to_nginx(self, client, uploaded):
+        response = client.get(f"/uploads/{uploaded['filename']}")
+
+        assert response.status_code == 200
+        assert response.data == b''
+        assert response.headers['X-Accel-Redirect'] == f"/_protected_uploads/{uploaded['file_path']}"
+        assert response.headers['ETag'] == ETAG
+        assert response.headers['Content-Type'] == 'application/pdf'
+        assert response.headers['Content-Disposition'] == 'inline; filename="drawing.pdf"'
+        assert response.headers['Last-Modified']
+
+    def test_not_modified_without_nginx(self, client, uploaded):
+        """Conditional requests are answered by Flask"""
+        response = client.get(f"/uploads/{uploaded['filename']}", headers={'If-None-Match': ETAG})
+
+        assert response.status_code == 304
+        assert 'X-Accel-Redirect' not in response.headers
+
+    def test_unknown_file(self, client):
+        assert client.get('/uploads/missing.pdf').status_code == 404
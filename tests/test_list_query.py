@@ -0,0 +1,125 @@
+"""
+Tests for list endpoint filtering, sorting, projection and cursor pagination
+"""
+import pytest
+from datetime import datetime, timedelta
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from models.delivery import Delivery
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+@pytest.fixture
+def seeded(app):
+    """12 POs over 3 suppliers; every third PO has no expected delivery date"""
+    with app.app_context():
+        material = Material(material_type='Cables & Wires')
+        db.session.add(material)
+        db.session.flush()
+
+        base = datetime(2025, 1, 1)
+        for i in range(12):
+            po = PurchaseOrder(
+                material_id=material.id,
+                po_ref=f'PO-LIST-{i:02d}',
+                po_date=base + timedelta(days=i),
+                expected_delivery_date=None if i % 3 == 0 else base + timedelta(days=30 + i % 4),
+                supplier_name=['Alpha', 'Beta', 'Gamma'][i % 3],
+                total_amount=1000 + i,
+                po_status='Released' if i % 2 else 'Draft'
+            )
+            db.session.add(po)
+            db.session.flush()
+            db.session.add(Payment(po_id=po.id, total_amount=po.total_amount,
+                                   paid_amount=100, payment_date=base + timedelta(days=i)))
+            db.session.add(Delivery(po_id=po.id, delivery_status='Pending',
+                                    expected_delivery_date=base + timedelta(days=40)))
+        db.session.commit()
+
+
+def walk(client, url):
+    """Follow next_cursor until the last page; returns all items and the page count"""
+    items, pages = [], 0
+    page = client.get(url).get_json()
+    while True:
+        items.extend(page['items'])
+        pages += 1
+        if not page['has_more']:
+            return items, pages
+        separator = '&' if '?' in url else '?'
+        page = client.get(f"{url}{separator}cursor={page['next_cursor']}").get_json()
+
+
+class TestCursorPagination:
+    """Keyset pages cover every row exactly once"""
+
+    def test_unpaginated_response_unchanged(self, client, seeded):
+        """Without limit/cursor the endpoint still returns a plain list"""
+        data = client.get('/api/purchase_orders').get_json()
+        assert isinstance(data, list) and len(data) == 12
+
+    @pytest.mark.parametrize('sort', ['id', '-id', 'expected_delivery_date', '-expected_delivery_date'])
+    def test_walk_all_pages(self, client, seeded, sort):
+        """Pages have no gaps or duplicates, including ties and NULLs in the sort column"""
+        items, pages = walk(client, f'/api/purchase_orders?limit=5&sort={sort}')
+        ids = [item['id'] for item in items]
+
+        assert pages == 3
+        assert len(ids) == len(set(ids)) == 12
+
+        expected = [po['id'] for po in client.get(f'/api/purchase_orders?sort={sort}').get_json()]
+        assert ids == expected
+
+    def test_nulls_sorted_last(self, client, seeded):
+        """Rows without a value come after every dated row in both directions"""
+        for sort in ['expected_delivery_date', '-expected_delivery_date']:
+            items, _ = walk(client, f'/api/purchase_orders?limit=4&sort={sort}')
+            dates = [item['expected_delivery_date'] for item in items]
+            assert dates[-4:] == [None] * 4
+            assert None not in dates[:8]
+
+    def test_invalid_cursor_rejected(self, client, seeded):
+        """A tampered cursor is a 400"""
+        response = client.get('/api/purchase_orders?cursor=not-a-cursor')
+        assert response.status_code == 400
+
+
+class TestFiltersAndProjection:
+    """Per-endpoint filters, sort validation and fields="""
+
+    def test_status_and_supplier_filters(self, client, seeded):
+        """Filters combine; comma-separated values match any"""
+        released = client.get('/api/purchase_orders?status=Released&supplier=Alpha,Beta').get_json()
+        assert {po['supplier_name'] for po in released} == {'Alpha', 'Beta'}
+        assert all(po['po_status'] == 'Released' for po in released)
+
+    def test_related_supplier_filter(self, client, seeded):
+        """Payments and deliveries filter by their PO's supplier"""
+        payments = client.get('/api/payments?supplier=Gamma').get_json()
+        deliveries = client.get('/api/deliveries?supplier=Gamma&limit=10').get_json()
+
+        assert len(payments) == 4
+        assert deliveries['count'] == 4
+
+    def test_date_range(self, client, seeded):
+        """date_to includes the whole day"""
+        pos = client.get('/api/purchase_orders?date_from=2025-01-03&date_to=2025-01-05').get_json()
+        assert len(pos) == 3
+
+    def test_fields_projection(self, client, seeded):
+        """Only the requested keys (plus id) are returned"""
+        page = client.get('/api/payments?limit=2&fields=paid_amount').get_json()
+        assert all(set(item) == {'id', 'paid_amount'} for item in page['items'])
+
+    def test_unknown_sort_rejected(self, client, seeded):
+        """Sorting by a non-whitelisted field is a 400"""
+        response = client.get('/api/deliveries?sort=notes')
+        assert response.status_code == 400
+        assert 'Sortable fields' in response.get_json()['error']
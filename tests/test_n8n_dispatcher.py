@@ -0,0 +1,330 @@
+"""
+Tests for the n8n dispatch outbox
+Uploads commit an outbox row instead of calling n8n inline; the dispatcher
+delivers it with retries, backoff and coalescing
+"""
+import io
+import pytest
+import requests
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.delivery import Delivery
+from models.file import File
+from models.n8n_dispatch import N8nDispatch
+from services.n8n_dispatcher import N8nDispatcher
+
+API_KEY = 'test-dispatch-key'
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeSession:
+    """Stands in for the pooled requests.Session and records every POST"""
+
+    def __init__(self, outcomes=None):
+        self.outcomes = list(outcomes or [])
+        self.calls = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.calls.append({'url': url, 'json': json})
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+
+@pytest.fixture
+def app(app, monkeypatch, tmp_path):
+    """Test application with this module's settings"""
+    app.config['N8N_API_KEY'] = API_KEY
+    app.config['N8N_DISPATCH_MAX_ATTEMPTS'] = 3
+    monkeypatch.setattr('routes.uploads.UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(N8nDispatcher, '_stats', {'sent': 0, 'failed': 0, 'retried': 0, 'coalesced': 0,
+                                                  'last_error': None})
+    monkeypatch.setattr(N8nDispatcher, '_latencies', [])
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+@pytest.fixture
+def http(monkeypatch):
+    """Fake HTTP session used by the dispatcher"""
+    session = FakeSession()
+    monkeypatch.setattr(N8nDispatcher, '_http', session)
+    return session
+
+
+@pytest.fixture
+def delivery(app):
+    """A delivery to attach documents to"""
+    material = Material(material_type='Cables & Wires', description='Power cables')
+    db.session.add(material)
+    db.session.flush()
+    po = PurchaseOrder(material_id=material.id, po_ref='PO-DISPATCH', supplier_name='Alpha', total_amount=1000)
+    db.session.add(po)
+    db.session.flush()
+    delivery = Delivery(po_id=po.id, delivery_status='Pending')
+    db.session.add(delivery)
+    db.session.commit()
+    return delivery.id
+
+
+def make_due(dispatch_id):
+    """Move a dispatch's next attempt into the past"""
+    dispatch = db.session.get(N8nDispatch, dispatch_id)
+    dispatch.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+class TestUploadEnqueues:
+    """Uploads return once the file and the outbox row are committed"""
+
+    def test_upload_queues_without_calling_n8n(self, client, app, http, delivery):
+        """No HTTP call happens inside the request"""
+        response = client.post(
+            f'/api/deliveries/{delivery}/upload-document',
+            data={'file': (io.BytesIO(b'%PDF-1.4 test'), 'note.pdf')},
+            content_type='multipart/form-data'
+        )
+
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['n8n_triggered'] is True
+        assert http.calls == []
+
+        dispatch = db.session.get(N8nDispatch, data['dispatch_id'])
+        assert dispatch.status == 'pending'
+        assert dispatch.webhook == 'extract-document'
+        assert dispatch.payload['file_id'] == data['file_id']
+        assert dispatch.payload['delivery_id'] == delivery
+        assert dispatch.payload['po_ref'] == 'PO-DISPATCH'
+
+    def test_failed_enqueue_leaves_no_file(self, client, app, http, delivery, monkeypatch):
+        """The File and its outbox row are committed together or not at all"""
+        def failing_enqueue(*args, **kwargs):
+            raise RuntimeError('outbox unavailable')
+        monkeypatch.setattr(N8nDispatcher, 'enqueue', failing_enqueue)
+
+        response = client.post(
+            f'/api/deliveries/{delivery}/upload-document',
+            data={'file': (io.BytesIO(b'%PDF-1.4 test'), 'note.pdf')},
+            content_type='multipart/form-data'
+        )
+
+        assert response.status_code == 500
+        db.session.remove()
+        assert File.query.count() == 0
+        assert N8nDispatch.query.count() == 0
+        assert db.session.get(Delivery, delivery).delivery_note_path is None
+
+
+class TestDelivery:
+    """Sending, retrying and giving up"""
+
+    def test_process_due_sends(self, app, http):
+        """A 2xx response marks the row sent"""
+        dispatch = N8nDispatcher.enqueue('extract-document', {'file_id': 1})
+        db.session.commit()
+
+        assert N8nDispatcher.process_due() == 1
+
+        assert http.calls[0]['url'].endswith('/webhook/extract-document')
+        assert http.calls[0]['json'] == {'file_id': 1}
+        dispatch = db.session.get(N8nDispatch, dispatch.id)
+        assert dispatch.status == 'sent'
+        assert dispatch.attempts == 1
+        assert dispatch.sent_at is not None
+        assert N8nDispatcher.process_due() == 0
+
+    def test_failure_backs_off_then_fails(self, app, http):
+        """Errors reschedule with growing delays until max attempts"""
+        http.outcomes = [503, requests.ConnectionError('refused'), 500]
+        dispatch = N8nDispatcher.enqueue('extract-document', {'file_id': 2})
+        db.session.commit()
+        dispatch_id = dispatch.id
+
+        N8nDispatcher.process_due()
+        dispatch = db.session.get(N8nDispatch, dispatch_id)
+        assert dispatch.status == 'pending'
+        assert dispatch.last_status_code == 503
+        assert dispatch.next_attempt_at > datetime.utcnow()
+
+        # Not due yet: nothing is sent
+        assert N8nDispatcher.process_due() == 0
+
+        make_due(dispatch_id)
+        N8nDispatcher.process_due()
+        dispatch = db.session.get(N8nDispatch, dispatch_id)
+        assert dispatch.status == 'pending'
+        assert 'refused' in dispatch.last_error
+
+        make_due(dispatch_id)
+        N8nDispatcher.process_due()
+        dispatch = db.session.get(N8nDispatch, dispatch_id)
+        assert dispatch.status == 'failed'
+        assert dispatch.attempts == 3
+        assert len(http.calls) == 3
+
+    def test_backoff_grows(self):
+        """Exponential with jitter, capped"""
+        assert 4 <= N8nDispatcher.backoff(1) <= 6
+        assert 16 <= N8nDispatcher.backoff(3) <= 24
+        assert N8nDispatcher.backoff(30) <= N8nDispatcher.BACKOFF_MAX * 1.2
+
+    def test_stale_claim_is_retried(self, app, http):
+        """Rows left in 'sending' by a crashed worker are picked up again"""
+        dispatch = N8nDispatch(webhook='extract-document', payload={'file_id': 3}, status='sending',
+                               claimed_at=datetime.utcnow() - timedelta(seconds=N8nDispatcher.CLAIM_TIMEOUT + 1))
+        db.session.add(dispatch)
+        db.session.commit()
+
+        assert N8nDispatcher.process_due() == 1
+        assert db.session.get(N8nDispatch, dispatch.id).status == 'sent'
+
+
+class TestCoalescing:
+    """Repeated enqueues for the same key become one call"""
+
+    def test_same_key_is_merged(self, app, http):
+        """Only the latest payload is sent"""
+        first = N8nDispatcher.enqueue('extract-document', {'file_id': 4, 'v': 1}, dedupe_key='file:4')
+        db.session.commit()
+        second = N8nDispatcher.enqueue('extract-document', {'file_id': 4, 'v': 2}, dedupe_key='file:4')
+        db.session.commit()
+
+        assert first.id == second.id
+        assert second.coalesced_count == 1
+        N8nDispatcher.process_due()
+        assert http.calls == [{'url': http.calls[0]['url'], 'json': {'file_id': 4, 'v': 2}}]
+
+    def test_repeated_upload_is_merged(self, client, app, http, delivery):
+        """The same document uploaded twice for one delivery is extracted once, for both files"""
+        def upload(content):
+            response = client.post(
+                f'/api/deliveries/{delivery}/upload-document',
+                data={'file': (io.BytesIO(content), 'note.pdf')},
+                content_type='multipart/form-data'
+            )
+            return response.get_json()
+
+        first = upload(b'%PDF-1.4 same note')
+        second = upload(b'%PDF-1.4 same note')
+        other = upload(b'%PDF-1.4 another note')
+
+        assert second['dispatch_id'] == first['dispatch_id']
+        assert other['dispatch_id'] != first['dispatch_id']
+        dispatch = db.session.get(N8nDispatch, first['dispatch_id'])
+        assert dispatch.coalesced_count == 1
+        assert dispatch.payload['file_id'] == second['file_id']
+        assert dispatch.payload['file_ids'] == [first['file_id'], second['file_id']]
+
+        N8nDispatcher.process_due()
+        sent = {call['json']['file_id']: call['json']['file_ids'] for call in http.calls}
+        assert sent == {second['file_id']: [first['file_id'], second['file_id']],
+                        other['file_id']: [other['file_id']]}
+
+    def test_merged_result_reaches_every_file(self, client, app, http, delivery):
+        """The callback for a merged request completes all of its files"""
+        def upload():
+            response = client.post(
+                f'/api/deliveries/{delivery}/upload-document',
+                data={'file': (io.BytesIO(b'%PDF-1.4 same note'), 'note.pdf')},
+                content_type='multipart/form-data'
+            )
+            return response.get_json()['file_id']
+
+        file_ids = [upload(), upload()]
+        N8nDispatcher.process_due()
+        payload = http.calls[0]['json']
+
+        response = client.post('/api/n8n/delivery-extraction', headers={'X-API-Key': API_KEY}, json={
+            'delivery_id': delivery, 'file_id': payload['file_id'], 'file_ids': payload['file_ids'],
+            'extraction_status': 'completed', 'extraction_confidence': 95,
+            'extracted_data': {'dn_number': 'DN-1'}
+        })
+
+        assert response.status_code == 200
+        db.session.expire_all()
+        files = [db.session.get(File, file_id) for file_id in file_ids]
+        assert [f.processing_status for f in files] == ['completed', 'completed']
+        assert [f.extracted_data for f in files] == [{'dn_number': 'DN-1'}] * 2
+
+    def test_one_pending_row_per_key(self, app):
+        """The database rejects a second pending row for the same key"""
+        N8nDispatcher.enqueue('extract-document', {'file_id': 9}, dedupe_key='file:9')
+        db.session.commit()
+
+        db.session.add(N8nDispatch(webhook='extract-document', payload={'file_id': 9}, dedupe_key='file:9'))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_concurrent_insert_is_merged(self, app, monkeypatch):
+        """A row inserted by another request after the pending check is merged into"""
+        first = N8nDispatcher.enqueue('extract-document', {'file_id': 10, 'v': 1}, dedupe_key='file:10')
+        db.session.commit()
+
+        merge_pending = N8nDispatcher._merge_pending
+        checks = []
+
+        def missed_first_check(*args):
+            checks.append(args)
+            return None if len(checks) == 1 else merge_pending(*args)
+        monkeypatch.setattr(N8nDispatcher, '_merge_pending', missed_first_check)
+
+        second = N8nDispatcher.enqueue('extract-document', {'file_id': 10, 'v': 2}, dedupe_key='file:10')
+        db.session.commit()
+
+        assert len(checks) == 2
+        assert second.id == first.id
+        assert second.payload == {'file_id': 10, 'v': 2}
+        assert N8nDispatch.query.count() == 1
+
+    def test_sent_rows_are_not_reused(self, app, http):
+        """A new enqueue after delivery is a new call"""
+        N8nDispatcher.enqueue('extract-document', {'file_id': 5}, dedupe_key='file:5')
+        db.session.commit()
+        N8nDispatcher.process_due()
+
+        again = N8nDispatcher.enqueue('extract-document', {'file_id': 5}, dedupe_key='file:5')
+        db.session.commit()
+        assert again.status == 'pending'
+        assert N8nDispatch.query.count() == 2
+
+
+class TestMetrics:
+    """Queue depth and latency"""
+
+    def test_metrics_endpoint(self, client, app, http):
+        """Depth counts unsent rows; latency is recorded per send"""
+        N8nDispatcher.enqueue('extract-document', {'file_id': 6})
+        N8nDispatcher.enqueue('extract-document', {'file_id': 7})
+        db.session.commit()
+        N8nDispatcher.process_due()
+        N8nDispatcher.enqueue('extract-document', {'file_id': 8})
+        db.session.commit()
+
+        response = client.get('/api/n8n/dispatch-metrics', headers={'X-API-Key': API_KEY})
+
+        assert response.status_code == 200
+        metrics = response.get_json()['metrics']
+        assert metrics['queue_depth'] == 1
+        assert metrics['by_status'] == {'pending': 1, 'sent': 2}
+        assert metrics['oldest_pending_age_seconds'] is not None
+        assert metrics['latency_seconds']['samples'] == 2
+        assert metrics['totals']['sent'] == 2
+
+    def test_metrics_requires_api_key(self, client):
+        """Same auth as the other n8n endpoints"""
+        assert client.get('/api/n8n/dispatch-metrics').status_code == 401
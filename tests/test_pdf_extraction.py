@@ -0,0 +1,222 @@
+"""
+Tests for page-parallel PDF text extraction
+Small PDFs are answered in the request; large ones return a job id
+"""
+import base64
+import os
+import time
+import pytest
+import PyPDF2
+from models import db
+from models.file import File
+from services.pdf_extraction import PdfExtractionService
+
+API_KEY = 'test-extraction-key'
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                          'sample documents', 'sample lpo', 'sample multi page.pdf')
+
+
+@pytest.fixture
+def app(app):
+    """Test application with this module's settings"""
+    app.config['N8N_API_KEY'] = API_KEY
+    app.config['PDF_EXTRACTION_WORKERS'] = 2
+    app.config['PDF_PAGES_PER_TASK'] = 2
+    app.config['PDF_SYNC_MAX_PAGES'] = 4
+    yield app
+    PdfExtractionService.shutdown()
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+def build_pdf(path, pages):
+    """PDF of the given length made by repeating the sample's pages"""
+    reader = PyPDF2.PdfReader(SAMPLE_PDF)
+    writer = PyPDF2.PdfWriter()
+    for i in range(pages):
+        writer.add_page(reader.pages[i % len(reader.pages)])
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return str(path)
+
+
+def sequential_text(path):
+    """Text as the endpoints used to build it, one page after another"""
+    reader = PyPDF2.PdfReader(path)
+    return '\n\n'.join(page.extract_text() or '' for page in reader.pages).strip()
+
+
+def wait_for_job(client, status_url, timeout=60):
+    """Poll the job until it finishes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        data = client.get(status_url, headers={'X-API-Key': API_KEY}).get_json()
+        if data['status'] in ('completed', 'failed'):
+            return data
+        time.sleep(0.1)
+    raise AssertionError('extraction job did not finish')
+
+
+class TestPageOrder:
+    """Parallel ranges come back in page order"""
+
+    def test_pool_matches_sequential(self, app, tmp_path):
+        """Same pages, same order, with one page per task"""
+        path = build_pdf(tmp_path / 'ten.pdf', 10)
+
+        pages = list(PdfExtractionService.iter_pages(path, workers=2, pages_per_task=1))
+
+        reader = PyPDF2.PdfReader(path)
+        assert pages == [page.extract_text() or '' for page in reader.pages]
+
+    def test_inline_when_pool_disabled(self, app, tmp_path):
+        """PDF_EXTRACTION_WORKERS=0 never starts the pool"""
+        path = build_pdf(tmp_path / 'six.pdf', 6)
+
+        text = ''.join(PdfExtractionService.iter_pages(path, workers=0))
+
+        assert PdfExtractionService._pool is None
+        assert text
+
+
+class TestEndpoints:
+    """extract-pdf-text and extract-pdf-from-file"""
+
+    def test_small_pdf_is_synchronous(self, client, tmp_path):
+        """Up to PDF_SYNC_MAX_PAGES pages the text is in the response"""
+        path = build_pdf(tmp_path / 'small.pdf', 3)
+        with open(path, 'rb') as f:
+            file_data = base64.b64encode(f.read()).decode()
+
+        response = client.post('/api/n8n/extract-pdf-text', json={'file_data': file_data, 'file_id': 7},
+                               headers={'X-API-Key': API_KEY})
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['num_pages'] == 3
+        assert data['file_id'] == 7
+        assert data['text'] == sequential_text(path)
+
+    def test_large_pdf_returns_job(self, client, tmp_path):
+        """Larger PDFs are queued and the text is available from the job"""
+        path = build_pdf(tmp_path / 'large.pdf', 12)
+        with open(path, 'rb') as f:
+            file_data = base64.b64encode(f.read()).decode()
+
+        response = client.post('/api/n8n/extract-pdf-text', json={'file_data': file_data},
+                               headers={'X-API-Key': API_KEY})
+
+        assert response.status_code == 202
+        queued = response.get_json()
+        assert queued['num_pages'] == 12
+        assert queued['job_id']
+
+        job = wait_for_job(client, queued['status_url'])
+        assert job['status'] == 'completed'
+        assert job['pages_done'] == 12
+        assert job['text'] == sequential_text(path)
+
+    def test_wait_forces_synchronous(self, client, tmp_path):
+        """wait=true answers large PDFs in the request"""
+        path = build_pdf(tmp_path / 'large.pdf', 9)
+        with open(path, 'rb') as f:
+            file_data = base64.b64encode(f.read()).decode()
+
+        response = client.post('/api/n8n/extract-pdf-text', json={'file_data': file_data, 'wait': True},
+                               headers={'X-API-Key': API_KEY})
+
+        assert response.status_code == 200
+        assert response.get_json()['text'] == sequential_text(path)
+
+    def test_extract_from_stored_file(self, client, app, tmp_path):
+        """Stored files go through the same path and keep the file on disk"""
+        path = build_pdf(tmp_path / 'stored.pdf', 8)
+
+        with app.app_context():
+            # An absolute file_path resolves to itself under the upload folder
+            file = File(filename='stored.pdf', original_filename='stored.pdf', file_path=path,
+                        file_type='pdf', file_size=os.path.getsize(path))
+            db.session.add(file)
+            db.session.commit()
+            file_id = file.id
+
+        response = client.get(f'/api/n8n/extract-pdf-from-file/{file_id}', headers={'X-API-Key': API_KEY})
+        assert response.status_code == 202
+
+        job = wait_for_job(client, response.get_json()['status_url'])
+        assert job['file_id'] == file_id
+        assert job['text'] == sequential_text(path)
+        assert os.path.exists(path)
+
+    def test_raw_pdf_body(self, client, tmp_path):
+        """application/pdf bodies are streamed without base64"""
+        path = build_pdf(tmp_path / 'raw.pdf', 3)
+        with open(path, 'rb') as f:
+            response = client.post('/api/n8n/extract-pdf-text?file_id=5', data=f.read(),
+                                   content_type='application/pdf', headers={'X-API-Key': API_KEY})
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['file_id'] == 5
+        assert data['num_pages'] == 3
+        assert data['text'] == sequential_text(path)
+
+    def test_empty_body(self, client):
+        """An empty PDF is a client error, not a 500"""
+        response = client.post('/api/n8n/extract-pdf-text', data=b'',
+                               content_type='application/pdf', headers={'X-API-Key': API_KEY})
+
+        assert response.status_code == 400
+        assert response.get_json()['message'] == 'PDF file is empty'
+
+    def test_empty_stored_file(self, client, app, tmp_path):
+        """An empty stored file is rejected before a job is queued"""
+        path = tmp_path / 'empty.pdf'
+        path.write_bytes(b'')
+
+        with app.app_context():
+            file = File(filename='empty.pdf', original_filename='empty.pdf', file_path=str(path),
+                        file_type='pdf', file_size=0)
+            db.session.add(file)
+            db.session.commit()
+            file_id = file.id
+
+        response = client.get(f'/api/n8n/extract-pdf-from-file/{file_id}', headers={'X-API-Key': API_KEY})
+        assert response.status_code == 400
+        assert response.get_json()['message'] == 'PDF file is empty'
+
+    def test_multipart_body(self, client, tmp_path):
+        """multipart uploads take options from form fields"""
+        path = build_pdf(tmp_path / 'multipart.pdf', 9)
+        with open(path, 'rb') as f:
+            response = client.post('/api/n8n/extract-pdf-text', headers={'X-API-Key': API_KEY},
+                                   data={'file': (f, 'multipart.pdf'), 'wait': 'true', 'file_id': '6'},
+                                   content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        assert response.get_json()['text'] == sequential_text(path)
+
+    def test_multipart_without_file(self, client):
+        """A multipart body needs a file part"""
+        response = client.post('/api/n8n/extract-pdf-text', headers={'X-API-Key': API_KEY},
+                               data={'wait': 'true'}, content_type='multipart/form-data')
+        assert response.status_code == 400
+
+    def test_spooled_file_removed(self, client, tmp_path, monkeypatch):
+        """The temporary copy is deleted after a synchronous extraction"""
+        monkeypatch.setattr('tempfile.tempdir', str(tmp_path))
+        path = build_pdf(tmp_path / 'raw.pdf', 2)
+        with open(path, 'rb') as f:
+            client.post('/api/n8n/extract-pdf-text', data=f.read(),
+                        content_type='application/pdf', headers={'X-API-Key': API_KEY})
+
+        assert [p.name for p in tmp_path.iterdir()] == ['raw.pdf']
+
+    def test_unknown_job(self, client):
+        """Unknown job ids are 404"""
+        response = client.get('/api/n8n/extract-pdf-jobs/missing', headers={'X-API-Key': API_KEY})
+        assert response.status_code == 404
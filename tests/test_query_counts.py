@@ -0,0 +1,142 @@
+"""
+Query-count tests for the list endpoints
+Serializing related data must not issue one lazy load per row
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from models.delivery import Delivery
+from models.file import File
+from routes.uploads import upload_stats
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+def seed(material_count, pos_per_material, deliveries_per_po, payments_per_po=1):
+    """Materials, POs, deliveries and payments with every relation populated"""
+    now = datetime.utcnow()
+    materials = [Material(material_type=f'Material {m}') for m in range(material_count)]
+    db.session.add_all(materials)
+    db.session.flush()
+
+    pos = [
+        PurchaseOrder(material_id=material.id, po_ref=f'PO-{material.id}-{p}',
+                      supplier_name=f'Supplier {p % 7}', total_amount=1000)
+        for material in materials for p in range(pos_per_material)
+    ]
+    db.session.add_all(pos)
+    db.session.flush()
+
+    for po in pos:
+        db.session.add_all(
+            Delivery(po_id=po.id, delivery_status='Pending',
+                     expected_delivery_date=now + timedelta(days=d))
+            for d in range(deliveries_per_po)
+        )
+        db.session.add_all(
+            Payment(po_id=po.id, total_amount=1000, paid_amount=100)
+            for _ in range(payments_per_po)
+        )
+        db.session.add(File(filename=f'f-{po.id}.pdf', original_filename='f.pdf', file_path='x',
+                            file_type='po', file_size=1, purchase_order_id=po.id))
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def count_queries(client, url):
+    """Response JSON and the number of SELECTs the request issued"""
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_execute)
+
+    assert response.status_code == 200
+    return response.get_json(), len(statements)
+
+
+class TestListQueryCounts:
+    """Each list endpoint costs a constant number of queries"""
+
+    @pytest.mark.parametrize('url', [
+        '/api/materials',
+        '/api/purchase_orders',
+        '/api/payments',
+        '/api/deliveries',
+        '/api/files',
+        '/api/purchase_orders?limit=20',
+        '/api/deliveries?limit=20',
+        '/api/deliveries/pending',
+        '/api/deliveries/delayed'
+    ])
+    def test_constant_queries(self, app, client, url):
+        """Ten times the rows, same number of queries"""
+        with app.app_context():
+            seed(material_count=2, pos_per_material=2, deliveries_per_po=2)
+            _, small = count_queries(client, url)
+
+            seed(material_count=20, pos_per_material=2, deliveries_per_po=2)
+            _, large = count_queries(client, url)
+
+        assert large == small <= 3
+
+    def test_deliveries_5000_rows(self, app, client):
+        """/api/deliveries with 5,000 rows costs at most three queries"""
+        with app.app_context():
+            seed(material_count=50, pos_per_material=10, deliveries_per_po=10, payments_per_po=0)
+            data, queries = count_queries(client, '/api/deliveries')
+
+        assert len(data) == 5000
+        assert queries <= 3
+        assert all(d['purchase_order']['material']['material_type'] for d in data)
+
+    def test_purchase_order_detail(self, app, client):
+        """PO detail with its payments and deliveries is a constant number of queries"""
+        with app.app_context():
+            seed(material_count=1, pos_per_material=1, deliveries_per_po=30, payments_per_po=30)
+            po_id = PurchaseOrder.query.first().id
+            db.session.expunge_all()
+            data, queries = count_queries(client, f'/api/purchase_orders/{po_id}')
+
+        assert len(data['deliveries']) == 30 and len(data['payments']) == 30
+        assert queries <= 3
+
+
+class TestUploadsPage:
+    """Upload statistics come from one grouped query; rows load through /api/files"""
+
+    def test_stats_single_query(self, app, client):
+        """The page costs one SELECT however many files exist"""
+        with app.app_context():
+            db.session.add_all(
+                File(filename=f'u-{i}.pdf', original_filename='u.pdf', file_path='x', file_type='other',
+                     file_size=1024 * 1024, processing_status=['uploaded', 'completed', 'failed', 'processing'][i % 4])
+                for i in range(400)
+            )
+            db.session.commit()
+            _, queries = count_queries(client, '/uploads')
+
+            stats = upload_stats()
+
+        assert queries == 1
+        assert stats == {'total_files': 400, 'pending_processing': 100, 'completed': 100,
+                         'failed': 100, 'total_size_mb': 400}
+
+    def test_empty_store(self, app, client):
+        with app.app_context():
+            assert upload_stats()['total_files'] == 0
+            assert upload_stats()['total_size_mb'] == 0
@@ -0,0 +1,183 @@
+"""
+Tests for the pooled SMB connection manager
+A fake SMBConnection stands in for the file server and counts handshakes
+"""
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from smb.base import NotConnectedError
+import services.smb_service as smb_module
+from services.smb_service import SMBService, SMBConnectionPool
+
+
+class FakeServer:
+    """Folder tree shared by every fake connection"""
+
+    def __init__(self):
+        self.tree = {'PKP_Projects': ['Villa_Projects', 'Towers'], 'PKP_Projects/Villa_Projects': ['Villa_1']}
+        self.connections = []
+        self.fail_next_list = 0
+        self.list_delay = 0
+
+
+class FakeSMBConnection:
+    """SMBConnection double: one 'handshake' per connect()"""
+
+    server = None
+
+    def __init__(self, **kwargs):
+        self.closed = False
+        self.alive = True
+        self.busy = False
+        FakeSMBConnection.server.connections.append(self)
+
+    def connect(self, ip, port):
+        return True
+
+    def listPath(self, share, path, timeout=30):
+        assert not self.busy, 'connection used by two threads at once'
+        self.busy = True
+        try:
+            time.sleep(self.server.list_delay)
+            if self.server.fail_next_list:
+                self.server.fail_next_list -= 1
+                self.alive = False
+                raise NotConnectedError('socket closed')
+            if path not in self.server.tree:
+                raise KeyError(path)
+            return [SimpleNamespace(filename=name, isDirectory=True, file_size=0, last_write_time=0)
+                    for name in ['.', '..'] + self.server.tree[path]]
+        finally:
+            self.busy = False
+
+    def echo(self, data, timeout=10):
+        if not self.alive:
+            raise NotConnectedError('no echo')
+        return data
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(FakeSMBConnection, 'server', server)
+    monkeypatch.setattr(smb_module, 'SMBConnection', FakeSMBConnection)
+    monkeypatch.setattr(smb_module, 'SMB_AVAILABLE', True)
+    return server
+
+
+@pytest.fixture
+def service(server, monkeypatch):
+    service = SMBService()
+    service.listing_ttl = 0  # Every call reaches the server
+    service.listing_max_age = 0
+    monkeypatch.setattr('routes.smb.smb_service', service)
+    return service
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestReuse:
+    """One handshake serves many requests"""
+
+    def test_requests_share_connection(self, client, server, service):
+        for _ in range(5):
+            response = client.get('/api/smb/folders')
+            assert response.get_json()['folders'] == ['Towers', 'Villa_Projects']
+
+        assert len(server.connections) == 1
+        assert service.pool.status()['reused'] == 4
+        assert not server.connections[0].closed
+
+    def test_threads_get_their_own_connection(self, server, service):
+        """Concurrent callers never share a connection and never exceed max_size"""
+        service.pool.max_size = 3
+        server.list_delay = 0.02
+        errors = []
+
+        def work():
+            try:
+                for _ in range(5):
+                    service.list_folders('')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert 1 < len(server.connections) <= 3
+        assert service.pool.status()['in_use'] == 0
+
+
+class TestHealth:
+    """Dead, idle and failing connections are replaced"""
+
+    def test_failed_health_check_reconnects(self, server, service):
+        service.pool.health_check_interval = 0
+        service.list_folders('')
+        server.connections[0].alive = False
+
+        assert service.list_folders('Villa_Projects') == ['Villa_1']
+
+        assert len(server.connections) == 2
+        assert server.connections[0].closed
+        assert service.pool.status()['failed_health_checks'] == 1
+
+    def test_idle_timeout_closes(self, server, service):
+        service.list_folders('')
+        service.pool.idle_timeout = 0
+
+        service.list_folders('')
+
+        assert server.connections[0].closed
+        assert len(server.connections) == 2
+        assert service.pool.status()['open'] == 1
+
+    def test_reconnect_on_connection_error(self, server, service):
+        """A dropped socket mid-operation is retried on a fresh connection"""
+        service.list_folders('')
+        server.fail_next_list = 1
+
+        assert service.list_folders('') == ['Towers', 'Villa_Projects']
+        assert server.connections[0].closed
+        assert service.pool.status()['discarded'] == 1
+
+    def test_operation_error_keeps_connection(self, server, service):
+        """A missing folder is not a connection problem"""
+        with pytest.raises(Exception, match='Failed to list folders'):
+            service.list_folders('Missing')
+
+        service.list_folders('')
+        assert len(server.connections) == 1
+
+
+class TestLimits:
+    def test_acquire_times_out_when_exhausted(self, server):
+        pool = SMBConnectionPool(lambda: FakeSMBConnection(), max_size=1, acquire_timeout=0.05)
+        held = pool.acquire()
+
+        with pytest.raises(Exception, match='No SMB connection available'):
+            pool.acquire()
+
+        pool.release(held)
+        assert pool.acquire() is held
+
+    def test_failed_connect_frees_slot(self, server):
+        def refuse():
+            raise Exception('SMB connection failed: refused')
+
+        pool = SMBConnectionPool(refuse, max_size=1, acquire_timeout=0.05)
+        for _ in range(2):
+            with pytest.raises(Exception, match='refused'):
+                pool.acquire()
+        assert pool.status()['open'] == 0
@@ -0,0 +1,339 @@
+"""
+Tests for the SMB service: listing cache, folder crawler and streaming
+transfers (the connection pool is covered in test_smb_pool.py)
+A fake SMBConnection stands in for the file server and counts listings
+"""
+import io
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from smb.base import NotConnectedError
+import services.smb_service as smb_module
+from services.smb_service import SMBService
+
+
+class FakeServer:
+    """Folder tree shared by every fake connection"""
+
+    def __init__(self):
+        self.tree = {'PKP_Projects': ['Villa_Projects', 'Towers'], 'PKP_Projects/Villa_Projects': ['Villa_1'],
+                     'PKP_Projects/Towers': [], 'PKP_Projects/Villa_Projects/Villa_1': []}
+        self.files = {}
+        self.mtimes = {}
+        self.connections = []
+        self.fail_next_list = 0
+        self.fail_next_store = 0
+        self.fail_next_retrieve = 0
+        self.retrieves = []
+        self.list_delay = 0
+        self.listed = []
+        self.attribute_lookups = 0
+        self.active_lists = 0
+        self.peak_lists = 0
+        self.lock = threading.Lock()
+
+    def touch(self, path):
+        """Changing a folder's contents bumps its last_write_time"""
+        self.mtimes[path] = self.mtimes.get(path, 0) + 1
+
+
+class FakeSMBConnection:
+    """SMBConnection double: one 'handshake' per connect()"""
+
+    server = None
+
+    def __init__(self, **kwargs):
+        self.closed = False
+        self.alive = True
+        self.busy = False
+        FakeSMBConnection.server.connections.append(self)
+
+    def connect(self, ip, port):
+        return True
+
+    def listPath(self, share, path, timeout=30):
+        assert not self.busy, 'connection used by two threads at once'
+        self.busy = True
+        server = self.server
+        with server.lock:
+            server.listed.append(path)
+            server.active_lists += 1
+            server.peak_lists = max(server.peak_lists, server.active_lists)
+        try:
+            time.sleep(server.list_delay)
+            if server.fail_next_list:
+                server.fail_next_list -= 1
+                self.alive = False
+                raise NotConnectedError('socket closed')
+            if path not in server.tree:
+                raise KeyError(path)
+            mtime = server.mtimes.get(path, 0)
+            entries = [SimpleNamespace(filename=name, isDirectory=True, file_size=0, last_write_time=mtime)
+                       for name in ['.', '..'] + server.tree[path]]
+            entries += [SimpleNamespace(filename=name, isDirectory=False, file_size=len(data), last_write_time=mtime)
+                        for name, data in server.files.get(path, {}).items()]
+            return entries
+        finally:
+            with server.lock:
+                server.active_lists -= 1
+            self.busy = False
+
+    def getAttributes(self, share, path, timeout=30):
+        self.server.attribute_lookups += 1
+        folder, _, name = path.rpartition('/')
+        if name in self.server.files.get(folder, {}):
+            return SimpleNamespace(filename=name, isDirectory=False,
+                                   file_size=len(self.server.files[folder][name]), last_write_time=0)
+        if path not in self.server.tree:
+            raise KeyError(path)
+        return SimpleNamespace(filename=name, isDirectory=True, file_size=0,
+                               last_write_time=self.server.mtimes.get(path, 0))
+
+    def storeFile(self, share, path, file_obj, timeout=30):
+        folder, name = path.rsplit('/', 1)
+        data = file_obj.read(3)
+        if self.server.fail_next_store:
+            self.server.fail_next_store -= 1
+            raise NotConnectedError('socket closed')
+        data += file_obj.read()
+        self.server.files.setdefault(folder, {})[name] = data
+        self.server.touch(folder)
+        return len(data)
+
+    def retrieveFileFromOffset(self, share, path, file_obj, offset=0, max_length=-1, timeout=30):
+        folder, name = path.rsplit('/', 1)
+        data = self.server.files[folder][name]
+        end = len(data) if max_length < 0 else offset + max_length
+        self.server.retrieves.append(offset)
+        file_obj.write(data[offset:offset + 1])
+        if self.server.fail_next_retrieve and offset > 0:
+            self.server.fail_next_retrieve -= 1
+            raise NotConnectedError('socket closed')
+        file_obj.write(data[offset + 1:end])
+        return None, len(data[offset:end])
+
+    def deleteFiles(self, share, path, timeout=30):
+        folder, name = path.rsplit('/', 1)
+        del self.server.files[folder][name]
+        self.server.touch(folder)
+
+    def createDirectory(self, share, path, timeout=30):
+        folder, name = path.rsplit('/', 1)
+        self.server.tree[folder].append(name)
+        self.server.tree[path] = []
+        self.server.touch(folder)
+
+    def echo(self, data, timeout=10):
+        if not self.alive:
+            raise NotConnectedError('no echo')
+        return data
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(FakeSMBConnection, 'server', server)
+    monkeypatch.setattr(smb_module, 'SMBConnection', FakeSMBConnection)
+    monkeypatch.setattr(smb_module, 'SMB_AVAILABLE', True)
+    return server
+
+
+@pytest.fixture
+def service(server, monkeypatch):
+    service = SMBService()
+    monkeypatch.setattr('routes.smb.smb_service', service)
+    return service
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestListingCache:
+    """Listings are reused until they expire or we change the folder"""
+
+    def test_repeat_listing_is_cached(self, client, server, service):
+        for _ in range(3):
+            response = client.get('/api/smb/browse')
+            assert response.get_json()['folders'] == ['Towers', 'Villa_Projects']
+
+        assert server.listed == ['PKP_Projects']
+        assert service.cache_stats['hits'] == 5
+
+    def test_refresh_bypasses_cache(self, client, server, service):
+        client.get('/api/smb/folders')
+        client.get('/api/smb/folders?refresh=true')
+
+        assert server.listed == ['PKP_Projects'] * 2
+
+    def test_unchanged_folder_is_revalidated(self, server, service):
+        """After the TTL an unchanged last_write_time costs one attribute lookup, not a listing"""
+        service.list_folders('')
+        service.listing_ttl = 0
+
+        assert service.list_folders('') == ['Towers', 'Villa_Projects']
+
+        assert server.listed == ['PKP_Projects']
+        assert server.attribute_lookups == 1
+        assert service.cache_stats['revalidated'] == 1
+
+    def test_changed_folder_is_listed_again(self, server, service):
+        service.list_folders('')
+        service.listing_ttl = 0
+        server.tree['PKP_Projects'].append('Offices')
+        server.touch('PKP_Projects')
+
+        assert 'Offices' in service.list_folders('')
+        assert server.listed == ['PKP_Projects'] * 2
+
+    def test_our_changes_invalidate(self, server, service, tmp_path):
+        source = tmp_path / 'lpo.pdf'
+        source.write_bytes(b'%PDF-1.4 lpo')
+        assert service.list_files('Towers') == []
+
+        service.upload_file(str(source), 'Towers', 'lpo.pdf')
+        assert [f['name'] for f in service.list_files('Towers')] == ['lpo.pdf']
+
+        service.delete_file('Towers', 'lpo.pdf')
+        assert service.list_files('Towers') == []
+
+        service.create_folder('Towers', 'Tower_A')
+        assert service.list_folders('Towers') == ['Tower_A']
+
+        assert service.cache_stats['invalidated'] == 3
+
+
+class TestCrawler:
+    """get_folder_structure lists folders concurrently"""
+
+    def build_tree(self, server, width=4, depth=3):
+        server.tree = {}
+        level = ['PKP_Projects']
+        for _ in range(depth):
+            next_level = []
+            for folder in level:
+                server.tree[folder] = [f'F{i}' for i in range(width)]
+                next_level += [f'{folder}/F{i}' for i in range(width)]
+            level = next_level
+        for folder in level:
+            server.tree[folder] = []
+
+    def test_structure_matches_serial_walk(self, client, server, service):
+        response = client.get('/api/smb/structure')
+
+        assert response.get_json()['structure'] == {
+            'Towers': {'path': 'Towers', 'subfolders': {}},
+            'Villa_Projects': {'path': 'Villa_Projects', 'subfolders': {
+                'Villa_1': {'path': 'Villa_Projects/Villa_1', 'subfolders': {}}
+            }}
+        }
+
+    def test_lists_in_parallel(self, server, service):
+        self.build_tree(server)
+        server.list_delay = 0.02
+        service.crawl_workers = 4
+        service.pool.max_size = 4
+
+        structure = service.get_folder_structure(max_depth=3)
+
+        assert len(structure) == 4
+        assert len(structure['F3']['subfolders']['F2']['subfolders']) == 4
+        assert len(server.listed) == 1 + 4 + 16
+        assert 1 < server.peak_lists <= 4
+        assert len(server.connections) <= 4
+
+    def test_second_crawl_is_cached(self, server, service):
+        self.build_tree(server)
+        first = service.get_folder_structure(max_depth=3)
+        listed = len(server.listed)
+
+        assert service.get_folder_structure(max_depth=3) == first
+        assert len(server.listed) == listed
+
+    def test_unreadable_folder_is_empty(self, server, service):
+        del server.tree['PKP_Projects/Villa_Projects']
+
+        structure = service.get_folder_structure()
+
+        assert structure['Villa_Projects']['subfolders'] == {}
+        assert 'Towers' in structure
+
+
+class TestStreaming:
+    """Downloads and uploads go straight between the client and the share"""
+
+    CONTENT = b'%PDF-1.4 drawing set' * 3
+
+    @pytest.fixture(autouse=True)
+    def no_temp_files(self, monkeypatch):
+        def refuse(*args, **kwargs):
+            raise AssertionError('temporary file created')
+        monkeypatch.setattr(tempfile, 'NamedTemporaryFile', refuse)
+
+    def test_download_is_chunked(self, client, server, service):
+        server.files['PKP_Projects/Towers'] = {'set.pdf': self.CONTENT}
+        service.stream_chunk_size = 16
+
+        response = client.get('/api/smb/download?path=Towers&filename=set.pdf')
+
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.data == self.CONTENT
+        assert response.content_length == len(self.CONTENT)
+        assert response.mimetype == 'application/pdf'
+        assert response.headers['Content-Disposition'] == 'attachment; filename="set.pdf"'
+        assert server.retrieves == list(range(0, len(self.CONTENT), 16))
+
+    def test_download_resumes_after_dropped_connection(self, server, service):
+        server.files['PKP_Projects/Towers'] = {'set.pdf': self.CONTENT}
+        server.fail_next_retrieve = 1
+
+        size, chunks = service.stream_file('Towers', 'set.pdf', chunk_size=16)
+
+        assert b''.join(chunks) == self.CONTENT
+        assert server.retrieves[:3] == [0, 16, 16]
+
+    def test_missing_file_fails_before_streaming(self, client, server, service):
+        response = client.get('/api/smb/download?path=Towers&filename=missing.pdf')
+
+        assert response.status_code == 500
+        assert response.get_json()['success'] is False
+        assert server.retrieves == []
+
+    def test_raw_body_upload(self, client, server, service):
+        response = client.post('/api/smb/upload?path=Towers&filename=set.pdf', data=self.CONTENT,
+                               content_type='application/octet-stream')
+
+        assert response.status_code == 200
+        assert response.get_json()['bytes_uploaded'] == len(self.CONTENT)
+        assert server.files['PKP_Projects/Towers']['set.pdf'] == self.CONTENT
+
+    def test_raw_body_upload_requires_filename(self, client, server, service):
+        response = client.post('/api/smb/upload?path=Towers', data=self.CONTENT,
+                               content_type='application/octet-stream')
+        assert response.status_code == 400
+
+    def test_request_stream_is_not_replayed(self, client, server, service):
+        """A dropped connection fails the upload rather than storing a truncated body"""
+        server.fail_next_store = 1
+
+        response = client.post('/api/smb/upload?path=Towers&filename=set.pdf', data=self.CONTENT,
+                               content_type='application/octet-stream')
+
+        assert response.status_code == 500
+        assert 'set.pdf' not in server.files.get('PKP_Projects/Towers', {})
+
+    def test_form_upload_is_retried_from_start(self, client, server, service):
+        server.fail_next_store = 1
+
+        response = client.post('/api/smb/upload', data={'file': (io.BytesIO(self.CONTENT), 'set.pdf'),
+                                                        'path': 'Towers'}, content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        assert server.files['PKP_Projects/Towers']['set.pdf'] == self.CONTENT
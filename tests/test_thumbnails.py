@@ -0,0 +1,134 @@
+"""
+Tests for document thumbnails and previews
+First pages of PDFs and images are rendered next to their blob, keyed by
+content hash, and served with long-lived cache headers
+"""
+import io
+import os
+import pytest
+from PIL import Image
+from services.content_store import ContentStore
+from services.thumbnails import ThumbnailService
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                          'sample documents', 'sample lpo', 'sample single page.pdf')
+
+
+@pytest.fixture
+def app(app, monkeypatch, tmp_path):
+    """Test application with this module's settings"""
+    monkeypatch.setattr('routes.uploads.UPLOAD_FOLDER', str(tmp_path))
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+def pdf_bytes():
+    with open(SAMPLE_PDF, 'rb') as f:
+        return f.read()
+
+
+def png_bytes(width=1600, height=900):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def upload(client, content, name):
+    response = client.post('/api/upload', data={'file': (io.BytesIO(content), name)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 201
+    return response.get_json()['file']
+
+
+class TestRendering:
+    """Rendering straight from the service"""
+
+    def test_pdf_first_page(self, tmp_path):
+        source = tmp_path / 'doc.pdf'
+        source.write_bytes(pdf_bytes())
+
+        assert ThumbnailService.generate(str(source), 'abc') == 4
+
+        with Image.open(ThumbnailService.path_for(str(source), 'abc', 'thumb', 'webp')) as thumb:
+            assert max(thumb.size) == ThumbnailService.SIZES['thumb']
+        with Image.open(ThumbnailService.path_for(str(source), 'abc', 'preview', 'png')) as preview:
+            assert max(preview.size) <= ThumbnailService.SIZES['preview']
+        # Nothing left to render the second time
+        assert ThumbnailService.generate(str(source), 'abc') == 0
+
+    def test_image_keeps_aspect_ratio(self, tmp_path):
+        source = tmp_path / 'photo.png'
+        source.write_bytes(png_bytes(1600, 900))
+
+        ThumbnailService.generate(str(source), 'def')
+
+        with Image.open(ThumbnailService.path_for(str(source), 'def', 'thumb', 'png')) as thumb:
+            assert thumb.size[0] == 200
+            assert abs(thumb.size[1] - 200 * 900 / 1600) <= 1
+
+    def test_background_submit(self, tmp_path):
+        """Rendering runs on the runner thread and a queued blob is not queued twice"""
+        source = tmp_path / 'doc.pdf'
+        source.write_bytes(pdf_bytes())
+
+        future = ThumbnailService.submit(str(source), 'bg')
+
+        assert future.result(timeout=30) == 4
+        assert os.path.exists(ThumbnailService.path_for(str(source), 'bg', 'preview', 'webp'))
+        assert ThumbnailService.submit(str(tmp_path / 'sheet.xlsx'), 'xlsx') is None
+
+
+class TestEndpoint:
+    """GET /api/files/<id>/thumbnail"""
+
+    def test_served_with_long_cache(self, client):
+        file = upload(client, pdf_bytes(), 'lpo.pdf')
+        assert file['thumbnail_url'] == f"/api/files/{file['id']}/thumbnail"
+
+        response = client.get(file['thumbnail_url'], headers={'Accept': 'image/webp,*/*'})
+
+        assert response.status_code == 200
+        assert response.mimetype == 'image/webp'
+        assert response.cache_control.max_age == 31536000
+        assert response.cache_control.immutable
+        assert 'Accept' in response.vary
+
+        again = client.get(file['thumbnail_url'], headers={'Accept': 'image/webp,*/*',
+                                                           'If-None-Match': response.headers['ETag']})
+        assert again.status_code == 304
+
+    def test_png_preview(self, client):
+        file = upload(client, png_bytes(), 'site.png')
+
+        response = client.get(f"{file['thumbnail_url']}?size=preview&format=png")
+
+        assert response.status_code == 200
+        assert response.mimetype == 'image/png'
+        with Image.open(io.BytesIO(response.data)) as preview:
+            assert max(preview.size) == ThumbnailService.SIZES['preview']
+
+    def test_unsupported_type(self, client, app):
+        file = upload(client, b'PK\x03\x04 sheet', 'rates.xlsx')
+        assert file['thumbnail_url'] is None
+        assert client.get(f"/api/files/{file['id']}/thumbnail").status_code == 404
+
+    def test_invalid_size(self, client):
+        file = upload(client, pdf_bytes(), 'lpo.pdf')
+        assert client.get(f"{file['thumbnail_url']}?size=huge").status_code == 400
+
+    def test_previews_collected_with_blob(self, client, tmp_path):
+        file = upload(client, pdf_bytes(), 'lpo.pdf')
+        client.get(file['thumbnail_url'])
+        thumb = ThumbnailService.path_for(str(tmp_path / file['file_path']), file['content_hash'], 'thumb', 'png')
+        assert os.path.exists(thumb)
+
+        client.delete(f"/api/files/{file['id']}")
+        ContentStore.collect_garbage(str(tmp_path), set(), grace=0)
+
+        assert not os.path.exists(thumb)
+        assert not os.path.exists(tmp_path / file['file_path'])
@@ -0,0 +1,129 @@
+"""
+Tests for the shared time-bucketing utility
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, literal, func
+from sqlalchemy.dialects import postgresql
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from models.payment import Payment
+from services.time_buckets import TimeBuckets
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+def add_payments(payment_dates, amount=100):
+    """One payment of amount on each date"""
+    material = Material(material_type='Cables & Wires', description='Power cables')
+    db.session.add(material)
+    db.session.flush()
+    po = PurchaseOrder(material_id=material.id, po_ref='PO-BUCKET', supplier_name='Alpha', total_amount=10000)
+    db.session.add(po)
+    db.session.flush()
+    for payment_date in payment_dates:
+        db.session.add(Payment(po_id=po.id, total_amount=amount, paid_amount=amount, payment_date=payment_date))
+    db.session.commit()
+
+
+class TestPeriodKeys:
+    """SQL and Python agree on which period a date falls in"""
+
+    @pytest.mark.parametrize('granularity', TimeBuckets.GRANULARITIES)
+    def test_sqlite_matches_python(self, app, granularity):
+        """Every day of two years, including year and week boundaries"""
+        with app.app_context():
+            start = datetime(2024, 1, 1, 13, 45)
+            for offset in range(0, 731, 3):
+                value = start + timedelta(days=offset)
+                sql_key = db.session.execute(
+                    select(TimeBuckets.period_expression(literal(value), granularity))
+                ).scalar()
+                assert sql_key == TimeBuckets.period_key(value, granularity), value
+
+    def test_postgres_expressions(self):
+        """PostgreSQL keys use to_char / date_trunc"""
+        compiled = {
+            granularity: str(TimeBuckets.period_expression(Payment.payment_date, granularity, 'postgresql')
+                             .compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+            for granularity in TimeBuckets.GRANULARITIES
+        }
+        assert "to_char(payments.payment_date, 'YYYY-MM-DD')" in compiled['day']
+        assert "date_trunc('week', payments.payment_date)" in compiled['week']
+        assert "'YYYY-MM'" in compiled['month']
+        assert '\'YYYY-"Q"Q\'' in compiled['quarter']
+
+    def test_periods_cover_range(self):
+        """Range boundaries fall inside the first and last period"""
+        assert TimeBuckets.periods(datetime(2024, 11, 15), datetime(2025, 3, 2), 'quarter') == ['2024-Q4', '2025-Q1']
+        assert TimeBuckets.periods(datetime(2025, 2, 26), datetime(2025, 3, 12), 'week') == [
+            '2025-02-24', '2025-03-03', '2025-03-10'
+        ]
+        assert TimeBuckets.periods(datetime(2024, 12, 31), datetime(2025, 1, 2), 'day') == [
+            '2024-12-31', '2025-01-01'
+        ]
+
+    def test_unknown_granularity(self):
+        """Only day, week, month and quarter are accepted"""
+        with pytest.raises(ValueError):
+            TimeBuckets.periods(datetime(2025, 1, 1), datetime(2025, 2, 1), 'year')
+
+
+class TestSeries:
+    """Grouped series with empty periods filled"""
+
+    def test_single_query_with_filled_gaps(self, app):
+        """Months without payments are reported as zero"""
+        with app.app_context():
+            add_payments([datetime(2025, 1, 5), datetime(2025, 1, 20), datetime(2025, 4, 2)])
+
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                series = TimeBuckets.series(
+                    Payment.payment_date,
+                    {'total': func.sum(Payment.paid_amount), 'count': func.count(Payment.id)},
+                    start=datetime(2025, 1, 1), end=datetime(2025, 5, 1)
+                )
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert len(statements) == 1
+        assert series == [
+            {'period': '2025-01', 'total': 200, 'count': 2},
+            {'period': '2025-02', 'total': 0, 'count': 0},
+            {'period': '2025-03', 'total': 0, 'count': 0},
+            {'period': '2025-04', 'total': 100, 'count': 1}
+        ]
+
+    def test_open_end_includes_future_rows(self, app):
+        """Without an end the series runs to the latest row"""
+        with app.app_context():
+            future = datetime.utcnow() + timedelta(days=70)
+            add_payments([future])
+
+            series = TimeBuckets.series(
+                Payment.payment_date, {'total': func.sum(Payment.paid_amount)},
+                start=datetime.utcnow() - timedelta(days=1), granularity='month'
+            )
+
+        assert series[-1] == {'period': future.strftime('%Y-%m'), 'total': 100}
+        assert len(series) >= 3
+
+    def test_dashboard_payment_trends(self, client, app):
+        """Dashboard chart has the last six months, oldest first"""
+        with app.app_context():
+            now = datetime.now()
+            add_payments([now, now, now - timedelta(days=400)], amount=250)
+
+        trends = client.get('/api/dashboard/analytics').get_json()['payment_trends']
+
+        assert len(trends['labels']) == 6
+        assert trends['labels'][-1] == now.strftime('%b')
+        assert trends['values'] == [0.0] * 5 + [500.0]
@@ -0,0 +1,134 @@
+"""
+Tests for the compiled validation rules (services/validation_rules.py)
+Rules are data compiled once per record type; every run returns its own
+result, so one agent can validate records from many threads at once
+"""
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytest
+from services.data_processing_agent import DataProcessingAgent
+from services.validation_rules import VALIDATION_RULES, VALIDATORS, compile_validator, parse_date
+
+TODAY = datetime.now().strftime('%Y-%m-%d')
+
+
+@pytest.fixture
+def agent():
+    """Agent without a database: no PO lookups, no amount profiles"""
+    return DataProcessingAgent(None)
+
+
+def random_record(rng):
+    day = (datetime.now() + timedelta(days=rng.randint(-2000, 900))).strftime('%Y-%m-%d')
+    record_type = rng.choice(list(VALIDATION_RULES))
+    data = {
+        'lpo_release': {'material_id': 1, 'supplier_name': 'ABC Trading', 'lpo_number': rng.choice(['LPO-2025-001', 'PO-1']),
+                        'release_date': day, 'expected_delivery_date': rng.choice([TODAY, day]),
+                        'amount': rng.choice([-5, 1000, '2e7', 'abc'])},
+        'invoice': {'payment_date': rng.choice([day, 'bad']), 'invoice_date': day, 'due_date': TODAY,
+                    'total_amount': rng.choice([0, 500]), 'invoice_number': rng.choice(['IN', 'INV-1'])},
+        'submittal': {'material_type': 'Cable', 'approval_status': rng.choice(['Approved', 'Nope']),
+                      'revision_number': rng.choice([-1, 0, 2, 'x'])},
+        'delivery': {'lpo_id': 1, 'delivery_date': day, 'status': rng.choice(['Partial', 'Delivered']),
+                     'delivery_percentage': rng.choice([0, 50, 100])}
+    }[record_type]
+    return record_type, data
+
+
+class TestCompiledRules:
+    """Rule tables and what they report"""
+
+    def test_every_record_type_is_compiled(self):
+        assert VALIDATORS.keys() == VALIDATION_RULES.keys()
+
+    def test_messages_in_rule_order(self, agent):
+        is_valid, errors, warnings = agent._validate('lpo_release', {
+            'lpo_number': 'PO-1', 'release_date': TODAY, 'expected_delivery_date': TODAY,
+            'amount': 'abc', 'contact_email': 'nobody'
+        })
+
+        assert not is_valid
+        assert errors == [
+            '❌ Material Id is required',
+            '❌ Supplier Name is required',
+            '❌ Amount must be a valid number',
+            "❌ Email 'nobody' is not valid"
+        ]
+        assert warnings == [
+            "⚠️ LPO number 'PO-1' doesn't follow standard format (LPO-YYYY-NNN)",
+            '⚠️ Expected delivery is same day as LPO release'
+        ]
+
+    def test_field_alternatives_and_date_order(self, agent):
+        due = (datetime.now() + timedelta(days=120)).strftime('%Y-%m-%d')
+
+        is_valid, errors, warnings = agent._validate('invoice', {
+            'invoice_date': 'not-a-date', 'due_date': due, 'total_amount': 100
+        })
+
+        assert errors == ['❌ Payment Date is required', '❌ Payment Date has invalid date format (use YYYY-MM-DD)']
+        assert warnings == []
+
+        _, errors, warnings = agent._validate('invoice', {
+            'payment_date': TODAY, 'invoice_date': TODAY, 'due_date': due, 'total_amount': 100
+        })
+        assert errors == []
+        assert warnings == ['⚠️ Payment terms are 120 days (longer than typical)']
+
+    def test_unknown_record_type(self, agent):
+        assert agent._validate('quotation', {}) == (False, ['❌ Unknown record type: quotation'], [])
+
+    def test_custom_rule_table(self, agent):
+        validate = compile_validator([
+            {'check': 'required', 'fields': ['quote_ref']},
+            {'check': 'one_of', 'field': 'status', 'values': ['Open', 'Closed']}
+        ])
+
+        result = validate({'status': 'Lost'}, agent)
+
+        assert result.errors == [
+            '❌ Quote Ref is required',
+            "❌ Status 'Lost' is invalid. Must be one of: Open, Closed"
+        ]
+
+    def test_parse_date(self):
+        assert parse_date('2025-03-01') == datetime(2025, 3, 1)
+        for value in ['2025-13-01', 'soon', 20250301]:
+            with pytest.raises(ValueError):
+                parse_date(value)
+
+
+class TestReentrancy:
+    """No per-run state on the agent"""
+
+    def test_results_are_independent(self, agent):
+        first = agent._validate('delivery', {'status': 'Lost'})
+        agent._validate('delivery', {'lpo_id': 1, 'delivery_date': TODAY, 'status': 'Delivered'})
+
+        assert first[1] == [
+            '❌ Lpo Id is required',
+            '❌ Delivery Date is required',
+            "❌ Status 'Lost' is invalid. Must be one of: Pending, Partial, Delivered, Rejected"
+        ]
+
+    def test_concurrent_validation_matches_sequential(self, agent):
+        rng = random.Random(6)
+        records = [random_record(rng) for _ in range(4000)]
+        expected = [agent._validate(record_type, data) for record_type, data in records]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda record: agent._validate(*record), records))
+
+        assert results == expected
+
+    def test_batch_lookups_are_per_thread(self, agent):
+        agent._lookups = 'this thread'
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(agent._lookups))
+        thread.start()
+        thread.join()
+
+        assert seen == [None]
+        assert agent._lookups == 'this thread'
@@ -0,0 +1,69 @@
+"""
+Tests for WriteTracker - shared session listeners for write subscribers
+Each subscriber sees only its models' writes, once per transaction outcome
+"""
+import pytest
+from sqlalchemy import event, update
+from models import db
+from models.material import Material
+from models.purchase_order import PurchaseOrder
+from services.write_tracking import WriteTracker
+
+
+@pytest.fixture
+def calls(app):
+    """Record the callbacks of a subscriber to Material writes"""
+    calls = []
+    WriteTracker.subscribe(
+        'test_materials',
+        (Material,),
+        on_flush=lambda session, objects, deleted: [obj.material_type for obj in objects],
+        on_bulk=lambda session, model: calls.append(('bulk', model)),
+        on_commit=lambda session, writes: calls.append(('commit', writes.changes, writes.bulk)),
+        on_rollback=lambda session, writes: calls.append(('rollback', writes.changes, writes.bulk))
+    )
+    yield calls
+    WriteTracker._subscriptions.pop('test_materials')
+
+
+class TestWriteTracker:
+    """Writes are collected per transaction and dispatched to subscribers"""
+
+    def test_one_listener_per_event(self, app):
+        """Dashboard cache, amount profiles and analytics snapshot share the listeners"""
+        assert {'dashboard_cache', 'amount_profiles', 'analytics_snapshot'} <= set(WriteTracker._subscriptions)
+        assert event.contains(db.session, 'after_flush', WriteTracker._after_flush)
+
+    def test_commit_gets_changes_of_every_flush(self, calls):
+        db.session.add(Material(material_type='Cables'))
+        db.session.flush()
+        db.session.add(Material(material_type='Conduits'))
+        db.session.commit()
+
+        assert calls == [('commit', ['Cables', 'Conduits'], set())]
+
+    def test_other_models_are_not_dispatched(self, calls, app):
+        material = Material(material_type='Cables')
+        db.session.add(material)
+        db.session.commit()
+        calls.clear()
+
+        db.session.add(PurchaseOrder(material_id=material.id, po_ref='PO-WT', supplier_name='Alpha',
+                                     total_amount=100))
+        db.session.commit()
+
+        assert calls == []
+
+    def test_rollback_gets_discarded_changes(self, calls):
+        db.session.add(Material(material_type='Cables'))
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+
+        assert calls == [('rollback', ['Cables'], set())]
+
+    def test_bulk_statement(self, calls):
+        db.session.execute(update(Material).values(description='x'))
+        db.session.commit()
+
+        assert calls == [('bulk', Material), ('commit', [], {Material})]